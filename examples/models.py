@@ -56,6 +56,36 @@ class Instrument2(Base):
         name = 'instrument'
 
 
+class Instrument3(Base):
+    ccy = odm.SymbolField(bitmap=True)
+    type = odm.SymbolField(bitmap=True)
+    description = odm.CharField()
+
+    class Meta:
+        app_label = 'examples3'
+        name = 'instrument'
+
+
+class Instrument4(Base):
+    ccy = odm.SymbolField(bitmap=True)
+    type = odm.SymbolField(bitmap=True)
+
+    class Meta:
+        ordering = 'id'
+        app_label = 'examples4'
+        name = 'instrument'
+
+
+class Instrument5(Base):
+    type = odm.SymbolField()
+    description = odm.CharField()
+
+    class Meta:
+        app_label = 'examples5'
+        name = 'instrument'
+        indexes = [('ccy', 'type'), ('ccy', 'description')]
+
+
 class Fund(Base):
     description = odm.CharField()
 
@@ -234,6 +264,27 @@ class Environment(odm.StdModel):
     data = odm.PickleObjectField()
 
 
+class LazyEnvironment(odm.StdModel):
+    data = odm.PickleObjectField(lazy=True)
+
+
+class LazyStatistics(odm.StdModel):
+    name = odm.SymbolField()
+    data = odm.JSONField(as_string=False)
+    info = odm.JSONField()
+    extra = odm.PickleObjectField(required=False, lazy=False)
+
+    class Meta:
+        lazy = True
+
+
+class CompressedData(odm.StdModel):
+    name = odm.SymbolField()
+    text = odm.CharField(compress=True)
+    data = odm.JSONField(compress=9, compress_threshold=32)
+    blob = odm.PickleObjectField(compress=True, required=False)
+
+
 ##############################################
 # Numeric Data
 
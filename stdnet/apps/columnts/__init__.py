@@ -1,5 +1,5 @@
 '''\
-**backends**: :ref:`Redis <redis-server>`.
+**backends**: :ref:`Redis <redis-server>`, Memory.
 
 An application which implements a specialised remote
 :class:`stdnet.odm.Structure` for managing numeric multivariate
@@ -94,4 +94,5 @@ with the initial byte (``byte0``) indicating the type of data::
 .. _timeseries: http://en.wikipedia.org/wiki/Time_series
 '''
 from . import redis
+from . import memory
 from .models import *
@@ -0,0 +1,436 @@
+'''Memory implementation of ColumnTS'''
+from bisect import bisect_left, bisect_right
+from struct import pack
+
+from stdnet.backends import memoryb
+from stdnet.backends.memoryb.store import rank_slice
+
+
+nan = float('nan')
+# 9 bytes string for nil data
+nildata = b'\x00'*9
+
+
+class columnts(object):
+    '''The data of a :class:`MemoryColumnTS` in the store. An ordered list
+of timestamps and a dictionary of field values, ``nan`` for missing data.'''
+    def __init__(self):
+        self.times = []
+        self.fields = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def rank(self, timestamp):
+        timestamp = float(timestamp)
+        index = bisect_left(self.times, timestamp)
+        if index < len(self.times) and self.times[index] == timestamp:
+            return index
+
+    def times_range(self, start, stop):
+        times = self.times
+        return bisect_left(times, float(start)), bisect_right(times,
+                                                              float(stop))
+
+    def get_range(self, start, stop, fields=None):
+        times = self.times[start:stop]
+        field_values = {}
+        if times:
+            for field in (fields or self.fields):
+                values = self.fields.get(field)
+                if values is not None:
+                    field_values[field] = values[start:stop]
+        return [times, field_values]
+
+    def range(self, start, stop, fields=None):
+        return self.get_range(*self.times_range(start, stop), fields=fields)
+
+    def irange(self, start=0, stop=-1, fields=None):
+        start, stop = rank_slice(len(self.times), start, stop)
+        return self.get_range(start, stop, fields)
+
+    def ipop_range(self, start, stop):
+        if start is None or stop is None or not self.times:
+            return [[], {}]
+        start = int(start)
+        if start < 0:
+            start = max(len(self.times) + start, 0)
+        start, stop = rank_slice(len(self.times), start, stop)
+        data = self.get_range(start, stop)
+        del self.times[start:stop]
+        for values in self.fields.values():
+            del values[start:stop]
+        return data
+
+    def add(self, times, field_values, weights=None, tsmul=None):
+        '''Add or replace *field_values* at *times*. If *weights* are
+provided, weighted values are added to the existing ones.'''
+        length = len(self.times)
+        new_serie = length == 0
+        if tsmul is not None:
+            if not len(tsmul):
+                raise ValueError('Timeseries not available')
+            if len(tsmul.fields) != 1:
+                raise ValueError('Timeseries has more than one field. Cannot '
+                                 'be used to multiply timeseries.')
+            values = list(tsmul.fields.values())[0]
+            tsmul = dict(zip(tsmul.times, values))
+        for field in field_values:
+            if field not in self.fields:
+                self.fields[field] = [nan]*length
+        time_set = set()
+        weight = None
+        for index, timestamp in enumerate(times):
+            timestamp = float(timestamp)
+            time_set.add(timestamp)
+            rank = self.rank(timestamp)
+            if rank is None:
+                rank = bisect_left(self.times, timestamp)
+                self.times.insert(rank, timestamp)
+                for values in self.fields.values():
+                    values.insert(rank, nan)
+            for field, values in field_values.items():
+                value = to_number(values[index])
+                if value == value and weights is not None:
+                    if isinstance(weights, dict):
+                        weight = weights[field]
+                    else:
+                        weight = weights
+                    value = weight*value
+                    if tsmul is not None:
+                        value = tsmul.get(timestamp, nan)*value
+                    if value == value and not new_serie:
+                        value += self.fields[field][rank]
+                self.fields[field][rank] = value
+        if weight is not None and not new_serie:
+            for rank, timestamp in enumerate(self.times):
+                if timestamp not in time_set:
+                    for values in self.fields.values():
+                        values[rank] = nan
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return nan
+
+
+def pack_value(value):
+    if value == value:
+        return b'\x02' + pack('>d', value)
+    else:
+        return nildata
+
+
+def single_field_dict(data):
+    times, field_values = data
+    if len(times) == 1:
+        return dict(((f, v[0]) for f, v in field_values.items()))
+
+
+class MemoryColumnTS(memoryb.MemoryStructure):
+    '''Memory backend for :class:`ColumnTS`'''
+    def __contains__(self, timestamp):
+        value = self.value
+        return value is not None and value.rank(timestamp) is not None
+
+    def size(self):
+        value = self.value
+        return len(value) if value is not None else 0
+
+    @property
+    def fieldsid(self):
+        return self.id + ':fields'
+
+    def fieldid(self, field):
+        return self.id + ':field:' + field
+
+    def flush(self):
+        cache = self.instance.cache
+        data = self.flat()
+        if data:
+            with self.client.lock:
+                value = self.get_value(columnts)
+                for t in data['delete_times']:
+                    value.ipop_range(value.rank(t), value.rank(t))
+                for field in data['delete_fields']:
+                    value.fields.pop(field, None)
+                for time_fields in data['add']:
+                    value.add(time_fields['times'], time_fields['fields'])
+                self.discard_empty()
+                return len(value)
+        elif cache.merged_series:
+            return self._merge(cache.merged_series)
+
+    def allkeys(self):
+        return [self.id] if self.value is not None else []
+
+    def fields(self):
+        '''Return a tuple of ordered fields for this :class:`ColumnTS`.'''
+        value = self.value
+        return tuple(sorted(value.fields)) if value is not None else ()
+
+    def info(self, start, end, fields):
+        value = self.value or columnts()
+        times, field_values = value.irange()
+        result = {'size': len(times), 'fields': {}}
+        if times:
+            result['start'] = times[0]
+            result['stop'] = times[-1]
+            for field, data in field_values.items():
+                result['fields'][field] = {
+                    'missing': len([v for v in data if v != v])}
+        return result
+
+    def field(self, field):
+        '''Fetch an entire row field string'''
+        value = self.value
+        if value is not None and field in value.fields:
+            return b''.join((pack_value(v) for v in value.fields[field]))
+
+    def numfields(self):
+        '''Number of fields'''
+        value = self.value
+        return len(value.fields) if value is not None else 0
+
+    def get(self, dte):
+        value = self.value
+        if value is not None:
+            return single_field_dict(value.range(dte, dte))
+
+    def pop(self, dte):
+        with self.client.lock:
+            value = self.value
+            if value is not None:
+                rank = value.rank(dte)
+                return self._ipop_range(rank, rank, single_field_dict)
+
+    def ipop(self, index):
+        return self._ipop_range(index, index, single_field_dict)
+
+    def irange(self, start=0, end=-1, fields=None, **kwargs):
+        value = self.value
+        if value is not None:
+            return value.irange(start, end, fields)
+        return [[], {}]
+
+    def range(self, start, end, fields=None, **kwargs):
+        value = self.value
+        if value is not None:
+            return value.range(start, end, fields)
+        return [[], {}]
+
+    def irange_and_delete(self):
+        with self.client.lock:
+            result = self.irange()
+            self.delete()
+            return result
+
+    def pop_range(self, start, end, **kwargs):
+        with self.client.lock:
+            value = self.value
+            if value is not None:
+                return self._ipop_range(value.rank(start), value.rank(end))
+            return [[], {}]
+
+    def ipop_range(self, start=0, end=-1, **kwargs):
+        return self._ipop_range(start, end)
+
+    def times(self, start, end, **kwargs):
+        return self.range(start, end)[0]
+
+    def itimes(self, start=0, end=-1, **kwargs):
+        return self.irange(start, end)[0]
+
+    def stats(self, start, end, fields=None, **kwargs):
+        return univariate(self.range(start, end, fields))
+
+    def istats(self, start, end, fields=None, **kwargs):
+        return univariate(self.irange(start, end, fields))
+
+    def multi_stats(self, start, end, fields, series, stats):
+        return self._multi_stats(start, end, 'range', fields, series, stats)
+
+    def imulti_stats(self, start, end, fields, series, stats):
+        return self._multi_stats(start, end, 'irange', fields, series, stats)
+
+    def merge(self, series, fields):
+        all_series = []
+        for elems in series:
+            all_series.append({'weight': elems[0],
+                               'series': [ts.backend_structure().id
+                                          for ts in elems[1:]]})
+        self.instance.cache.merged_series = {'series': all_series,
+                                             'fields': fields}
+
+    def run_script(self, script_name, series, *args, **params):
+        raise NotImplementedError('Lua scripts are not available for the '
+                                  'memory backend')
+
+    ###############################################################  INTERNALS
+    def flat(self):
+        cache = self.instance.cache
+        if cache.deleted_timestamps or cache.delete_fields or cache.fields:
+            fields = []
+            for field in cache.fields:
+                times = []
+                data = []
+                for t, v in cache.fields[field]:
+                    times.append(t)
+                    data.append(v)
+                fields.append({'times': times,
+                               'fields': {field: data}})
+            return {'delete_times': list(cache.deleted_timestamps),
+                    'delete_fields': list(cache.delete_fields),
+                    'add': fields}
+
+    def _ipop_range(self, start, end, callback=None):
+        with self.client.lock:
+            value = self.value
+            if value is not None:
+                result = value.ipop_range(start, end)
+                self.discard_empty()
+            else:
+                result = [[], {}]
+            return callback(result) if callback else result
+
+    def _merge(self, data):
+        with self.client.lock:
+            self.delete()
+            value = self.get_value(columnts)
+            fields = data['fields']
+            for elem in data['series']:
+                series = [self.client.get(id) or columnts()
+                          for id in elem['series']]
+                if len(series) > 2:
+                    raise ValueError('Too many timeseries. Cannot perform '
+                                     'operation')
+                ts, tsmul = series[0], None
+                if len(series) == 2:
+                    tsmul, ts = series
+                times, field_values = ts.irange(0, -1, fields)
+                value.add(times, field_values, elem['weight'], tsmul)
+            self.discard_empty()
+            return len(value)
+
+    def _multi_stats(self, start, end, method, fields, series, stats):
+        all = [(self.id, fields)]
+        if series:
+            all.extend(((ts.backend_structure().id, fields)
+                        for ts, fields in series))
+        sdata = []
+        for s in all:
+            if not len(s) == 2:
+                raise ValueError('Series must be a list of two elements tuple')
+            id, fields = s
+            value = self.client.get(id) or columnts()
+            times, field_values = getattr(value, method)(start, end, fields)
+            sdata.append((id, times, field_values))
+        return multivariate(sdata)
+
+
+# Add the memory structure to the struct map in the backend class
+memoryb.BackendDataServer.struct_map['columnts'] = MemoryColumnTS
+
+
+##############################################################    STATISTICS
+def univariate(data):
+    '''Aggregate statistics of a ``[times, field_values]`` slice.'''
+    times, field_values = data
+    sts = {}
+    if not times:
+        return sts
+    result = {'start': times[0], 'stop': times[-1], 'len': len(times),
+              'stats': sts}
+    for field, values in field_values.items():
+        N = 0
+        min_val, max_val = 1.e10, -1.e10
+        sum_val = sum2_val = 0
+        dsum = dsum2 = dsum3 = dsum4 = 0
+        p = nan
+        for v in values:
+            if v == v:
+                min_val = min(min_val, v)
+                max_val = max(max_val, v)
+                sum_val += v
+                sum2_val += v*v
+                if p == p:
+                    dv = v - p
+                    dv2 = dv*dv
+                    dsum += dv
+                    dsum2 += dv2
+                    dsum3 += dv2*dv
+                    dsum4 += dv2*dv2
+                p = v
+                N += 1
+        if N > 1:
+            sts[field] = {'N': N,
+                          'min': min_val,
+                          'max': max_val,
+                          'sum': sum_val/N,
+                          'sum2': sum2_val/N,
+                          'dsum': dsum/(N-1),
+                          'dsum2': dsum2/(N-1),
+                          'dsum3': dsum3/(N-1),
+                          'dsum4': dsum4/(N-1)}
+    return result
+
+
+def vector_square(vector):
+    return [v*vector[j] for i, v in enumerate(vector) for j in range(i+1)]
+
+
+def vector_sadd(vector1, vector2):
+    for i, v in enumerate(vector2):
+        vector1[i] += v
+
+
+def multivariate(series):
+    '''Aggregate cross statistics of a list of ``(key, times, field_values)``
+slices. Cross sections are taken at the times of the first slice.'''
+    names = []
+    sections = {}
+    first_times = ()
+    for i, (key, times, field_values) in enumerate(series):
+        fields = sorted(field_values)
+        names.extend(('%s @ %s' % (key, f) for f in fields))
+        if i == 0:
+            first_times = times
+        for j, time in enumerate(times):
+            if i == 0:
+                section = []
+            else:
+                section = sections.get(time)
+                if section is None:
+                    continue
+            for f in fields:
+                v = field_values[f][j]
+                if v != v:
+                    section = None
+                    break
+                section.append(v)
+            sections[time] = section
+    S = len(names)
+    T = S*(S+1)//2
+    N = 0
+    sum, sum2, dsum, dsum2 = [0]*S, [0]*T, [0]*S, [0]*T
+    start = stop = prev_section = None
+    for time in first_times:
+        section = sections.get(time)
+        if section and len(section) == S:
+            N += 1
+            stop = time
+            vector_sadd(sum, section)
+            vector_sadd(sum2, vector_square(section))
+            if prev_section:
+                dsection = [v - p for v, p in zip(section, prev_section)]
+                vector_sadd(dsum, dsection)
+                vector_sadd(dsum2, vector_square(dsection))
+            else:
+                start = time
+            prev_section = section
+    if N > 1:
+        return {'fields': names, 'start': start, 'stop': stop,
+                'type': 'multi', 'N': N, 'sum': sum, 'sum2': sum2,
+                'dsum': dsum, 'dsum2': dsum2}
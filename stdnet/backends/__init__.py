@@ -1,6 +1,10 @@
 import sys
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 from collections import namedtuple
 from inspect import isgenerator
+from threading import Lock, Thread
+from timeit import default_timer
 
 try:
     from pulsar import maybe_async as async
@@ -13,6 +17,7 @@ except ImportError:     # pragma    noproxy
 from stdnet.utils.exceptions import *
 from stdnet.utils import raise_error_trace
 from stdnet.utils.importer import import_module
+from stdnet.utils.instrument import result_count
 from stdnet.utils import (iteritems, int_or_float, to_string, urlencode,
                           urlparse)
 
@@ -20,6 +25,9 @@ from stdnet.utils import (iteritems, int_or_float, to_string, urlencode,
 __all__ = ['BackendStructure',
            'BackendDataServer',
            'BackendQuery',
+           'Page',
+           'index_size',
+           'ReplicaSet',
            'session_result',
            'session_data',
            'instance_session_result',
@@ -39,6 +47,178 @@ instance_session_result = namedtuple('instance_session_result',
 session_data = namedtuple('session_data',
                           'meta dirty deletes queries structures')
 session_result = namedtuple('session_result', 'meta results')
+# health of a read replica in a ReplicaSet
+replica_status = namedtuple('replica_status', 'healthy latency lag')
+# number of keys, of members and estimated bytes of a model index
+index_size = namedtuple('index_size', 'keys members memory')
+
+
+class Page(list):
+    '''A list of instances returned by the :meth:`stdnet.odm.Query.after`
+and :meth:`stdnet.odm.Query.before` keyset pagination methods.
+
+.. attribute:: after
+
+    Opaque cursor to pass to :meth:`stdnet.odm.Query.after` for retrieving
+    the next page or ``None`` if there are no more pages.
+
+.. attribute:: before
+
+    Opaque cursor to pass to :meth:`stdnet.odm.Query.before` for retrieving
+    the previous page or ``None`` on the first page.
+'''
+    def __init__(self, items=(), after=None, before=None):
+        super(Page, self).__init__(items)
+        self.after = after
+        self.before = before
+
+
+def encode_cursor(*values):
+    '''Encode *values* into an opaque pagination cursor.'''
+    value = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(value).decode('utf-8')
+
+
+def decode_cursor(cursor, kind):
+    '''Decode a *cursor* created by :func:`encode_cursor` with first value
+equal to *kind*. Return the remaining values.'''
+    try:
+        if not isinstance(cursor, bytes):
+            cursor = cursor.encode('utf-8')
+        values = json.loads(urlsafe_b64decode(cursor).decode('utf-8'))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or not values or values[0] != kind:
+        raise QuerySetError('Invalid pagination cursor %s' % cursor)
+    return values[1:]
+
+
+class ReplicaSet(object):
+    '''Load balancer of the read replicas of a master backend, passed as
+the ``read_backend`` of :meth:`stdnet.odm.Router.register`.
+
+:param replicas: list of :class:`BackendDataServer` or
+    :ref:`connection strings <connection-string>`.
+:param strategy: ``round_robin`` (default) or ``latency`` for choosing the
+    replica with the lowest ``ping`` round trip.
+:param max_lag: optional maximum replication lag, the difference between the
+    :meth:`BackendDataServer.replication_offset` of the master and of a
+    replica. Replicas lagging further behind are not used.
+:param check_interval: seconds between health checks. Default 5.
+
+When no replica is healthy, reads fall back to the master. Reads are routed
+with the cached :attr:`status`: only the first read checks the replicas,
+later checks run in a background thread once the status is older than
+``check_interval`` seconds, so that a slow replica never stalls reads.
+
+.. attribute:: status
+
+    Dictionary of replicas and their ``replica_status`` namedtuple
+    with ``healthy``, ``latency`` and ``lag`` of the last health check.
+'''
+    strategies = ('round_robin', 'latency')
+
+    def __init__(self, replicas, strategy='round_robin', max_lag=None,
+                 check_interval=5):
+        if strategy not in self.strategies:
+            raise ImproperlyConfigured('Unknown replica strategy "%s"' %
+                                       strategy)
+        self.replicas = [getdb(r) for r in replicas]
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.status = {}
+        self._checked = None
+        self._next = 0
+        self._lock = Lock()
+        self._refreshing = None
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+                           ', '.join((str(r) for r in self.replicas)))
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def __iter__(self):
+        return iter(self.replicas)
+
+    def get(self, master):
+        '''Return the replica for the next read or *master* when no
+replica is available.'''
+        available = self.available(master)
+        if not available:
+            return master
+        if self.strategy == 'latency':
+            return min(available, key=lambda r: self.status[r].latency)
+        with self._lock:
+            self._next += 1
+            return available[self._next % len(available)]
+
+    def available(self, master):
+        '''The list of healthy replicas in the cached :attr:`status`. A
+:meth:`refresh` is started if the last check is older than
+:attr:`check_interval` seconds.'''
+        checked = self._checked
+        if checked is None:
+            self.check(master)
+        elif default_timer() - checked >= self.check_interval:
+            self.refresh(master)
+        status = self.status
+        return [r for r in self.replicas if r in status and status[r].healthy]
+
+    def is_available(self, replica, master):
+        '''``True`` if *replica* is healthy.'''
+        return replica in self.available(master)
+
+    def refresh(self, master):
+        '''Run :meth:`check` in a background thread unless one is already
+running. Return the thread or ``None``.'''
+        with self._lock:
+            if self._refreshing is not None:
+                return None
+            thread = Thread(target=self._refresh, args=(master,))
+            thread.daemon = True
+            self._refreshing = thread
+        thread.start()
+        return thread
+
+    def _refresh(self, master):
+        try:
+            self.check(master)
+        finally:
+            self._refreshing = None
+
+    def check(self, master):
+        '''Check replicas via ``ping`` and, if :attr:`max_lag` is given,
+their lag behind *master*. Return the :attr:`status`.'''
+        master_offset = None
+        if self.max_lag is not None:
+            try:
+                master_offset = master.replication_offset()
+            except Exception:
+                master_offset = None
+        status = {}
+        for replica in self.replicas:
+            healthy, latency, lag = False, None, None
+            try:
+                start = default_timer()
+                healthy = bool(replica.ping())
+                latency = default_timer() - start
+                if healthy and master_offset is not None:
+                    offset = replica.replication_offset()
+                    if offset is None:
+                        healthy = False
+                    else:
+                        lag = max(master_offset - offset, 0)
+                        healthy = lag <= self.max_lag
+            except Exception:
+                healthy = False
+            status[replica] = replica_status(healthy, latency, lag)
+        self.status = status
+        self._checked = default_timer()
+        return status
+
 
 pass_through = lambda x: x
 str_lower_case = lambda x: to_string(x).lower()
@@ -157,8 +337,36 @@ class BackendDataServer(object):
         The default model Manager for this backend. If not
         provided, the :class:`stdnet.odm.Manager` is used.
         Default ``None``.
+
+    .. attribute:: coalescer
+
+        Optional handler which coalesces concurrent reads. When available,
+        :meth:`stdnet.odm.Query.get` calls are executed via
+        :meth:`coalesced_get`. Default ``None``.
+
+    .. attribute:: instrument
+
+        Optional :class:`stdnet.utils.instrument.Instrument` receiving
+        events of the operations executed by the backend. Set via
+        :meth:`set_instrument`. Default ``None``.
+
+    .. attribute:: recorder
+
+        Optional :class:`stdnet.utils.workload.WorkloadRecorder` writing the
+        commands sent to the server. Set via :meth:`set_recorder`. Default
+        ``None``.
+
+    .. attribute:: tracer
+
+        Optional :class:`stdnet.utils.tracing.Tracer` opening spans of the
+        operations executed by the backend. Set via :meth:`set_tracer`.
+        Default ``None``.
     '''
     Query = None
+    coalescer = None
+    instrument = None
+    recorder = None
+    tracer = None
     structure_module = None
     default_manager = None
     default_port = 8000
@@ -258,7 +466,14 @@ from database.
             yield instance
 
     def objects_from_db(self, meta, data, related_fields=None):
-        return list(self.make_objects(meta, data, related_fields))
+        tracer = self.tracer
+        if tracer is None:
+            return list(self.make_objects(meta, data, related_fields))
+        with tracer.start_span('odm.make_objects',
+                               model=meta.modelkey) as span:
+            objects = list(self.make_objects(meta, data, related_fields))
+            span.set_attribute('rows', len(objects))
+        return objects
 
     def structure(self, instance, client=None):
         '''Create a backend :class:`stdnet.odm.Structure` handler.
@@ -275,16 +490,22 @@ from database.
 
     def execute(self, result, callback=None):
         if self.is_async():
-            result = async(result)
-            if callback:
-                return result.add_callback(callback)
-            else:
-                return result
+            return self.execute_async(result, callback)
         else:
             if isgenerator(result):
                 result = execute_generator(result)
             return callback(result) if callback else result
 
+    def execute_async(self, result, callback=None):
+        '''Execute *result*, a generator of asynchronous results, and
+return an asynchronous result. If *callback* is given, it is called once
+*result* is available.'''
+        result = async(result)
+        if callback:
+            return result.add_callback(callback)
+        else:
+            return result
+
     # VIRTUAL METHODS
     def is_async(self):
         '''Check if the backend handler is asynchronous.'''
@@ -304,6 +525,32 @@ indices are created.'''
         '''Ping the server'''
         pass
 
+    def set_instrument(self, instrument):
+        '''Set the :attr:`instrument` of this backend, ``None`` to switch
+off instrumentation.'''
+        self.instrument = instrument
+
+    def set_recorder(self, recorder):
+        '''Set the :attr:`recorder` of this backend, ``None`` to stop
+recording.'''
+        self.recorder = recorder
+
+    def set_tracer(self, tracer):
+        '''Set the :attr:`tracer` of this backend, ``None`` to switch
+off tracing.'''
+        self.tracer = tracer
+
+    def replication_offset(self):
+        '''The replication offset of the server, used by :class:`ReplicaSet`
+for measuring the lag of replicas. ``None`` if not available.'''
+        pass
+
+    def index_sizes(self, meta):
+        '''Dictionary of :class:`index_size` of the indices of the model with
+*meta*, keyed by field attribute name or compound index name. The ``id`` key
+is the set of all ids of the model. Empty if not available.'''
+        return {}
+
     def instance_keys(self, obj):
         '''Return a list of database keys used by instance *obj*'''
         return [self.basekey(obj._meta, obj.pkvalue())]
@@ -324,6 +571,11 @@ must return a instance of the backend handler.'''
         '''Execute a :class:`stdnet.odm.Session` in the backend server.'''
         raise NotImplementedError()
 
+    def coalesced_get(self, query, kwargs):
+        '''Generator of the instance matching *kwargs* in *query*, batching
+concurrent reads via the :attr:`coalescer`.'''
+        raise NotImplementedError()
+
     def model_keys(self, meta):
         '''Return a list of database keys used by model *model*'''
         raise NotImplementedError()
@@ -354,6 +606,7 @@ class BackendQuery(object):
         self.timeout = timeout
         self.__count = None
         self.__slice_cache = {}
+        self.phases = []
         # build the queryset without performing any database communication
         self._build(**kwargs)
 
@@ -388,10 +641,22 @@ class BackendQuery(object):
         '''Cached results.'''
         return self.__slice_cache
 
+    @property
+    def slowlog(self):
+        '''The :class:`stdnet.odm.SlowLog` of the router of this query or
+``None``.'''
+        router = getattr(self.session, 'router', None)
+        return getattr(router, 'slowlog', None)
+
     def __len__(self):
-        return self.execute_query()
+        return self.count()
 
     def count(self):
+        if not self.executed and (self.slowlog is not None or
+                                  self.backend.tracer is not None):
+            return self.backend.execute(self._traced('query.count',
+                                                     self._count()),
+                                        self._got_count)
         return self.execute_query()
 
     def __contains__(self, val):
@@ -409,7 +674,18 @@ class BackendQuery(object):
         return self.backend.execute(self.items(), lambda r: r[slic])
 
     def items(self, slic=None, callback=None):
-        return self.backend.execute(self._slice_items(slic), callback)
+        return self.backend.execute(self._traced('query.items',
+                                                 self._slice_items(slic)),
+                                    callback)
+
+    def page(self, cursor=None, limit=25, backward=False):
+        '''Keyset pagination. Return a :class:`Page` of at most *limit*
+instances following (preceding if *backward* is ``True``) *cursor*.'''
+        if limit <= 0:
+            raise QuerySetError('Page limit must be positive')
+        return self.backend.execute(
+            self._traced('query.page',
+                         self._page_items(cursor, limit, backward)))
 
     def delete(self, qs):
         with self.session.begin() as t:
@@ -435,12 +711,42 @@ class BackendQuery(object):
         '''
         raise NotImplementedError
 
+    def _page(self, cursor, limit, backward):     # pragma: no cover
+        '''Load a :class:`Page` of items from the server.'''
+        raise QuerySetError('Keyset pagination not available for "%s"' %
+                            self.backend)
+
     # PRIVATE METHODS
 
     def _got_count(self, c):
         self.__count = c
         return c
 
+    def _log_slow(self, operation, start, count, slic=None):
+        slowlog = self.slowlog
+        if slowlog is not None:
+            slowlog.record(self, operation, default_timer() - start, count,
+                           slic)
+
+    def _traced(self, name, result):
+        # run the generator *result* within a span when tracing
+        tracer = self.backend.tracer
+        if tracer is None:
+            return result
+        return self._trace(tracer, name, result)
+
+    def _trace(self, tracer, name, result):
+        with tracer.start_span(name, model=self.meta.modelkey) as span:
+            result = yield result
+            span.set_attribute('rows', result_count(result))
+        yield result
+
+    def _count(self):
+        start = default_timer()
+        result = yield self._execute_query()
+        self._log_slow('count', start, result)
+        yield result
+
     def _slice_items(self, slic):
         key = None
         seq = self.__slice_cache.get(None)
@@ -452,6 +758,7 @@ class BackendQuery(object):
         if seq is not None:
             yield seq
         else:
+            start = default_timer()
             result = yield self.execute_query()
             items = ()
             if result:
@@ -464,8 +771,23 @@ class BackendQuery(object):
                     session.add(el, modified=False)
                 seq.append(el)
             self.__slice_cache[key] = seq
+            self._log_slow('items', start, len(seq), slic)
             yield seq
 
+    def _page_items(self, cursor, limit, backward):
+        start = default_timer()
+        result = yield self.execute_query()
+        page = Page()
+        if result:
+            page = yield self._page(cursor, limit, backward)
+        session = self.session
+        model = self.model
+        for el in page:
+            if isinstance(el, model):
+                session.add(el, modified=False)
+        self._log_slow('page', start, len(page))
+        yield page
+
 
 def parse_backend(backend):
     """Converts the "backend" into the database connection parameters.
@@ -489,8 +811,13 @@ It returns a (scheme, host, params) tuple."""
 
 
 def _getdb(scheme, host, params):
+    # a scheme such as redis+shard selects the shard module of the redis
+    # backend package
+    name, _, variant = scheme.partition('+')
     try:
-        module = import_module('stdnet.backends.%sb' % scheme)
+        module = import_module('stdnet.backends.%sb' % name)
+        if variant:
+            module = import_module('%s.%s' % (module.__name__, variant))
     except ImportError:
         raise NotImplementedError
     return getattr(module, 'BackendDataServer')(scheme, host, **params)
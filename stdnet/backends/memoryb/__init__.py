@@ -0,0 +1,1032 @@
+'''Pure python in-memory backend.
+
+The ``memory://<name>`` backend keeps data in a
+:class:`stdnet.backends.memoryb.store.Store` of the running process. Backends
+connected with the same *name* share their data. Queries, sessions and
+structures have the same index and ordering semantic of the lua scripts of
+the redis backend, so that the backend can be used for unit tests, embedded
+use or as a reference implementation.
+'''
+import json
+from bisect import bisect_left, bisect_right
+from functools import partial
+from timeit import default_timer
+
+import stdnet
+from stdnet import FieldValueError, CommitException, QuerySetError
+from stdnet.utils import native_str, unique_tuple, iteritems
+from stdnet.backends import (BackendStructure, session_result,
+                             instance_session_result, Page, encode_cursor,
+                             decode_cursor, index_size)
+
+from .store import get_store, encode, zset, timeseries, rank_slice
+from .odm import Model
+
+
+MIN_FLOAT = -1.e99
+OBJ = 'obj'
+SELECT_OPS = ('intersect', 'union', 'diff')
+# rough memory overhead, in bytes, of a key and of a set or hash member.
+# The same figures of the redis backend.
+KEY_BYTES = 64
+MEMBER_BYTES = 48
+
+
+############################################################################
+##    MEMORY QUERY CLASS
+############################################################################
+class MemoryQuery(stdnet.BackendQuery):
+    '''A :class:`stdnet.BackendQuery` evaluated on the data of a
+:class:`stdnet.backends.memoryb.store.Store`. The query is evaluated once,
+when first needed, and the :attr:`result` is a set of ids or, when a
+:meth:`stdnet.odm.Query.get_field` is not the primary key, a list of field
+values.'''
+    result = None
+
+    def _build(self, **kwargs):
+        if self.queryelem.data.get('where'):
+            raise QuerySetError('Where clauses not available for "%s"' %
+                                self.backend)
+
+    @property
+    def odm(self):
+        '''The :class:`stdnet.backends.memoryb.odm.Model` of the query.'''
+        return self.backend.model(self.meta)
+
+    def evaluate(self):
+        '''Evaluate the query, if not already done, and return the
+:attr:`result`.'''
+        if self.result is None:
+            tracer = self.backend.tracer
+            if tracer is None:
+                self.result = self._evaluate()
+            else:
+                with tracer.start_span('memory.evaluate',
+                                       model=self.meta.modelkey) as span:
+                    self.result = self._evaluate()
+                    span.set_attribute('rows', len(self.result))
+        return self.result
+
+    def _evaluate(self):
+        with self.backend.client.lock:
+            qs = self.queryelem
+            ids = self.select(qs)
+            gf = qs._get_field
+            if gf and gf != self.meta.pkname():
+                attname = self.meta.dfields[gf].attname
+                model = self.odm
+                ids = [(model.data(id) or {}).get(attname)
+                       for id in model.sort_ids(ids)]
+            return ids
+
+    def reset(self):
+        '''Clear the :attr:`result` so that the query is evaluated again.'''
+        self.result = None
+
+    def aggregate(self, field):
+        '''Add the ids of instances related recursively via the
+self-referencing *field* to the :attr:`result`.'''
+        self.odm.aggregate(self.evaluate(), field)
+
+    def select(self, elem, candidates=None):
+        '''Set of ids matching the query element *elem*, restricted to
+*candidates* if provided.'''
+        keyword = elem.keyword
+        if keyword == 'expression':
+            self.add_phase('expression')
+            return self.select(elem.underlying[0], candidates)
+        elif keyword == 'set':
+            return self.select_set(elem, candidates)
+        elif keyword in SELECT_OPS:
+            children = list(elem)
+            if keyword == 'intersect':
+                # evaluate index lookups first, range lookups on the result
+                children.sort(key=self.is_range)
+                ids = candidates
+                for child in children:
+                    ids = self.select_child(child, ids)
+            elif keyword == 'union':
+                ids = set()
+                for child in children:
+                    ids.update(self.select_child(child, candidates))
+            else:
+                ids = self.select_child(children[0], candidates)
+                for child in children[1:]:
+                    ids.difference_update(self.select_child(child, ids))
+            return ids
+        raise ValueError('Could not perform %s operation' % keyword)
+
+    def select_set(self, elem, candidates):
+        model = self.odm
+        charset = self.backend.charset
+        if elem.name == self.meta.pkname() and not elem.underlying:
+            ids = model.ids()
+            return set(ids if candidates is None else
+                       (id for id in candidates if id in ids))
+        self.add_phase('query')
+        lookups = []
+        for child in elem:
+            if self.is_query(child):
+                lookup, value = 'set', child
+            else:
+                lookup, value = child
+            if lookup == 'set':
+                value = self.values(value)
+            elif lookup == 'compound':
+                value = tuple((encode('' if v is None else v, charset)
+                               for v in value))
+            elif lookup == 'value':
+                value = encode('' if value is None else value, charset)
+            else:
+                value, nested = value
+                nested_args = []
+                for name, meta in nested or ():
+                    if meta:
+                        meta = self.backend.basekey(meta)
+                    nested_args.extend((name, meta))
+                value = (value, nested_args)
+            lookups.append((lookup, value))
+        return model.query(elem.name, lookups, candidates)
+
+    def select_child(self, child, candidates):
+        # A child of the same model is evaluated with the ids of its
+        # siblings, any other query is evaluated by its own backend query
+        if (child.keyword != 'empty' and child.meta is self.meta and
+                not child._get_field and not child.data.get('where')):
+            return self.select(child, candidates)
+        ids = set(self.values(child))
+        if candidates is not None:
+            ids.intersection_update(candidates)
+        return ids
+
+    def is_range(self, elem):
+        if elem.keyword == 'set' and elem.underlying:
+            for child in elem:
+                if self.is_query(child) or child[0] in ('value', 'compound'):
+                    return 0
+            return 1
+        return 0
+
+    def is_query(self, elem):
+        '''``True`` if *elem* is a query element of the backend of this
+query rather than a lookup tuple.'''
+        return getattr(elem, 'backend', None) == self.queryelem.backend
+
+    def values(self, elem):
+        '''The ids, or field values, of the nested query *elem*.'''
+        if elem.keyword == 'empty':
+            return ()
+        query = elem.backend_query()
+        self.phases.extend(query.phases)
+        return query.evaluate()
+
+    def add_phase(self, phase):
+        if phase not in self.phases:
+            self.phases.append(phase)
+
+    def _execute_query(self):
+        yield len(self.evaluate())
+
+    def order(self, last):
+        '''Perform ordering with respect model fields.'''
+        desc = last.desc
+        field = last.name
+        nested = last.nested
+        nested_args = []
+        while nested:
+            meta = nested.model._meta
+            nested_args.extend((self.backend.basekey(meta), nested.name))
+            last = nested
+            nested = nested.nested
+        method = 'ALPHA' if last.field.internal_type == 'text' else ''
+        if field == last.model._meta.pkname():
+            field = ''
+        return {'field': field,
+                'method': method,
+                'desc': desc,
+                'nested': nested_args}
+
+    def explicit_ordering(self, ids, order):
+        '''List of *ids* sorted by the value of a field, with the semantic of
+the redis ``SORT`` command.'''
+        model = self.odm
+        store = model.store
+        field = order['field']
+        nested = order['nested']
+        alpha = order['method'] == 'ALPHA'
+        items = []
+        for id in ids:
+            if field:
+                value = (model.data(id) or {}).get(field)
+                for n, name in enumerate(nested):
+                    if n % 2:
+                        value = (store.get(key) or {}).get(name)
+                    elif value is None:
+                        break
+                    else:
+                        key = '%s:%s:%s' % (name, OBJ,
+                                            native_str(value, model.charset))
+            else:
+                value = id
+            if alpha:
+                value = (0, b'') if value is None else (1, value)
+            else:
+                try:
+                    value = float(value or 0)
+                except ValueError:
+                    value = 0.0
+            items.append((value, id))
+        items.sort(reverse=order['desc'])
+        return [id for _, id in items]
+
+    def _has(self, val):
+        return encode(val, self.backend.charset) in self.evaluate()
+
+    def _items(self, slic):
+        meta = self.meta
+        model = self.odm
+        get = self.queryelem._get_field
+        if get and slic:
+            raise QuerySetError('Cannot slice a queryset in conjunction '
+                                'with get_field. Use load_only instead.')
+        ids = self.evaluate()
+        if get:
+            self.add_phase('load')
+            if get == meta.pkname():
+                ids = model.sort_ids(ids)
+            tpy = meta.dfields.get(get).to_python
+            return [tpy(v, self.backend) for v in ids]
+        if self.queryelem.ordering:
+            ids = self.explicit_ordering(ids,
+                                         self.order(self.queryelem.ordering))
+        elif meta.ordering:
+            ids = model.sort_by_score(ids, meta.ordering.desc)
+        elif slic:
+            ids = self.explicit_ordering(
+                ids, self.order(meta.get_sorting(meta.pkname())))
+        else:
+            ids = model.sort_ids(ids)
+        if slic:
+            ids = ids[slic]
+        return self.load(ids, 'load')
+
+    def _page(self, cursor, limit, backward):
+        meta = self.meta
+        ordering = self.queryelem.ordering
+        if self.queryelem._get_field:
+            raise QuerySetError('Cannot paginate a queryset in conjunction '
+                                'with get_field. Use load_only instead.')
+        if ordering:
+            if not (meta.ordering and ordering.name == meta.ordering.name and
+                    not ordering.nested):
+                raise QuerySetError('Keyset pagination is available for the '
+                                    'model ordering only')
+        else:
+            ordering = meta.ordering
+        if ordering:
+            kind = 'z'
+        elif backward:
+            raise QuerySetError('Backward pagination is available for '
+                                'ordered models only')
+        else:
+            kind = 's'
+        if cursor is not None:
+            cursor = decode_cursor(cursor, kind)
+        if kind == 'z':
+            ids, cursors = self.keyset(cursor, limit, backward, ordering.desc)
+        else:
+            ids, cursors = self.scan(cursor, limit)
+        return Page(self.load(ids, 'page'), **cursors)
+
+    def keyset(self, cursor, limit, backward, desc):
+        '''Keyset pagination of an ordered model. The *cursor* is a
+``(score, id)`` pair.'''
+        model = self.odm
+        score = model.ids().score
+        items = sorted(((score(id), id) for id in self.evaluate()))
+        size = len(items)
+        # moving towards higher scores
+        up = desc == backward
+        if cursor:
+            key = (float(cursor[0]), encode(cursor[1], model.charset))
+            if up:
+                start = bisect_right(items, key)
+                stop = min(start + limit, size)
+            else:
+                stop = bisect_left(items, key)
+                start = max(stop - limit, 0)
+        elif up:
+            start, stop = 0, min(limit, size)
+        else:
+            start, stop = max(size - limit, 0), size
+        # number of items preceding the page in the iteration order
+        preceding = size - stop if desc else start
+        items = items[start:stop]
+        if desc:
+            items.reverse()
+        cursors = {}
+        if items:
+            charset = model.charset
+            first, last = items[0], items[-1]
+            if preceding:
+                cursors['before'] = encode_cursor(
+                    'z', first[0], native_str(first[1], charset))
+            cursors['after'] = encode_cursor('z', last[0],
+                                             native_str(last[1], charset))
+        return [id for _, id in items], cursors
+
+    def scan(self, cursor, limit):
+        '''Stable pagination of an unordered model. The *cursor* is the
+last id of the previous page.'''
+        model = self.odm
+        ids = model.sort_ids(self.evaluate())
+        start = 0
+        if cursor:
+            last = encode(cursor[0], model.charset)
+            keys = [int(id) for id in ids] if model.auto else ids
+            start = bisect_right(keys, int(last) if model.auto else last)
+        items = ids[start:start+limit]
+        cursors = {}
+        if items and start + limit < len(ids):
+            cursors['after'] = encode_cursor(
+                's', native_str(items[-1], model.charset))
+        return items, cursors
+
+    def load(self, ids, phase):
+        '''Load instances with *ids*.'''
+        self.add_phase(phase)
+        meta = self.meta
+        model = self.odm
+        pkname_tuple = (meta.pk.name,)
+        fields = self.queryelem.fields or None
+        if fields:
+            fields = unique_tuple(fields, self.queryelem.select_related or ())
+        if fields == pkname_tuple:
+            attributes = fields
+        elif fields:
+            fields, attributes = meta.backend_fields(fields)
+        with model.store.lock:
+            data = list(self.build(model, ids, fields,
+                                   fields and attributes))
+            related_fields = self.load_related(model, ids)
+        return self.backend.objects_from_db(meta, data, related_fields)
+
+    def build(self, model, ids, fields, attributes):
+        fields = tuple(fields) if fields else None
+        if fields:
+            if len(fields) == 1 and fields[0] in (self.meta.pkname(), ''):
+                for id in ids:
+                    yield id, (), {}
+            else:
+                for id in ids:
+                    data = model.data(id) or {}
+                    yield id, fields, dict(((a, data.get(a))
+                                            for a in attributes))
+        else:
+            for id in ids:
+                yield id, None, dict(model.data(id) or ())
+
+    def load_related(self, model, ids):
+        '''Dictionary of data of related fields to load with the
+instances.'''
+        related = self.queryelem.select_related
+        related_fields = {}
+        if related:
+            meta = self.meta
+            store = model.store
+            charset = model.charset
+            for rel in related:
+                field = meta.dfields[rel]
+                fields = list(related[rel])
+                if meta.pkname() in fields:
+                    fields.remove(meta.pkname())
+                    if not fields:
+                        fields.append('')
+                if field in meta.multifields:
+                    data = []
+                    for id in ids:
+                        key = '%s:%s' % (model.object_key(id), field.name)
+                        data.append((native_str(id, charset),
+                                     structure_items(store.get(key))))
+                else:
+                    rmodel = self.backend.model(field.relmodel._meta)
+                    data, processed = [], set()
+                    for id in ids:
+                        rid = (model.data(id) or {}).get(field.attname)
+                        if rid is None or rid in processed:
+                            continue
+                        processed.add(rid)
+                        rdata = rmodel.data(rid)
+                        if rdata is not None:
+                            data.append(rid)
+                    data = self.build(rmodel, data, fields, fields)
+                related_fields[field.name] = list(data)
+        return related_fields
+
+
+def structure_items(value):
+    '''The items of a structure loaded with the instance of a model.'''
+    if value is None:
+        return []
+    elif isinstance(value, zset):
+        return list(value.items())
+    elif isinstance(value, dict):
+        return dict(value)
+    elif isinstance(value, timeseries):
+        return value.irange()
+    elif isinstance(value, bytearray):
+        return bytes(value)
+    else:
+        return list(value)
+
+
+############################################################################
+##    STRUCTURES
+############################################################################
+class MemoryStructure(BackendStructure):
+    '''Base class for the structures of the memory backend. The
+:attr:`client` is the :class:`stdnet.backends.memoryb.store.Store`.'''
+    def __init__(self, *args, **kwargs):
+        super(MemoryStructure, self).__init__(*args, **kwargs)
+        instance = self.instance
+        field = instance.field
+        if field:
+            model = field.model
+            if instance._pkvalue:
+                id = self.backend.basekey(model._meta, OBJ,
+                                          instance._pkvalue, field.name)
+            else:
+                id = self.backend.basekey(model._meta, 'struct', field.name)
+        else:
+            id = '%s.%s' % (instance._meta.name, instance.id)
+        self.id = id
+
+    @property
+    def value(self):
+        '''The container of this structure or ``None``.'''
+        return self.client.get(self.id)
+
+    def get_value(self, factory):
+        return self.client.get(self.id, factory)
+
+    def discard_empty(self):
+        self.client.discard_empty(self.id)
+
+    def encode(self, value):
+        return encode(value, self.backend.charset)
+
+    def delete(self):
+        with self.client.lock:
+            return self.client.delete(self.id)
+
+    def size(self):
+        value = self.value
+        return len(value) if value is not None else 0
+
+
+class String(MemoryStructure):
+
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        data = cache.getvalue()
+        if data:
+            self.get_value(bytearray).extend(data)
+            result = True
+        return result
+
+    def incr(self, num=1):
+        with self.client.lock:
+            value = int(bytes(self.value or b'0')) + num
+            self.client.set(self.id, bytearray(encode(value)))
+            return value
+
+
+class Set(MemoryStructure):
+
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.toadd:
+            self.get_value(set).update((self.encode(v) for v in cache.toadd))
+            result = True
+        if cache.toremove:
+            self.get_value(set).difference_update(
+                (self.encode(v) for v in cache.toremove))
+            self.discard_empty()
+            result = True
+        return result
+
+    def items(self):
+        return set(self.value or ())
+
+
+class Zset(MemoryStructure):
+    '''Memory ordered set structure'''
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.toadd:
+            value = self.get_value(zset)
+            for score, v in cache.toadd.items():
+                value.add(score, self.encode(v))
+            result = True
+        if cache.toremove:
+            value = self.get_value(zset)
+            for v in cache.toremove:
+                value.remove(self.encode(v))
+            self.discard_empty()
+            result = True
+        return result
+
+    def get(self, score):
+        r = self.range(score, score, withscores=False)
+        if r:
+            if len(r) > 1:
+                return r
+            else:
+                return r[0]
+
+    def items(self):
+        return self.irange(withscores=True)
+
+    def values(self):
+        return self.irange(withscores=False)
+
+    def rank(self, value):
+        data = self.value
+        if data is not None:
+            return data.rank(self.encode(value))
+
+    def count(self, start, stop):
+        value = self.value
+        return len(value.range(start, stop)) if value is not None else 0
+
+    def range(self, start, end, withscores=True, desc=False, **options):
+        value = self.value
+        result = value.range(start, end, desc) if value is not None else []
+        return self._range(withscores, result)
+
+    def irange(self, start=0, stop=-1, desc=False, withscores=True, **options):
+        value = self.value
+        result = value.irange(start, stop, desc) if value is not None else []
+        return self._range(withscores, result)
+
+    def ipop_range(self, start, stop=None, withscores=True, **options):
+        '''Remove and return a range from the ordered set by rank (index).'''
+        with self.client.lock:
+            stop = start if stop is None else stop
+            return self._pop(withscores, self.irange(start, stop))
+
+    def pop_range(self, start, stop=None, withscores=True, **options):
+        '''Remove and return a range from the ordered set by score.'''
+        with self.client.lock:
+            stop = start if stop is None else stop
+            return self._pop(withscores, self.range(start, stop))
+
+    # PRIVATE
+    def _pop(self, withscores, result):
+        value = self.value
+        for _, v in result:
+            value.remove(v)
+        self.discard_empty()
+        return self._range(withscores, result)
+
+    def _range(self, withscores, result):
+        if withscores:
+            return result
+        else:
+            return [v for _, v in result]
+
+
+class List(MemoryStructure):
+
+    def pop_front(self):
+        return self._pop(0)
+
+    def pop_back(self):
+        return self._pop(-1)
+
+    def block_pop_front(self, timeout):
+        return self._block_pop(0, timeout)
+
+    def block_pop_back(self, timeout):
+        return self._block_pop(-1, timeout)
+
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.front:
+            value = self.get_value(list)
+            for v in cache.front:
+                value.insert(0, self.encode(v))
+            result = True
+        if cache.back:
+            self.get_value(list).extend((self.encode(v) for v in cache.back))
+            result = True
+        return result
+
+    def range(self, start=0, end=-1):
+        value = self.value or []
+        start, end = rank_slice(len(value), start, end)
+        return value[start:end]
+
+    def _pop(self, index):
+        with self.client.lock:
+            value = self.value
+            if value:
+                result = value.pop(index)
+                self.discard_empty()
+                return result
+
+    def _block_pop(self, index, timeout):
+        # Wait for an element for timeout seconds, forever if timeout is 0
+        condition = self.client.condition
+        end = default_timer() + timeout if timeout else None
+        with condition:
+            while True:
+                value = self._pop(index)
+                if value is not None:
+                    return value
+                if end is None:
+                    condition.wait()
+                else:
+                    remaining = end - default_timer()
+                    if remaining <= 0:
+                        return None
+                    condition.wait(remaining)
+
+
+class Hash(MemoryStructure):
+
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.toadd:
+            self.get_value(dict).update(((self.encode(k), self.encode(v))
+                                         for k, v in iteritems(cache.toadd)))
+            result = True
+        if cache.toremove:
+            self.remove(*cache.toremove)
+            result = True
+        return result
+
+    def get(self, key):
+        return (self.value or {}).get(self.encode(key))
+
+    def pop(self, key):
+        with self.client.lock:
+            value = self.value
+            if value is not None:
+                result = value.pop(self.encode(key), None)
+                self.discard_empty()
+                return result
+
+    def remove(self, *fields):
+        with self.client.lock:
+            value = self.value
+            removed = 0
+            if value is not None:
+                for field in fields:
+                    if value.pop(self.encode(field), None) is not None:
+                        removed += 1
+                self.discard_empty()
+            return removed
+
+    def __contains__(self, key):
+        return self.encode(key) in (self.value or ())
+
+    def keys(self):
+        return list(self.value or ())
+
+    def values(self):
+        return list((self.value or {}).values())
+
+    def items(self):
+        return dict(self.value or ())
+
+
+class TS(MemoryStructure):
+    '''Memory timeseries with the semantic of the ts.lua script'''
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.toadd:
+            value = self.get_value(timeseries)
+            for t, v in cache.toadd:
+                value.add(t, self.encode(v))
+        if cache.toremove:
+            raise NotImplementedError('Cannot remove. TSDEL not implemented')
+        return result
+
+    def __contains__(self, timestamp):
+        value = self.value
+        return value is not None and timestamp in value
+
+    def count(self, start, stop):
+        value = self.value
+        return value.count(start, stop) if value is not None else 0
+
+    def times(self, time_start, time_stop, **kwargs):
+        return [t for t, _ in self.range(time_start, time_stop)]
+
+    def itimes(self, start=0, stop=-1, **kwargs):
+        value = self.value
+        return value.itimes(start, stop) if value is not None else []
+
+    def get(self, dte):
+        value = self.value
+        if value is not None:
+            return value.get(dte)
+
+    def rank(self, dte):
+        value = self.value
+        if value is not None:
+            return value.rank(dte)
+
+    def pop(self, dte):
+        return self._call('pop', dte)
+
+    def ipop(self, index):
+        return self._call('ipop', index)
+
+    def range(self, time_start, time_stop, **kwargs):
+        value = self.value
+        return value.range(time_start, time_stop) if value is not None else []
+
+    def irange(self, start=0, stop=-1, **kwargs):
+        value = self.value
+        return value.irange(start, stop) if value is not None else []
+
+    def pop_range(self, time_start, time_stop, **kwargs):
+        return self._call('pop_range', time_start, time_stop) or []
+
+    def ipop_range(self, start=0, stop=-1, **kwargs):
+        return self._call('ipop_range', start, stop) or []
+
+    def _call(self, method, *args):
+        with self.client.lock:
+            value = self.value
+            if value is not None:
+                result = getattr(value, method)(*args)
+                self.discard_empty()
+                return result
+
+
+class NumberArray(MemoryStructure):
+
+    def flush(self):
+        cache = self.instance.cache
+        result = None
+        if cache.back:
+            value = self.get_value(bytearray)
+            for v in cache.back:
+                value.extend(v)
+            result = True
+        return result
+
+    def get(self, index):
+        value = self.value
+        if value is not None and 0 <= index < len(value)//8:
+            return bytes(value[8*index:8*index+8])
+
+    def set(self, index, value):
+        with self.client.lock:
+            data = self.value
+            if data is None or not 0 <= index < len(data)//8:
+                raise IndexError('Index out of range')
+            data[8*index:8*index+8] = value
+
+    def range(self):
+        value = bytes(self.value or b'')
+        return [value[i:i+8] for i in range(0, len(value), 8)]
+
+    def resize(self, size, value=None):
+        with self.client.lock:
+            data = self.get_value(bytearray)
+            n = len(data)//8
+            if size < n:
+                del data[8*size:]
+            else:
+                value = value if value is not None else b'\x00'*8
+                data.extend(value*(size-n))
+            self.discard_empty()
+            return size
+
+    def size(self):
+        return len(self.value or b'')//8
+
+
+############################################################################
+##    MEMORY BACKEND
+############################################################################
+class BackendDataServer(stdnet.BackendDataServer):
+    '''In-memory :class:`stdnet.BackendDataServer`.
+
+The address of the connection string is the name of the
+:class:`stdnet.backends.memoryb.store.Store`, ``local`` if not given.
+Backends with the same address share data::
+
+    from stdnet import getdb
+
+    backend = getdb('memory://local')
+
+A :meth:`execute_session` is applied while holding the store lock so that
+sessions are atomic with respect to other threads.'''
+    Query = MemoryQuery
+    default_port = None
+    struct_map = {'set': Set,
+                  'list': List,
+                  'zset': Zset,
+                  'hashtable': Hash,
+                  'ts': TS,
+                  'numberarray': NumberArray,
+                  'string': String}
+
+    def __init__(self, name=None, address=None, **params):
+        super(BackendDataServer, self).__init__(name, address or 'local',
+                                                **params)
+
+    def setup_connection(self, address):
+        self.models = {}
+        if self.namespace:
+            self.params['namespace'] = self.namespace
+        return get_store(address[0])
+
+    def auto_id_to_python(self, value):
+        return int(value)
+
+    def ping(self):
+        return True
+
+    def meta(self, meta):
+        '''Extract model metadata for the
+:class:`stdnet.backends.memoryb.odm.Model`.'''
+        data = meta.as_dict()
+        data['namespace'] = self.basekey(meta)
+        return data
+
+    def model(self, meta):
+        '''The :class:`stdnet.backends.memoryb.odm.Model` for *meta*.'''
+        model = self.models.get(meta)
+        if model is None:
+            model = Model(self.client, self.meta(meta), self.charset)
+            self.models[meta] = model
+        return model
+
+    def execute_session(self, session_data):
+        '''Execute a session in memory. Instances are validated before any
+change is applied to the store.'''
+        operations = []
+        for sm in session_data:  # loop through model sessions
+            meta = sm.meta
+            if sm.structures:
+                operations.append(partial(self.flush_structure, sm))
+            delquery = None
+            if sm.deletes is not None:
+                delquery = self.backend_query(sm.deletes)
+            self.accumulate_delete(operations, delquery)
+            if sm.dirty:
+                data = []
+                for instance in sm.dirty:
+                    state = instance.get_state()
+                    if not meta.is_valid(instance):
+                        raise FieldValueError(
+                            json.dumps(instance._dbdata['errors']))
+                    score = MIN_FLOAT
+                    if meta.ordering:
+                        if meta.ordering.auto:
+                            score = meta.ordering.name.incrby
+                        else:
+                            v = getattr(instance, meta.ordering.name, None)
+                            if v is not None:
+                                score = meta.ordering.field.scorefun(v)
+                    fields = dict(((k, encode(v, self.charset)) for k, v in
+                                   iteritems(instance._dbdata['cleaned_data'])))
+                    prev_id = state.iid if state.persistent else ''
+                    id = instance.pkvalue() or ''
+                    data.append((state.iid, state.action,
+                                 encode(prev_id, self.charset),
+                                 encode(id, self.charset), score, fields))
+                operations.append(partial(self.commit, meta, data))
+        results = []
+        store = self.client
+        with store.lock:
+            for operation in operations:
+                result = operation()
+                if result is not None:
+                    results.append(result)
+            store.notify()
+        return results
+
+    def commit(self, meta, data):
+        model = self.model(meta)
+        results = []
+        for iid, action, prev_id, id, score, fields in data:
+            id, flag, info = model.commit(action, prev_id, id, score, fields)
+            if flag:
+                results.append(instance_session_result(iid, True, id, False,
+                                                       float(info)))
+            else:
+                results.append(CommitException(info))
+        return session_result(meta, results)
+
+    def delete(self, backend_query):
+        ids = backend_query.odm.delete(list(backend_query.evaluate()))
+        return session_result(backend_query.meta,
+                              [instance_session_result(id, False, id, True, 0)
+                               for id in ids])
+
+    def backend_query(self, query):
+        return query.backend_query()
+
+    def accumulate_delete(self, operations, backend_query):
+        # Accumulate models queries for a delete. It loops through the
+        # related models to build related queries.
+        if not isinstance(backend_query, MemoryQuery):
+            return
+        session = backend_query.session
+        query = backend_query.queryelem
+        meta = query.meta
+        # the query is evaluated when the session is executed
+        operations.append(backend_query.reset)
+        rel_managers = []
+        for name in meta.related:
+            rmanager = getattr(meta.model, name)
+            # the related manager model is the same as current model
+            if rmanager.model == meta.model:
+                operations.append(partial(backend_query.aggregate,
+                                          rmanager.field.attname))
+            # only consider models which are registered with the router
+            elif rmanager.model in session.router:
+                rel_managers.append(rmanager)
+        # loop over related managers
+        for rmanager in rel_managers:
+            # IMPORTANT. delete only if field is required
+            if rmanager.field.required:
+                rq = self.backend_query(rmanager.query_from_query(query))
+                self.accumulate_delete(operations, rq)
+        operations.append(partial(self.delete, backend_query))
+
+    def flush(self, meta=None):
+        '''Flush all keys in the :attr:`namespace`, or the keys of the model
+with *meta* if provided. Return the number of keys removed.'''
+        if meta is None:
+            return self.client.flush(self.namespace)
+        return self.client.flush(self.basekey(meta) + ':')
+
+    def clean(self, meta):
+        # queries do not create temporary keys
+        return 0
+
+    def model_keys(self, meta):
+        return self.client.keys(self.basekey(meta) + ':')
+
+    def index_sizes(self, meta):
+        '''Index sizes of the model with *meta*. The memory is estimated as
+for the redis backend, bitmap indices are stored as sets.'''
+        model = self.model(meta)
+        store = self.client
+        sizes = {}
+        ids = store.get(model.idset)
+        n = len(ids) if ids else 0
+        sizes['id'] = index_size(1 if n else 0, n,
+                                 KEY_BYTES*(1 if n else 0) + n*MEMBER_BYTES)
+        with store.lock:
+            for field in meta.indices:
+                name = field.attname
+                if field.unique:
+                    mapping = store.get(model.map_key(name)) or {}
+                    keys, members = (1 if mapping else 0), len(mapping)
+                else:
+                    index = store.get(model.index_key(name)) or {}
+                    keys = len(index)
+                    members = sum((len(s) for s in index.values()))
+                sizes[name] = index_size(keys, members, keys*KEY_BYTES +
+                                         members*MEMBER_BYTES)
+            for fields in meta.compound_indices:
+                name = meta.compound_name(fields)
+                index = store.get(model.compound_key(name)) or {}
+                keys = len(index)
+                members = sum((len(s) for s in index.values()))
+                sizes[name] = index_size(keys, members, keys*KEY_BYTES +
+                                         members*MEMBER_BYTES)
+        return sizes
+
+    def instance_keys(self, obj):
+        meta = obj._meta
+        keys = [self.basekey(meta, OBJ, obj.pkvalue())]
+        for field in meta.multifields:
+            f = getattr(obj, field.attname)
+            be = self.structure(f)
+            keys.append(be.id)
+        return keys
+
+    def flush_structure(self, sm):
+        for instance in sm.structures:
+            be = self.structure(instance)
+            if instance.action == 'update':
+                be.flush()
+            else:
+                be.delete()
+            instance.cache.clear()
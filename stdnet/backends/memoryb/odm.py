@@ -0,0 +1,436 @@
+'''Object-data mapping of the memory backend.
+
+A python port of the ``odm.lua`` script of the redis backend. The
+:class:`Model` commits instances, maintains indices and evaluates lookups
+on a :class:`stdnet.backends.memoryb.store.Store` with the same keys and the
+same semantic used by the script in redis:
+
+* ``<namespace>:id`` set (zset for ordered models) of ids.
+* ``<namespace>:ids`` counter of auto ids.
+* ``<namespace>:obj:<id>`` hash table of an instance.
+* ``<namespace>:uni:<field>`` mapping of unique values to ids.
+* ``<namespace>:idx:<field>`` mapping of values to sets of ids.
+* ``<namespace>:cidx:<name>`` mapping of compound values to sets of ids.
+'''
+from stdnet.utils import native_str, to_string, iteritems
+from stdnet.utils.exceptions import QuerySetError
+
+from .store import encode, zset
+
+AUTO_ID, COMPOSITE_ID, CUSTOM_ID = 1, 2, 3
+
+
+def _number(value):
+    return float(value)
+
+
+def _text(value):
+    return value
+
+
+def _lower(value):
+    return value.lower()
+
+
+# name: (conversion, test) pairs. Numeric selectors compare floats, text
+# selectors compare the decoded field value.
+range_selectors = {
+    'ge': (_number, lambda v, v1: v >= v1),
+    'gt': (_number, lambda v, v1: v > v1),
+    'le': (_number, lambda v, v1: v <= v1),
+    'lt': (_number, lambda v, v1: v < v1),
+    'startswith': (_text, lambda v, v1: v.startswith(v1)),
+    'endswith': (_text, lambda v, v1: v.endswith(v1)),
+    'contains': (_text, lambda v, v1: v1 in v),
+    'istartswith': (_lower, lambda v, v1: v.startswith(v1)),
+    'iendswith': (_lower, lambda v, v1: v.endswith(v1)),
+    'icontains': (_lower, lambda v, v1: v1 in v)}
+
+
+class RangeSelector(object):
+    '''A range lookup on the value of a field, possibly on a related
+model via *nested* ``(attname, basekey)`` pairs.'''
+    def __init__(self, model, lookup, value, nested):
+        selector = range_selectors.get(lookup)
+        if selector is None:
+            raise QuerySetError('Cannot understand query type "%s".' % lookup)
+        self.model = model
+        self.convert, self.test = selector
+        if self.convert is _number:
+            self.value = float(value)
+        else:
+            self.value = to_string(value)
+        self.nested = nested
+
+    def __call__(self, id):
+        if self.nested:
+            value = self.model.nested_value(id, self.nested)
+        else:
+            value = id
+        if value is None:
+            return False
+        try:
+            if self.convert is _number:
+                value = float(value)
+            else:
+                value = self.convert(to_string(value, self.model.charset))
+        except (ValueError, TypeError):
+            return False
+        return self.test(value, self.value)
+
+
+class Model(object):
+    '''Object-data mapping of a model in a
+:class:`stdnet.backends.memoryb.store.Store`.
+
+:parameter store: the :class:`stdnet.backends.memoryb.store.Store`.
+:parameter meta: the model metadata dictionary returned by
+    :meth:`stdnet.backends.memoryb.BackendDataServer.meta`.
+:parameter charset: the charset of the backend.
+'''
+    def __init__(self, store, meta, charset='utf-8'):
+        self.store = store
+        self.meta = meta
+        self.charset = charset
+        self.namespace = meta['namespace']
+        self.pkname = meta['id_name']
+        self.sorted = bool(meta['sorted'])
+        self.autoincr = bool(meta['autoincr'])
+        self.auto = meta['id_type'] == AUTO_ID
+        self.indices = meta['indices']
+        self.compound = meta['compound']
+        self.multi_fields = meta['multi_fields']
+        self.idset = self.namespace + ':id'
+        self.auto_ids = self.namespace + ':ids'
+
+    def __repr__(self):
+        return self.namespace
+
+    # KEYS
+    def object_key(self, id):
+        return '%s:obj:%s' % (self.namespace, native_str(id, self.charset))
+
+    def map_key(self, field):
+        return '%s:uni:%s' % (self.namespace, field)
+
+    def index_key(self, field):
+        return '%s:idx:%s' % (self.namespace, field)
+
+    def compound_key(self, name):
+        return '%s:cidx:%s' % (self.namespace, name)
+
+    def compound_value(self, values):
+        '''Compound index value of a sequence of *values*. Values are
+prefixed by their length so that different tuples of values never map to
+the same key.'''
+        bits = []
+        for value in values:
+            value = value or b''
+            bits.append(encode(len(value)) + b':' + value)
+        return b''.join(bits)
+
+    # ID SET
+    def ids(self):
+        '''The container of all ids.'''
+        return self.store.get(self.idset) or ()
+
+    def has_id(self, id):
+        return id in self.ids()
+
+    def score(self, id):
+        '''The score of *id* in the id set of an ordered model.'''
+        return self.ids().score(id)
+
+    def sort_ids(self, ids):
+        '''List of *ids* in ascending order of their value.'''
+        if self.auto:
+            return sorted(ids, key=int)
+        return sorted(ids)
+
+    def sort_by_score(self, ids, desc=False):
+        '''List of *ids* ordered by their score, and then by id, as redis
+sorted sets are.'''
+        if not ids:
+            return []
+        score = self.ids().score
+        items = sorted(((score(id), id) for id in ids), reverse=desc)
+        return [id for _, id in items]
+
+    def data(self, id):
+        '''The hash table of the instance with *id* or ``None``.'''
+        return self.store.get(self.object_key(id))
+
+    def add_id(self, id, score):
+        if self.sorted:
+            ids = self.store.get(self.idset, zset)
+            if self.autoincr:
+                score += ids.score(id) or 0
+            ids.add(score, id)
+        else:
+            self.store.get(self.idset, set).add(id)
+        return score
+
+    def remove_id(self, id):
+        ids = self.store.get(self.idset)
+        if ids is not None:
+            if self.sorted:
+                ids.remove(id)
+            else:
+                ids.discard(id)
+            self.store.discard_empty(self.idset)
+
+    # COMMIT AND DELETE
+    def commit(self, action, prev_id, id, score, data):
+        '''Commit an instance and update indices.
+
+:parameter action: ``add``, ``update`` or ``override``.
+:parameter prev_id: the id of the instance in the store or ``b''``.
+:parameter id: the id of the instance or ``b''`` for a new auto id.
+:parameter score: score of the instance for ordered models.
+:parameter data: dictionary of field values.
+:return: a three elements tuple ``(id, flag, info)`` where ``info`` is the
+    score when ``flag`` is ``True``, otherwise an error message.'''
+        store = self.store
+        created_id = False
+        if self.auto:
+            if not id:
+                created_id = True
+                id = store.incr(self.auto_ids)
+            else:
+                id = int(id)
+                if store.get(self.auto_ids, int) < id:
+                    store.set(self.auto_ids, id)
+            id = encode(id)
+        if not id:
+            return id, False, 'Id not available. Cannot commit.'
+        # If no previous id force the action to be add
+        if not prev_id:
+            prev_id = id
+            action = 'add'
+        snapshot = self._snapshot(prev_id, id)
+        if action != 'add':
+            self.update_indices(False, prev_id)
+            # when overriding, remove all data from previous hash table
+            # only if the previous id is the same as the current one.
+            if action == 'override' and prev_id == id:
+                store.delete(self.object_key(id))
+        if id != prev_id:
+            self.remove_id(prev_id)
+        score = self.add_id(id, score)
+        if data:
+            store.get(self.object_key(id), dict).update(data)
+        errors = self.update_indices(True, id, prev_id)
+        if errors:
+            # An error has occurred. Rollback changes.
+            self.update_indices(False, id)
+            self._rollback(snapshot)
+            if created_id:
+                store.incr(self.auto_ids, -1)
+            return b'' if created_id else prev_id, False, errors[0]
+        return id, True, score
+
+    def delete(self, ids):
+        '''Delete instances with *ids* and return the list of ids of
+instances which were available.'''
+        store = self.store
+        results = []
+        for id in ids:
+            idkey = self.object_key(id)
+            self.update_indices(False, id)
+            num = store.delete(idkey)
+            self.remove_id(id)
+            for name in self.multi_fields:
+                store.delete('%s:%s' % (idkey, name))
+            if num:
+                results.append(id)
+        return results
+
+    def aggregate(self, ids, field):
+        '''Add to the set of *ids* the ids of instances related recursively
+via the self-referencing *field*.'''
+        processed = set()
+        for id in list(ids):
+            self._aggregate(ids, id, field, processed)
+        return ids
+
+    def update_indices(self, update, id, oldid=None):
+        '''Add (*update* is ``True``) or remove the instance with *id* from
+indices. Return a list of unique constraint errors.'''
+        store = self.store
+        errors = []
+        data = self.data(id) or {}
+        for field, unique in iteritems(self.indices):
+            value = data.get(field)
+            if unique:
+                key = self.map_key(field)
+                if update:
+                    if value is None:
+                        continue
+                    mapping = store.get(key, dict)
+                    stored_id = mapping.get(value)
+                    if (stored_id is not None and stored_id not in (id, oldid)
+                            and self.has_id(stored_id)):
+                        # remove the field from the instance hash table so
+                        # that removing indices won't delete the mapping.
+                        data.pop(field)
+                        errors.append('Unique constraint "%s" violated: "%s" '
+                                      'is already in database.' %
+                                      (field, to_string(value, self.charset)))
+                    else:
+                        mapping[value] = id
+                elif value is not None:
+                    mapping = store.get(key)
+                    if mapping is not None and mapping.get(value) == id:
+                        mapping.pop(value)
+                        store.discard_empty(key)
+            else:
+                self._set_index(self.index_key(field), value or b'', id,
+                                update)
+        # compound indices are updated only when unique constraints are met
+        if not update or not errors:
+            for name, fields in iteritems(self.compound):
+                value = self.compound_value([data.get(f) for f in fields])
+                self._set_index(self.compound_key(name), value, id, update)
+        return errors
+
+    # QUERIES
+    def query(self, field, lookups, candidates=None):
+        '''Set of ids matching *lookups* on *field*.
+
+:parameter lookups: list of ``(lookup, value)`` pairs where lookup is
+    ``value`` for an encoded field value, ``set`` for an iterable over
+    encoded values, ``compound`` for a tuple of encoded values of a compound
+    index, otherwise a range lookup with value given by a
+    ``(value, nested)`` pair.
+:parameter candidates: optional set of ids. If given, the result is
+    restricted to these ids.'''
+        ids = None
+        ranges = []
+        for lookup, value in lookups:
+            if lookup == 'compound':
+                ids = ids if ids is not None else set()
+                index = self.store.get(self.compound_key(field)) or {}
+                ids.update(index.get(self.compound_value(value), ()))
+            elif lookup == 'value':
+                ids = ids if ids is not None else set()
+                ids.update(self._value_ids(field, value))
+            elif lookup == 'set':
+                ids = ids if ids is not None else set()
+                for v in value:
+                    ids.update(self._value_ids(field, v))
+            else:
+                value, nested = value
+                nested = list(nested or ())
+                if field != self.pkname:
+                    nested.append(field)
+                ranges.append(RangeSelector(self, lookup, value, nested))
+        if ids is None:
+            if not ranges:
+                return set()
+            ids = candidates if candidates is not None else self.ids()
+        elif candidates is not None:
+            ids.intersection_update(candidates)
+        if ranges:
+            ids = set((id for id in ids if self._select(id, ranges)))
+        return ids
+
+    def nested_value(self, id, nested):
+        '''Value of a field obtained by following the *nested* list of
+field names and related model base keys, starting from the instance with
+*id*.'''
+        key = self.object_key(id)
+        value = None
+        for n, name in enumerate(nested):
+            if n % 2:
+                if value is None:
+                    return None
+                key = '%s:obj:%s' % (name, native_str(value, self.charset))
+            else:
+                value = (self.store.get(key) or {}).get(name)
+        return value
+
+    def index_ids(self, field, value):
+        '''Set of ids in the index of *field* for *value*.'''
+        index = self.store.get(self.index_key(field)) or {}
+        return index.get(value, ())
+
+    # INTERNALS
+    def _value_ids(self, field, value):
+        if value is None:
+            return ()
+        if field == self.pkname:
+            return (value,) if self.has_id(value) else ()
+        unique = self.indices.get(field)
+        if unique:
+            id = (self.store.get(self.map_key(field)) or {}).get(value)
+            return (id,) if id is not None and self.has_id(id) else ()
+        elif unique is False:
+            return self.index_ids(field, value)
+        else:
+            raise QuerySetError('Cannot query on field "%s". Not an index.'
+                                % field)
+
+    def _select(self, id, ranges):
+        for selector in ranges:
+            if not selector(id):
+                return False
+        return True
+
+    def _set_index(self, key, value, id, add):
+        store = self.store
+        if add:
+            index = store.get(key, dict)
+            ids = index.get(value)
+            if ids is None:
+                ids = index[value] = set()
+            ids.add(id)
+        else:
+            index = store.get(key)
+            if index is not None:
+                ids = index.get(value)
+                if ids is not None:
+                    ids.discard(id)
+                    if not ids:
+                        index.pop(value)
+                store.discard_empty(key)
+
+    def _aggregate(self, ids, id, field, processed):
+        if id not in processed:
+            processed.add(id)
+            for rid in list(self.index_ids(field, id)):
+                if self.has_id(rid):
+                    ids.add(rid)
+                    self._aggregate(ids, rid, field, processed)
+
+    def _snapshot(self, *ids):
+        # State of the hash tables and of the id set entries of *ids*
+        all_ids = self.ids()
+        snapshot = []
+        for id in set(ids):
+            data = self.data(id)
+            if data is not None:
+                data = dict(data)
+            if self.sorted:
+                member = all_ids.score(id) if all_ids else None
+            else:
+                member = True if id in all_ids else None
+            snapshot.append((id, data, member))
+        return snapshot
+
+    def _rollback(self, snapshot):
+        store = self.store
+        for id, data, member in snapshot:
+            key = self.object_key(id)
+            if data is None:
+                store.delete(key)
+            else:
+                store.set(key, data)
+            if member is None:
+                self.remove_id(id)
+            else:
+                if self.sorted:
+                    store.get(self.idset, zset).add(member, id)
+                else:
+                    store.get(self.idset, set).add(id)
+                if data is not None:
+                    self.update_indices(True, id)
@@ -0,0 +1,288 @@
+'''In-process keyspace of the memory backend.
+
+A :class:`Store` maps keys to python containers playing the role of the
+redis data types: ``set`` for sets, :class:`zset` for sorted sets, ``list``
+for lists, ``dict`` for hashes, :class:`timeseries` for timeseries and
+``bytearray`` for strings. Backends connected to the same store name share
+the same data, as clients connected to the same redis server do.
+'''
+from bisect import bisect_left, bisect_right
+from threading import RLock, Condition
+
+from stdnet.utils import string_type
+from stdnet.utils import zset as zset_module
+
+
+__all__ = ['Store', 'get_store', 'zset', 'timeseries', 'encode',
+           'rank_slice', 'score_range']
+
+
+_stores = {}
+_stores_lock = RLock()
+
+
+def get_store(name):
+    '''The :class:`Store` called *name*, created if not available.'''
+    with _stores_lock:
+        store = _stores.get(name)
+        if store is None:
+            store = _stores[name] = Store(name)
+        return store
+
+
+def encode(value, charset='utf-8'):
+    '''Encode *value* into bytes as the redis client does when sending
+arguments to the server.'''
+    if isinstance(value, bytes):
+        return value
+    elif isinstance(value, float):
+        return repr(value).encode('ascii')
+    elif isinstance(value, string_type):
+        return value.encode(charset)
+    else:
+        return str(value).encode('ascii')
+
+
+def rank_slice(size, start, stop):
+    '''Convert the inclusive *start* and *stop* ranks, which can be
+negative as in redis ``ZRANGE``, into the bounds of a python slice.'''
+    start, stop = int(start), int(stop)
+    if start < 0:
+        start = max(size + start, 0)
+    if stop < 0:
+        stop += size
+    stop = min(stop, size - 1)
+    if start > stop:
+        return 0, 0
+    return start, stop + 1
+
+
+def score_bound(value):
+    '''Two elements tuple with the float value of a redis score bound and
+a flag indicating if the bound is exclusive.'''
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    if isinstance(value, string_type) and value.startswith('('):
+        return float(value[1:]), True
+    return float(value), False
+
+
+def score_range(start, stop):
+    '''A function checking if a score is between *start* and *stop*.'''
+    start, exstart = score_bound(start)
+    stop, exstop = score_bound(stop)
+
+    def _(score):
+        if score < start or (exstart and score == start):
+            return False
+        return not (score > stop or (exstop and score == stop))
+    return _
+
+
+class zset(zset_module.zset):
+    '''A :class:`stdnet.utils.zset.zset` ordered by score and then by
+value, as redis sorted sets are. The skiplist is keyed on ``(score, value)``
+pairs so that values with the same score are ranked and removed correctly.'''
+    def __iter__(self):
+        for _, value in self._sl:
+            yield value
+
+    def __contains__(self, value):
+        return value in self._dict
+
+    def items(self):
+        for key, _ in self._sl:
+            yield key
+
+    def add(self, score, val):
+        r = 1
+        if val in self._dict:
+            sc = self._dict[val]
+            if sc == score:
+                return 0
+            self._sl.remove((sc, val))
+            r = 0
+        self._dict[val] = score
+        self._sl.insert((score, val), val)
+        return r
+
+    def remove(self, item):
+        score = self._dict.pop(item, None)
+        if score is not None:
+            self._sl.remove((score, item))
+            return score
+
+    def rank(self, item):
+        score = self._dict.get(item)
+        if score is not None:
+            return self._sl.rank((score, item))
+
+    def score(self, item):
+        '''The score of *item* or ``None``.'''
+        return self._dict.get(item)
+
+    def flat(self):
+        result = []
+        for score, value in self.items():
+            result.extend((score, value))
+        return tuple(result)
+
+    def irange(self, start=0, stop=-1, desc=False):
+        '''List of ``(score, value)`` pairs between ranks *start* and
+*stop* included.'''
+        items = list(self.items())
+        if desc:
+            items.reverse()
+        start, stop = rank_slice(len(items), start, stop)
+        return items[start:stop]
+
+    def range(self, start, stop, desc=False):
+        '''List of ``(score, value)`` pairs with scores between *start*
+and *stop*.'''
+        check = score_range(start, stop)
+        items = [item for item in self.items() if check(item[0])]
+        if desc:
+            items.reverse()
+        return items
+
+
+class timeseries(object):
+    '''An ordered associative container of timestamps and values, with the
+semantic of the ``ts_commands`` script of the redis backend.'''
+    def __init__(self):
+        self.times = []
+        self.values = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, timestamp):
+        return float(timestamp) in self.values
+
+    def add(self, timestamp, value):
+        timestamp = float(timestamp)
+        if timestamp not in self.values:
+            self.times.insert(bisect_left(self.times, timestamp), timestamp)
+        self.values[timestamp] = value
+
+    def rank(self, timestamp):
+        timestamp = float(timestamp)
+        if timestamp in self.values:
+            return bisect_left(self.times, timestamp)
+
+    def get(self, timestamp):
+        return self.values.get(float(timestamp))
+
+    def pop(self, timestamp):
+        timestamp = float(timestamp)
+        if timestamp in self.values:
+            self.times.remove(timestamp)
+            return self.values.pop(timestamp)
+
+    def ipop(self, index):
+        result = self.ipop_range(index, index)
+        if result:
+            return result[0][1]
+
+    def times_range(self, start, stop):
+        times = self.times
+        return times[bisect_left(times, float(start)):
+                     bisect_right(times, float(stop))]
+
+    def itimes(self, start=0, stop=-1):
+        start, stop = rank_slice(len(self.times), start, stop)
+        return self.times[start:stop]
+
+    def range(self, start, stop):
+        values = self.values
+        return [(t, values[t]) for t in self.times_range(start, stop)]
+
+    def irange(self, start=0, stop=-1):
+        values = self.values
+        return [(t, values[t]) for t in self.itimes(start, stop)]
+
+    def count(self, start, stop):
+        return len(self.times_range(start, stop))
+
+    def pop_range(self, start, stop):
+        return self._remove(self.range(start, stop))
+
+    def ipop_range(self, start=0, stop=-1):
+        return self._remove(self.irange(start, stop))
+
+    def _remove(self, items):
+        for t, _ in items:
+            self.times.remove(t)
+            self.values.pop(t)
+        return items
+
+
+class Store(object):
+    '''A keyspace shared by the memory backends with the same name.
+
+.. attribute:: data
+
+    Dictionary of keys and containers.
+
+.. attribute:: lock
+
+    Reentrant lock held while sessions are applied, so that they are
+    atomic with respect to other threads.
+'''
+    def __init__(self, name):
+        self.name = name
+        self.data = {}
+        self.lock = RLock()
+        self.condition = Condition(self.lock)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, factory=None):
+        '''The value at *key*. If not available and *factory* is given, a
+new value is created with it and stored.'''
+        value = self.data.get(key)
+        if value is None and factory is not None:
+            value = self.data[key] = factory()
+        return value
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        '''Remove *keys* and return the number of keys removed.'''
+        data = self.data
+        return len([k for k in keys if data.pop(k, None) is not None])
+
+    def discard_empty(self, key):
+        '''Remove *key* if its container is empty, as redis does.'''
+        value = self.data.get(key)
+        if value is not None and not len(value):
+            self.data.pop(key)
+
+    def keys(self, prefix=''):
+        '''List of keys starting with *prefix*.'''
+        return [k for k in self.data if k.startswith(prefix)]
+
+    def flush(self, prefix=''):
+        '''Remove all keys starting with *prefix* and return their
+number.'''
+        with self.lock:
+            keys = self.keys(prefix)
+            return self.delete(*keys)
+
+    def incr(self, key, amount=1):
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = value
+        return value
+
+    def notify(self):
+        '''Wake up threads waiting for an element of a list.'''
+        with self.condition:
+            self.condition.notify_all()
@@ -1,23 +1,51 @@
 '''Redis backend implementation'''
+import re
 import json
+from hashlib import sha1
 from functools import partial
+from collections import namedtuple
+from timeit import default_timer
 
 from .client import *
+from .client.extensions import SCAN_COUNT, redis
 
 import stdnet
-from stdnet import FieldValueError, CommitException, QuerySetError
-from stdnet.utils import (gen_unique_id, zip, ispy3k,
+from stdnet import (FieldValueError, CommitException, QuerySetError,
+                    ImproperlyConfigured)
+from stdnet.utils import (gen_unique_id, zip, ispy3k, iteritems,
                           native_str, flat_mapping, unique_tuple)
+from stdnet.utils.structures import OrderedDict
+from stdnet.utils.instrument import instrument_event
 from stdnet.backends import (BackendStructure, session_result,
-                             instance_session_result)
+                             instance_session_result, Page, encode_cursor,
+                             decode_cursor, index_size)
 
 MIN_FLOAT = -1.e99
+CrossSlotQuery = namedtuple('CrossSlotQuery', 'query_key')
 
 ############################################################################
 #    prefixes for data
 OBJ = 'obj'     # the hash table for a instance
 TMP = 'tmp'     # temorary key
 ODM_SCRIPTS = ('odmrun', 'move2set', 'zdiffstore')
+SELECT_OPS = {'intersect': 'and', 'union': 'or', 'diff': 'diff'}
+# hash tag of keys in Redis Cluster: one slot per model or per namespace
+CLUSTER_MODES = ('model', 'namespace')
+# comments, long strings, string and numeric literals in where clauses
+WHERE_CONSTANTS = re.compile(r'(--\[(=*)\[.*?\]\2\]|--(?!\[=*\[)[^\n]*)|'
+                             r'\[(=*)\[\n?(.*?)\]\3\]|'
+                             r'''("(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')|'''
+                             r'(?<![\w.])(0[xX][0-9a-fA-F]+|'
+                             r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)(?![\w.])',
+                             re.DOTALL)
+# opening of a long string or comment without the closing bracket
+WHERE_UNFINISHED = re.compile(r'\[=*\[')
+LUA_ESCAPES = re.compile(r'\\(\d{1,3}|.)', re.DOTALL)
+LUA_ESCAPE_CHARS = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r',
+                    't': '\t', 'v': '\v'}
+# rough memory overhead, in bytes, of a key and of a set or hash member
+KEY_BYTES = 64
+MEMBER_BYTES = 48
 ############################################################################
 
 if ispy3k:
@@ -74,14 +102,29 @@ class odmrun(RedisScript):
                 yield CommitException(msg)
 
     def load_query(self, response, backend, meta, get=None, fields=None,
-                   fields_attributes=None, redis_client=None, **options):
+                   fields_attributes=None, redis_client=None, page=None,
+                   **options):
         if get:
             tpy = meta.dfields.get(get).to_python
             return [tpy(v, backend) for v in response]
+        elif page:
+            data, related, cursors = response
+            cursors = json.loads(cursors.decode(redis_client.encoding))
+            items = self.load_query((data, related), backend, meta,
+                                    fields=fields,
+                                    fields_attributes=fields_attributes,
+                                    redis_client=redis_client)
+            cursors = dict(((k, encode_cursor(page['kind'], *v)) for k, v
+                            in iteritems(cursors) if v))
+            return Page(items, **cursors)
         else:
             data, related = response
             encoding = redis_client.encoding
             data = self.build(data, meta, fields, fields_attributes, encoding)
+            if backend.tracer is not None:
+                # parse eagerly so that parsing is not timed in the
+                # odm.make_objects span
+                data = list(data)
             related_fields = {}
             if related:
                 for fname, rdata, fields in related:
@@ -121,6 +164,90 @@ class odmrun(RedisScript):
             return self.build(data, meta, fields, fields, encoding)
 
 
+def _lua_escape(match):
+    c = match.group(1)
+    if c.isdigit():
+        return chr(int(c))
+    return LUA_ESCAPE_CHARS.get(c, c)
+
+
+def compile_where(code):
+    '''Compile a :meth:`stdnet.odm.Query.where` *code* into a two elements
+tuple containing the clause, where string and numeric literals are replaced by
+script arguments, and the tuple of arguments. Comments are removed and
+long strings, ``[[...]]``, are arguments too.'''
+    constants = []
+
+    def hoist(match):
+        comment, _, _, long_string, string, number = match.groups()
+        if comment:
+            return ' '
+        elif long_string is not None:
+            constants.append('s' + long_string)
+        elif string:
+            constants.append('s' + LUA_ESCAPES.sub(_lua_escape, string[1:-1]))
+        else:
+            constants.append('n' + number)
+        return '__args[%s]' % len(constants)
+    clause = WHERE_CONSTANTS.sub(hoist, code)
+    if WHERE_UNFINISHED.search(clause):
+        raise QuerySetError('Unfinished long string or comment in where '
+                            'clause "%s"' % code)
+    return clause, tuple(constants)
+
+
+class where_script(RedisScript):
+    '''A :meth:`stdnet.odm.Query.where` clause compiled into a lua script
+together with its execution statistics.'''
+    abstract = True
+
+    def __init__(self, clause):
+        script = str(read_lua_file('where', context={'where_clause': clause}))
+        name = 'where.%s' % sha1(script.encode('utf-8')).hexdigest()
+        super(where_script, self).__init__(script, name)
+        self.clause = clause
+        self.stats = {'calls': 0, 'scanned': 0}
+
+    def callback(self, response, **options):
+        stats = self.stats
+        stats['calls'] += 1
+        stats['scanned'] += response
+        return response
+
+
+class WhereScripts(object):
+    '''A LRU cache of :class:`where_script` with at most *max_size*
+compiled clauses.'''
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.scripts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.scripts)
+
+    def get(self, code):
+        '''Return the :class:`where_script` for *code* and the arguments
+to execute it with.'''
+        clause, args = compile_where(code)
+        script = self.scripts.pop(clause, None)
+        if script is None:
+            self.misses += 1
+            script = where_script(clause)
+            while self.scripts and len(self.scripts) >= self.max_size:
+                self.scripts.popitem(last=False)
+        else:
+            self.hits += 1
+        self.scripts[clause] = script
+        return script, args
+
+    def stats(self):
+        '''Dictionary of execution statistics for each cached clause.'''
+        return dict(((clause, script.stats.copy()) for clause, script
+                     in iteritems(self.scripts)))
+
+
 class check_structures(RedisScript):
     script = read_lua_file('structures')
 
@@ -154,32 +281,54 @@ class RedisQuery(stdnet.BackendQuery):
         backend = self.backend
         key, meta, keys, args = None, self.meta, [], []
         pkname = meta.pkname()
-        for child in qs:
-            if getattr(child, 'backend', None) == backend:
+        bitmaps = meta.bitmaps
+        plan = self.bitmap_plan(qs, args, bitmaps) if bitmaps else None
+        children = () if plan or qs.keyword == 'expression' else qs
+        if bitmaps and not plan and qs.keyword in SELECT_OPS:
+            children = self.group_bitmaps(qs, bitmaps)
+        for child in children:
+            if self.is_query(child):
                 lookup, value = 'set', child
             else:
                 lookup, value = child
             if lookup == 'set':
-                be = value.backend_query(pipe=pipe)
+                be = self.child_query(value, pipe)
                 keys.append(be.query_key)
                 args.extend(('set', be.query_key))
+            elif lookup == 'compound':
+                args.append(lookup)
+                args.extend(('' if v is None else v for v in value))
             else:
                 if isinstance(value, tuple):
                     value = self.dump_nested(*value)
                 args.extend((lookup, '' if value is None else value))
         temp_key = True
-        if qs.keyword == 'set':
+        if plan:
+            key = backend.tempkey(meta)
+            self.phases.append('bitmap')
+            backend.odmrun(pipe, 'bitmap', meta, (key,), self.meta_info,
+                           json.dumps(plan), *args)
+        elif qs.keyword == 'expression':
+            key = backend.tempkey(meta)
+            keys.append(key)
+            plan = self.expression_plan(qs.underlying[0], keys, args, pipe)
+            self.phases.append('expression')
+            backend.odmrun(pipe, 'expression', meta, keys, self.meta_info,
+                           json.dumps(plan), *args)
+        elif qs.keyword == 'set':
             if qs.name == pkname and not args:
                 key = backend.basekey(meta, 'id')
                 temp_key = False
             else:
                 key = backend.tempkey(meta)
                 keys.insert(0, key)
+                self.phases.append('query')
                 backend.odmrun(pipe, 'query', meta, keys, self.meta_info,
-                               qs.name, *args)
+                               qs.name, *args, query=qs)
         else:
             key = backend.tempkey(meta)
             p = 'z' if meta.ordering else 's'
+            self.phases.extend(('move2set', qs.keyword))
             pipe.execute_script('move2set', keys, p)
             if qs.keyword == 'intersect':
                 command = getattr(pipe, p+'interstore')
@@ -201,6 +350,7 @@ class RedisQuery(stdnet.BackendQuery):
             # Second key is the destination key (which can be the current
             # key if it is temporary key)
             keys.insert(0, key)
+            self.phases.append('where')
             backend.where_run(pipe, self.meta_info, keys, *where)
         #
         # If we are getting a field (for a subsequent query maybe)
@@ -213,12 +363,125 @@ class RedisQuery(stdnet.BackendQuery):
                 temp_key = True
                 key = backend.tempkey(meta)
             okey = backend.basekey(meta, OBJ, '*->' + field_attribute)
+            self.phases.append('sort')
             pipe.sort(bkey, by='nosort', get=okey, store=key)
             self.card = getattr(pipe, 'llen')
         if temp_key:
             pipe.expire(key, self.expire)
         self.query_key = key
 
+    def bitmap_plan(self, elem, args, bitmaps):
+        '''Build the plan for the ``bitmap`` lua command if *elem* can be
+evaluated from bitmap indices only, otherwise return ``None``. Field values
+are appended to *args* and referred to by position in the plan.'''
+        if elem.keyword == 'set':
+            if elem.name not in bitmaps or not elem.underlying:
+                return None
+            positions = []
+            for child in elem:
+                if not isinstance(child, tuple) or child[0] != 'value':
+                    return None
+                args.append('' if child[1] is None else child[1])
+                positions.append(len(args))
+            return {'field': elem.name, 'values': positions}
+        elif elem.keyword in SELECT_OPS:
+            plans = []
+            for child in elem:
+                if not self.bitmap_child(child):
+                    return None
+                plan = self.bitmap_plan(child, args, bitmaps)
+                if plan is None:
+                    return None
+                plans.append(plan)
+            return {'op': SELECT_OPS[elem.keyword], 'args': plans}
+
+    def bitmap_child(self, elem):
+        return (self.is_query(elem) and
+                elem.meta is self.meta and not elem.data.get('where') and
+                not elem._get_field)
+
+    def expression_plan(self, elem, keys, args, pipe):
+        '''Build the plan for the ``expression`` lua command which evaluates
+the tree of query elements *elem* with one script call. Field values are
+appended to *args* and keys of subqueries to *keys*, and referred to by
+position in the plan.'''
+        if elem.keyword in SELECT_OPS:
+            plans = [self.expression_plan(c, keys, args, pipe) for c in elem]
+            if elem.keyword == 'intersect':
+                # evaluate index lookups first, range lookups on the result
+                plans.sort(key=lambda p: 1 if 'ranges' in p and
+                           not (p['values'] or p['keys'] or
+                                p['compound']) else 0)
+            return {'op': SELECT_OPS[elem.keyword], 'args': plans}
+        elif elem.keyword == 'set' and self.is_query(elem):
+            if elem.name == self.meta.pkname() and not elem.underlying:
+                return {'all': True}
+            plan = {'field': elem.name, 'values': [], 'keys': [],
+                    'compound': [], 'ranges': []}
+            for child in elem:
+                if self.is_query(child):
+                    lookup, value = 'set', child
+                else:
+                    lookup, value = child
+                if lookup == 'set':
+                    be = self.child_query(value, pipe)
+                    keys.append(be.query_key)
+                    plan['keys'].append(len(keys))
+                elif lookup == 'compound':
+                    positions = []
+                    for v in value:
+                        args.append('' if v is None else v)
+                        positions.append(len(args))
+                    plan['compound'].append(positions)
+                elif lookup == 'value':
+                    args.append('' if value is None else value)
+                    plan['values'].append(len(args))
+                else:
+                    args.append(self.dump_nested(*value))
+                    plan['ranges'].append((lookup, len(args)))
+            return plan
+        else:
+            # any other query is evaluated with its own key
+            be = self.child_query(elem, pipe)
+            keys.append(be.query_key)
+            return {'key': len(keys)}
+
+    def is_query(self, elem):
+        '''``True`` if *elem* is a query element of the backend of this
+query rather than a lookup tuple.'''
+        return getattr(elem, 'backend', None) == self.queryelem.backend
+
+    def child_query(self, elem, pipe):
+        '''The :class:`RedisQuery` of the nested query *elem*, accumulated
+in *pipe*. In :ref:`cluster mode <redis-cluster>`, a query on a model with a
+different hash tag is evaluated first and its result copied into a key of
+this model slot.'''
+        backend = self.backend
+        if backend.cluster and (backend.hash_tag(elem.meta) !=
+                                backend.hash_tag(self.meta)):
+            query = backend.cross_slot_query(self.meta, elem, pipe)
+        else:
+            query = elem.backend_query(pipe=pipe)
+        # phases of nested queries are executed by this query
+        self.phases.extend(getattr(query, 'phases', ()))
+        return query
+
+    def group_bitmaps(self, qs, bitmaps):
+        '''Group the children of a select query which can be evaluated from
+bitmap indices into a single select, so that they are combined with one
+``bitmap`` lua command.'''
+        children = list(qs)
+        start, keyword = 0, qs.keyword
+        if keyword == 'diff':
+            start, keyword = 1, 'union'
+        grouped = [c for c in children[start:] if self.bitmap_child(c) and
+                   self.bitmap_plan(c, [], bitmaps)]
+        if len(grouped) > 1:
+            children = [c for c in children if c not in grouped]
+            children.append(qs.__class__(qs.meta, qs.session, keyword=keyword,
+                                         underlying=grouped))
+        return children
+
     def _execute_query(self):
         '''Execute the query without fetching data. Returns the number of
 elements in the query.'''
@@ -308,13 +571,49 @@ elements in the query.'''
         elif stop is None:
             stop = -1
         get = self.queryelem._get_field
+        if get and slic:
+            raise QuerySetError('Cannot slice a queryset in conjunction '
+                                'with get_field. Use load_only instead.')
+        return self._load({'ordering': name,
+                           'order': order,
+                           'start': start,
+                           'stop': stop,
+                           'get': get})
+
+    def _page(self, cursor, limit, backward):
+        meta = self.meta
+        ordering = self.queryelem.ordering
+        if self.queryelem._get_field:
+            raise QuerySetError('Cannot paginate a queryset in conjunction '
+                                'with get_field. Use load_only instead.')
+        if ordering:
+            if not (meta.ordering and ordering.name == meta.ordering.name and
+                    not ordering.nested):
+                raise QuerySetError('Keyset pagination is available for the '
+                                    'model ordering only')
+        else:
+            ordering = meta.ordering
+        if ordering:
+            page = {'kind': 'z', 'desc': ordering.desc}
+        elif backward:
+            raise QuerySetError('Backward pagination is available for '
+                                'ordered models only')
+        else:
+            page = {'kind': 's'}
+        if cursor is not None:
+            page['cursor'] = decode_cursor(cursor, page['kind'])
+        page.update({'limit': limit, 'backward': backward})
+        return self._load({'page': page})
+
+    def _load(self, options):
+        # Load the query via the load_query lua script
+        backend = self.backend
+        meta = self.meta
+        get = options.get('get')
         fields_attributes = None
         pkname_tuple = (meta.pk.name,)
         # if the get_field is available, we only load that field
         if get:
-            if slic:
-                raise QuerySetError('Cannot slice a queryset in conjunction '
-                                    'with get_field. Use load_only instead.')
             if get == meta.pk.name:
                 fields_attributes = fields = pkname_tuple
             else:
@@ -330,16 +629,15 @@ elements in the query.'''
                 fields, fields_attributes = meta.backend_fields(fields)
             else:
                 fields_attributes = ()
-        options = {'ordering': name,
-                   'order': order,
-                   'start': start,
-                   'stop': stop,
-                   'fields': fields_attributes,
-                   'related': dict(self.related_lua_args()),
-                   'get': get}
+        options.update({'fields': fields_attributes,
+                        'related': dict(self.related_lua_args())})
+        phase = 'page' if 'page' in options else 'load'
+        if phase not in self.phases:
+            self.phases.append(phase)
         joptions = json.dumps(options)
         options.update({'fields': fields,
-                        'fields_attributes': fields_attributes})
+                        'fields_attributes': fields_attributes,
+                        'query': self.queryelem})
         return backend.odmrun(backend.client, 'load', meta, (self.query_key,),
                               self.meta_info, joptions, **options)
 
@@ -717,8 +1015,21 @@ end''')
 ##    REDIS BACKEND
 ############################################################################
 class BackendDataServer(stdnet.BackendDataServer):
+    '''Redis :class:`stdnet.BackendDataServer`.
+
+    .. attribute:: where_scripts
+
+        The :class:`WhereScripts` cache of compiled
+        :meth:`stdnet.odm.Query.where` clauses, shared by all redis backends.
+
+    .. attribute:: cluster
+
+        The hash tag mode, ``model`` or ``namespace``, when connected to a
+        :ref:`Redis Cluster <redis-cluster>`, otherwise ``None``.
+    '''
     Query = RedisQuery
-    _redis_clients = {}
+    cluster = None
+    where_scripts = WhereScripts()
     default_port = 6379
     struct_map = {'set': Set,
                   'list': List,
@@ -735,43 +1046,155 @@ class BackendDataServer(stdnet.BackendDataServer):
             address = address[0]
         if 'db' not in self.params:
             self.params['db'] = 0
-        rpy = redis_client(address=address, **self.params)
+        coalesce = self.params.pop('coalesce', None)
+        cluster = self.params.pop('cluster', None)
+        if cluster:
+            if cluster not in CLUSTER_MODES:
+                raise ImproperlyConfigured('cluster must be one of %s' %
+                                           ', '.join(CLUSTER_MODES))
+            if int(self.params['db']):
+                raise ImproperlyConfigured('Redis Cluster supports database '
+                                           '0 only')
+            self.cluster = cluster
+            rpy = redis_client(address=address, cluster=True, **self.params)
+            self.params['cluster'] = cluster
+        else:
+            rpy = redis_client(address=address, **self.params)
         if self.namespace:
             self.params['namespace'] = self.namespace
+        if coalesce is not None:
+            self.params['coalesce'] = coalesce
+            self.coalescer = rpy.read_coalescer(0.001*float(coalesce))
         return rpy
 
     def auto_id_to_python(self, value):
         return int(value)
 
+    def setup_model(self, meta):
+        '''Load the odm scripts in the server so that the first session
+does not wait for them. If the server is not available, or it refuses the
+scripts, they are loaded when first executed.'''
+        try:
+            return self.client.preload_scripts(('odmrun',))
+        except redis.RedisError:
+            pass
+
     def is_async(self):
         return self.client.is_async
 
+    def execute_async(self, result, callback=None):
+        return self.client.execute_async(result, callback)
+
     def ping(self):
         return self.client.ping()
 
+    def replication_offset(self):
+        '''The ``master_repl_offset`` of a master or the
+``slave_repl_offset`` of a replica, from ``INFO replication``. ``None`` when
+the replica is disconnected from its master.'''
+        info = self.client.info('replication').get('Replication', {})
+        if info.get('role') == 'slave':
+            if info.get('master_link_status') != 'up':
+                return None
+            return info.get('slave_repl_offset')
+        return info.get('master_repl_offset')
+
     def disconnect(self):
         self.client.connection_pool.disconnect()
 
+    def set_instrument(self, instrument):
+        super(BackendDataServer, self).set_instrument(instrument)
+        self.client.instrument = instrument
+
+    def set_recorder(self, recorder):
+        super(BackendDataServer, self).set_recorder(recorder)
+        self.client.recorder = recorder
+
+    def set_tracer(self, tracer):
+        super(BackendDataServer, self).set_tracer(tracer)
+        self.client.tracer = tracer
+
+    def pool_stats(self):
+        '''The :attr:`~.client.pool.ConnectionPool.stats` of the connection
+pool, shared by all backends with the same connection parameters.'''
+        return self.client.connection_pool.stats
+
     def meta(self, meta):
         '''Extract model metadata for lua script stdnet/lib/lua/odm.lua'''
         data = meta.as_dict()
         data['namespace'] = self.basekey(meta)
         return data
 
+    def basekey(self, meta, *args):
+        key = super(BackendDataServer, self).basekey(meta, *args)
+        if self.cluster:
+            tag = self.hash_tag(meta)
+            if self.cluster == 'model':
+                key = '{%s}%s' % (tag, key[len(tag):])
+            else:
+                key = '{%s}%s' % (tag, key[len(self.namespace):])
+        return key
+
+    def hash_tag(self, meta):
+        '''The hash tag of keys of the model with *meta* in
+:ref:`cluster mode <redis-cluster>`.'''
+        if self.cluster == 'model':
+            return '%s%s' % (self.namespace, meta.modelkey)
+        return self.namespace or 'stdnet'
+
     def odmrun(self, client, odm_command, meta, keys, meta_info,
                *args, **options):
         options.update({'backend': self, 'meta': meta,
                         'odm_command': odm_command})
+        if self.cluster and not keys:
+            # route the script to the node owning the model slot
+            keys = (self.basekey(meta, 'id'),)
         return client.execute_script('odmrun', keys, odm_command, meta_info,
                                      *args, **options)
 
+    def coalesced_get(self, query, kwargs):
+        '''Load the instance matching *kwargs* together with the reads
+of concurrent callers. A lookup on the primary key checks the id set and
+fetches the instance hash in the next batch of the :attr:`coalescer`, other
+lookups share the ids of concurrent queries with the same fingerprint.'''
+        meta = query._meta
+        pkname = meta.pk.name
+        coalescer = self.coalescer
+        if list(kwargs) == [pkname]:
+            ids = (kwargs[pkname],)
+        else:
+            fingerprint = (self.basekey(meta), tuple(sorted(
+                ((k, repr(v)) for k, v in iteritems(kwargs)))))
+            ids = yield coalescer.share(
+                fingerprint,
+                lambda: query.filter(**kwargs).get_field(pkname).all())
+        items = ids
+        if len(ids) == 1:
+            id = ids[0]
+            idset = self.basekey(meta, 'id')
+            exists = ('ZSCORE', idset, id) if meta.ordering else\
+                ('SISMEMBER', idset, id)
+            exists, data = yield coalescer.execute(
+                exists, ('HGETALL', self.basekey(meta, OBJ, id)))
+            items = []
+            if exists is not None and exists is not False:
+                data = dict(((native_str(k, self.client.encoding), v)
+                             for k, v in iteritems(data)))
+                items = self.objects_from_db(meta, ((id, None, data),))
+                for instance in items:
+                    query.session.add(instance, modified=False)
+        yield meta.model.get_unique_instance(items)
+
     def where_run(self, client, meta_info, keys, where, load_only):
-        where = read_lua_file('where', context={'where_clause': where})
-        numkeys = len(keys)
-        keys.append(meta_info)
-        if load_only:
-            keys.append(json.dumps(load_only))
-        return client.eval(where, numkeys, *keys)
+        script, args = self.where_scripts.get(where)
+        load_only = json.dumps(load_only) if load_only else ''
+        return client.execute_script(script, keys, meta_info, load_only,
+                                     *args)
+
+    def where_stats(self):
+        '''Execution statistics of :meth:`stdnet.odm.Query.where` clauses
+available in the :attr:`where_scripts` cache.'''
+        return self.where_scripts.stats()
 
     def execute_session(self, session_data):
         '''Execute a session in redis.'''
@@ -782,7 +1205,7 @@ class BackendDataServer(stdnet.BackendDataServer):
                 self.flush_structure(sm, pipe)
             delquery = None
             if sm.deletes is not None:
-                delquery = sm.deletes.backend_query(pipe=pipe)
+                delquery = self.backend_query(sm.deletes, pipe)
             self.accumulate_delete(pipe, delquery)
             if sm.dirty:
                 meta_info = json.dumps(self.meta(meta))
@@ -811,7 +1234,24 @@ class BackendDataServer(stdnet.BackendDataServer):
                     processed.append(state.iid)
                 self.odmrun(pipe, 'commit', meta, (), meta_info,
                             *lua_data, iids=processed)
-        return pipe.execute()
+        if self.instrument is None:
+            return pipe.execute()
+        return self.execute(self._instrument_session(pipe, session_data))
+
+    def _instrument_session(self, pipe, session_data):
+        start = default_timer()
+        commands = len(pipe.command_stack)
+        result = yield pipe.execute()
+        models = [sm.meta.modelkey for sm in session_data]
+        self.instrument.emit(instrument_event(
+            'session', None, models[0] if len(models) == 1 else None,
+            0, 0, default_timer() - start, commands, None))
+        yield result
+
+    def backend_query(self, query, pipe):
+        '''The :class:`RedisQuery` of the odm *query* accumulated in
+*pipe*.'''
+        return query.backend_query(pipe=pipe)
 
     def accumulate_delete(self, pipe, backend_query):
         # Accumulate models queries for a delete. It loops through the
@@ -839,7 +1279,8 @@ class BackendDataServer(stdnet.BackendDataServer):
         for rmanager in rel_managers:
             # IMPORTANT. delete only if field is required
             if rmanager.field.required:
-                rq = rmanager.query_from_query(query).backend_query(pipe=pipe)
+                rq = self.backend_query(rmanager.query_from_query(query),
+                                        pipe)
                 self.accumulate_delete(pipe, rq)
         self.odmrun(pipe, 'delete', meta, keys, meta_info)
 
@@ -847,17 +1288,123 @@ class BackendDataServer(stdnet.BackendDataServer):
         return self.basekey(meta, TMP, name if name is not None else
                             gen_unique_id())
 
-    def flush(self, meta=None):
-        '''Flush all model keys from the database'''
-        pattern = self.basekey(meta) if meta else self.namespace
-        return self.client.delpattern('%s*' % pattern)
-
-    def clean(self, meta):
-        return self.client.delpattern(self.tempkey(meta, '*'))
-
-    def model_keys(self, meta):
+    def cross_slot_query(self, meta, elem, pipe):
+        '''Evaluate the query *elem* on a model in a different cluster slot
+and copy its result into a temporary key of the model with *meta*, queued
+in *pipe*.'''
+        query = elem.backend_query()
+        query.execute_query()
+        client = self.client
+        key = query.query_key
+        type = decode(client.type(key), client.encoding)
+        dest = self.tempkey(meta)
+        if type == 'list':
+            members = client.lrange(key, 0, -1)
+            if members:
+                pipe.rpush(dest, *members)
+        elif type == 'zset':
+            members = client.zrange(key, 0, -1, withscores=True)
+            if members:
+                flat = []
+                for member, score in members:
+                    flat.extend((score, member))
+                pipe.zadd(dest, *flat)
+        else:
+            members = client.smembers(key)
+            if members:
+                pipe.sadd(dest, *members)
+        pipe.expire(dest, query.expire)
+        return CrossSlotQuery(dest)
+
+    def flush(self, meta=None, **options):
+        '''Flush all model keys from the database.
+
+If *meta* is provided, the keys owned by the model are derived from its id
+set and indices and removed in batches. The keys left with the model prefix,
+such as temporary query keys, are then removed via the client ``delpattern``
+method. Otherwise all keys in the :attr:`namespace` are removed via
+``delpattern``. *options* are passed to :meth:`model_keys_scan` and
+``delpattern``.'''
+        if meta is None:
+            pattern = '%s*' % self.namespace
+            if self.cluster == 'model':
+                pattern = '{' + pattern
+            elif self.cluster:
+                pattern = '{%s}*' % (self.namespace or 'stdnet')
+            return self.client.delpattern(pattern, **options)
+        return self.client.execute_scan(self._flush_model(meta, **options))
+
+    def clean(self, meta, **options):
+        return self.client.delpattern(self.tempkey(meta, '*'), **options)
+
+    def _flush_model(self, meta, **options):
+        total = yield self.model_keys_scan(meta, 'del', **options)
         pattern = '%s*' % self.basekey(meta)
-        return self.execute(self.client.keys(pattern), self._decode_keys)
+        removed = yield self.client.delpattern(pattern, **options)
+        yield total + removed
+
+    def model_keys(self, meta, **options):
+        return self.execute(self.client.execute_scan(
+            self.model_keys_scan(meta, 'keys', **options)), self._decode_keys)
+
+    def model_keys_scan(self, meta, action, count=SCAN_COUNT, progress=None,
+                        throttle=0):
+        '''Generator over the keys owned by the model with *meta*.
+
+Each step processes *count* ids of the model id set and collects the instance
+hashes, structures and index keys of these ids. The keys not depending on
+ids (id set, unique and bitmap indices) are collected in the last step.
+
+:param action: ``'del'`` to unlink the keys, ``'keys'`` to return them.
+:param progress: optional callable invoked after each step with the number
+    of keys processed so far.
+:param throttle: optional number of seconds to wait between steps.
+:return: the list of keys or the number of deleted keys.'''
+        meta_info = json.dumps(self.meta(meta))
+        cursor, total, keys = 0, 0, set()
+        while True:
+            cursor, n, batch = yield self.odmrun(self.client, 'keys', meta, (),
+                                                 meta_info, cursor, count,
+                                                 action)
+            cursor = int(cursor)
+            total += n
+            keys.update(batch)
+            if progress:
+                progress(total)
+            if not cursor:
+                break
+            if throttle:
+                yield self.client.sleep(throttle)
+        yield list(keys) if action == 'keys' else total
+
+    def index_sizes(self, meta):
+        '''Index sizes of the model with *meta*, obtained by scanning index
+keys. The memory of set and hash indices is estimated from their number of
+keys and members, while for bitmap indices the members are bytes.'''
+        return self.execute(self._index_sizes(meta))
+
+    def _index_sizes(self, meta):
+        patterns = [('id', self.basekey(meta, 'id'), False)]
+        for field in meta.indices:
+            name = field.attname
+            if field.unique:
+                patterns.append((name, self.basekey(meta, 'uni', name), False))
+            else:
+                prefix = 'bidx' if field.bitmap else 'idx'
+                patterns.append((name, self.basekey(meta, prefix, name, '*'),
+                                 field.bitmap))
+        for fields in meta.compound_indices:
+            name = meta.compound_name(fields)
+            patterns.append((name, self.basekey(meta, 'cidx', name, '*'),
+                             False))
+        sizes = {}
+        for name, pattern, bitmap in patterns:
+            keys = yield self.client.keyinfo(pattern)
+            members = sum((k.length for k in keys))
+            memory = len(keys)*KEY_BYTES
+            memory += members if bitmap else members*MEMBER_BYTES
+            sizes[name] = index_size(len(keys), members, memory)
+        yield sizes
 
     def instance_keys(self, obj):
         meta = obj._meta
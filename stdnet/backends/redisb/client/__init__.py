@@ -4,24 +4,38 @@ except ImportError:
     async = None
 
 from .extensions import (RedisScript, read_lua_file, redis, get_script,
-                         RedisDb, RedisKey, RedisDataFormatter)
+                         RedisDb, RedisKey, RedisDataFormatter, LuaFile)
 from .client import Redis
+from .pool import ConnectionPool, shared_pool
 
 RedisError = redis.RedisError
 
 __all__ = ['redis_client', 'RedisScript', 'read_lua_file', 'RedisError',
-           'RedisDb', 'RedisKey', 'RedisDataFormatter', 'get_script']
+           'RedisDb', 'RedisKey', 'RedisDataFormatter', 'get_script',
+           'LuaFile', 'ConnectionPool', 'shared_pool']
 
 
 def redis_client(address=None, connection_pool=None, timeout=None,
-                 parser=None, **kwargs):
+                 parser=None, loop=None, cluster=False, **kwargs):
     '''Get a new redis client.
 
     :param address: a ``host``, ``port`` tuple.
     :param connection_pool: optional connection pool.
     :param timeout: socket timeout.
-    :param timeout: socket timeout.
+    :param loop: set to ``asyncio`` for an asyncio client.
+    :param cluster: if ``True``, *address* is a startup node of a Redis
+        Cluster and a :class:`.cluster.RedisCluster` client is returned.
+    :param kwargs: connection parameters and the ``max_connections``,
+        ``pool_timeout`` and ``idle_timeout`` options of the
+        :func:`.pool.shared_pool` used by the client.
     '''
+    if loop == 'asyncio':
+        from . import aio
+        return aio.redis_client(address, **kwargs)
+    if cluster:
+        from .cluster import RedisCluster
+        kwargs['socket_timeout'] = timeout
+        return RedisCluster((address,), **kwargs)
     if not connection_pool:
         if timeout == 0:
             if not async:
@@ -30,6 +44,7 @@ def redis_client(address=None, connection_pool=None, timeout=None,
             return async.pool.redis(address, **kwargs)
         else:
             kwargs['socket_timeout'] = timeout
-            return Redis(address[0], address[1], **kwargs)
+            return Redis(connection_pool=shared_pool(
+                host=address[0], port=address[1], **kwargs))
     else:
         return Redis(connection_pool=connection_pool)
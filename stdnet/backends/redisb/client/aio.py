@@ -0,0 +1,464 @@
+'''The :mod:`stdnet.backends.redisb.client.aio` module implements an
+asyncio_ connector for redis which does not require any third party
+library other than redis-py_ (used for commands and response callbacks).
+To use this connector, add ``loop=asyncio`` to the redis
+:ref:`connection string <connection-string>`::
+
+    'redis://127.0.0.1:6379?db=3&loop=asyncio&max_connections=100'
+
+Client commands return coroutines, while queries, sessions and structures
+return asyncio tasks, so that they can be awaited::
+
+    from stdnet import odm
+
+    models = odm.Router('redis://127.0.0.1:6379?loop=asyncio')
+    models.register(Instrument)
+
+    async def handler():
+        instrument = await models.instrument.new(name='eur', ccy='EUR')
+        qs = await models.instrument.filter(ccy='EUR').all()
+
+Commands are executed on connections taken from a pool with at most
+``max_connections`` (default 50) connections. Pipelines are sent with one
+write and their replies are read in one go.
+
+.. _asyncio: https://docs.python.org/3/library/asyncio.html
+'''
+import asyncio
+from inspect import isgenerator, isawaitable
+
+from stdnet.utils.structures import OrderedDict
+
+from .extensions import (RedisExtensionsMixin, redis, BasePipeline,
+                         is_noscript, pack_command)
+from . import coalesce
+from .prefixed import PrefixedRedisMixin
+
+try:
+    from redis.connection import BaseParser
+    parse_error = BaseParser().parse_error
+except (ImportError, AttributeError):     # pragma    nocover
+    parse_error = redis.ResponseError
+
+MAX_CONNECTIONS = 50
+
+
+def redis_client(address, db=0, password=None, encoding='utf-8',
+                 max_connections=None, **kwargs):
+    '''Create a new asyncio :class:`Redis` client for *address*.'''
+    pool = ConnectionPool(address, db=int(db or 0), password=password,
+                          encoding=encoding,
+                          max_connections=int(max_connections or
+                                              MAX_CONNECTIONS))
+    return Redis(pool)
+
+
+async def wait(value):
+    '''Wait for *value*, which can be a generator of stdnet asynchronous
+    results, an awaitable or a list of those.'''
+    if isgenerator(value):
+        return await run_generator(value)
+    elif isawaitable(value):
+        return await value
+    elif (isinstance(value, (list, tuple)) and
+          any((isgenerator(v) or isawaitable(v) for v in value))):
+        return await asyncio.gather(*[wait(v) for v in value])
+    else:
+        return value
+
+
+async def run_generator(gen):
+    '''Run a generator yielding asynchronous results. The result is
+    the last value yielded by the generator, as for
+    :func:`stdnet.backends.execute_generator`.'''
+    result, error = None, None
+    while True:
+        try:
+            if error is not None:
+                value, error = gen.throw(error), None
+            else:
+                value = gen.send(result)
+        except StopIteration:
+            return result
+        try:
+            result = await wait(value)
+        except Exception as e:
+            result, error = None, e
+
+
+class Connection(object):
+    '''A connection to redis using asyncio streams.'''
+    def __init__(self, pool):
+        self.pool = pool
+        self.reader = None
+        self.writer = None
+
+    @property
+    def connected(self):
+        return self.writer is not None
+
+    async def connect(self):
+        pool = self.pool
+        try:
+            self.reader, self.writer = await asyncio.open_connection(
+                *pool.address)
+        except OSError as e:
+            raise redis.ConnectionError('Error connecting to %s:%s. %s' %
+                                        (pool.address[0], pool.address[1], e))
+        commands = []
+        if pool.password:
+            commands.append(('AUTH', pool.password))
+        if pool.db:
+            commands.append(('SELECT', pool.db))
+        for response in await self.execute(commands):
+            if isinstance(response, Exception):
+                self.close()
+                raise response
+
+    async def execute(self, commands):
+        '''Send *commands* in one write and return the list of replies.
+        Error replies are returned as exceptions.'''
+        if not commands:
+            return []
+        encoding = self.pool.encoding
+        try:
+            self.writer.write(b''.join((pack_command(c, encoding)
+                                        for c in commands)))
+            await self.writer.drain()
+            return [(await self.read_response()) for _ in commands]
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.close()
+            raise redis.ConnectionError('Error while talking to redis. %s' % e)
+
+    async def read_response(self):
+        line = await self.reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        kind, response = line[:1], line[1:-2]
+        if kind == b'+':
+            return response
+        elif kind == b'-':
+            return parse_error(response.decode(self.pool.encoding))
+        elif kind == b':':
+            return int(response)
+        elif kind == b'$':
+            length = int(response)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2]
+        elif kind == b'*':
+            length = int(response)
+            if length == -1:
+                return None
+            return [(await self.read_response()) for _ in range(length)]
+        else:
+            self.close()
+            raise redis.InvalidResponse('Protocol Error: %r' % line)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class ConnectionPool(object):
+    '''A pool of :class:`Connection` with at most *max_connections*
+    connections. Coroutines wait for a connection when all of them are
+    in use.'''
+    def __init__(self, address, db=0, password=None, encoding='utf-8',
+                 max_connections=MAX_CONNECTIONS):
+        self.address = tuple(address)
+        self.db = db
+        self.password = password
+        self.encoding = encoding
+        self.max_connections = max_connections
+        self.connection_kwargs = {'host': self.address[0],
+                                  'port': self.address[1],
+                                  'db': db, 'encoding': encoding}
+        self._available = []
+        self._in_use = set()
+        self._semaphore = None
+
+    @property
+    def available_connections(self):
+        return len(self._available)
+
+    @property
+    def in_use_connections(self):
+        return len(self._in_use)
+
+    async def get_connection(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        await self._semaphore.acquire()
+        try:
+            connection = None
+            while self._available and connection is None:
+                connection = self._available.pop()
+                if not connection.connected:
+                    connection = None
+            if connection is None:
+                connection = Connection(self)
+                await connection.connect()
+        except Exception:
+            self._semaphore.release()
+            raise
+        self._in_use.add(connection)
+        return connection
+
+    def release(self, connection):
+        self._in_use.discard(connection)
+        if connection.connected:
+            self._available.append(connection)
+        self._semaphore.release()
+
+    async def execute(self, commands):
+        connection = await self.get_connection()
+        try:
+            return await connection.execute(commands)
+        finally:
+            self.release(connection)
+
+    def disconnect(self):
+        for connection in self._available + list(self._in_use):
+            connection.close()
+        self._available = []
+
+
+class Redis(RedisExtensionsMixin, redis.StrictRedis):
+    '''An asyncio redis client. Commands return coroutines.'''
+    def __init__(self, connection_pool):
+        self.connection_pool = connection_pool
+        self.connection = None
+        self.response_callbacks = self.RESPONSE_CALLBACKS.copy()
+
+    @property
+    def is_async(self):
+        return True
+
+    @property
+    def encoding(self):
+        return self.connection_pool.encoding
+
+    def address(self):
+        return self.connection_pool.address
+
+    def prefixed(self, prefix):
+        '''Return a new :class:`PrefixedRedis` client.
+        '''
+        return PrefixedRedis(self, prefix)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self, transaction, shard_hint)
+
+    async def execute_command(self, *args, **options):
+        response, = await self.connection_pool.execute((args,))
+        if isinstance(response, Exception):
+            raise response
+        return self.parse_reply(args[0], response, options)
+
+    def parse_reply(self, command_name, response, options):
+        callback = self.response_callbacks.get(command_name)
+        return callback(response, **options) if callback else response
+
+    def execute_async(self, result, callback=None):
+        '''Schedule *result*, a generator of asynchronous results or an
+        awaitable, in the event loop and return a task. If *callback* is
+        given it is called with the result.'''
+        return asyncio.ensure_future(self._execute_async(result, callback))
+
+    def execute_scan(self, gen):
+        return self.execute_async(gen)
+
+    def sleep(self, seconds):
+        # a task, since asyncio.sleep may be a generator based coroutine
+        return asyncio.ensure_future(asyncio.sleep(seconds))
+
+    def preload_scripts(self, names=None):
+        return self.execute_async(self._preload_scripts(names))
+
+    def read_coalescer(self, window=0):
+        '''Return a :class:`ReadCoalescer` which batches the reads of
+        coroutines issued within *window* seconds while other batches are
+        in flight, or within the same event loop iteration otherwise.'''
+        return ReadCoalescer(self, window)
+
+    async def execute_script(self, name, keys, *args, **options):
+        '''Execute a script.
+
+        makes sure all required scripts are loaded and loads them again
+        when the server replies with ``NOSCRIPT``.
+        '''
+        script = self._get_script(name)
+        await self.preload_scripts((script,))
+        try:
+            return await script(self, keys, args, options)
+        except redis.RedisError as e:
+            if not is_noscript(e):
+                raise
+            self.loaded_scripts().clear()
+            await self.preload_scripts((script,))
+            return await script(self, keys, args, options)
+
+    async def _execute_async(self, result, callback):
+        result = await wait(result)
+        if callback:
+            result = await wait(callback(result))
+        return result
+
+    async def _preload_scripts(self, names):
+        toload = self._scripts_to_load(names)
+        if toload:
+            pipe = self.pipeline(False)
+            for script in toload.values():
+                pipe.script_load(script.script)
+            await pipe.execute()
+            self.loaded_scripts().update(toload)
+        return list(toload.values())
+
+
+class ReadCoalescer(coalesce.ReadCoalescer):
+    '''Coalesce reads from concurrent coroutines. Methods return
+    futures.'''
+    def execute(self, *commands):
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = OrderedDict()
+            loop = asyncio.get_event_loop()
+            # wait for the window only while other batches are in flight
+            if self.window and self._running:
+                loop.call_later(self.window, self._flush)
+            else:
+                loop.call_soon(self._flush)
+        futures = []
+        for command in commands:
+            future = batch.get(command)
+            if future is None:
+                future = batch[command] = asyncio.Future()
+            futures.append(future)
+        self.commands += len(commands)
+        return asyncio.gather(*futures)
+
+    def share(self, fingerprint, callable):
+        future = self._calls.get(fingerprint)
+        if future is None:
+            future = asyncio.ensure_future(wait(callable()))
+            self._calls[fingerprint] = future
+            future.add_done_callback(
+                lambda f: self._calls.pop(fingerprint, None))
+        return future
+
+    def _flush(self):
+        batch, self._batch = self._batch, None
+        self.batches += 1
+        self._running += 1
+        asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            pipe = self.client.pipeline(False)
+            for command in batch:
+                pipe.execute_command(*command)
+            replies = await pipe.execute(False)
+        except Exception as e:
+            replies = [e]*len(batch)
+        finally:
+            self._running -= 1
+        for future, reply in zip(batch.values(), replies):
+            if future.done():
+                continue
+            elif isinstance(reply, Exception):
+                future.set_exception(reply)
+            else:
+                future.set_result(reply)
+
+
+class PrefixedRedis(PrefixedRedisMixin, Redis):
+    pass
+
+
+class Pipeline(BasePipeline, Redis):
+    '''An asyncio pipeline. Commands are queued and sent to the server
+    by the :meth:`execute` coroutine.'''
+    def __init__(self, client, transaction, shard_hint):
+        self.client = client
+        self.response_callbacks = client.response_callbacks
+        self.transaction = transaction
+        self.shard_hint = shard_hint
+        self.watching = False
+        self.connection = None
+        self.reset()
+
+    @property
+    def connection_pool(self):
+        return self.client.connection_pool
+
+    @property
+    def is_pipeline(self):
+        return True
+
+    @property
+    def instrument(self):
+        return self.client.instrument
+
+    @property
+    def tracer(self):
+        return self.client.tracer
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def execute_script(self, name, keys, *args, **options):
+        '''Execute a script.
+
+        makes sure all required scripts are loaded.
+        '''
+        script = self._get_script(name)
+        toload = self._scripts_to_load((script,))
+        for s in toload.values():
+            self.script_load(s.script)
+        self.loaded_scripts().update(toload)
+        return script(self, keys, args, options)
+
+    async def execute(self, raise_on_error=True):
+        '''Execute the pipeline.
+
+        Scripts not available in the server are loaded again and the
+        pipeline is executed once more if none of its commands was executed.
+        '''
+        stack = list(self.command_stack)
+        self.reset()
+        response = await self._execute(stack)
+        if any((is_noscript(r) for r in response)):
+            self.client.loaded_scripts().clear()
+            scripts = [options['script'] for _, options in stack
+                       if options.get('script')]
+            await self.client.preload_scripts(scripts)
+            # safe to execute again since no command had effects
+            if all((is_noscript(r) or args[0] in ('SCRIPT', 'SCRIPT LOAD')
+                    for r, (args, _) in zip(response, stack))):
+                response = await self._execute(stack)
+        if raise_on_error:
+            for r in response:
+                if isinstance(r, Exception):
+                    raise r
+        return response
+
+    async def _execute(self, stack):
+        commands = [args for args, _ in stack]
+        if self.transaction:
+            commands = [('MULTI',)] + commands + [('EXEC',)]
+        response = await self.connection_pool.execute(commands)
+        if self.transaction:
+            result = response[-1]
+            if isinstance(result, Exception):
+                raise result
+            elif result is None:
+                # the transaction was aborted by a WATCHed key
+                raise redis.WatchError('Watched variable changed.')
+            response = result
+        return [r if isinstance(r, Exception) else
+                self.parse_reply(args[0], r, options)
+                for r, (args, options) in zip(response, stack)]
@@ -12,11 +12,11 @@ Usage::
     db = getdb('redis://127.0.0.1:6378?password=bla&timeout=0')
 
 '''
+from pulsar import maybe_async, async_sleep
 from pulsar.apps import redis
 from pulsar.apps.redis.client import BasePipeline
 
-from .extensions import (RedisExtensionsMixin, get_script, RedisError,
-                         all_loaded_scripts)
+from .extensions import RedisExtensionsMixin, is_noscript
 from .prefixed import PrefixedRedisMixin
 
 
@@ -37,24 +37,53 @@ class Redis(RedisExtensionsMixin, redis.Redis):
     def pipeline(self, transaction=True, shard_hint=None):
         return Pipeline(self, self.response_callbacks, transaction, shard_hint)
 
+    def execute_scan(self, gen):
+        return maybe_async(gen)
+
+    def execute_async(self, result, callback=None):
+        result = maybe_async(result)
+        if callback:
+            return result.add_callback(callback)
+        else:
+            return result
+
+    def preload_scripts(self, names=None):
+        return maybe_async(self._preload_scripts(names))
+
+    def sleep(self, seconds):
+        return async_sleep(seconds)
+
+    def read_coalescer(self, window=0):
+        '''Reads are not coalesced by the pulsar client.'''
+        return None
+
     def execute_script(self, name, keys, *args, **options):
         '''Execute a script.
 
-        makes sure all required scripts are loaded.
+        makes sure all required scripts are loaded and loads them again
+        when the server replies with ``NOSCRIPT``.
         '''
-        script = get_script(name)
-        if not script:
-            raise redis.RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
-        toload = script.required_scripts.difference(loaded)
-        for name in toload:
-            s = get_script(name)
-            yield self.script_load(s.script)
-        loaded.update(toload)
-        yield script(self, keys, args, options)
+        script = self._get_script(name)
+        yield self.preload_scripts((script,))
+        try:
+            result = yield script(self, keys, args, options)
+        except redis.RedisError as e:
+            if not is_noscript(e):
+                raise
+            self.loaded_scripts().clear()
+            yield self.preload_scripts((script,))
+            result = yield script(self, keys, args, options)
+        yield result
+
+    def _preload_scripts(self, names):
+        toload = self._scripts_to_load(names)
+        if toload:
+            pipe = self.pipeline(False)
+            for script in toload.values():
+                pipe.script_load(script.script)
+            yield pipe.execute()
+            self.loaded_scripts().update(toload)
+        yield list(toload.values())
 
 
 class PrefixedRedis(PrefixedRedisMixin, Redis):
@@ -68,18 +97,11 @@ class Pipeline(BasePipeline, Redis):
 
         makes sure all required scripts are loaded.
         '''
-        script = get_script(name)
-        if not script:
-            raise redis.RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
-        toload = script.required_scripts.difference(loaded)
-        for name in toload:
-            s = get_script(name)
+        script = self._get_script(name)
+        toload = self._scripts_to_load((script,))
+        for s in toload.values():
             self.script_load(s.script)
-        loaded.update(toload)
+        self.loaded_scripts().update(toload)
         return script(self, keys, args, options)
 
 
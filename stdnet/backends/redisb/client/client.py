@@ -28,8 +28,10 @@ import os
 import io
 import socket
 from copy import copy
+from timeit import default_timer
 
-from .extensions import RedisExtensionsMixin, redis, BasePipeline
+from .extensions import (RedisExtensionsMixin, redis, BasePipeline,
+                         is_noscript)
 from .prefixed import PrefixedRedisMixin
 
 
@@ -54,6 +56,17 @@ class Redis(RedisExtensionsMixin, redis.StrictRedis):
             transaction,
             shard_hint)
 
+    def execute_command(self, *args, **options):
+        recorder = self.recorder
+        if recorder is None:
+            return super(Redis, self).execute_command(*args, **options)
+        start = default_timer()
+        try:
+            return super(Redis, self).execute_command(*args, **options)
+        finally:
+            recorder.record(((args, options),), start,
+                            default_timer() - start)
+
 
 class PrefixedRedis(PrefixedRedisMixin, Redis):
     pass
@@ -77,3 +90,45 @@ class Pipeline(BasePipeline, Redis):
     @property
     def is_pipeline(self):
         return True
+
+    @property
+    def instrument(self):
+        return self.client.instrument
+
+    @property
+    def tracer(self):
+        return self.client.tracer
+
+    @property
+    def recorder(self):
+        return self.client.recorder
+
+    def execute(self, raise_on_error=True):
+        '''Execute the pipeline.
+
+        If scripts were not available in the server (``NOSCRIPT`` errors),
+        they are loaded again. The pipeline is executed once more only when
+        none of its commands was executed, otherwise the error is raised.
+        '''
+        stack = list(self.command_stack)
+        start = default_timer()
+        response = super(Pipeline, self).execute(raise_on_error=False)
+        if any((is_noscript(r) for r in response)):
+            self.client.loaded_scripts().clear()
+            scripts = [options['script'] for _, options in stack
+                       if options.get('script')]
+            self.client.preload_scripts(scripts)
+            # safe to execute again since no command had effects
+            if all((is_noscript(r) or args[0] in ('SCRIPT', 'SCRIPT LOAD')
+                    for r, (args, _) in zip(response, stack))):
+                self.command_stack.extend(stack)
+                response = super(Pipeline, self).execute(raise_on_error=False)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(stack, start, default_timer() - start,
+                            self.transaction)
+        if raise_on_error:
+            for r in response:
+                if isinstance(r, Exception):
+                    raise r
+        return response
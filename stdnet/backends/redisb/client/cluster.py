@@ -0,0 +1,334 @@
+'''The :mod:`stdnet.backends.redisb.client.cluster` module implements a
+client for `Redis Cluster`_. Commands are sent to the master owning the
+slot of their first key, the slot map is obtained with ``CLUSTER SLOTS``
+and updated when a node replies with ``MOVED``. ``ASK`` redirections are
+followed during slot migrations.
+
+Scripts are loaded in all masters. Pipelines are split by node and are
+executed in a ``MULTI``/``EXEC`` block only when all their commands
+belong to the same slot.
+
+.. _`Redis Cluster`: http://redis.io/topics/cluster-spec
+'''
+from stdnet.utils import native_str
+from stdnet.utils.structures import OrderedDict
+
+from .extensions import RedisExtensionsMixin, redis
+from .client import Redis
+from .pool import shared_pool
+
+SLOTS = 16384
+MAX_REDIRECTIONS = 5
+# Commands sent to all masters
+BROADCAST = frozenset(('SCRIPT', 'FLUSHDB', 'FLUSHALL'))
+# Commands without keys, sent to any node
+KEYLESS = frozenset(('PING', 'INFO', 'ECHO', 'DBSIZE', 'TIME', 'SCAN',
+                     'KEYS', 'RANDOMKEY', 'CLUSTER', 'CONFIG', 'CLIENT',
+                     'LASTSAVE', 'ASKING', 'READONLY'))
+
+
+def _crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = (crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1
+        table.append(crc & 0xFFFF)
+    return table
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data):
+    '''CRC16 (XMODEM) checksum of *data* bytes.'''
+    crc = 0
+    for byte in bytearray(data):
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[((crc >> 8) ^ byte) & 0xFF]
+    return crc
+
+
+def key_slot(key, encoding='utf-8'):
+    '''The cluster slot of *key*. When *key* contains a hash tag, a non
+empty string between ``{`` and ``}``, only the tag is hashed.'''
+    if not isinstance(key, bytes):
+        key = str(key).encode(encoding)
+    start = key.find(b'{')
+    if start > -1:
+        end = key.find(b'}', start + 1)
+        if end > start + 1:
+            key = key[start+1:end]
+    return crc16(key) % SLOTS
+
+
+def command_name(args):
+    return native_str(args[0]).split()[0].upper()
+
+
+def command_key(args):
+    '''The key which routes command *args* or ``None``.'''
+    name = command_name(args)
+    if name in ('EVALSHA', 'EVAL'):
+        return args[3] if int(args[2]) else None
+    elif name in KEYLESS or name in BROADCAST or len(args) < 2:
+        return None
+    return args[1]
+
+
+def redirection(error):
+    '''Return a ``(kind, slot, address)`` tuple if *error* is a ``MOVED``
+or ``ASK`` redirection, otherwise ``None``.'''
+    bits = str(error).split()
+    if len(bits) == 3 and bits[0] in ('MOVED', 'ASK'):
+        host, port = bits[2].rsplit(':', 1)
+        return bits[0], int(bits[1]), (host, int(port))
+
+
+def parse_slots(response, encoding):
+    '''Generator of ``(start, end, address)`` from a ``CLUSTER SLOTS``
+reply, parsed or not by redis-py.'''
+    if isinstance(response, dict):
+        for (start, end), nodes in response.items():
+            host, port = nodes['master'][:2]
+            yield int(start), int(end), (native_str(host, encoding), int(port))
+    else:
+        for r in response:
+            host, port = r[2][:2]
+            yield int(r[0]), int(r[1]), (native_str(host, encoding), int(port))
+
+
+class ClusterConnectionPool(object):
+    '''The connection pools of the nodes of a :class:`RedisCluster`.'''
+    def __init__(self, cluster, connection_kwargs):
+        self.cluster = cluster
+        self.connection_kwargs = connection_kwargs
+
+    @property
+    def stats(self):
+        return dict(((address, node.connection_pool.stats) for address, node
+                     in self.cluster.nodes.items()))
+
+    def disconnect(self):
+        for node in self.cluster.nodes.values():
+            node.connection_pool.disconnect()
+
+
+class RedisCluster(RedisExtensionsMixin, redis.StrictRedis):
+    '''A Redis Cluster client.
+
+    :param startup_nodes: list of ``(host, port)`` addresses used to
+        discover the cluster.
+
+    .. attribute:: nodes
+
+        Dictionary of node addresses and their :class:`Redis` client.
+    '''
+    def __init__(self, startup_nodes, db=0, **kwargs):
+        if int(db or 0):
+            raise redis.RedisError('Redis Cluster supports database 0 only')
+        self.startup_nodes = [tuple(a) for a in startup_nodes]
+        self.connection_kwargs = kwargs
+        self.connection_pool = ClusterConnectionPool(self, kwargs)
+        self.response_callbacks = self.RESPONSE_CALLBACKS.copy()
+        self.nodes = {}
+        self.slots = None
+
+    @property
+    def encoding(self):
+        return self.connection_kwargs.get('encoding', 'utf-8')
+
+    def address(self):
+        return ('cluster',) + tuple(self.startup_nodes)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return Pipeline(self, transaction)
+
+    def node(self, address):
+        '''The :class:`Redis` client of the node at *address*.'''
+        address = tuple(address)
+        client = self.nodes.get(address)
+        if client is None:
+            client = Redis(connection_pool=shared_pool(
+                host=address[0], port=address[1], **self.connection_kwargs))
+            self.nodes[address] = client
+        return client
+
+    def masters(self):
+        '''List of :class:`Redis` clients of the masters.'''
+        if self.slots is None:
+            self.refresh_slots()
+        seen = OrderedDict()
+        for address in self.slots:
+            if address is not None:
+                seen[address] = True
+        return [self.node(address) for address in seen]
+
+    def refresh_slots(self):
+        '''Load the slot map from the first available node.'''
+        error = None
+        for address in list(self.nodes) + self.startup_nodes:
+            try:
+                response = self.node(address).execute_command('CLUSTER',
+                                                              'SLOTS')
+            except redis.ConnectionError as e:
+                error = e
+                continue
+            slots = [None]*SLOTS
+            for start, end, master in parse_slots(response, self.encoding):
+                for slot in range(start, end + 1):
+                    slots[slot] = master
+            self.slots = slots
+            return slots
+        raise error or redis.ConnectionError('No cluster nodes available')
+
+    def node_for(self, args):
+        '''The :class:`Redis` client of the master serving command *args*.
+'''
+        if self.slots is None:
+            self.refresh_slots()
+        key = command_key(args)
+        if key is None:
+            return self.masters()[0]
+        address = self.slots[key_slot(key, self.encoding)]
+        if address is None:
+            raise redis.ResponseError('Slot of key "%s" is not served' % key)
+        return self.node(address)
+
+    def execute_command(self, *args, **options):
+        if command_name(args) in BROADCAST:
+            result = None
+            for node in self.masters():
+                result = node.execute_command(*args, **options)
+            return result
+        return self.execute_node_command(self.node_for(args), args, options)
+
+    def execute_node_command(self, node, args, options):
+        '''Execute *args* in *node* following cluster redirections.'''
+        asking = False
+        for _ in range(MAX_REDIRECTIONS):
+            try:
+                if asking:
+                    pipe = node.pipeline(False)
+                    pipe.execute_command('ASKING')
+                    pipe.execute_command(*args, **options)
+                    return pipe.execute()[1]
+                return node.execute_command(*args, **options)
+            except redis.ResponseError as e:
+                redirect = redirection(e)
+                if not redirect:
+                    raise
+                kind, slot, address = redirect
+                if kind == 'MOVED':
+                    self.refresh_slots()
+                asking = kind == 'ASK'
+                node = self.node(address)
+        raise redis.ResponseError('Too many cluster redirections')
+
+    def _scan(self, pattern, count, action, progress, throttle):
+        # Scan each master
+        total, keys = 0, []
+        for node in self.masters():
+            step = None
+            if progress:
+                step = lambda n, done=total: progress(done + n)
+            result = yield node._scan(pattern, count, action, step, throttle)
+            if action == 'keys':
+                keys.extend(result)
+            else:
+                total += result
+        yield keys if action == 'keys' else total
+
+    def _keyinfo(self, pattern, keys, start, num, count):
+        # The keyinfo script is executed for keys of one slot at a time
+        if keys is None:
+            keys = yield self._scan(pattern, count, 'keys', None, 0)
+            keys = sorted(keys)
+        keys = keys[start:start+num if num is not None else None]
+        slots = OrderedDict()
+        for key in keys:
+            slots.setdefault(key_slot(key, self.encoding), []).append(key)
+        info = {}
+        for slot_keys in slots.values():
+            for i in range(0, len(slot_keys), count):
+                result = yield self.execute_script('keyinfo',
+                                                   slot_keys[i:i+count])
+                info.update(((k.key, k) for k in result))
+        yield [info[k] for k in keys if k in info]
+
+
+class Pipeline(RedisCluster):
+    '''A pipeline for :class:`RedisCluster`. Commands are grouped by node
+    and each group is sent with one node pipeline.'''
+    def __init__(self, cluster, transaction):
+        self.cluster = cluster
+        self.transaction = transaction
+        self.response_callbacks = cluster.response_callbacks
+        self.command_stack = []
+
+    @property
+    def is_pipeline(self):
+        return True
+
+    @property
+    def instrument(self):
+        return self.cluster.instrument
+
+    @property
+    def tracer(self):
+        return self.cluster.tracer
+
+    @property
+    def encoding(self):
+        return self.cluster.encoding
+
+    def address(self):
+        return self.cluster.address()
+
+    def execute_command(self, *args, **options):
+        self.command_stack.append((args, options))
+        return self
+
+    def reset(self):
+        self.command_stack = []
+
+    def execute(self, raise_on_error=True):
+        stack, self.command_stack = self.command_stack, []
+        cluster = self.cluster
+        groups = OrderedDict()
+        for index, (args, options) in enumerate(stack):
+            if command_name(args) in BROADCAST:
+                nodes = cluster.masters()
+            else:
+                nodes = (cluster.node_for(args),)
+            for node in nodes:
+                groups.setdefault(node, []).append((index, args, options))
+        response = [None]*len(stack)
+        for node, commands in groups.items():
+            for index, reply in self._execute_node(node, commands):
+                response[index] = reply
+        if raise_on_error:
+            for r in response:
+                if isinstance(r, Exception):
+                    raise r
+        return response
+
+    def _execute_node(self, node, commands):
+        slots = set((key_slot(command_key(args), self.encoding)
+                     for _, args, _ in commands
+                     if command_key(args) is not None))
+        pipe = node.pipeline(self.transaction and len(slots) <= 1)
+        for _, args, options in commands:
+            pipe.execute_command(*args, **options)
+        try:
+            replies = pipe.execute(False)
+        except redis.ResponseError as e:
+            if not redirection(e):
+                raise
+            replies = [e]*len(commands)
+        for (index, args, options), reply in zip(commands, replies):
+            # commands redirected were not executed, send them again
+            if isinstance(reply, redis.ResponseError) and redirection(reply):
+                try:
+                    reply = self.cluster.execute_command(*args, **options)
+                except redis.RedisError as e:
+                    reply = e
+            yield index, reply
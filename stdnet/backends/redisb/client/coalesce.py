@@ -0,0 +1,134 @@
+'''Coalescing of concurrent reads.
+
+A :class:`ReadCoalescer` collects the read commands issued by concurrent
+threads within a short time window and sends them to redis in one pipeline,
+fanning the replies out to all waiters. Identical commands are sent once.
+The window is waited for only while batches of other threads are in flight,
+so that a read without concurrent readers is sent at once, while under
+load a read can wait up to the window in addition to its round trip.
+It can also share the result of an in-flight call among concurrent callers
+with the same fingerprint.
+'''
+import time
+from threading import Lock, Event
+
+from stdnet.utils.structures import OrderedDict
+
+
+class ReadBatch(object):
+    '''A batch of read commands sent to redis in one pipeline.'''
+    def __init__(self):
+        self.replies = OrderedDict()
+        self.error = None
+        self.done = Event()
+
+    def __len__(self):
+        return len(self.replies)
+
+    def run(self, client):
+        try:
+            pipe = client.pipeline(False)
+            for command in self.replies:
+                pipe.execute_command(*command)
+            replies = pipe.execute(False)
+            for command, reply in zip(list(self.replies), replies):
+                self.replies[command] = reply
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+class SharedCall(object):
+    '''The result of a call shared by concurrent callers.'''
+    def __init__(self):
+        self.result = None
+        self.error = None
+        self.done = Event()
+
+
+class ReadCoalescer(object):
+    '''Coalesce reads from concurrent threads.
+
+    :param client: the redis client.
+    :param window: time in seconds the first thread of a batch waits for
+        other threads to join the batch, when batches of other threads are
+        in flight.
+
+    .. attribute:: batches
+
+        Number of pipelines sent to the server.
+
+    .. attribute:: commands
+
+        Number of read commands requested, including the duplicates which
+        were not sent to the server.
+    '''
+    def __init__(self, client, window=0):
+        self.client = client
+        self.window = window
+        self.batches = 0
+        self.commands = 0
+        self._lock = Lock()
+        self._batch = None
+        self._running = 0
+        self._calls = {}
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.window)
+
+    def execute(self, *commands):
+        '''Execute read *commands*, tuples of command name and arguments,
+        together with the commands requested by other threads and return
+        the list of replies.'''
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = ReadBatch()
+            for command in commands:
+                batch.replies[command] = None
+            self.commands += len(commands)
+        if leader:
+            # without batches in flight there is nobody to wait for
+            if self.window and self._running:
+                time.sleep(self.window)
+            with self._lock:
+                self._batch = None
+                self.batches += 1
+                self._running += 1
+            batch.run(self.client)
+            with self._lock:
+                self._running -= 1
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        replies = [batch.replies[command] for command in commands]
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    def share(self, fingerprint, callable):
+        '''Return the result of *callable*. Concurrent calls with the same
+        *fingerprint* wait for the first one and share its result.'''
+        with self._lock:
+            call = self._calls.get(fingerprint)
+            leader = call is None
+            if leader:
+                call = self._calls[fingerprint] = SharedCall()
+        if leader:
+            try:
+                call.result = callable()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(fingerprint, None)
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
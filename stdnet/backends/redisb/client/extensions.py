@@ -1,12 +1,18 @@
 import os
+import time
 from hashlib import sha1
 from collections import namedtuple
 from datetime import datetime
 from copy import copy
+from timeit import default_timer
 
 from stdnet.utils.structures import OrderedDict
-from stdnet.utils import iteritems, format_int
+from stdnet.utils import iteritems, format_int, to_bytes
 from stdnet import odm
+from stdnet.backends import execute_generator
+from stdnet.utils.instrument import (instrument_event, payload_size,
+                                     result_count)
+from stdnet.utils.tracing import response_size
 
 try:
     import redis
@@ -16,10 +22,15 @@ except ImportError:     # pragma    nocover
 
 from redis.client import BasePipeline
 
+from .coalesce import ReadCoalescer
+
 RedisError = redis.RedisError
+NoScriptError = getattr(redis.exceptions, 'NoScriptError', None)
 p = os.path
 DEFAULT_LUA_PATH = p.join(p.dirname(p.dirname(p.abspath(__file__))), 'lua')
 redis_connection = namedtuple('redis_connection', 'address db')
+# Number of keys examined by each step of a SCAN iteration
+SCAN_COUNT = 1000
 
 ###########################################################
 #    GLOBAL REGISTERED SCRIPT DICTIONARY
@@ -36,24 +47,101 @@ def get_script(script):
 ###########################################################
 
 
-def script_callback(response, script=None, **options):
+def script_callback(response, script=None, instrument=None, span=None,
+                    **options):
     if script:
-        return script.callback(response, **options)
+        if span is not None:
+            return traced_callback(response, script, instrument, span,
+                                   options)
+        if instrument is None:
+            return script.callback(response, **options)
+        instrument, start, numkeys, size = instrument
+        result = script.callback(response, **options)
+        meta = options.get('meta')
+        query = options.get('query')
+        instrument.emit(instrument_event(
+            script.name, options.get('odm_command'),
+            meta.modelkey if meta is not None else None, numkeys, size,
+            default_timer() - start, result_count(result),
+            repr(query) if query is not None else None))
+        return result
     else:
         return response
 
 
+def traced_callback(response, script, instrument, span, options):
+    # end the redis.script span and process the reply in a redis.parse span
+    span.end()
+    with span.tracer.start_span('redis.parse', parent=span.parent,
+                                model=span.attributes.get('model'),
+                                bytes=response_size(response)) as parse:
+        result = script_callback(response, script, instrument, **options)
+        parse.set_attribute('rows', result_count(result))
+    return result
+
+
+def pack_command(args, encoding='utf-8'):
+    '''Encode a command *args* with the redis protocol. As in redis-py,
+    the words of multi word commands, such as ``SCRIPT LOAD``, are sent as
+    separate arguments.'''
+    args = tuple(to_bytes(args[0], encoding).split()) + tuple(args[1:])
+    output = [('*%s\r\n' % len(args)).encode(encoding)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            value = arg
+        elif isinstance(arg, float):
+            value = repr(arg).encode(encoding)
+        else:
+            value = to_bytes(arg, encoding)
+        output.append(('$%s\r\n' % len(value)).encode(encoding))
+        output.append(value)
+        output.append(b'\r\n')
+    return b''.join(output)
+
+
+def is_noscript(error):
+    '''Check if *error* is a ``NOSCRIPT`` reply, returned by ``EVALSHA``
+    when the script is not loaded in the server.'''
+    if NoScriptError is not None and isinstance(error, NoScriptError):
+        return True
+    return isinstance(error, Exception) and str(error).startswith('NOSCRIPT')
+
+
+class LuaFile(object):
+    '''A lua file read the first time its source is required.
+
+    The content of files is cached so that files shared by several scripts
+    are read only once.
+    '''
+    sources = {}
+
+    def __init__(self, name, context=None):
+        self.name = name
+        self.context = context
+
+    def __str__(self):
+        data = self.sources.get(self.name)
+        if data is None:
+            with open(self.name) as f:
+                data = f.read()
+            self.sources[self.name] = data
+        if self.context:
+            data = data.format(self.context)
+        return data
+
+    def __repr__(self):
+        return self.name
+
+
 def read_lua_file(dotted_module, path=None, context=None):
-    '''Load lua script from the stdnet/lib/lua directory'''
+    '''Load lua script from the stdnet/lib/lua directory.
+
+    Return a :class:`LuaFile`, the file is read when the script is first
+    loaded in redis rather than at import time.'''
     path = path or DEFAULT_LUA_PATH
     bits = dotted_module.split('.')
     bits[-1] += '.lua'
-    name = os.path.join(path, *bits)
-    with open(name) as f:
-        data = f.read()
-    if context:
-        data = data.format(context)
-    return data
+    return LuaFile(os.path.join(path, *bits), context)
 
 
 def parse_info(response):
@@ -98,6 +186,9 @@ class RedisExtensionsMixin(object):
     '''Extension for Redis clients.
     '''
     prefix = ''
+    instrument = None
+    recorder = None
+    tracer = None
     RESPONSE_CALLBACKS = dict_update(
         redis.StrictRedis.RESPONSE_CALLBACKS,
         {'EVALSHA': script_callback,
@@ -117,41 +208,184 @@ class RedisExtensionsMixin(object):
         '''
         raise NotImplementedError
 
+    def loaded_scripts(self):
+        '''The set of script names loaded in the redis server at
+        :meth:`address`.'''
+        address = self.address()
+        if address not in all_loaded_scripts:
+            all_loaded_scripts[address] = set()
+        return all_loaded_scripts[address]
+
+    def preload_scripts(self, names=None):
+        '''Load scripts and their required scripts in the server.
+
+        Scripts already loaded are skipped and the others are loaded in one
+        pipeline. When the client is a pipeline, ``SCRIPT LOAD`` commands
+        are queued in it.
+
+        :param names: list of script names or :class:`RedisScript`, if not
+            provided all registered scripts are loaded.
+        :return: the list of loaded scripts.
+        '''
+        toload = self._scripts_to_load(names)
+        if toload:
+            pipe = self if self.is_pipeline else self.pipeline(False)
+            for script in toload.values():
+                pipe.script_load(script.script)
+            if pipe is not self:
+                pipe.execute()
+            self.loaded_scripts().update(toload)
+        return list(toload.values())
+
     def execute_script(self, name, keys, *args, **options):
         '''Execute a registered lua script at ``name``.
 
         The script must be implemented via subclassing :class:`RedisScript`.
+        If the server replies with ``NOSCRIPT``, for example after a restart
+        or a ``SCRIPT FLUSH``, scripts are loaded again and the script
+        is executed once more.
 
-        :param name: the name of the registered script.
+        :param name: the name of the registered script or a
+            :class:`RedisScript` instance.
         :param keys: tuple/list of keys pased to the script.
         :param args: argument passed to the script.
         :param options: key-value parameters passed to the
             :meth:`RedisScript.callback` method once the script has finished
             execution.
         '''
-        script = get_script(name)
-        if not script:
-            raise RedisError('No such script "%s"' % name)
-        address = self.address()
-        if address not in all_loaded_scripts:
-            all_loaded_scripts[address] = set()
-        loaded = all_loaded_scripts[address]
-        toload = script.required_scripts.difference(loaded)
-        for name in toload:
-            s = get_script(name)
-            self.script_load(s.script)
-        loaded.update(toload)
-        return script(self, keys, args, options)
-
-    def countpattern(self, pattern):
-        '''delete all keys matching *pattern*.
+        script = self._get_script(name)
+        self.preload_scripts((script,))
+        if self.is_pipeline:
+            return script(self, keys, args, options)
+        try:
+            return script(self, keys, args, options)
+        except RedisError as e:
+            if not is_noscript(e):
+                raise
+            self.loaded_scripts().clear()
+            self.preload_scripts((script,))
+            return script(self, keys, args, options)
+
+    def read_coalescer(self, window=0):
+        '''Return a :class:`ReadCoalescer` which batches the reads of
+        concurrent threads issued within *window* seconds.'''
+        return ReadCoalescer(self, window)
+
+    def scanpattern(self, pattern, cursor=0, count=SCAN_COUNT, action=''):
+        '''Perform one step of a ``SCAN`` iteration over keys matching
+        *pattern*.
+
+        :param cursor: the ``SCAN`` cursor, 0 to start a new iteration.
+        :param count: the number of keys to examine.
+        :param action: ``'del'`` to unlink matched keys, ``'keys'`` to
+            return matched keys, otherwise matched keys are only counted.
+        :return: a three elements tuple containing the next cursor (0 when
+            the iteration is finished), the number of matched (or deleted)
+            keys and the list of matched keys.
         '''
-        return self.execute_script('countpattern', (), pattern)
+        return self.execute_script('scanpattern', (), pattern, cursor, count,
+                                   action)
 
-    def delpattern(self, pattern):
+    def countpattern(self, pattern, count=SCAN_COUNT, progress=None,
+                     throttle=0):
+        '''Count keys matching *pattern*.
+
+        The count is performed in steps of *count* keys so that the server
+        is not blocked. Check :meth:`delpattern` for the other parameters.
+        '''
+        return self.execute_scan(self._scan(pattern, count, '', progress,
+                                            throttle))
+
+    def delpattern(self, pattern, count=SCAN_COUNT, progress=None,
+                   throttle=0):
         '''delete all keys matching *pattern*.
+
+        Keys are removed in batches via ``UNLINK`` while iterating the
+        keyspace with ``SCAN`` so that the server is never blocked
+        for a full keyspace walk.
+
+        :param count: number of keys examined at each step.
+        :param progress: optional callable invoked after each step with
+            the number of keys deleted so far.
+        :param throttle: optional number of seconds to wait between steps.
+        :return: the number of deleted keys.
+        '''
+        return self.execute_scan(self._scan(pattern, count, 'del', progress,
+                                            throttle))
+
+    def scankeys(self, pattern, count=SCAN_COUNT, progress=None, throttle=0):
+        '''Return the list of keys matching *pattern* without blocking the
+        server. Check :meth:`delpattern` for the parameters.'''
+        return self.execute_scan(self._scan(pattern, count, 'keys', progress,
+                                            throttle))
+
+    def keyinfo(self, pattern=None, keys=None, start=0, num=None,
+                count=SCAN_COUNT):
+        '''Retrieve :class:`RedisKey` information for *keys* or, if
+        not provided, for keys matching *pattern*, sorted in alphabetical
+        order.
+
+        :param start: index of the first key to retrieve.
+        :param num: optional number of keys to retrieve.
         '''
-        return self.execute_script('delpattern', (), pattern)
+        return self.execute_scan(self._keyinfo(pattern, keys, start, num,
+                                               count))
+
+    def execute_scan(self, gen):
+        '''Execute the generator of a ``SCAN`` iteration.'''
+        return execute_generator(gen)
+
+    def sleep(self, seconds):
+        '''Wait *seconds* between the steps of a ``SCAN`` iteration.
+        Asynchronous clients return an asynchronous result, yielded by
+        the iteration, rather than blocking the event loop.'''
+        time.sleep(seconds)
+
+    def _scan(self, pattern, count, action, progress, throttle):
+        cursor, total, keys = 0, 0, []
+        while True:
+            cursor, n, batch = yield self.scanpattern(pattern, cursor, count,
+                                                      action)
+            total += n
+            keys.extend(batch)
+            if progress:
+                progress(total)
+            if not cursor:
+                break
+            if throttle:
+                yield self.sleep(throttle)
+        yield keys if action == 'keys' else total
+
+    def _scripts_to_load(self, names):
+        # Ordered dictionary of scripts, required by names, not yet loaded
+        loaded = self.loaded_scripts()
+        toload = OrderedDict()
+        for name in (registered_scripts() if names is None else names):
+            script = self._get_script(name)
+            for name in sorted(script.required_scripts.difference(loaded)):
+                if name not in toload:
+                    toload[name] = (script if name == script.name else
+                                    get_script(name))
+        return toload
+
+    def _get_script(self, name):
+        if isinstance(name, RedisScript):
+            return name
+        script = get_script(name)
+        if not script:
+            raise RedisError('No such script "%s"' % name)
+        return script
+
+    def _keyinfo(self, pattern, keys, start, num, count):
+        if keys is None:
+            keys = yield self._scan(pattern, count, 'keys', None, 0)
+            keys = sorted(keys)
+        keys = keys[start:start+num if num is not None else None]
+        result = []
+        for i in range(0, len(keys), count):
+            info = yield self.execute_script('keyinfo', keys[i:i+count])
+            result.extend(info)
+        yield result
 
     def zdiffstore(self, dest, keys, withscores=False):
         '''Compute the difference of multiple sorted.
@@ -187,9 +421,12 @@ class RedisScriptMeta(type):
     def __new__(cls, name, bases, attrs):
         super_new = super(RedisScriptMeta, cls).__new__
         abstract = attrs.pop('abstract', False)
+        # the script source is resolved lazily by the script property
+        if not isinstance(attrs.get('script', property()), property):
+            attrs['source'] = attrs.pop('script')
         new_class = super_new(cls, name, bases, attrs)
         if not abstract:
-            self = new_class(new_class.script, new_class.__name__)
+            self = new_class(new_class.source, new_class.__name__)
             _scripts[self.name] = self
         return new_class
 
@@ -201,7 +438,8 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
 
     .. attribute:: script
 
-        The lua script to run
+        The lua script to run. It can be a string, a :class:`LuaFile` or
+        a list/tuple of those, joined when the script is first needed.
 
     .. attribute:: required_scripts
 
@@ -217,14 +455,12 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
     .. _SHA-1: http://en.wikipedia.org/wiki/SHA-1
     '''
     abstract = True
-    script = None
+    source = None
     required_scripts = ()
 
     def __init__(self, script, name):
-        if isinstance(script, (list, tuple)):
-            script = '\n'.join(script)
         self.__name = name
-        self.script = script
+        self.source = script
         rs = set((name,))
         rs.update(self.required_scripts)
         self.required_scripts = rs
@@ -233,6 +469,15 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
     def name(self):
         return self.__name
 
+    @property
+    def script(self):
+        if not hasattr(self, '_script'):
+            source = self.source
+            if isinstance(source, (list, tuple)):
+                source = '\n'.join((str(s) for s in source))
+            self._script = str(source)
+        return self._script
+
     @property
     def sha1(self):
         if not hasattr(self, '_sha1'):
@@ -262,6 +507,18 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
         numkeys = len(keys)
         keys_args = tuple(keys) + args
         options.update({'script': self, 'redis_client': client})
+        instrument = client.instrument
+        if instrument is not None:
+            options['instrument'] = (instrument, default_timer(), numkeys,
+                                     payload_size(keys_args))
+        tracer = client.tracer
+        if tracer is not None:
+            meta = options.get('meta')
+            options['span'] = tracer.start_span(
+                'redis.script', script=self.name,
+                command=options.get('odm_command'),
+                model=meta.modelkey if meta is not None else None,
+                keys=numkeys, bytes=payload_size(keys_args))
         return client.execute_command('EVALSHA', self.sha1, numkeys,
                                       *keys_args, **options)
 
@@ -269,25 +526,21 @@ class RedisScript(RedisScriptMeta('_RS', (object,), {'abstract': True})):
 ############################################################################
 ##    BATTERY INCLUDED REDIS SCRIPTS
 ############################################################################
-class countpattern(RedisScript):
-    script = '''\
-return # redis.call('keys', ARGV[1])
-'''
+class scanpattern(RedisScript):
+    script = read_lua_file('commands.scanpattern')
 
     def preprocess_args(self, client, args):
         if args and client.prefix:
-            args = tuple(('%s%s' % (client.prefix, a) for a in args))
+            args = ('%s%s' % (client.prefix, args[0]),) + tuple(args[1:])
         return args
 
-
-class delpattern(countpattern):
-    script = '''\
-local n = 0
-for i,key in ipairs(redis.call('keys', ARGV[1])) do
-  n = n + redis.call('del', key)
-end
-return n
-'''
+    def callback(self, response, redis_client=None, **options):
+        cursor, n, keys = response
+        prefix = redis_client.prefix
+        if prefix:
+            prefix = prefix.encode(redis_client.encoding)
+            keys = [k[len(prefix):] for k in keys]
+        return int(cursor), n, keys
 
 
 class zpop(RedisScript):
@@ -311,13 +564,6 @@ class move2set(RedisScript):
 class keyinfo(RedisScript):
     script = read_lua_file('commands.keyinfo')
 
-    def preprocess_args(self, client, args):
-        if args and client.prefix:
-            a = ['%s%s' % (client.prefix, args[0])]
-            a.extend(args[1:])
-            args = tuple(a)
-        return args
-
     def callback(self, response, redis_client=None, **options):
         client = redis_client
         if client.is_pipeline:
@@ -467,9 +713,9 @@ class KeyQuery(odm.QueryBase):
         c = db.client
         if self.slice:
             start, num = self.get_start_num(self.slice)
-            qs = c.execute_script('keyinfo', (), self.pattern, start, num)
+            qs = c.keyinfo(self.pattern, start=start, num=num)
         else:
-            qs = c.execute_script('keyinfo', (), self.pattern)
+            qs = c.keyinfo(self.pattern)
         for q in qs:
             q.database = db
             yield q
@@ -486,7 +732,7 @@ class KeyQuery(odm.QueryBase):
             if N is None:
                 N = self.count()
             start += N
-        return start+1, stop-start
+        return start, stop-start
 
 
 class RedisKeyManager(odm.Manager):
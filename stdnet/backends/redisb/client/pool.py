@@ -0,0 +1,190 @@
+'''Shared connection pools.
+
+Redis clients created by :func:`stdnet.backends.redisb.client.redis_client`
+with the same address, database and connection parameters share one
+:class:`ConnectionPool`, so that the backends of many models registered with
+the same :ref:`connection string <connection-string>` do not open a pool,
+and idle sockets, each.
+'''
+import os
+from threading import Lock, Condition, local
+from timeit import default_timer
+
+from stdnet.utils import native_str
+
+from .extensions import redis
+
+
+class ConnectionPool(redis.ConnectionPool):
+    '''A redis-py connection pool with blocking acquisition, eviction of
+    idle connections and statistics.
+
+    :param max_connections: maximum number of connections, unlimited if
+        ``None``.
+    :param timeout: seconds a thread waits for a connection when
+        *max_connections* are in use. It waits forever if ``None``.
+    :param idle_timeout: connections idle for longer than *idle_timeout*
+        seconds are closed.
+    :param health_check_interval: connections idle for longer than
+        *health_check_interval* seconds are checked with ``PING`` before
+        being used. Default 30.
+
+    A thread gets back the connection it released last, if it is still
+    available, so that its commands reuse one socket.
+    '''
+    def __init__(self, connection_class=redis.Connection,
+                 max_connections=None, timeout=None, idle_timeout=None,
+                 health_check_interval=30, **connection_kwargs):
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._condition = Condition(Lock())
+        super(ConnectionPool, self).__init__(connection_class,
+                                             max_connections,
+                                             **connection_kwargs)
+        self._reset()
+
+    def __repr__(self):
+        kw = self.connection_kwargs
+        return '%s(%s:%s/%s)' % (self.__class__.__name__, kw.get('host'),
+                                 kw.get('port'), kw.get('db', 0))
+
+    @property
+    def stats(self):
+        '''Dictionary of pool statistics: the number of ``created``,
+``in_use`` and ``available`` connections, the number of ``waits`` for a
+connection, of ``timeouts``, of idle connections ``evicted`` and of
+connections found broken by a health check (``reconnects``).'''
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update({'created': self._created_connections,
+                          'in_use': len(self._in_use_connections),
+                          'available': len(self._available_connections),
+                          'max_connections': self.max_connections})
+        return stats
+
+    def get_connection(self, command_name, *keys, **options):
+        self._checkpid()
+        timeout = self.timeout
+        deadline = None if timeout is None else default_timer() + timeout
+        with self._condition:
+            while True:
+                connection, idle = self._take()
+                if connection is not None:
+                    break
+                if (self.max_connections is None or
+                        self._created_connections < self.max_connections):
+                    connection = self.connection_class(
+                        **self.connection_kwargs)
+                    self._created_connections += 1
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - default_timer()
+                    if remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise redis.ConnectionError(
+                            'No connection available after %s seconds' %
+                            timeout)
+                self._counters['waits'] += 1
+                self._condition.wait(remaining)
+            self._in_use_connections.add(connection)
+        interval = self.health_check_interval
+        if interval is not None and idle >= interval:
+            self._health_check(connection)
+        return connection
+
+    def release(self, connection):
+        self._checkpid()
+        with self._condition:
+            if connection not in self._in_use_connections:
+                return
+            self._in_use_connections.remove(connection)
+            self._available_connections.append(connection)
+            self._released[connection] = default_timer()
+            self._local.connection = connection
+            self._condition.notify()
+
+    def disconnect(self):
+        with self._condition:
+            super(ConnectionPool, self).disconnect()
+
+    def _take(self):
+        # Pop an available connection, preferring the one released last by
+        # the current thread, after closing idle connections
+        now = default_timer()
+        available = self._available_connections
+        released = self._released
+        if self.idle_timeout is not None:
+            for connection in list(available):
+                if now - released.get(connection, now) > self.idle_timeout:
+                    available.remove(connection)
+                    released.pop(connection, None)
+                    connection.disconnect()
+                    self._created_connections -= 1
+                    self._counters['evicted'] += 1
+        if not available:
+            return None, 0
+        connection = getattr(self._local, 'connection', None)
+        if connection in available:
+            available.remove(connection)
+        else:
+            connection = available.pop()
+        return connection, now - released.pop(connection, now)
+
+    def _health_check(self, connection):
+        if getattr(connection, '_sock', None) is None:
+            return
+        try:
+            connection.send_command('PING')
+            if native_str(connection.read_response()) != 'PONG':
+                raise redis.ConnectionError('Bad PING reply')
+        except Exception:
+            # the connection reconnects on the next command
+            connection.disconnect()
+            with self._condition:
+                self._counters['reconnects'] += 1
+
+    def _checkpid(self):
+        if self.pid != os.getpid():
+            with self._condition:
+                if self.pid != os.getpid():
+                    self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self._created_connections = 0
+        self._available_connections = []
+        self._in_use_connections = set()
+        self._released = {}
+        self._local = local()
+        self._counters = {'waits': 0, 'timeouts': 0, 'evicted': 0,
+                          'reconnects': 0}
+
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def shared_pool(max_connections=None, pool_timeout=None, idle_timeout=None,
+                **connection_kwargs):
+    '''Return the :class:`ConnectionPool` for *connection_kwargs*, shared
+by all clients with the same connection parameters. The pool options are
+applied when the pool is created.'''
+    key = tuple(sorted(((k, str(v)) for k, v in connection_kwargs.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                max_connections=int(max_connections) if max_connections
+                else None,
+                timeout=float(pool_timeout) if pool_timeout else None,
+                idle_timeout=float(idle_timeout) if idle_timeout else None,
+                **connection_kwargs)
+        return pool
+
+
+def pools():
+    '''List of all shared :class:`ConnectionPool`.'''
+    with _pools_lock:
+        return list(_pools.values())
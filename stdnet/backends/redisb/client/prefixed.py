@@ -62,6 +62,8 @@ class PrefixedRedisMixin(object):
                                   'INFO', 'LASTSAVE', 'PING',
                                   'PSUBSCRIBE', 'PUBLISH', 'PUNSUBSCRIBE',
                                   'QUIT', 'RANDOMKEY', 'SAVE', 'SCRIPT',
+                                  'SCRIPT EXISTS', 'SCRIPT FLUSH',
+                                  'SCRIPT KILL', 'SCRIPT LOAD',
                                   'SELECT', 'SHUTDOWN', 'SLAVEOF',
                                   'SLOWLOG', 'SUBSCRIBE', 'SYNC',
                                   'TIME', 'UNSUBSCRIBE', 'UNWATCH'))
@@ -108,6 +110,18 @@ class PrefixedRedisMixin(object):
     def client(self):
         return self._client
 
+    @property
+    def instrument(self):
+        return self._client.instrument
+
+    @property
+    def tracer(self):
+        return self._client.tracer
+
+    @property
+    def recorder(self):
+        return self._client.recorder
+
     @property
     def prefix(self):
         return self._prefix
@@ -142,6 +156,10 @@ class PrefixedRedisMixin(object):
     def flushdb(self):
         return self.client.delpattern('%s*' % self.prefix)
 
+    def preload_scripts(self, names=None):
+        # scripts have no keys, they are loaded by the wrapped client
+        return self.client.preload_scripts(names)
+
     def _parse_response(self, request, response, command_name, args, options):
         if command_name in self.RESPONSE_CALLBACKS:
             if not isinstance(response, Exception):
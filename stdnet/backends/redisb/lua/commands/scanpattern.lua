@@ -0,0 +1,19 @@
+-- One step of a SCAN iteration over keys matching a pattern
+-- ARGV[1] pattern, ARGV[2] cursor, ARGV[3] number of keys to examine
+-- ARGV[4] 'del' to unlink matched keys, 'keys' to return them
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local result = redis.call('scan', ARGV[2], 'match', ARGV[1], 'count', ARGV[3])
+local keys, n = result[2], # result[2]
+if ARGV[4] == 'del' and n > 0 then
+    local ok, removed = pcall(redis.call, 'unlink', unpack(keys))
+    if not ok then
+        removed = redis.call('del', unpack(keys))
+    end
+    n = removed
+end
+if ARGV[4] ~= 'keys' then
+    keys = {}
+end
+return {result[1], n, keys}
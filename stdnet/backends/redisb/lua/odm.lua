@@ -15,7 +15,9 @@ local odm = {
         multi_fields = {},
         sorted = false,
         autoincr = false,
-        indices = {}
+        indices = {},
+        bitmaps = {},
+        compound = {}
     },
     range_selectors = {
         ge = function (v, v1)
@@ -50,6 +52,11 @@ odm.Model = {
         self.meta = tabletools.json_clean(meta)
         self.idset = self.meta.namespace .. ':id'    -- key for set containing all ids
         self.auto_ids = self.meta.namespace .. ':ids' -- key for auto ids
+        self.bitmaps = {}   -- fields indexed with bitmaps
+        for _, field in ipairs(self.meta.bitmaps or {}) do
+            self.bitmaps[field] = true
+        end
+        self.compound = self.meta.compound or {}  -- compound indices
         return self
     end,
     --[[
@@ -78,10 +85,14 @@ odm.Model = {
         :param field: the field to query
         :param destkey: the key which will store the set of ids resulting from the query
         :param queries: an array containing pairs of query_type, value where query_type
-            can be one of 'set', 'value' or a range filter.
+            can be one of 'set', 'value' or a range filter. For compound indices
+            the array contains 'compound' followed by the values of the index fields.
     --]]
     query = function (self, destkey, field, queries)
         local ranges, unique, qtype, oper, nested = {}, self.meta.indices[field]
+        if self.compound[field] then
+            return self:_querycompound(destkey, field, queries)
+        end
         for i, value in ipairs(queries) do
             if 2*math.floor(i/2) == i then
                 if qtype == 'set' then
@@ -113,6 +124,43 @@ odm.Model = {
         end
         return self:setsize(destkey)
     end,
+    --[[
+        Evaluate a query on bitmap indices and store the resulting ids into
+        destkey. Bitmaps are combined with BITOP and converted into ids once.
+        It returns the size of the set in destkey.
+        :param plan: a table with either a field and the positions of its
+            values in args, or an operation ('and', 'or', 'diff') and
+            nested plans.
+        :param args: array of field values
+    --]]
+    bitmap = function (self, destkey, plan, args)
+        local temps = {}
+        local key = self:_bitmap_plan(plan, args, temps)
+        odm.redis.call('del', destkey)
+        self:_add_ids(destkey, self:_bits_to_ids(key))
+        redis_delete(temps)
+        return self:setsize(destkey)
+    end,
+    --[[
+        Evaluate a boolean expression of lookups and store the resulting ids
+        into destkey. The expression is evaluated on lua tables so that no
+        intermediate keys are created. It returns the size of the set in destkey.
+        :param plan: a table with either an operation ('and', 'or', 'diff') and
+            nested plans, 'all' for all ids, 'key' for the position of a key
+            containing ids, or a field lookup with the positions of values,
+            compound values, subquery keys and range lookups.
+        :param keys: array of keys
+        :param args: array of field values
+    --]]
+    expression = function (self, destkey, plan, keys, args)
+        local ids = {}
+        for id in pairs(self:_expression(plan, nil, keys, args)) do
+            table.insert(ids, id)
+        end
+        odm.redis.call('del', destkey)
+        self:_add_ids(destkey, ids)
+        return self:setsize(destkey)
+    end,
     --[[
         Delete a query stored in key id
     --]]
@@ -149,10 +197,16 @@ odm.Model = {
         :param options: dictionary of options 
     --]]
     load = function (self, key, options)
-        local result, ids, related_items
+        local result, ids, related_items, cursors
         options = tabletools.json_clean(options)
         if options.get and options.get ~= '' then
             return redis_members(key)
+        elseif options.page then
+            if options.page.kind == 'z' then
+                ids, cursors = self:_keyset(key, options.page)
+            else
+                ids, cursors = self:_scan(key, options.page)
+            end
         elseif options.ordering == 'explicit' then
             ids = self:_explicit_ordering(key, options.start, options.stop, options.order)
         elseif options.ordering == 'DESC' then
@@ -183,8 +237,88 @@ odm.Model = {
         else
             related_items = {}
         end
+        if cursors then
+            return {result, related_items, cjson.encode(cursors)}
+        end
         return {result, related_items}
     end,
+    --[[
+        One step of an iteration over the keys owned by the model. Keys are
+        derived from the ids in the id set (instance hashes, structures and
+        index keys) so that the keyspace is never scanned.
+        :param cursor: '0' to start a new iteration
+        :param count: number of ids to process
+        :param action: 'del' to unlink the keys, otherwise existing keys
+            are returned
+        @return {next cursor, number of keys, keys}
+    --]]
+    keys = function (self, cursor, count, action)
+        local keys, seen, ids, next = {}, {}
+        local function add(key)
+            if not seen[key] then
+                seen[key] = true
+                table.insert(keys, key)
+            end
+        end
+        if self.meta.sorted then
+            ids = odm.redis.call('zrange', self.idset, cursor, cursor + count - 1)
+            next = # ids < count + 0 and '0' or tostring(cursor + count)
+        else
+            local result = odm.redis.call('sscan', self.idset, cursor, 'count', count)
+            next, ids = result[1], result[2]
+        end
+        for _, id in ipairs(ids) do
+            local idkey = self:object_key(id)
+            add(idkey)
+            for _, name in ipairs(self.meta.multi_fields or {}) do
+                add(idkey .. ':' .. name)
+            end
+            for field, unique in pairs(self.meta.indices) do
+                if not unique and not self.bitmaps[field] then
+                    add(self:index_key(field, odm.redis.call('hget', idkey, field)))
+                end
+            end
+            for name, fields in pairs(self.compound) do
+                add(self:compound_key(name, odm.redis.call('hmget', idkey, unpack(fields))))
+            end
+        end
+        -- keys which do not depend on ids are added in the last step
+        if next == '0' then
+            for field, unique in pairs(self.meta.indices) do
+                if unique then
+                    add(self:map_key(field))
+                end
+            end
+            for _, key in ipairs(odm.redis.call('smembers', self:bitmap_registry())) do
+                add(key)
+            end
+            for _, name in ipairs(self.meta.multi_fields or {}) do
+                add(self.meta.namespace .. ':struct:' .. name)
+            end
+            add(self:bitmap_registry())
+            add(self.auto_ids)
+            add(self.idset)
+        end
+        local result = {}
+        if action == 'del' then
+            local n = 0
+            for i = 1, # keys, 1000 do
+                local batch = tabletools.slice(keys, i, i + 999)
+                local ok, removed = pcall(odm.redis.call, 'unlink', unpack(batch))
+                if not ok then
+                    removed = odm.redis.call('del', unpack(batch))
+                end
+                n = n + removed
+            end
+            return {next, n, result}
+        end
+        for _, key in ipairs(keys) do
+            if odm.redis.call('exists', key) + 0 == 1 then
+                table.insert(result, key)
+            end
+        end
+        return {next, # result, result}
+    end,
     --
     --          INTERNAL METHODS
     --
@@ -204,6 +338,31 @@ odm.Model = {
         return idxkey
     end,
     --
+    bitmap_key = function (self, field, value)
+        local bkey = self.meta.namespace .. ':bidx:' .. field .. ':'
+        if value then
+            bkey = bkey .. value
+        end
+        return bkey
+    end,
+    --
+    -- Set containing the keys of all bitmap indices, so that bitmaps whose
+    -- bits are all cleared can still be found.
+    bitmap_registry = function (self)
+        return self.meta.namespace .. ':bidx'
+    end,
+    --
+    -- Key of a compound index. Values are prefixed by their length so that
+    -- different tuples of values never map to the same key.
+    compound_key = function (self, name, values)
+        local bits = {self.meta.namespace .. ':cidx:' .. name .. ':'}
+        for i = 1, # self.compound[name] do
+            local value = values[i] or ''
+            table.insert(bits, string.len(value) .. ':' .. value)
+        end
+        return table.concat(bits)
+    end,
+    --
     --[[
         A temporary key in the model namespace
     --]]
@@ -293,6 +452,20 @@ odm.Model = {
         end
     end,
     --
+    _querycompound = function(self, destkey, name, queries)
+        local n, i, key = # self.compound[name], 1
+        while i <= # queries do
+            key = self:compound_key(name, tabletools.slice(queries, i+1, i+n))
+            if self.meta.sorted then
+                odm.redis.call('zunionstore', destkey, 2, destkey, key)
+            else
+                odm.redis.call('sunionstore', destkey, destkey, key)
+            end
+            i = i + n + 1
+        end
+        return self:setsize(destkey)
+    end,
+    --
     _add = function(self, destkey, field, id)
         -- field is not used, but is here to have the same signature as _union
         if id then
@@ -311,13 +484,221 @@ odm.Model = {
     --
     _union = function(self, destkey, field, value)
         local idxkey = self:index_key(field, value)
-        if self.meta.sorted then
+        if self.bitmaps[field] then
+            self:_add_ids(destkey, self:_bits_to_ids(self:bitmap_key(field, value)))
+        elseif self.meta.sorted then
             odm.redis.call('zunionstore', destkey, 2, destkey, idxkey)
         else
             odm.redis.call('sunionstore', destkey, destkey, idxkey)
         end
     end,
     --
+    -- Add an array of ids, which are known to be in the idset, to destkey
+    _add_ids = function(self, destkey, ids)
+        if self.meta.sorted then
+            for _, id in ipairs(ids) do
+                odm.redis.call('zadd', destkey, odm.redis.call('zscore', self.idset, id), id)
+            end
+        else
+            local n = # ids
+            for i = 1, n, 1000 do
+                odm.redis.call('sadd', destkey, unpack(ids, i, math.min(i + 999, n)))
+            end
+        end
+    end,
+    --
+    -- Array of ids with bits set in the bitmap at key
+    _bits_to_ids = function(self, key)
+        local bits, ids, byte = odm.redis.call('get', key), {}
+        if bits then
+            for i = 1, string.len(bits) do
+                byte = string.byte(bits, i)
+                if byte > 0 then
+                    for j = 0, 7 do
+                        if bit.band(byte, 2^(7-j)) > 0 then
+                            table.insert(ids, 8*(i-1) + j)
+                        end
+                    end
+                end
+            end
+        end
+        return ids
+    end,
+    --
+    -- Evaluate a bitmap plan and return the key of the resulting bitmap.
+    -- Intermediate keys are appended to temps.
+    _bitmap_plan = function(self, plan, args, temps)
+        local keys, op, dest = {}, plan.op
+        if plan.field then
+            for _, i in ipairs(plan.values) do
+                table.insert(keys, self:bitmap_key(plan.field, args[i]))
+            end
+            if # keys == 1 then
+                return keys[1]
+            end
+            op = 'or'
+        else
+            for _, p in ipairs(plan.args) do
+                table.insert(keys, self:_bitmap_plan(p, args, temps))
+            end
+        end
+        dest = self:temp_key()
+        table.insert(temps, dest)
+        if op == 'diff' then
+            -- A AND NOT B is evaluated as A XOR (A AND B) since BITOP NOT
+            -- would not cover bits beyond the length of B
+            local first = table.remove(keys, 1)
+            if # keys > 1 then
+                odm.redis.call('bitop', 'or', dest, unpack(keys))
+                keys = {dest}
+            end
+            odm.redis.call('bitop', 'and', dest, first, keys[1])
+            odm.redis.call('bitop', 'xor', dest, first, dest)
+        else
+            odm.redis.call('bitop', op, dest, unpack(keys))
+        end
+        return dest
+    end,
+    --
+    -- Table of ids matching an expression plan, restricted to candidates
+    -- when not nil
+    _expression = function(self, plan, candidates, keys, args)
+        local result
+        if plan.op == 'and' then
+            for _, p in ipairs(plan.args) do
+                candidates = self:_expression(p, candidates, keys, args)
+            end
+            return candidates or self:_ids_table(self:setids(self.idset))
+        elseif plan.op == 'or' then
+            result = {}
+            for _, p in ipairs(plan.args) do
+                for id in pairs(self:_expression(p, candidates, keys, args)) do
+                    result[id] = true
+                end
+            end
+            return result
+        elseif plan.op == 'diff' then
+            result = self:_expression(plan.args[1], candidates, keys, args)
+            for i = 2, # plan.args do
+                for id in pairs(self:_expression(plan.args[i], result, keys, args)) do
+                    result[id] = nil
+                end
+            end
+            return result
+        elseif plan.all then
+            result = {}
+            for id in pairs(candidates or self:_ids_table(self:setids(self.idset))) do
+                result[id] = true
+            end
+            return result
+        elseif plan.key then
+            result = self:_ids_table(redis_members(keys[plan.key]))
+        else
+            result = self:_expression_lookup(plan, candidates, keys, args)
+        end
+        if candidates then
+            for id in pairs(result) do
+                if not candidates[id] then
+                    result[id] = nil
+                end
+            end
+        end
+        return result
+    end,
+    --
+    -- Table of ids matching the lookups on a field
+    _expression_lookup = function(self, plan, candidates, keys, args)
+        local field, unique, values, ids, value = plan.field, self.meta.indices[plan.field], {}
+        for _, i in ipairs(plan.values) do
+            table.insert(values, args[i])
+        end
+        for _, i in ipairs(plan.keys) do
+            for _, v in ipairs(redis_members(keys[i])) do
+                table.insert(values, v)
+            end
+        end
+        if # values > 0 or # plan.keys > 0 or # plan.compound > 0 then
+            ids = {}
+            for _, positions in ipairs(plan.compound) do
+                local cvalues = {}
+                for _, i in ipairs(positions) do
+                    table.insert(cvalues, args[i])
+                end
+                for _, id in ipairs(self:setids(self:compound_key(field, cvalues))) do
+                    ids[id] = true
+                end
+            end
+            for _, v in ipairs(values) do
+                if field == self.meta.id_name then
+                    if self:has_id(v) then
+                        ids[v] = true
+                    end
+                elseif unique then
+                    value = odm.redis.call('hget', self:map_key(field), v)
+                    if value then
+                        ids[value] = true
+                    end
+                elseif unique == false then
+                    for _, id in ipairs(self:_index_ids(field, v)) do
+                        ids[tostring(id)] = true
+                    end
+                else
+                    error('Cannot query on field "' .. field .. '". Not an index.')
+                end
+            end
+        end
+        if # plan.ranges > 0 then
+            local ranges, selected, nested, selector, ok = {}, {}
+            for _, range in ipairs(plan.ranges) do
+                selector = odm.range_selectors[range[1]]
+                if not selector then
+                    error('Cannot understand query type "' .. range[1] .. '".')
+                end
+                value, nested = unpack(cjson.decode(args[range[2]]))
+                if field ~= self.meta.id_name then
+                    table.insert(nested, field)
+                end
+                table.insert(ranges, {selector=selector, value=value, nested=nested})
+            end
+            for id in pairs(ids or candidates or self:_ids_table(self:setids(self.idset))) do
+                ok = true
+                for _, range in ipairs(ranges) do
+                    if # range.nested > 0 then
+                        _, value = self:_nested_field(id, range.nested)
+                    else
+                        value = id
+                    end
+                    if not (value and range.selector(value, range.value)) then
+                        ok = false
+                        break
+                    end
+                end
+                if ok then
+                    selected[id] = true
+                end
+            end
+            ids = selected
+        end
+        return ids or {}
+    end,
+    --
+    _ids_table = function(self, ids)
+        local result = {}
+        for _, id in ipairs(ids) do
+            result[id] = true
+        end
+        return result
+    end,
+    --
+    -- Array of ids in the index of field for a given value
+    _index_ids = function(self, field, value)
+        if self.bitmaps[field] then
+            return self:_bits_to_ids(self:bitmap_key(field, value))
+        else
+            return self:setids(self:index_key(field, value))
+        end
+    end,
+    --
     _add_to_dest = function(self, destkey, field, key, as_union)
         local processed = {}
         for _, id in ipairs(redis_members(key)) do
@@ -475,6 +856,12 @@ odm.Model = {
                 elseif value then
                     odm.redis.call('hdel', idxkey, value)
                 end
+            elseif self.bitmaps[field] then
+                idxkey = self:bitmap_key(field, value)
+                odm.redis.call('setbit', idxkey, id, update and 1 or 0)
+                if update then
+                    odm.redis.call('sadd', self:bitmap_registry(), idxkey)
+                end
             else
                 idxkey = self:index_key(field, value)
                 if update then
@@ -484,6 +871,17 @@ odm.Model = {
                 end
             end
         end
+        -- compound indices are updated only when unique constraints are met
+        if not update or # errors == 0 then
+            for name, fields in pairs(self.compound) do
+                idxkey = self:compound_key(name, odm.redis.call('hmget', idkey, unpack(fields)))
+                if update then
+                    self:setadd(idxkey, score, id)
+                else
+                    self:remove_from_set(idxkey, id)
+                end
+            end
+        end
         return errors
     end,
     --
@@ -537,6 +935,100 @@ odm.Model = {
         return ids
     end,
     --
+    -- Keyset pagination of a sorted set. The cursor is a (score, id) pair.
+    _keyset = function (self, key, page)
+        local cursor, limit, cmd = page.cursor, page.limit, 'zrange'
+        local start, stop, rank, score, ids, cursors
+        if page.desc then
+            cmd = 'zrevrange'
+        end
+        if cursor then
+            rank = odm.redis.call(page.desc and 'zrevrank' or 'zrank', key, cursor[2])
+            score = rank and odm.redis.call('zscore', key, cursor[2])
+            if score ~= cursor[1] then
+                -- the cursor is no longer in the set, find where it would be
+                rank = self:_keyset_rank(key, cursor[1], cursor[2], page.desc)
+            elseif not page.backward then
+                rank = rank + 1
+            end
+            if page.backward then
+                start, stop = math.max(rank - limit, 0), rank - 1
+            else
+                start, stop = rank, rank + limit - 1
+            end
+        elseif page.backward then
+            stop = odm.redis.call('zcard', key) - 1
+            start = math.max(stop - limit + 1, 0)
+        else
+            start, stop = 0, limit - 1
+        end
+        ids, cursors = {}, {}
+        if stop >= start then
+            local values = odm.redis.call(cmd, key, start, stop, 'WITHSCORES')
+            for i = 1, # values, 2 do
+                table.insert(ids, values[i])
+            end
+            if # ids > 0 then
+                -- no previous page when starting from the first element
+                if start > 0 then
+                    cursors.before = {values[2], values[1]}
+                end
+                cursors.after = {values[# values], values[# values - 1]}
+            end
+        end
+        return ids, cursors
+    end,
+    --
+    -- Number of elements preceding the (score, id) pair in the iteration
+    -- order of a sorted set
+    _keyset_rank = function (self, key, score, id, desc)
+        local rank, ties
+        if desc then
+            rank = odm.redis.call('zcount', key, '(' .. score, '+inf')
+        else
+            rank = odm.redis.call('zcount', key, '-inf', '(' .. score)
+        end
+        ties = odm.redis.call('zrangebyscore', key, score, score)
+        for _, tie in ipairs(ties) do
+            if (desc and tie > id) or (not desc and tie < id) then
+                rank = rank + 1
+            end
+        end
+        return rank
+    end,
+    --
+    -- Stable pagination of a set via SSCAN. The scan is over the id set of
+    -- the model, which outlives the temporary key of a filtered query, and
+    -- skips ids not in the query key. The cursor is a pair containing the
+    -- scan cursor and the number of elements already scanned from the
+    -- batch at that cursor.
+    _scan = function (self, key, page)
+        local cursor, skip, limit, ids = '0', 0, page.limit, {}
+        local filtered = key ~= self.idset
+        if page.cursor then
+            cursor, skip = page.cursor[1], page.cursor[2]
+        end
+        while true do
+            local result = odm.redis.call('sscan', self.idset, cursor, 'COUNT', limit)
+            local batch, i = result[2], skip
+            while i < # batch and # ids < limit do
+                i = i + 1
+                if not filtered or odm.redis.call('sismember', key, batch[i]) + 0 == 1 then
+                    table.insert(ids, batch[i])
+                end
+            end
+            if i < # batch then
+                return ids, {after={cursor, i}}
+            end
+            cursor, skip = result[1], 0
+            if cursor == '0' then
+                return ids, {}
+            elseif # ids == limit then
+                return ids, {after={cursor, 0}}
+            end
+        end
+    end,
+    --
     -- Load related objects with their fields
     _load_related = function (self, result, related)
         local related_items = {}
@@ -591,7 +1083,7 @@ odm.Model = {
     _aggregate = function (self, destkey, id, field, processed)
         if not processed[id] then
             processed[id] = true
-            for _, rid in ipairs(self:setids(self:index_key(field, id))) do
+            for _, rid in ipairs(self:_index_ids(field, id)) do
                 self:_add(destkey, field, rid)
                 self:_aggregate(destkey, rid, field, processed)
             end
@@ -651,10 +1143,25 @@ else
         delete = function(self, model, keys, ...)
             return model:delete(first_key(keys))
         end,
+        -- Build a query from bitmap indices and store results on a new set
+        bitmap = function(self, model, keys, plan, args)
+            return model:bitmap(first_key(keys), cjson.decode(plan), args)
+        end,
+        -- Evaluate a boolean expression and store results on a new set
+        expression = function(self, model, keys, plan, args)
+            return model:expression(first_key(keys), cjson.decode(plan), keys, args)
+        end,
         -- recursively add id to a set
         aggregate = function(self, model, keys, field, args)
             return model:aggregate(first_key(keys), field)
         end,
+        -- One step of an iteration over the model keys
+        keys = function(self, model, keys, cursor, args)
+            if redis.replicate_commands then
+                redis.replicate_commands()
+            end
+            return model:keys(cursor, args[1], args[2])
+        end,
         -- structure. Don nothing
         structure = function(self, model, keys, ...)
             return ''
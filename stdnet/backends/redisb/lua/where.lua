@@ -1,6 +1,6 @@
 if redis then
     -- THE FIRST ARGUMENT IS THE NAME OF THE SCRIPT
-    if # ARGV < 1 then
+    if # ARGV < 2 then
         error('Wrong number of arguments.')
     end
     if # KEYS < 2 then
@@ -13,9 +13,18 @@ if redis then
     if destkey == key then
         redis.call('del', key)
     end
-    if # ARGV == 2 then
+    if ARGV[2] ~= '' then
         load_only = cjson.decode(ARGV[2])
     end
+    -- constants of the where clause, prefixed by 'n' for numbers
+    local __args = {{}}
+    for i = 3, # ARGV do
+        local value = string.sub(ARGV[i], 2)
+        if string.sub(ARGV[i], 1, 1) == 'n' then
+            value = tonumber(value)
+        end
+        __args[i-2] = value
+    end
     
     local function setnumber(this, name, field)
         this[name] = field + 0
@@ -50,4 +59,5 @@ if redis then
             redis.call('sadd', destkey, id)
         end
     end
+    return # ids
 end
\ No newline at end of file
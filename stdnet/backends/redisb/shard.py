@@ -0,0 +1,415 @@
+'''The :mod:`stdnet.backends.redisb.shard` module implements a redis backend
+which distributes the data of models across several redis servers.
+It is selected with the ``redis+shard`` scheme and a comma separated list
+of server addresses::
+
+    models = odm.Router('redis+shard://10.0.0.1:6379,10.0.0.2:6379?db=3')
+
+Instances are placed by consistent hashing of their primary key on a
+:class:`HashRing`, together with the structures of their multi-fields.
+Each server keeps the id set and indices of the instances it owns, so that
+queries are evaluated by each server and their results merged by the client
+(scatter-gather). Ordering and slicing are applied after merging.
+
+Auto ids are generated by the first server of the list before instances
+are committed. Unique constraints are enforced by each server for the
+instances it owns, and a commit involving several servers is not atomic.
+Lookups across models are evaluated by each server with the data it holds,
+which is correct for models not sharded or for related instances stored on
+the same server. Keyset pagination is not available.
+
+After adding a server, :meth:`BackendDataServer.reshard` moves instances to
+the servers now owning them.
+'''
+import json
+from bisect import bisect
+from hashlib import md5
+
+import stdnet
+from stdnet import QuerySetError, CommitException, ImproperlyConfigured
+from stdnet.utils import iteritems, native_str, flat_mapping, to_bytes
+from stdnet.utils.structures import OrderedDict
+from stdnet.backends import session_result, instance_session_result
+
+from . import (BackendDataServer as RedisDataServer, RedisQuery, OBJ,
+               MIN_FLOAT, SCAN_COUNT)
+
+# Number of points of each server in the ring
+REPLICAS = 160
+
+
+class HashRing(object):
+    '''A consistent hash ring. Each node is placed at *replicas* points of
+the ring and a key belongs to the first node following its hash, so that
+adding or removing a node moves only the keys of that node.'''
+    def __init__(self, nodes=(), replicas=REPLICAS):
+        self.replicas = replicas
+        self._nodes = {}
+        self._points = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._nodes.values()))
+
+    def hash(self, key):
+        return int(md5(to_bytes(str(key))).hexdigest()[:8], 16)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            self._nodes[self.hash('%s-%s' % (node, i))] = node
+        self._points = sorted(self._nodes)
+
+    def remove(self, node):
+        self._nodes = dict(((p, n) for p, n in iteritems(self._nodes)
+                            if n != node))
+        self._points = sorted(self._nodes)
+
+    def get(self, key):
+        '''The node owning *key*.'''
+        if not self._points:
+            raise KeyError('No nodes in the hash ring')
+        index = bisect(self._points, self.hash(key)) % len(self._points)
+        return self._nodes[self._points[index]]
+
+
+class NodeQuery(RedisQuery):
+    '''The part of a sharded query evaluated by one node.'''
+    def __init__(self, queryelem, node, **kwargs):
+        self._node = node
+        super(NodeQuery, self).__init__(queryelem, **kwargs)
+
+    @property
+    def backend(self):
+        return self._node
+
+    def child_query(self, elem, pipe):
+        query = self._node.backend_query(elem, pipe)
+        self.phases.extend(query.phases)
+        return query
+
+
+class ShardQuery(stdnet.BackendQuery):
+    '''Scatter-gather query. A :class:`NodeQuery` is evaluated by each node
+and results are merged.'''
+    def _build(self, **kwargs):
+        self.queries = [NodeQuery(self.queryelem, node) for node in
+                        self.backend.nodes.values()]
+        # all nodes execute the same phases
+        self.phases = self.queries[0].phases
+
+    def _execute_query(self):
+        yield sum((q.execute_query() for q in self.queries))
+
+    def _has(self, val):
+        return any((val in q for q in self.queries))
+
+    def _items(self, slic):
+        start, stop = 0, None
+        if slic:
+            start, stop = slic.start or 0, slic.stop
+        # each node loads the items up to stop, the slice is applied after
+        # merging
+        node_slice = None
+        if stop is not None and start >= 0 and stop >= 0:
+            node_slice = slice(0, stop)
+        items = []
+        for q in self.queries:
+            if q.execute_query():
+                items.extend(q._items(node_slice))
+        meta = self.meta
+        ordering = self.queryelem.ordering or meta.ordering
+        if not ordering and slic:
+            ordering = meta.get_sorting(meta.pkname())
+        if ordering and not self.queryelem._get_field:
+            items = self.sort(items, ordering)
+        return items[start:stop] if slic else items
+
+    def sort(self, items, ordering):
+        '''Sort *items* loaded from different nodes.'''
+        if ordering.nested:
+            raise QuerySetError('Sharded queries cannot be ordered by '
+                                'fields of related models')
+        if ordering.auto or ordering.field is self.meta.pk:
+            value = lambda obj: obj.pkvalue()
+        else:
+            value = lambda obj: getattr(obj, ordering.name, None)
+
+        def key(obj):
+            v = value(obj)
+            return (v is not None, v)
+        return sorted(items, key=key, reverse=ordering.desc)
+
+    def page(self, cursor=None, limit=25, backward=False):
+        raise QuerySetError('Keyset pagination is not available for '
+                            'sharded models')
+
+
+class ShardNode(RedisDataServer):
+    '''A redis server of a sharded :class:`BackendDataServer`.
+
+    .. attribute:: shard
+
+        The :class:`BackendDataServer` this node belongs to.
+    '''
+    shard = None
+
+    def backend_query(self, query, pipe):
+        if query.backend == self.shard:
+            return NodeQuery(query.construct(), self, pipe=pipe)
+        return query.backend_query(pipe=pipe)
+
+
+class BackendDataServer(stdnet.BackendDataServer):
+    '''Sharded redis :class:`stdnet.BackendDataServer`.
+
+    .. attribute:: nodes
+
+        Ordered dictionary of server addresses and their :class:`ShardNode`.
+
+    .. attribute:: ring
+
+        The :class:`HashRing` of server addresses. The number of points of
+        each server is set with the ``replicas`` connection parameter.
+    '''
+    Query = ShardQuery
+    default_port = 6379
+
+    def setup_connection(self, address):
+        replicas = int(self.params.pop('replicas', REPLICAS))
+        params = self.params.copy()
+        self.nodes = OrderedDict()
+        for node_address in ':'.join((str(a) for a in address)).split(','):
+            node = ShardNode('redis', node_address, charset=self.charset,
+                             namespace=self.namespace, **params)
+            if node.is_async():
+                raise ImproperlyConfigured('Sharded redis backend requires '
+                                           'synchronous connections')
+            node.shard = self
+            self.nodes[node_address] = node
+        self.ring = HashRing(self.nodes, replicas)
+        if replicas != REPLICAS:
+            self.params['replicas'] = replicas
+        if self.namespace:
+            self.params['namespace'] = self.namespace
+        return self.id_node.client
+
+    @property
+    def id_node(self):
+        '''The :class:`ShardNode` generating auto ids.'''
+        return next(iter(self.nodes.values()))
+
+    def node(self, key):
+        '''The :class:`ShardNode` owning *key*.'''
+        return self.nodes[self.ring.get(key)]
+
+    def instance_node(self, meta, pkvalue):
+        '''The :class:`ShardNode` owning the instance of model *meta* with
+primary key *pkvalue*.'''
+        return self.node(self.basekey(meta, pkvalue))
+
+    def structure_node(self, instance):
+        '''The :class:`ShardNode` owning the structure *instance*. The
+structures of multi-fields belong to the node of their model instance.'''
+        field = instance.field
+        if field:
+            meta = field.model._meta
+            if instance._pkvalue:
+                return self.instance_node(meta, instance._pkvalue)
+            return self.node(self.basekey(meta, 'struct', field.name))
+        return self.node('%s.%s' % (instance._meta.name, instance.id))
+
+    def structure(self, instance, client=None):
+        return self.structure_node(instance).structure(instance, client)
+
+    def auto_id_to_python(self, value):
+        return int(value)
+
+    def meta(self, meta):
+        return self.id_node.meta(meta)
+
+    def setup_model(self, meta):
+        for node in self.nodes.values():
+            node.setup_model(meta)
+
+    def ping(self):
+        return all((node.ping() for node in self.nodes.values()))
+
+    def disconnect(self):
+        for node in self.nodes.values():
+            node.disconnect()
+
+    def set_instrument(self, instrument):
+        super(BackendDataServer, self).set_instrument(instrument)
+        for node in self.nodes.values():
+            node.set_instrument(instrument)
+
+    def set_recorder(self, recorder):
+        super(BackendDataServer, self).set_recorder(recorder)
+        for node in self.nodes.values():
+            node.set_recorder(recorder)
+
+    def set_tracer(self, tracer):
+        super(BackendDataServer, self).set_tracer(tracer)
+        for node in self.nodes.values():
+            node.set_tracer(tracer)
+
+    def clean(self, meta, **options):
+        for node in self.nodes.values():
+            node.clean(meta, **options)
+
+    def flush(self, meta=None, **options):
+        return sum((node.flush(meta, **options) or 0 for node
+                    in self.nodes.values()))
+
+    def model_keys(self, meta, **options):
+        keys = []
+        for node in self.nodes.values():
+            keys.extend(node.model_keys(meta, **options))
+        return keys
+
+    def execute_session(self, session_data):
+        '''Split the session data by node and execute it on each node.
+Instances are committed on the node owning their primary key, while
+deletes are executed on all nodes.'''
+        nodes = OrderedDict(((node, []) for node in self.nodes.values()))
+        for sm in session_data:
+            meta = sm.meta
+            self.reserve_ids(meta, sm.dirty)
+            dirty = self._group(sm.dirty, lambda instance:
+                                self._dirty_node(meta, instance))
+            structures = self._group(sm.structures, self.structure_node)
+            for node, data in iteritems(nodes):
+                ndirty = dirty.get(node, ())
+                nstructures = structures.get(node, ())
+                if ndirty or nstructures or sm.deletes is not None:
+                    data.append(stdnet.session_data(meta, ndirty, sm.deletes,
+                                                    sm.queries, nstructures))
+        results = OrderedDict()
+        for node, data in iteritems(nodes):
+            if data:
+                for result in node.execute_session(data):
+                    if isinstance(result, session_result):
+                        meta, res = result
+                        results.setdefault(meta, []).extend(res)
+        return [session_result(meta, res) for meta, res in iteritems(results)]
+
+    def reserve_ids(self, meta, instances):
+        '''Assign auto ids, generated by the :attr:`id_node`, to new
+*instances* so that they can be placed before committing.'''
+        if meta.pk.type == 'auto':
+            new = [instance for instance in instances
+                   if not instance.pkvalue()]
+            if new:
+                key = self.id_node.basekey(meta, 'ids')
+                last = self.id_node.client.incrby(key, len(new))
+                for id, instance in enumerate(new, last - len(new) + 1):
+                    setattr(instance, meta.pk.attname, id)
+
+    def reshard(self, meta, count=SCAN_COUNT, progress=None):
+        '''Move the instances of model *meta* to the nodes owning them,
+for example after a server is added to the connection string. Writes should
+be paused while resharding.
+
+:param count: number of ids processed at each step.
+:param progress: optional callable invoked after each step with the number
+    of instances moved so far.
+:return: the number of instances moved.'''
+        moved = 0
+        for node in self.nodes.values():
+            batch = []
+            for id in self._scan_ids(node, meta, count):
+                target = self.instance_node(meta, id)
+                if target is not node:
+                    batch.append((id, target))
+                if len(batch) >= count:
+                    moved += self._move(meta, node, batch)
+                    batch = []
+                    if progress:
+                        progress(moved)
+            if batch:
+                moved += self._move(meta, node, batch)
+                if progress:
+                    progress(moved)
+        return moved
+
+    # INTERNALS
+    def _group(self, items, node):
+        groups = {}
+        for item in items or ():
+            groups.setdefault(node(item), []).append(item)
+        return groups
+
+    def _dirty_node(self, meta, instance):
+        node = self.instance_node(meta, instance.pkvalue())
+        state = instance.get_state()
+        if state.persistent and node is not self.instance_node(meta,
+                                                               state.iid):
+            raise CommitException('Cannot change the primary key of %s to a '
+                                  'value owned by a different node' %
+                                  instance)
+        return node
+
+    def _scan_ids(self, node, meta, count):
+        client = node.client
+        idset = node.basekey(meta, 'id')
+        if meta.ordering:
+            ids = (id for id, _ in client.zscan_iter(idset, count=count))
+        else:
+            ids = client.sscan_iter(idset, count=count)
+        for id in ids:
+            yield native_str(id, client.encoding)
+
+    def _move(self, meta, source, batch):
+        # Load instances, scores and multi-fields from source, commit them
+        # in their target nodes and delete them from source
+        multifields = [field.name for field in meta.multifields]
+        pipe = source.client.pipeline(False)
+        for id, _ in batch:
+            pipe.hgetall(source.basekey(meta, OBJ, id))
+            if meta.ordering:
+                pipe.zscore(source.basekey(meta, 'id'), id)
+            for name in multifields:
+                pipe.dump(source.basekey(meta, OBJ, id, name))
+        replies = iter(pipe.execute())
+        targets = OrderedDict()
+        for id, target in batch:
+            data = next(replies)
+            score = next(replies) if meta.ordering else MIN_FLOAT
+            dumps = [(name, next(replies)) for name in multifields]
+            targets.setdefault(target, []).append((id, score, data, dumps))
+        meta_info = json.dumps(source.meta(meta))
+        moved = []
+        for target, items in iteritems(targets):
+            lua_data = [len(items)]
+            for id, score, data, _ in items:
+                data = flat_mapping(data)
+                lua_data.extend(('add', '', id, score, len(data)))
+                lua_data.extend(data)
+            pipe = target.client.pipeline()
+            target.odmrun(pipe, 'commit', meta, (), meta_info, *lua_data,
+                          iids=[item[0] for item in items])
+            committed = set()
+            for result in pipe.execute():
+                if isinstance(result, session_result):
+                    committed.update((str(r.iid) for r in result.results
+                                      if isinstance(r,
+                                                    instance_session_result)))
+            pipe = target.client.pipeline()
+            for id, _, _, dumps in items:
+                if id in committed:
+                    moved.append(id)
+                    for name, dump in dumps:
+                        if dump is not None:
+                            pipe.execute_command(
+                                'RESTORE', target.basekey(meta, OBJ, id, name),
+                                0, dump, 'REPLACE')
+            pipe.execute()
+        if moved:
+            key = source.tempkey(meta)
+            pipe = source.client.pipeline()
+            pipe.sadd(key, *moved)
+            source.odmrun(pipe, 'delete', meta, (key,), meta_info)
+            pipe.delete(key)
+            pipe.execute()
+        return len(moved)
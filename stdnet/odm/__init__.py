@@ -10,3 +10,5 @@ from .structfields import *
 from .globals import *
 from .utils import *
 from .search import *
+from .slowlog import *
+from .advisor import *
@@ -0,0 +1,363 @@
+'''Index advisor driven by a recorded query workload.
+
+An :class:`IndexAdvisor` consumes query fingerprints, as recorded by a
+:class:`SlowLog` or obtained from :func:`query_fingerprint`, and reports
+which indices of the models registered with a :class:`Router` should be
+added or removed::
+
+    from stdnet import odm
+
+    advisor = odm.IndexAdvisor(models)
+    advisor.record_slowlog(models.slowlog)
+    for r in advisor.report():
+        print(r.model, r.action, r.kind, r.fields, r.reason)
+
+.. attribute:: recommendation
+
+    Namedtuple with the following fields:
+
+    * ``model`` the model key.
+    * ``action`` ``add``, ``remove`` or ``convert``.
+    * ``kind`` ``index``, ``bitmap``, ``compound`` or ``ordering``, the
+      latter being the :attr:`ModelMeta.ordering` sorted index.
+    * ``fields`` tuple of field names.
+    * ``reason`` a human readable explanation.
+    * ``queries`` number of recorded queries which would benefit.
+    * ``read_cost`` estimated number of elements the server would not need
+      to process for the recorded workload, ``None`` if unknown.
+    * ``write_cost`` index updates added, or removed if negative, for each
+      committed instance.
+    * ``memory`` estimated bytes added, or freed if negative, ``None`` if
+      unknown.
+
+Estimates use the :meth:`stdnet.BackendDataServer.index_sizes` of the
+model backend, when available, and are meant for ranking recommendations
+rather than for capacity planning.
+'''
+import re
+from collections import namedtuple
+from math import log
+
+from stdnet.utils import iteritems
+
+from .query import Q, QueryElement
+from .slowlog import query_fingerprint
+
+
+__all__ = ['IndexAdvisor', 'recommendation', 'parse_fingerprint']
+
+recommendation = namedtuple('recommendation', 'model action kind fields '
+                            'reason queries read_cost write_cost memory')
+
+EQUALITY_LOOKUPS = ('value', 'set')
+WHERE_EQUALITY = re.compile(r'\bthis\.(\w+)\s*==')
+# bytes of a score in a sorted set
+SCORE_BYTES = 8
+
+
+def parse_fingerprint(fingerprint):
+    '''Parse a :func:`query_fingerprint` into a three elements tuple
+``(model, tree, options)``. The *tree* is a ``(name, children)`` tuple,
+where *children* is a list of trees or ``None`` for lookups, and *options*
+a dictionary with the ``order``, ``fields``, ``related``, ``get`` and
+``where`` parts of the fingerprint.'''
+    model, _, text = fingerprint.partition(' ')
+    tree, pos = _parse_tree(text, 0)
+    options = {}
+    text = text[pos:].strip()
+    while text:
+        if text.startswith('where='):
+            options['where'] = text[6:]
+            break
+        part, _, text = text.partition(' ')
+        key, _, value = part.partition('=')
+        options[key] = value
+    return model, tree, options
+
+
+def _parse_tree(text, pos):
+    start, size = pos, len(text)
+    while (pos < size and text[pos] not in '() ' and
+           not text.startswith(', ', pos)):
+        pos += 1
+    name = text[start:pos]
+    if pos < size and text[pos] == '(':
+        children = []
+        pos += 1
+        while pos < size and text[pos] != ')':
+            child, pos = _parse_tree(text, pos)
+            children.append(child)
+            if text.startswith(', ', pos):
+                pos += 2
+        return (name, children), pos + 1
+    return (name, None), pos
+
+
+class ModelWorkload(object):
+    '''Usage of the indices of a model in the recorded queries.
+
+.. attribute:: queries
+
+    Number of recorded queries on the model, including subqueries.
+
+.. attribute:: equality
+
+    Dictionary of field attribute names and number of equality lookups.
+
+.. attribute:: ranges
+
+    Dictionary of field attribute names and number of range lookups, which
+    are evaluated by scanning the ids selected by the other lookups.
+
+.. attribute:: compound
+
+    Dictionary of compound index names and number of lookups.
+
+.. attribute:: combined
+
+    Dictionary of tuples of field attribute names filtered together by
+    equality and number of queries.
+
+.. attribute:: sorts
+
+    Dictionary of field names and number of queries sorted by them.
+
+.. attribute:: where
+
+    Dictionary of field names and number of equality tests in ``where``
+    clauses, which are evaluated by scanning instances.
+'''
+    def __init__(self, model):
+        self.model = model
+        self.queries = 0
+        self.duration = 0.0
+        self.equality = {}
+        self.ranges = {}
+        self.compound = {}
+        self.combined = {}
+        self.sorts = {}
+        self.where = {}
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.model)
+
+    def add(self, counter, key, count):
+        counter[key] = counter.get(key, 0) + count
+
+
+class IndexAdvisor(object):
+    '''Recommend index additions and removals for the models registered
+with *router* from a recorded query workload.
+
+:parameter router: a :class:`Router`.
+:parameter min_queries: minimum number of recorded queries for a
+    recommendation. Indices are recommended for removal only for models
+    with at least *min_queries* recorded queries.
+:parameter bitmap_cardinality: maximum number of distinct values of an
+    index for recommending its conversion to a bitmap index.
+
+.. attribute:: workload
+
+    Dictionary of model keys and :class:`ModelWorkload`.
+'''
+    def __init__(self, router, min_queries=10, bitmap_cardinality=16):
+        self.router = router
+        self.min_queries = min_queries
+        self.bitmap_cardinality = bitmap_cardinality
+        self.workload = {}
+
+    def record(self, query, duration=0.0, count=1):
+        '''Record *count* executions of *query*, a fingerprint string,
+a :class:`Query` or a :class:`QueryElement`.'''
+        if isinstance(query, Q):
+            query = query.construct()
+            if not isinstance(query, QueryElement):
+                return
+            query = query_fingerprint(query)
+        model, tree, options = parse_fingerprint(query)
+        workload = self._workload(model)
+        workload.queries += count
+        workload.duration += duration
+        self._record_tree(model, tree, count)
+        order = options.get('order')
+        if order:
+            workload.add(workload.sorts,
+                         order.lstrip('-').split('__')[0], count)
+        for field in set(WHERE_EQUALITY.findall(options.get('where', ''))):
+            workload.add(workload.where, field, count)
+
+    def record_slowlog(self, slowlog):
+        '''Record the entries of a :class:`SlowLog`.'''
+        for entry in slowlog.entries():
+            self.record(entry.fingerprint, entry.duration)
+
+    def report(self, sizes=True):
+        '''List of :class:`recommendation` for all recorded models, sorted by
+model and by number of queries affected. If *sizes* is ``True`` the
+:meth:`stdnet.BackendDataServer.index_sizes` of models are used to estimate
+costs.'''
+        metas = dict(((meta.modelkey, meta) for meta in
+                      self.router.registered_models))
+        result = []
+        for model in sorted(self.workload):
+            meta = metas.get(model)
+            if meta is None:
+                continue
+            index_sizes = {}
+            if sizes:
+                index_sizes = self.router[meta.model].backend.index_sizes(meta)
+            recommendations = self.recommend(meta, self.workload[model],
+                                             index_sizes)
+            recommendations.sort(key=lambda r: -r.queries)
+            result.extend(recommendations)
+        return result
+
+    def recommend(self, meta, workload, sizes):
+        '''List of :class:`recommendation` for the model with *meta* given
+its :class:`ModelWorkload` and its *sizes* dictionary.'''
+        result = []
+        model = meta.modelkey
+        ids = sizes.get('id')
+        n = ids.members if ids else None
+        member_bytes = self.member_bytes(sizes)
+        fields = dict(((f.attname, f) for f in meta.scalarfields))
+        ordering = meta.ordering.name if meta.ordering else None
+        # equality tests in where clauses on fields which could be indices
+        for name, count in sorted(iteritems(workload.where)):
+            field = fields.get(name)
+            if (field is None or field.index or field.as_cache or
+                    count < self.min_queries):
+                continue
+            result.append(recommendation(
+                model, 'add', 'index', (field.name,),
+                'equality test in %s where clauses scanning instances' %
+                count, count, count*n if n is not None else None, 1,
+                self.estimate(n, member_bytes)))
+        # fields filtered together by equality
+        compounds = set((frozenset((f.attname for f in c))
+                         for c in meta.compound_indices))
+        for names, count in sorted(iteritems(workload.combined)):
+            names = tuple((name for name in names if name in fields and
+                           not fields[name].unique))
+            if (len(names) < 2 or count < self.min_queries or
+                    frozenset(names) in compounds):
+                continue
+            read_cost = None
+            if sizes:
+                read_cost = count*sum((self.average_size(sizes.get(name))
+                                       for name in names))
+            result.append(recommendation(
+                model, 'add', 'compound',
+                tuple((fields[name].name for name in names)),
+                'fields filtered together by equality in %s queries' % count,
+                count, read_cost, 1,
+                self.estimate(n, member_bytes)))
+        # the most used sort field as the model ordering
+        if workload.sorts:
+            count, name = max(((c, s) for s, c in iteritems(workload.sorts)))
+            field = fields.get(name)
+            if (name != ordering and field is not None and
+                    count >= self.min_queries):
+                reason = '%s queries sorted by %s' % (count, field.name)
+                if ordering:
+                    reason += ', replacing the ordering by %s' % ordering
+                result.append(recommendation(
+                    model, 'add', 'ordering', (field.name,), reason, count,
+                    int(count*n*log(n, 2)) if n else None, 0,
+                    n*SCORE_BYTES if n is not None else None))
+        if workload.queries < self.min_queries:
+            return result
+        # unused indices
+        for field in meta.indices:
+            name = field.attname
+            if (field.unique or field.primary_key or name == ordering or
+                    getattr(field, 'relmodel', None) or
+                    workload.equality.get(name) or workload.ranges.get(name)):
+                continue
+            size = sizes.get(name)
+            result.append(recommendation(
+                model, 'remove', 'bitmap' if field.bitmap else 'index',
+                (field.name,), 'not used by %s recorded queries' %
+                workload.queries, 0, 0, -1,
+                -size.memory if size else None))
+        for compound in meta.compound_indices:
+            name = meta.compound_name(compound)
+            if workload.compound.get(name):
+                continue
+            size = sizes.get(name)
+            result.append(recommendation(
+                model, 'remove', 'compound', tuple((f.name for f in compound)),
+                'not used by %s recorded queries' % workload.queries, 0, 0,
+                -1, -size.memory if size else None))
+        # low cardinality indices
+        if n and meta.pk.type == 'auto':
+            for field in meta.indices:
+                size = sizes.get(field.attname)
+                if (field.unique or field.bitmap or size is None or
+                        not size.keys or
+                        size.keys > self.bitmap_cardinality):
+                    continue
+                memory = size.keys*(n//8 + 1) - size.memory
+                if memory < 0:
+                    result.append(recommendation(
+                        model, 'convert', 'bitmap', (field.name,),
+                        '%s distinct values for %s instances' %
+                        (size.keys, n),
+                        workload.equality.get(field.attname, 0), None, 0,
+                        memory))
+        return result
+
+    def member_bytes(self, sizes):
+        '''Average bytes per member of the indices in *sizes*, used to
+estimate the memory of new indices.'''
+        members = sum((s.members for s in sizes.values()))
+        if members:
+            return sum((s.memory for s in sizes.values()))/float(members)
+
+    def estimate(self, n, member_bytes):
+        '''Estimated bytes of a new index on *n* instances.'''
+        if n is not None and member_bytes:
+            return int(n*member_bytes)
+
+    def average_size(self, size):
+        '''Average number of ids for a value of an index.'''
+        if size and size.keys:
+            return size.members//size.keys
+        return 0
+
+    def _workload(self, model):
+        workload = self.workload.get(model)
+        if workload is None:
+            workload = self.workload[model] = ModelWorkload(model)
+        return workload
+
+    def _record_tree(self, model, tree, count):
+        name, children = tree
+        if ':' in name:
+            # a subquery on a different model
+            model, name = name.split(':', 1)
+            self._workload(model).queries += count
+        keyword, _, field = name.partition('-')
+        workload = self._workload(model)
+        if keyword == 'set':
+            for lookup, nested in children or ():
+                if nested is not None:
+                    # ids of the field from a subquery
+                    workload.add(workload.equality, field, count)
+                    self._record_tree(model, (lookup, nested), count)
+                elif lookup in EQUALITY_LOOKUPS:
+                    workload.add(workload.equality, field, count)
+                elif lookup == 'compound':
+                    workload.add(workload.compound, field, count)
+                else:
+                    workload.add(workload.ranges, field, count)
+            return
+        if keyword == 'intersect':
+            combined = [c[0][4:] for c in children if c[0].startswith('set-')
+                        and c[1] and
+                        all((l[0] == 'value' for l in c[1]))]
+            if len(combined) > 1:
+                workload.add(workload.combined, tuple(sorted(combined)),
+                             count)
+        for child in children or ():
+            self._record_tree(model, child, count)
@@ -8,7 +8,7 @@ from stdnet.utils import UnicodeMixin, unique_tuple
 from stdnet.utils.structures import OrderedDict
 
 from .globals import hashmodel, JSPLITTER, orderinginfo
-from .fields import Field, AutoIdField
+from .fields import Field, AutoIdField, LazyAttribute
 from .related import class_prepared
 
 
@@ -71,6 +71,10 @@ class of :class:`Model` in the following way::
 :parameter name: Check the :attr:`name` attribute.
 :parameter modelkey: Check the :attr:`modelkey` attribute.
 :parameter attributes: Check the :attr:`attributes` attribute.
+:parameter indexes: Check the :attr:`compound_indices` attribute.
+:parameter lazy: if ``True`` the :attr:`Field.heavy` fields of the model are
+    :attr:`Field.lazy` unless specified otherwise in the field. Default
+    ``False``.
 
 This is the list of attributes and methods available. All attributes,
 but the ones mantioned above, are initialized by the object relational
@@ -127,6 +131,24 @@ mapper.
     List of :class:`Field` which are indices (:attr:`Field.index` attribute
     set to ``True``).
 
+.. attribute:: compound_indices
+
+    List of tuples of :class:`Field` which are indexed together. Each tuple
+    creates one index keyed on the values of all its fields, which is used by
+    queries filtering on all of them by equality. Specified in the ``Meta``
+    class via the ``indexes`` attribute, a list of tuples of field names::
+
+        class Position(odm.StdModel):
+            ...
+
+            class Meta:
+                indexes = [('fund', 'ccy')]
+
+.. attribute:: bitmaps
+
+    Frozen set of the attribute names of the :attr:`indices` with a
+    :attr:`Field.bitmap`.
+
 .. attribute:: pk
 
     The :class:`Field` representing the primary key.
@@ -147,7 +169,8 @@ mapper.
 '''
     def __init__(self, model, fields, app_label=None, modelkey=None,
                  name=None, register=True, pkname=None, ordering=None,
-                 attributes=None, abstract=False, **kwargs):
+                 attributes=None, abstract=False, indexes=None, lazy=False,
+                 **kwargs):
         self.model = model
         self.abstract = abstract
         self.attributes = unique_tuple(attributes or ())
@@ -155,6 +178,7 @@ mapper.
         self.fields = []
         self.scalarfields = []
         self.indices = []
+        self.compound_indices = []
         self.multifields = []
         self.related = {}
         self.manytomany = []
@@ -187,8 +211,21 @@ mapper.
         fields.pop(pkname, None)
         for name, field in fields.items():
             field.register_with_model(name, model)
+            if field.heavy:
+                field.lazy = (field._lazy if field._lazy is not None else
+                              bool(lazy))
+                if field.lazy:
+                    setattr(model, field.attname, LazyAttribute(field))
         if pk is not None:
             pk.register_with_model(pkname, model)
+            if pk.type != 'auto':
+                for field in self.indices:
+                    if field.bitmap:
+                        raise FieldError('Bitmap index on "%s" requires an '
+                                         'auto id primary key.' % field)
+        self.bitmaps = frozenset((f.attname for f in self.indices if f.bitmap))
+        for names in indexes or ():
+            self.compound_indices.append(self.get_compound_index(names))
         self.ordering = None
         if ordering:
             self.ordering = self.get_sorting(ordering, ImproperlyConfigured)
@@ -215,8 +252,18 @@ mapper.
                 loadedfields = tuple(loadedfields)
             obj._loadedfields = loadedfields
             for field in obj.loadedfields():
-                value = field.value_from_data(obj, data)
-                setattr(obj, field.attname, field.to_python(value, backend))
+                if field.lazy:
+                    # keep the database value, converted on first access
+                    value = field.lazy_value_from_data(obj, data)
+                    obj.__dict__.pop(field.attname, None)
+                    lazy = obj.dbdata.get('lazy')
+                    if lazy is None:
+                        lazy = obj.dbdata['lazy'] = {}
+                    lazy[field.attname] = (value, backend)
+                else:
+                    value = field.value_from_data(obj, data)
+                    setattr(obj, field.attname,
+                            field.to_python(value, backend))
             if backend or ('__dbdata__' in data and
                            data['__dbdata__'][pk.name] == pkvalue):
                 obj.dbdata[pk.name] = pkvalue
@@ -261,6 +308,25 @@ Return ``True`` if the instance is ready to be saved to database.'''
                         data[name] = svalue
         return len(errors) == 0
 
+    def get_compound_index(self, names):
+        '''Tuple of scalar :class:`Field` for the compound index on field
+*names*.'''
+        fields = []
+        for name in names:
+            field = self.dfields.get(name)
+            if field is None or field not in self.scalarfields:
+                raise ImproperlyConfigured('"%s" cannot index "%s". It is not '
+                                           'a scalar field.' % (self, name))
+            fields.append(field)
+        if len(fields) < 2:
+            raise ImproperlyConfigured('"%s" compound index requires at least '
+                                       'two fields.' % self)
+        return tuple(fields)
+
+    def compound_name(self, fields):
+        '''Name of the compound index on *fields*.'''
+        return ','.join((f.attname for f in fields))
+
     def get_sorting(self, sortby, errorClass=None):
         desc = False
         if isinstance(sortby, autoincrement):
@@ -327,7 +393,12 @@ of fields names and a list of field attribute names.'''
                 'autoincr': self.ordering and self.ordering.auto,
                 'multi_fields': [field.name for field in self.multifields],
                 'indices': dict(((idx.attname, idx.unique)
-                                 for idx in self.indices))}
+                                 for idx in self.indices)),
+                'bitmaps': [idx.attname for idx in self.indices
+                            if idx.bitmap],
+                'compound': dict(((self.compound_name(fields),
+                                   [f.attname for f in fields])
+                                  for fields in self.compound_indices))}
 
 
 class autoincrement(object):
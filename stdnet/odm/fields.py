@@ -36,6 +36,28 @@ __all__ = ['Field',
 NONE_EMPTY = (None, '')
 
 
+class LazyAttribute(object):
+    '''Descriptor of a :attr:`Field.lazy` field. On first access it converts
+the database value stored by :meth:`ModelMeta.load_state` and caches the
+result in the instance dictionary, which takes precedence over the
+descriptor on later accesses.'''
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        field = self.field
+        attname = field.attname
+        lazy = instance.dbdata.get('lazy')
+        if not lazy or attname not in lazy:
+            raise AttributeError(attname)
+        value, backend = lazy.pop(attname)
+        value = field.load_lazy(instance, value, backend)
+        setattr(instance, attname, value)
+        return value
+
+
 class Field(UnicodeMixin):
     '''This is the base class of all StdNet Fields.
 Each field is specified as a :class:`StdModel` class attribute.
@@ -63,6 +85,17 @@ Each field is specified as a :class:`StdModel` class attribute.
 
     Default ``False``.
 
+.. attribute:: bitmap
+
+    If ``True``, the field is indexed with a bitmap rather than a set of ids.
+    The backend stores one bit string per field value, with the bit at
+    position ``id`` set for each matching instance. This is only available
+    for non-unique fields of models with an :class:`AutoIdField` primary key
+    and it is well suited to low-cardinality fields such as status flags,
+    types or currencies. When ``True``, :attr:`Field.index` is also ``True``.
+
+    Default ``False``.
+
 .. attribute:: primary_key
 
     If ``True``, this field is the primary key for the model.
@@ -125,6 +158,21 @@ Each field is specified as a :class:`StdModel` class attribute.
     This attribute is used by the :class:`StdModel.fieldvalue_pairs` method
     which returns a dictionary of field names and values.
 
+    Default ``False``.
+
+.. attribute:: heavy
+
+    ``True`` for fields, such as :class:`JSONField` and
+    :class:`PickleObjectField`, whose values are expensive to decode.
+    Only heavy fields can be :attr:`lazy`.
+
+.. attribute:: lazy
+
+    If ``True`` the value loaded from the backend is kept in its database
+    representation and converted via :meth:`to_python` the first time the
+    attribute is accessed. Available for :attr:`heavy` fields only. When not
+    given, the ``lazy`` attribute of the model ``Meta`` class is used.
+
     Default ``False``.
 '''
     _default = None
@@ -133,13 +181,21 @@ Each field is specified as a :class:`StdModel` class attribute.
     index = True
     charset = None
     hidden = False
+    bitmap = False
+    heavy = False
+    lazy = False
     internal_type = None
     creation_counter = 0
 
     def __init__(self, unique=False, primary_key=False, required=True,
-                 index=None, hidden=None, as_cache=False, **extras):
+                 index=None, hidden=None, as_cache=False, bitmap=False,
+                 **extras):
         self.primary_key = primary_key
         index = index if index is not None else self.index
+        if bitmap:
+            if unique or primary_key:
+                raise FieldError('Unique field cannot have a bitmap index')
+            index = True
         if primary_key:
             self.unique = True
             self.required = True
@@ -155,12 +211,15 @@ Each field is specified as a :class:`StdModel` class attribute.
             self.required = False
             self.unique = False
             self.index = False
+        self.bitmap = bool(bitmap and self.index)
         self.charset = extras.pop('charset', self.charset)
         self.hidden = hidden if hidden is not None else self.hidden
         self.meta = None
         self.name = None
         self.model = None
         self._default = extras.pop('default', self._default)
+        if self.heavy:
+            self._lazy = extras.pop('lazy', None)
         self.encoder = self.get_encoder(extras)
         self._handle_extras(**extras)
         self.creation_counter = Field.creation_counter
@@ -189,6 +248,16 @@ Each field is specified as a :class:`StdModel` class attribute.
     def value_from_data(self, instance, data):
         return data.pop(self.attname, None)
 
+    def lazy_value_from_data(self, instance, data):
+        '''The database representation of the value of a :attr:`lazy`
+field in *data*, converted by :meth:`load_lazy` on first access.'''
+        return data.pop(self.attname, None)
+
+    def load_lazy(self, instance, value, backend=None):
+        '''Convert *value*, obtained from :meth:`lazy_value_from_data`, into
+the python value of a :attr:`lazy` field.'''
+        return self.to_python(value, backend)
+
     def register_with_model(self, name, model):
         '''Called during the creation of a the :class:`StdModel`
 class when :class:`Metaclass` is initialised. It fills
@@ -505,17 +574,76 @@ or other entities. They are indexes by default.'''
 class CharField(SymbolField):
     '''A text :class:`SymbolField` which is never an index.
 It contains unicode and by default and :attr:`Field.required`
-is set to ``False``.'''
+is set to ``False``.
+
+:parameter compress: Set the :attr:`compress` attribute. ``True`` for the
+    default zlib level 6.
+:parameter compress_threshold: Set the :attr:`compress_threshold` attribute.
+
+    Default ``128``.
+
+.. attribute:: compress
+
+    Optional zlib compression level, from 1 to 9, of values stored in the
+    backend. Values shorter than :attr:`compress_threshold` bytes, or which
+    do not shrink, are stored uncompressed. Compressed values start with a
+    marker byte so that values stored before enabling compression are
+    still loaded. Values loaded from the backend are decompressed only
+    while :attr:`compress` is set. Compressed values cannot be sorted by
+    the backend.
+
+    Default ``None``.
+
+.. attribute:: compress_threshold
+
+    Minimum size in bytes of values to compress.
+'''
+    compress = None
+
     def __init__(self, *args, **kwargs):
         kwargs['index'] = False
         kwargs['unique'] = False
         kwargs['primary_key'] = False
         self.max_length = kwargs.pop('max_length', None)  # not used for now
+        compress = kwargs.pop('compress', None)
+        if compress is True:
+            compress = 6
+        if compress:
+            if compress not in range(1, 10):
+                raise FieldError('Compress level must be between 1 and 9')
+            self.compress = compress
+        self.compress_threshold = kwargs.pop('compress_threshold', 128)
         required = kwargs.get('required', None)
         if required is None:
             kwargs['required'] = False
         super(CharField, self).__init__(*args, **kwargs)
 
+    def to_python(self, value, backend=None):
+        return super(CharField, self).to_python(
+            self.decompressed(value, backend), backend)
+
+    def set_get_value(self, instance, value):
+        value = self.to_python(value)
+        setattr(instance, self.attname, value)
+        return self.compressed(value)
+
+    def decompressed(self, value, backend):
+        '''Decompress *value* if :attr:`compress` is set and *value* is
+loaded from *backend*. Values assigned by users are never decompressed.'''
+        if self.compress and backend is not None:
+            return encoders.decompress(value)
+        return value
+
+    def compressed(self, value):
+        '''The database representation of the serialised *value*,
+compressed if :attr:`compress` is set.'''
+        if self.compress and value is not None:
+            if not isinstance(value, bytes):
+                value = to_string(value).encode(self.charset)
+            return encoders.compress(value, self.compress,
+                                     self.compress_threshold)
+        return value
+
 
 class ByteField(CharField):
     '''A :class:`CharField` which contains binary data.
@@ -544,6 +672,7 @@ or :class:`JSONField` fields as more general alternatives.
           attribute is ``True``.
 '''
     type = 'object'
+    heavy = True
     _default = None
 
     def set_get_value(self, instance, value):
@@ -551,7 +680,7 @@ or :class:`JSONField` fields as more general alternatives.
         # as to_python
         value = self.to_python(value)
         setattr(instance, self.attname, value)
-        return self.serialise(value)
+        return self.compressed(self.serialise(value))
 
     def serialise(self, value, lookup=None):
         if value is not None:
@@ -748,12 +877,17 @@ behaviour and how the field is stored in the back-end server.
 '''
     type = 'json object'
     internal_type = 'serialized'
+    heavy = True
     _default = {}
 
     def get_encoder(self, params):
         self.as_string = params.pop('as_string', True)
-        if not self.as_string and not isinstance(self._default, dict):
-            self._default = {}
+        if not self.as_string:
+            if self.compress:
+                raise FieldError('Cannot compress a JSONField which is not '
+                                 'stored as a string')
+            if not isinstance(self._default, dict):
+                self._default = {}
         return encoders.Json(
             charset=self.charset,
             json_encoder=params.pop('encoder_class', DefaultJSONEncoder),
@@ -763,7 +897,7 @@ behaviour and how the field is stored in the back-end server.
         if value is None:
             return self.get_default()
         try:
-            return self.encoder.loads(value)
+            return self.encoder.loads(self.decompressed(value, backend))
         except TypeError:
             return value
 
@@ -774,7 +908,7 @@ behaviour and how the field is stored in the back-end server.
         setattr(instance, self.attname, value)
         if self.as_string:
             # dump as a string
-            return self.serialise(value)
+            return self.compressed(self.serialise(value))
         else:
             # unwind as a dictionary
             value = dict(dict_flat_generator(value,
@@ -805,6 +939,22 @@ behaviour and how the field is stored in the back-end server.
                                   attname=self.attname,
                                   loads=self.encoder.loads)
 
+    def lazy_value_from_data(self, instance, data):
+        if self.as_string:
+            return data.pop(self.attname, None)
+        else:
+            attname = self.attname
+            prefix = attname + JSPLITTER
+            return dict(((k, v) for k, v in data.items()
+                         if k == attname or k.startswith(prefix)))
+
+    def load_lazy(self, instance, value, backend=None):
+        if not self.as_string:
+            value = flat_to_nested(value, instance=instance,
+                                   attname=self.attname,
+                                   loads=self.encoder.loads)
+        return self.to_python(value, backend)
+
     def get_sorting(self, name, errorClass):
         pass
 
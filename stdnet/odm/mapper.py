@@ -2,7 +2,7 @@ from inspect import ismodule, isclass
 
 from stdnet.utils import native_str
 from stdnet.utils.importer import import_module
-from stdnet import getdb
+from stdnet import getdb, ReplicaSet
 
 from .base import ModelType, Model
 from .session import Manager, Session, ModelDictionary, StructureManager
@@ -58,14 +58,28 @@ one wishes to do so.
     deleted::
 
         models.post_delete.bind(callback, sender=MyModel)
+
+.. attribute:: slowlog
+
+    An optional :class:`SlowLog` recording queries slower than its
+    threshold. Default ``None``.
+
+.. attribute:: tracer
+
+    An optional :class:`stdnet.utils.tracing.Tracer` opening spans of
+    sessions, queries and backend operations. Set via :meth:`set_tracer`.
+    Default ``None``.
 '''
-    def __init__(self, default_backend=None, install_global=False):
+    def __init__(self, default_backend=None, install_global=False,
+                 slowlog=None):
         self._registered_models = ModelDictionary()
         self._registered_names = {}
         self._default_backend = default_backend
         self._install_global = install_global
         self._structures = {}
         self._search_engine = None
+        self.slowlog = slowlog
+        self.tracer = None
         self.pre_commit = Event()
         self.pre_delete = Event()
         self.post_commit = Event()
@@ -125,7 +139,9 @@ model was already registered it does nothing.
 :param read_backend: Optional :class:`stdnet.BackendDataServer` for read
     operations. This is useful when the server has a master/slave
     configuration, where the master accept write and read operations
-    and the ``slave`` read only operations.
+    and the ``slave`` read only operations. It can also be a list of
+    replicas or a :class:`stdnet.ReplicaSet`, in which case reads are
+    balanced across healthy replicas.
 :param include_related: ``True`` if related models to ``model`` needs to be
     registered. Default ``True``.
 :param params: Additional parameters for the :func:`getdb` function.
@@ -133,7 +149,9 @@ model was already registered it does nothing.
 '''
         backend = backend or self._default_backend
         backend = getdb(backend=backend, **params)
-        if read_backend:
+        if isinstance(read_backend, (list, tuple)):
+            read_backend = ReplicaSet(read_backend)
+        elif read_backend and not isinstance(read_backend, ReplicaSet):
             read_backend = getdb(read_backend)
         registered = 0
         if isinstance(model, Structure):
@@ -150,6 +168,12 @@ model was already registered it does nothing.
             self._registered_models[model] = manager
             if isinstance(model, ModelType):
                 attr_name = model._meta.name
+                backend.setup_model(model._meta)
+                if isinstance(read_backend, ReplicaSet):
+                    for replica in read_backend:
+                        replica.setup_model(model._meta)
+                elif read_backend:
+                    read_backend.setup_model(model._meta)
             else:
                 attr_name = model.__name__.lower()
             if attr_name not in self._registered_names:
@@ -159,6 +183,27 @@ model was already registered it does nothing.
         if registered:
             return backend
 
+    def set_instrument(self, instrument):
+        '''Set the :class:`stdnet.utils.instrument.Instrument` of the
+backends and read backends of all registered models.'''
+        for backend in self._backends():
+            backend.set_instrument(instrument)
+
+    def set_recorder(self, recorder):
+        '''Set the :class:`stdnet.utils.workload.WorkloadRecorder` of the
+backends and read backends of all registered models, ``None`` to stop
+recording.'''
+        for backend in self._backends():
+            backend.set_recorder(recorder)
+
+    def set_tracer(self, tracer):
+        '''Set the :class:`stdnet.utils.tracing.Tracer` of this router and
+of the backends and read backends of all registered models, ``None`` to
+switch off tracing.'''
+        self.tracer = tracer
+        for backend in self._backends():
+            backend.set_tracer(tracer)
+
     def from_uuid(self, uuid, session=None):
         '''Retrieve a :class:`Model` from its universally unique identifier
 ``uuid``. If the ``uuid`` does not match any instance an exception will raise.
@@ -241,9 +286,12 @@ For example::
         return list(self._register_applications(applications, models,
                                                 backends))
 
-    def session(self):
-        '''Obatain a new :class:`Session` for this ``Router``.'''
-        return Session(self)
+    def session(self, read_your_writes=False):
+        '''Obatain a new :class:`Session` for this ``Router``.
+
+:param read_your_writes: if ``True``, reads of the session are pinned to the
+    master backend after a commit. Check :attr:`Session.read_your_writes`.'''
+        return Session(self, read_your_writes)
 
     def create_all(self):
         '''Loop though :attr:`registered_models` and issue the
@@ -261,6 +309,18 @@ method for::
 
     # PRIVATE METHODS
 
+    def _backends(self):
+        # backends and read backends of registered models
+        for manager in self._registered_models.values():
+            backends = [manager.backend]
+            if manager.replicas is not None:
+                backends.extend(manager.replicas)
+            else:
+                backends.append(manager.read_backend)
+            for backend in backends:
+                if backend is not None:
+                    yield backend
+
     def _register_applications(self, applications, models, backends):
         backends = backends or {}
         for model in model_iterator(applications):
@@ -1,4 +1,5 @@
 from copy import copy
+from itertools import product
 from inspect import isgenerator
 from functools import partial
 from collections import Mapping
@@ -11,7 +12,7 @@ from .globals import lookup_value
 
 
 __all__ = ['Q', 'QueryBase', 'Query', 'QueryElement', 'EmptyQuery',
-           'intersect', 'union', 'difference']
+           'Predicate', 'intersect', 'union', 'difference']
 
 iterables = (tuple, list, set, frozenset, Mapping)
 
@@ -156,6 +157,68 @@ and :class:`QueryElement`.'''
         return q
 
 
+class Predicate(object):
+    '''A boolean expression of lookups which can be passed to the
+:meth:`Query.filter` method. Lookups are specified with the same syntax as
+the :meth:`Query.filter` keyword arguments and combined using ``&`` (and),
+``|`` (or) and ``~`` (not)::
+
+    from stdnet.odm import Predicate as P
+
+    qs = session.query(MyModel).filter(P(a=1) | (P(b__gt=3) & ~P(c='x')))
+
+For :ref:`backends <db-index>` supporting scripting, the whole expression
+is evaluated in the database with a single script.
+
+.. attribute:: lookups
+
+    Dictionary of lookups, all of which must be matched.
+
+.. attribute:: connector
+
+    ``and`` or ``or`` if this :class:`Predicate` combines :attr:`children`,
+    otherwise ``None``.
+
+.. attribute:: negated
+
+    If ``True`` the :class:`Predicate` matches elements not matched by its
+    lookups or children.
+'''
+    def __init__(self, **lookups):
+        self.lookups = lookups
+        self.connector = None
+        self.children = ()
+        self.negated = False
+
+    def __repr__(self):
+        if self.connector:
+            c = ' %s ' % self.connector
+            s = '(%s)' % c.join((repr(p) for p in self.children))
+        else:
+            s = '%s(%s)' % (self.__class__.__name__, self.lookups)
+        return '~' + s if self.negated else s
+    __str__ = __repr__
+
+    def __and__(self, other):
+        return self._combine(other, 'and')
+
+    def __or__(self, other):
+        return self._combine(other, 'or')
+
+    def __invert__(self):
+        p = copy(self)
+        p.negated = not self.negated
+        return p
+
+    def _combine(self, other, connector):
+        if not isinstance(other, Predicate):
+            raise TypeError('Cannot combine %s with %s' % (self, other))
+        p = self.__class__()
+        p.connector = connector
+        p.children = (self, other)
+        return p
+
+
 class QueryElement(Q):
     '''An element of a :class:`Query`.
 
@@ -369,6 +432,7 @@ criteria and options associated with it.
         '''A :class:`Query` is not initialized directly but via the
 :meth:`Session.query` or :meth:`Manager.query` methods.'''
         self.fargs = kwargs.pop('fargs', None)
+        self.predicates = kwargs.pop('predicates', ())
         self.eargs = kwargs.pop('eargs', None)
         self.unions = kwargs.pop('unions', ())
         self.searchengine = kwargs.pop('searchengine', None)
@@ -391,6 +455,9 @@ criteria and options associated with it.
             s = self.__class__.__name__
             if self.fargs:
                 s = '%s.filter(%s)' % (s, self.fargs)
+            if self.predicates:
+                s = '%s.filter(%s)' % (s, ', '.join(
+                    (str(p) for p in self.predicates)))
             if self.eargs:
                 s = '%s.exclude(%s)' % (s, self.eargs)
             return s
@@ -398,10 +465,11 @@ criteria and options associated with it.
             return repr(seq)
     __str__ = __repr__
 
-    def filter(self, **kwargs):
+    def filter(self, *predicates, **kwargs):
         '''Create a new :class:`Query` with additional clauses corresponding to
 ``where`` or ``limit`` in a ``SQL SELECT`` statement.
 
+:parameter predicates: optional :class:`Predicate` expressions.
 :parameter kwargs: dictionary of limiting clauses.
 :rtype: a new :class:`Query` instance.
 
@@ -409,12 +477,19 @@ For example::
 
     qs = session.query(MyModel)
     result = qs.filter(group = 'planet')
+    result = qs.filter(Predicate(group='planet') | Predicate(size__gt=10))
 '''
-        if kwargs:
+        if kwargs or predicates:
             q = self._clone()
-            if self.fargs:
-                kwargs = update_dictionary(self.fargs.copy(), kwargs)
-            q.fargs = kwargs
+            if kwargs:
+                if self.fargs:
+                    kwargs = update_dictionary(self.fargs.copy(), kwargs)
+                q.fargs = kwargs
+            if predicates:
+                for p in predicates:
+                    if not isinstance(p, Predicate):
+                        raise QuerySetError('%s is not a Predicate' % p)
+                q.predicates = self.predicates + predicates
             return q
         else:
             return self
@@ -591,11 +666,42 @@ to load all fields except a subset specified by *fields*.
         '''Retrieve all items for this :class:`Query`.'''
         return self.backend_query().items(callback=callback)
 
+    def after(self, cursor=None, limit=25):
+        '''Keyset pagination. Retrieve at most *limit* items following
+*cursor* and return them in a :class:`stdnet.Page`::
+
+    page = qs.after(limit=20)
+    next_page = qs.after(page.after, 20)
+
+:parameter cursor: an opaque cursor obtained from the :attr:`stdnet.Page.after`
+    attribute of a previous page. If not given the first page is returned.
+:parameter limit: maximum number of items in the page.
+
+Unlike slicing, the cost of retrieving a page does not depend on its
+position. Models with :attr:`Metaclass.ordering` resume from the last
+``(score, id)`` pair, while models without ordering resume a server-side
+scan which returns, in no particular order, all items present for
+the whole pagination.'''
+        return self.backend_query().page(cursor, limit)
+
+    def before(self, cursor=None, limit=25):
+        '''Same as :meth:`after` but retrieve at most *limit* items
+preceding *cursor*, obtained from the :attr:`stdnet.Page.before` attribute of a
+previous page. If *cursor* is not given the last page is returned.
+Available for models with :attr:`Metaclass.ordering` only.'''
+        return self.backend_query().page(cursor, limit, True)
+
     def get(self, **kwargs):
         '''Return an instance of a model matching the query. A special case is
 the query on ``id`` which provides a direct access to the :attr:`session`
 instances. If the given primary key is present in the session, the object
-is returned directly without performing any query.'''
+is returned directly without performing any query.
+
+When the backend has a :attr:`stdnet.BackendDataServer.coalescer`, lookups
+on a plain query are batched with the lookups of concurrent callers.'''
+        backend = self.backend
+        if kwargs and backend.coalescer is not None and self._plain():
+            return backend.execute(backend.coalesced_get(self, kwargs))
         return self.filter(**kwargs).items(
             callback=self.model.get_unique_instance)
 
@@ -615,7 +721,13 @@ list of ids deleted.'''
     def construct(self):
         '''Build the :class:`QueryElement` representing this query.'''
         if self.__construct is None:
-            self.__construct = self._construct()
+            tracer = self.session.router.tracer
+            if tracer is None:
+                self.__construct = self._construct()
+            else:
+                with tracer.start_span('query.construct',
+                                       model=self._meta.modelkey):
+                    self.__construct = self._construct()
         return self.__construct
 
     def backend_query(self, **kwargs):
@@ -653,17 +765,28 @@ an exception is raised.
     def clear(self):
         self.__construct = None
 
+    def _plain(self):
+        # True when the query has no clauses or loading options
+        return not (self.fargs or self.eargs or self.predicates or
+                    self.unions or self.intersections or self.text or
+                    self.exclude_fields or self.fields or
+                    self.select_related or self._get_field)
+
     def _construct(self):
         if self.fargs:
-            fargs = self.aggregate(self.fargs)
+            fargs = self.aggregate(self.fargs, compound=True)
             for f in fargs:
                 # no values to filter on. empty result.
                 if not f.valid:
                     return EmptyQuery(self._meta, self.session)
         else:
             fargs = None
+        if self.predicates:
+            q = self._expression(fargs or [])
+            if q is None:
+                return EmptyQuery(self._meta, self.session)
         # no filters, get the whole set
-        if not fargs:
+        elif not fargs:
             q = queryset(self)
         elif len(fargs) > 1:
             q = intersect(fargs)
@@ -695,11 +818,18 @@ an exception is raised.
         q.data = data
         return q
 
-    def aggregate(self, kwargs):
-        '''Aggregate lookup parameters.'''
+    def aggregate(self, kwargs, compound=False):
+        '''Aggregate lookup parameters.
+
+:parameter kwargs: dictionary of lookup parameters.
+:parameter compound: if ``True``, equality lookups on all fields of a
+    :attr:`ModelMeta.compound_indices` are replaced by a single lookup on the
+    compound index. Valid for intersections of lookups only.
+:rtype: a list of :class:`QueryElement`, one for each field.'''
         meta = self._meta
         fields = meta.dfields
         field_lookups = {}
+        unindexed = {}
         for name, value in iteritems(kwargs):
             bits = name.split(JSPLITTER)
             field_name = bits.pop(0)
@@ -727,8 +857,7 @@ an exception is raised.
             lookups = get_lookups(attname, field_lookups)
             # If we are here the field must be an index
             if not field.index:
-                raise QuerySetError("%s %s is not an index. Cannot query." %
-                                    (field.__class__.__name__, field_name))
+                unindexed[attname] = field
             if not iterable(value):
                 value = (value,)
             for v in value:
@@ -738,9 +867,103 @@ an exception is raised.
                     v = lookup_value('value', field.serialise(v, lookup))
                 lookups.append(v)
         #
+        if compound:
+            self._compound_lookups(field_lookups)
+        for attname, field in iteritems(unindexed):
+            if attname in field_lookups:
+                raise QuerySetError("%s %s is not an index. Cannot query." %
+                                    (field.__class__.__name__, field.name))
         return [queryset(self, name=name, underlying=field_lookups[name])
                 for name in sorted(field_lookups)]
 
+    def _expression(self, fargs):
+        # Build the expression query element from predicates and the
+        # elements obtained from filter keyword arguments
+        positives, negatives = list(fargs), []
+        for predicate in self.predicates:
+            elem, negated = self._predicate_element(predicate)
+            if negated:
+                if elem is not None:
+                    negatives.append(elem)
+            elif elem is None:
+                return None
+            else:
+                positives.append(elem)
+        q = self._and_elements(positives, negatives)
+        return Select(self._meta, self.session, keyword='expression',
+                      underlying=[q])
+
+    def _predicate_element(self, predicate):
+        # Return a two elements tuple (element, negated) where element is a
+        # QueryElement or None if predicate matches nothing
+        if predicate.connector == 'and':
+            positives, negatives, elem = [], [], True
+            for child in predicate.children:
+                e, negated = self._predicate_element(child)
+                if negated:
+                    if e is not None:
+                        negatives.append(e)
+                elif e is None:
+                    elem = None
+                else:
+                    positives.append(e)
+            if elem:
+                elem = self._and_elements(positives, negatives)
+        elif predicate.connector == 'or':
+            elems = []
+            for child in predicate.children:
+                e, negated = self._predicate_element(child)
+                if negated:
+                    elems.append(self._and_elements([], [e] if e else []))
+                elif e is not None:
+                    elems.append(e)
+            if len(elems) > 1:
+                elem = union(elems)
+            else:
+                elem = elems[0] if elems else None
+        elif not predicate.lookups:
+            elem = queryset(self)
+        else:
+            elems = self.aggregate(predicate.lookups, compound=True)
+            if [e for e in elems if not e.valid]:
+                elem = None
+            else:
+                elem = self._and_elements(elems, [])
+        return elem, predicate.negated
+
+    def _and_elements(self, positives, negatives):
+        if len(positives) > 1:
+            q = intersect(positives)
+        elif positives:
+            q = positives[0]
+        else:
+            q = queryset(self)
+        if negatives:
+            q = difference([q] + negatives)
+        return q
+
+    def _compound_lookups(self, field_lookups):
+        # Replace equality lookups on fields of compound indices with
+        # lookups on the compound indices, one for each combination of values
+        meta = self._meta
+        replaced = set()
+        compound = []
+        for fields in meta.compound_indices:
+            values = []
+            for field in fields:
+                lookups = field_lookups.get(field.attname)
+                if not lookups or [v for v in lookups if v.lookup != 'value']:
+                    break
+                values.append([v.value for v in lookups])
+            else:
+                replaced.update((field.attname for field in fields))
+                compound.append((meta.compound_name(fields),
+                                 [lookup_value('compound', v)
+                                  for v in product(*values)]))
+        for name in replaced:
+            field_lookups.pop(name)
+        field_lookups.update(compound)
+
     def _test_unique(self, fieldname, value, instance, exception, items):
         if items:
             r = self.model.get_unique_instance(items)
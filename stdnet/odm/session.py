@@ -1,6 +1,6 @@
 from itertools import chain
 
-from stdnet import session_result, session_data, async
+from stdnet import session_result, session_data, async, ReplicaSet
 from stdnet.utils import itervalues, iteritems
 from stdnet.utils.structures import OrderedDict
 from stdnet.utils.exceptions import *
@@ -44,8 +44,10 @@ class ModelDictionary(dict):
 class SessionModel(object):
     '''A :class:`SessionModel` is the container of all objects for a given
 :class:`Model` in a stdnet :class:`Session`.'''
-    def __init__(self, manager):
+    def __init__(self, manager, session=None):
         self.manager = manager
+        self.session = session
+        self._read_backend = None
         self._new = OrderedDict()
         self._deleted = OrderedDict()
         self._delete_query = []
@@ -68,8 +70,24 @@ class SessionModel(object):
 
     @property
     def read_backend(self):
-        '''The read-only backend for this :class:`SessionModel`.'''
-        return self.manager.read_backend
+        '''The read-only backend for this :class:`SessionModel`.
+
+Once a session with ``read_your_writes`` has committed, reads go to the
+master :attr:`backend`. When the manager reads from a
+:class:`stdnet.ReplicaSet`, the session model keeps reading from the same
+replica while it is healthy.'''
+        manager = self.manager
+        session = self.session
+        if session is not None and session.pinned:
+            return manager.backend
+        replicas = manager.replicas
+        if replicas is None:
+            return manager.read_backend
+        backend = self._read_backend
+        if backend is None or not replicas.is_available(backend,
+                                                        manager.backend):
+            backend = self._read_backend = replicas.get(manager.backend)
+        return backend
 
     @property
     def model(self):
@@ -431,7 +449,14 @@ class Transaction(object):
                                      'Transaction already executed.')
         session = self.session
         self.session = None
-        self.on_result = self._commit(session, callback)
+        tracer = session.router.tracer
+        if tracer is None:
+            self.on_result = self._commit(session, callback)
+        else:
+            models = ','.join((sm._meta.modelkey for sm in session))
+            with tracer.start_span('session.commit', models=models,
+                                   instances=len(session.dirty)):
+                self.on_result = self._commit(session, callback)
         return self.on_result
 
     def add_callback(self, callback):
@@ -449,11 +474,14 @@ class Transaction(object):
             responses = []
             for backend, data in session.backends_data():
                 responses.append(backend.execute_session(data))
-                asy = asy or backend.is_async()
+                if backend.is_async():
+                    asy = backend
             if asy:
-                return async(self._async_commit(session, responses, callback))
+                return asy.execute_async(self._async_commit(session, responses,
+                                                            callback))
             for response in responses:
                 tuple(self._post_commit(session, response))
+            self._pin(session, responses)
             return callback() if callback else True
         finally:
             if not asy:
@@ -502,10 +530,16 @@ class Transaction(object):
             for response in responses:
                 r = yield response
                 yield self._post_commit(session, r)
+            self._pin(session, responses)
             yield callback() if callback else True
         finally:
             session.transaction = None
 
+    def _pin(self, session, responses):
+        # pin reads to the master once writes are committed
+        if responses and session.read_your_writes:
+            session.pinned = True
+
 
 class Session(object):
     '''The middleware for persistent operations on the back-end.
@@ -520,9 +554,21 @@ class Session(object):
     .. attribute:: router
 
         Instance of the :class:`Router` which created this :class:`Session`.
+
+    .. attribute:: read_your_writes
+
+        If ``True``, reads are pinned to the master backend once this
+        :class:`Session` has committed changes, so that they are not served
+        by replicas lagging behind the commit.
+
+    .. attribute:: pinned
+
+        ``True`` when reads are pinned to the master backend.
     '''
-    def __init__(self, router):
+    def __init__(self, router, read_your_writes=False):
         self.transaction = None
+        self.read_your_writes = read_your_writes
+        self.pinned = False
         self._models = OrderedDict()
         self._router = router
 
@@ -688,7 +734,7 @@ of :class:`Model`.'''
         manager = self.manager(model)
         sm = self._models.get(manager)
         if sm is None and create:
-            sm = SessionModel(manager)
+            sm = SessionModel(manager, self)
             self._models[manager] = sm
         return sm
 
@@ -863,6 +909,12 @@ so by setting the ``manager_class`` attribute in the :class:`StdModel`::
 .. attribute:: read_backend
 
     A :class:`stdnet.BackendDataServer` for read-only operations (Queries).
+    When the manager has :attr:`replicas`, it is the replica chosen for
+    the next read.
+
+.. attribute:: replicas
+
+    The :class:`stdnet.ReplicaSet` of read replicas or ``None``.
 
 .. attribute:: query_class
 
@@ -891,8 +943,15 @@ so by setting the ``manager_class`` attribute in the :class:`StdModel`::
 
     @property
     def read_backend(self):
+        if isinstance(self._read_backend, ReplicaSet):
+            return self._read_backend.get(self._backend)
         return self._read_backend or self._backend
 
+    @property
+    def replicas(self):
+        if isinstance(self._read_backend, ReplicaSet):
+            return self._read_backend
+
     def __getattr__(self, attrname):
         if attrname.startswith('__'):  # required for copy
             raise AttributeError
@@ -0,0 +1,190 @@
+'''Client side log of slow queries.
+
+The redis ``SLOWLOG`` shows ``EVALSHA`` calls only, which tells nothing
+about the :class:`Query` which produced them. A :class:`SlowLog` set on a
+:class:`Router` records queries taking longer than a threshold together
+with their fingerprint, a string identifying the shape of a query
+independently from the values of its lookups::
+
+    from stdnet import odm
+
+    models = odm.Router('redis://127.0.0.1:6379?db=7',
+                        slowlog=odm.SlowLog(threshold=0.05))
+    ...
+    for entry in models.slowlog.entries():
+        print(entry.fingerprint, entry.duration, entry.caller)
+
+.. attribute:: slow_query
+
+    Namedtuple with the following fields:
+
+    * ``fingerprint`` the :func:`query_fingerprint` of the query.
+    * ``model`` the model key.
+    * ``operation`` ``items``, ``page`` or ``count``.
+    * ``phases`` tuple of the server side phases executed by the query, for
+      example the ``odmrun`` lua sub-commands for the redis backend.
+    * ``duration`` seconds from the start of the operation to its result.
+    * ``count`` the number of elements returned.
+    * ``slice`` the ``(start, stop)`` slice of the operation or ``None``.
+    * ``caller`` ``(filename, lineno, function)`` of the first frame outside
+      stdnet, or ``None``.
+    * ``timestamp`` the time the entry was recorded.
+'''
+import os
+import re
+import sys
+import time
+from collections import namedtuple, deque
+from threading import Lock
+
+from .query import QueryElement
+
+
+__all__ = ['SlowLog', 'slow_query', 'query_fingerprint']
+
+slow_query = namedtuple('slow_query', 'fingerprint model operation phases '
+                        'duration count slice caller timestamp')
+
+STDNET_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# string and numeric literals of where clauses
+WHERE_LITERALS = re.compile(r'''"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|'''
+                            r'(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+                            r'(?![\w.])')
+
+
+def query_fingerprint(elem):
+    '''Fingerprint of the :class:`QueryElement` *elem*: the model key, the
+tree of lookups with values replaced by their lookup type, the ordering,
+the loaded fields, related fields, ``get_field`` and the ``where`` clause
+with literals replaced by ``?``.
+Queries differing only in the values of their lookups have the same
+fingerprint, for example
+``models.instrument.filter(ccy__in=('EUR', 'USD')).construct()`` has
+fingerprint ``examples.instrument set-ccy(value)``.
+'''
+    meta = elem.meta
+    data = elem.data
+    parts = [meta.modelkey, _fingerprint(elem, meta)]
+    ordering = data.get('ordering')
+    if ordering:
+        name, nested = ordering.name, ordering.nested
+        while nested:
+            name += '__' + nested.name
+            nested = nested.nested
+        parts.append('order=%s%s' % ('-' if ordering.desc else '', name))
+    if data.get('fields'):
+        parts.append('fields=%s' % ','.join(data['fields']))
+    if data.get('select_related'):
+        parts.append('related=%s' % ','.join(sorted(data['select_related'])))
+    if data.get('get_field'):
+        parts.append('get=%s' % data['get_field'])
+    if data.get('where'):
+        parts.append('where=%s' % WHERE_LITERALS.sub('?', data['where'][0]))
+    return ' '.join(parts)
+
+
+def _fingerprint(elem, meta):
+    if not isinstance(elem, QueryElement):
+        lookup, value = elem
+        if isinstance(value, QueryElement):
+            return _fingerprint(value, meta)
+        return lookup
+    name = elem.keyword
+    if elem.keyword == 'set':
+        name += '-' + elem.name
+    if elem.meta is not meta:
+        name = '%s:%s' % (elem.meta.modelkey, name)
+    underlying = elem.underlying
+    if isinstance(underlying, QueryElement):
+        underlying = (underlying,)
+    children = []
+    for child in underlying:
+        child = _fingerprint(child, elem.meta)
+        if child not in children:
+            children.append(child)
+    # the order of children is irrelevant, except for the first element of
+    # a difference
+    if elem.keyword == 'diff':
+        children = children[:1] + sorted(children[1:])
+    else:
+        children.sort()
+    return '%s(%s)' % (name, ', '.join(children))
+
+
+def caller_frame():
+    '''``(filename, lineno, function)`` of the first frame in the stack
+outside the stdnet package.'''
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if not os.path.abspath(code.co_filename).startswith(STDNET_PATH):
+            return (code.co_filename, frame.f_lineno, code.co_name)
+        frame = frame.f_back
+
+
+class SlowLog(object):
+    '''A ring buffer of the last *size* :class:`slow_query` entries of
+queries slower than *threshold* seconds.
+
+:parameter threshold: the default threshold in seconds.
+:parameter size: maximum number of entries kept.
+:parameter thresholds: optional dictionary of model keys and thresholds
+    overriding *threshold* for the given models.
+:parameter caller: if ``True`` (default) the :attr:`slow_query.caller` is
+    recorded.
+'''
+    def __init__(self, threshold=0.1, size=128, thresholds=None, caller=True):
+        self.threshold = threshold
+        self.thresholds = dict(thresholds or ())
+        self.caller = caller
+        self._entries = deque(maxlen=size)
+        self._lock = Lock()
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.threshold)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def threshold_for(self, model):
+        '''The threshold of the model with key *model*.'''
+        return self.thresholds.get(model, self.threshold)
+
+    def record(self, query, operation, duration, count, slic=None):
+        '''Record a :class:`slow_query` entry for the
+:class:`stdnet.BackendQuery` *query* if *duration* is above the threshold
+of its model. Return the entry or ``None``.'''
+        model = query.meta.modelkey
+        if duration < self.threshold_for(model):
+            return
+        if slic is not None:
+            slic = (slic.start, slic.stop)
+        entry = slow_query(query_fingerprint(query.queryelem), model,
+                           operation, tuple(getattr(query, 'phases', ())),
+                           duration, count, slic,
+                           caller_frame() if self.caller else None,
+                           time.time())
+        with self._lock:
+            self._entries.append(entry)
+        return entry
+
+    def entries(self, model=None, limit=None):
+        '''List of recorded entries, most recent first, optionally for the
+model with key *model* only and at most *limit* entries.'''
+        with self._lock:
+            entries = [e for e in reversed(self._entries)
+                       if model is None or e.model == model]
+        return entries[:limit] if limit is not None else entries
+
+    def fingerprints(self):
+        '''Dictionary of fingerprints and ``(count, total duration)`` of
+recorded entries.'''
+        result = {}
+        for entry in self.entries():
+            count, total = result.get(entry.fingerprint, (0, 0.0))
+            result[entry.fingerprint] = (count + 1, total + entry.duration)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
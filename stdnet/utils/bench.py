@@ -0,0 +1,195 @@
+'''Benchmark results and regression tracking.
+
+A :class:`BenchmarkReport` collects the latencies of benchmarked operations,
+saves them as JSON and compares them with a baseline report. The
+benchmark suite in ``tests/all/benchmarks`` fills a report for each
+benchmark class when run with the ``--bench`` flag::
+
+    python runtests.py benchmarks --bench --size small \\
+        --bench-report bench/current --bench-baseline bench/baseline
+
+Saved reports can be compared from the command line, the exit code is 1 if
+regressions are found::
+
+    python -m stdnet.utils.bench bench/baseline bench/current -t 0.2
+
+.. attribute:: regression
+
+    Namedtuple with the following fields:
+
+    * ``name`` the name of the benchmark.
+    * ``metric`` ``ops`` (operations per second) or a latency percentile
+      such as ``p50`` or ``p99``.
+    * ``baseline`` the baseline value.
+    * ``current`` the current value.
+    * ``change`` relative change, positive when performance is worse.
+'''
+import os
+import sys
+import json
+import platform
+from math import ceil
+from collections import namedtuple
+from optparse import OptionParser
+
+from stdnet.utils import iteritems
+
+
+__all__ = ['BenchmarkResult', 'BenchmarkReport', 'regression', 'percentile']
+
+regression = namedtuple('regression', 'name metric baseline current change')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(samples, p):
+    '''The *p* percentile, between 0 and 100, of the sorted list *samples*,
+using the nearest rank method.'''
+    if not samples:
+        return 0.0
+    rank = int(ceil(p*len(samples)/100.0)) - 1
+    return samples[min(max(rank, 0), len(samples) - 1)]
+
+
+class BenchmarkResult(object):
+    '''Latencies of a benchmarked operation.
+
+:parameter name: the benchmark name.
+:parameter samples: list of seconds taken by each repetition.
+:parameter ops: number of operations performed by each repetition.
+:parameter size: the dataset size code, ``tiny``, ``small``, ``normal``,
+    ``big`` or ``huge``.
+'''
+    def __init__(self, name, samples, ops=1, size=None):
+        self.name = name
+        self.samples = sorted(samples)
+        self.ops = ops
+        self.size = size
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+
+    @property
+    def total(self):
+        return sum(self.samples)
+
+    @property
+    def ops_per_second(self):
+        total = self.total
+        return self.ops*len(self.samples)/total if total else 0.0
+
+    def latency(self, p):
+        '''Latency percentile *p* of one operation in seconds.'''
+        return percentile(self.samples, p)/self.ops
+
+    def as_dict(self):
+        data = {'size': self.size,
+                'repeat': len(self.samples),
+                'ops': self.ops,
+                'ops_per_second': self.ops_per_second,
+                'mean': self.total/(self.ops*len(self.samples))
+                if self.samples else 0.0}
+        for p in PERCENTILES:
+            data['p%s' % p] = self.latency(p)
+        return data
+
+
+class BenchmarkReport(object):
+    '''A collection of :class:`BenchmarkResult` keyed by name.
+
+.. attribute:: results
+
+    Dictionary of benchmark names and result dictionaries, as returned by
+    :meth:`BenchmarkResult.as_dict`.
+'''
+    def __init__(self, results=None, info=None):
+        self.results = dict(results or ())
+        self.info = info or {'python': platform.python_version(),
+                             'platform': platform.platform()}
+
+    def __len__(self):
+        return len(self.results)
+
+    def add(self, name, samples, ops=1, size=None):
+        '''Add a :class:`BenchmarkResult` and return it.'''
+        result = BenchmarkResult(name, samples, ops, size)
+        self.results[name] = result.as_dict()
+        return result
+
+    def update(self, report):
+        '''Add the results of another :class:`BenchmarkReport`.'''
+        self.results.update(report.results)
+
+    def as_dict(self):
+        return {'info': self.info, 'results': self.results}
+
+    def save(self, path):
+        '''Save the report as JSON into *path*, creating the directory if
+needed.'''
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=4, sort_keys=True)
+
+    @classmethod
+    def load(cls, path):
+        '''Load a report from a JSON file or, if *path* is a directory, all
+reports in it.'''
+        if os.path.isdir(path):
+            report = cls(info={})
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.json'):
+                    report.update(cls.load(os.path.join(path, name)))
+            return report
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data.get('results'), data.get('info'))
+
+    def compare(self, baseline, tolerance=0.2, percentiles=(50, 99)):
+        '''List of :class:`regression` of this report with respect to the
+*baseline* report. A benchmark regresses when its operations per second
+decrease, or a latency percentile increases, by more than *tolerance*
+relative to the baseline. Benchmarks with a different dataset size are not
+compared.'''
+        regressions = []
+        for name, current in sorted(iteritems(self.results)):
+            base = baseline.results.get(name)
+            if not base or base.get('size') != current.get('size'):
+                continue
+            metrics = [('ops', base['ops_per_second'],
+                        current['ops_per_second'])]
+            metrics.extend((('p%s' % p, base.get('p%s' % p),
+                             current.get('p%s' % p)) for p in percentiles))
+            for metric, b, c in metrics:
+                if not b or c is None:
+                    continue
+                if metric == 'ops':
+                    change = (b - c)/b
+                else:
+                    change = (c - b)/b
+                if change > tolerance:
+                    regressions.append(regression(name, metric, b, c, change))
+        return regressions
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] BASELINE CURRENT',
+                          description='Compare benchmark reports.')
+    parser.add_option('-t', '--tolerance', type='float', default=0.2,
+                      help='relative change tolerated, default 0.2')
+    options, args = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.error('baseline and current reports are required')
+    baseline, current = [BenchmarkReport.load(p) for p in args]
+    regressions = current.compare(baseline, options.tolerance)
+    for r in regressions:
+        sys.stdout.write('%s %s: %.6g -> %.6g (%+.1f%%)\n' %
+                         (r.name, r.metric, r.baseline, r.current,
+                          100*r.change))
+    sys.stdout.write('%s benchmarks, %s regressions\n' %
+                     (len(current), len(regressions)))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
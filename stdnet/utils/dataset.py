@@ -0,0 +1,357 @@
+'''Reproducible synthetic datasets for load testing.
+
+A :class:`Dataset` generates the rows of several models from declarative
+per-field :class:`Column` distributions and writes them in batches, one
+transaction per batch, so that large fixtures are built with few round
+trips to the server. Rows are generated a column at a time from a random
+generator seeded for each model, therefore a given seed always produces the
+same data::
+
+    from stdnet.utils import dataset as ds
+
+    data = ds.Dataset(models, seed=42, batch_size=5000)
+    data.add(Instrument, 100000,
+             name=ds.Sequence('inst%s'),
+             ccy=ds.Choice(cardinality=20, skew=1.2),
+             type=ds.Choice(('equity', 'bond', 'future')),
+             description=ds.Text(nulls=0.3))
+    data.add(Fund, 1000, name=ds.Sequence('fund%s'),
+             ccy=ds.Choice(('EUR', 'USD')))
+    data.add(Position,
+             instrument=ds.Related(Instrument, fanout=10, skew=1),
+             fund=ds.Related(Fund),
+             dt=ds.Date(date(2010, 1, 1), date(2013, 1, 1)),
+             size=ds.Float(-1000, 1000))
+    data.create()
+
+Models are created in the order they are added, a :class:`Related` column
+takes its values from the primary keys of a model created before.
+'''
+import string
+from bisect import bisect
+from random import Random
+from datetime import datetime, timedelta
+
+from stdnet.utils import zip, range
+
+
+__all__ = ['Dataset', 'Column', 'Sequence', 'Constant', 'Integer', 'Float',
+           'Choice', 'Text', 'Date', 'Related']
+
+SEED_STEP = 1000003
+
+
+class Column(object):
+    '''The distribution of the values of a field.
+
+:parameter nulls: ratio, between 0 and 1, of ``None`` values.
+'''
+    def __init__(self, nulls=0):
+        self.nulls = nulls
+
+    def __repr__(self):
+        return self.__class__.__name__
+
+    def sample(self, rnd, start, size):
+        '''List of *size* values, the first being the value of row
+*start*, generated with the ``random.Random`` instance *rnd*.'''
+        values = self.values(rnd, start, size)
+        nulls = self.nulls
+        if nulls:
+            r = rnd.random
+            values = [None if r() < nulls else v for v in values]
+        return values
+
+    def values(self, rnd, start, size):
+        raise NotImplementedError
+
+
+class Sequence(Column):
+    '''Unique values obtained by formatting the row number with
+*format*.'''
+    def __init__(self, format='%s', start=0, **kwargs):
+        self.format = format
+        self.start = start
+        super(Sequence, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        format = self.format
+        start += self.start
+        return [format % i for i in range(start, start + size)]
+
+
+class Constant(Column):
+    '''Always the same *value*.'''
+    def __init__(self, value, **kwargs):
+        self.value = value
+        super(Constant, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        return size*[self.value]
+
+
+class Integer(Column):
+    '''Uniformly distributed integers between *start* and *end*
+included.'''
+    def __init__(self, start=0, end=100, **kwargs):
+        self.start = start
+        self.end = end
+        super(Integer, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        r = rnd.randint
+        a, b = self.start, self.end
+        return [r(a, b) for _ in range(size)]
+
+
+class Float(Column):
+    '''Uniformly distributed floats between *start* and *end*.'''
+    def __init__(self, start=0, end=1, **kwargs):
+        self.start = start
+        self.end = end
+        super(Float, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        r = rnd.random
+        a, d = self.start, self.end - self.start
+        return [a + d*r() for _ in range(size)]
+
+
+class Choice(Column):
+    '''Values picked from *choices* or, if not given, from *cardinality*
+values obtained by formatting their index with *format*.
+
+:parameter skew: exponent of a Zipf distribution over the choices. The
+    ``n``-th choice is picked with a probability proportional to
+    ``1/n**skew``. ``0`` for a uniform distribution.
+'''
+    def __init__(self, choices=None, cardinality=10, skew=0, format='v%s',
+                 **kwargs):
+        if choices is None:
+            choices = [format % i for i in range(cardinality)]
+        self.choices = list(choices)
+        self.skew = skew
+        self.cumulative = cumulative(len(self.choices), skew)
+        super(Choice, self).__init__(**kwargs)
+
+    @property
+    def cardinality(self):
+        return len(self.choices)
+
+    def values(self, rnd, start, size):
+        choices = self.choices
+        return [choices[i] for i in pick(rnd, self.cumulative,
+                                         len(choices), size)]
+
+
+class Text(Column):
+    '''Random strings of ascii letters with length between *min_len* and
+*max_len*.'''
+    characters = string.ascii_letters + string.digits
+
+    def __init__(self, min_len=10, max_len=50, **kwargs):
+        self.min_len = min_len
+        self.max_len = max_len
+        super(Text, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        characters = self.characters
+        r = rnd.randint
+        a, b = self.min_len, self.max_len
+        # one pool of characters per batch, sliced at random offsets
+        pool = ''.join((rnd.choice(characters) for _ in range(4*b)))
+        values = []
+        for _ in range(size):
+            n = r(a, b)
+            o = r(0, len(pool) - n)
+            values.append(pool[o:o+n])
+        return values
+
+
+class Date(Column):
+    '''Uniformly distributed dates, or datetimes if *start* is a
+``datetime``, between *start* and *end*.'''
+    def __init__(self, start, end, **kwargs):
+        self.start = start
+        self.end = end
+        super(Date, self).__init__(**kwargs)
+
+    def values(self, rnd, start, size):
+        r = rnd.random
+        begin = self.start
+        delta = self.end - begin
+        if isinstance(begin, datetime):
+            seconds = delta.days*86400 + delta.seconds
+            return [begin + timedelta(seconds=int(seconds*r()))
+                    for _ in range(size)]
+        else:
+            return [begin + timedelta(days=int(delta.days*r()))
+                    for _ in range(size)]
+
+
+class Related(Column):
+    '''Primary keys of the instances of *model*, for foreign keys.
+
+:parameter fanout: average number of rows referring to one instance of
+    *model*. When given, the number of rows of a model added to a
+    :class:`Dataset` without size is *fanout* times the size of *model*.
+:parameter skew: exponent of a Zipf distribution over the related
+    instances. ``0`` for a uniform fan-out.
+'''
+    def __init__(self, model, fanout=None, skew=0, **kwargs):
+        self.model = model
+        self.fanout = fanout
+        self.skew = skew
+        self.ids = None
+        self.cumulative = None
+        super(Related, self).__init__(**kwargs)
+
+    def bind(self, ids):
+        '''Bind the list of primary keys to pick values from.'''
+        self.ids = ids
+        self.cumulative = cumulative(len(ids), self.skew) if ids else None
+
+    def values(self, rnd, start, size):
+        ids = self.ids
+        if not ids:
+            raise ValueError('Instances of %s must be created first.' %
+                             self.model._meta)
+        return [ids[i] for i in pick(rnd, self.cumulative, len(ids), size)]
+
+
+class ModelData(object):
+    '''The rows of a model in a :class:`Dataset`.'''
+    def __init__(self, model, size, columns, seed):
+        self.model = model
+        self.size = size
+        self.columns = columns
+        self.seed = seed
+        self.names = sorted(columns)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.model._meta, self.size)
+
+    def batches(self, batch_size):
+        '''Generator of lists of at most *batch_size* dictionaries of field
+values.'''
+        rnd = Random(self.seed)
+        names = self.names
+        columns = [self.columns[name] for name in names]
+        for start in range(0, self.size, batch_size):
+            size = min(batch_size, self.size - start)
+            data = [c.sample(rnd, start, size) for c in columns]
+            yield [dict(zip(names, values)) for values in zip(*data)]
+
+
+class Dataset(object):
+    '''A reproducible synthetic dataset for the models of a
+:class:`stdnet.odm.Router`.
+
+:parameter router: the :class:`stdnet.odm.Router` with the models.
+:parameter seed: the random seed. If not given a random one is picked and
+    available as the :attr:`seed` attribute.
+:parameter batch_size: number of instances committed by one transaction.
+
+.. attribute:: ids
+
+    Dictionary of models and the list of primary keys of their created
+    instances.
+'''
+    def __init__(self, router, seed=None, batch_size=1000):
+        if seed is None:
+            seed = Random().randint(0, 2**31)
+        self.router = router
+        self.seed = seed
+        self.batch_size = batch_size
+        self.data = []
+        self.ids = {}
+
+    def __repr__(self):
+        return '%s%s' % (self.__class__.__name__, self.data)
+
+    def add(self, model, size=None, **columns):
+        '''Add *size* instances of *model* with fields distributed according
+to the *columns* keyword arguments, :class:`Column` instances keyed by field
+name. If *size* is not given, it is obtained from the ``fanout`` of a
+:class:`Related` column. A :class:`Column` passed as *size* is the column
+of a field called ``size``. Return ``self``.'''
+        if isinstance(size, Column):
+            columns['size'] = size
+            size = None
+        if size is None:
+            for column in columns.values():
+                if isinstance(column, Related) and column.fanout:
+                    size = column.fanout*self.get(column.model).size
+                    break
+            else:
+                raise ValueError('The size of %s is required' % model._meta)
+        seed = self.seed + SEED_STEP*(len(self.data) + 1)
+        self.data.append(ModelData(model, size, columns, seed))
+        return self
+
+    def get(self, model):
+        '''The :class:`ModelData` of *model*.'''
+        for data in self.data:
+            if data.model is model:
+                return data
+        raise KeyError(model)
+
+    def rows(self, model):
+        '''Generator of batches of field values of *model*. Values of
+:class:`Related` columns are taken from :attr:`ids`.'''
+        data = self.get(model)
+        self._bind(data)
+        return data.batches(self.batch_size)
+
+    def create(self, progress=None):
+        '''Create all instances, one transaction per batch.
+
+:parameter progress: optional callable invoked after each batch with the
+    model, the number of instances created and the size of the model.
+:return: the :attr:`ids` dictionary, or an asynchronous result resolving
+    to it.'''
+        backend = self.router[self.data[0].model].backend
+        return backend.execute(self._create(progress))
+
+    # INTERNALS
+    def _bind(self, data):
+        for column in data.columns.values():
+            if isinstance(column, Related):
+                column.bind(self.ids.get(column.model))
+
+    def _create(self, progress):
+        for data in self.data:
+            model = data.model
+            ids = self.ids[model] = []
+            for rows in self.rows(model):
+                session = self.router.session()
+                with session.begin() as t:
+                    instances = [t.add(model(**row)) for row in rows]
+                yield t.on_result
+                ids.extend((instance.pkvalue() for instance in instances))
+                if progress:
+                    progress(model, len(ids), data.size)
+        yield self.ids
+
+
+def cumulative(n, skew):
+    '''Cumulative Zipf weights of *n* values with exponent *skew*, ``None``
+for a uniform distribution.'''
+    if not skew or n < 2:
+        return None
+    total = 0.0
+    weights = []
+    for i in range(1, n + 1):
+        total += 1.0/i**skew
+        weights.append(total)
+    return weights
+
+
+def pick(rnd, weights, n, size):
+    '''List of *size* random indices between 0 and *n* - 1 distributed
+according to the cumulative *weights*.'''
+    r = rnd.random
+    if weights is None:
+        return [int(n*r()) for _ in range(size)]
+    total = weights[-1]
+    return [min(bisect(weights, total*r()), n - 1) for _ in range(size)]
@@ -23,9 +23,16 @@ These are all available :class:`Encoder`:
 .. autoclass:: DateTimeConverter
 
 .. autoclass:: DateConverter
+
+Compression of field values:
+
+.. autofunction:: compress
+
+.. autofunction:: decompress
 '''
 import json
 import logging
+import zlib
 
 from datetime import datetime, date
 from struct import pack, unpack
@@ -36,10 +43,36 @@ from stdnet.utils import (JSONDateDecimalEncoder, pickle,
                           string_type)
 
 nan = float('nan')
+# first byte of compressed values. It does not start JSON, pickle (protocol
+# 2 starts with 0x80) or text values, which are loaded verbatim.
+COMPRESSED_MARKER = b'\x00'
 
 LOGGER = logging.getLogger('stdnet.encoders')
 
 
+def compress(value, level=6, threshold=128):
+    '''Compress *value*, a bytes string, with zlib at *level* if it is at
+least *threshold* bytes long and compression reduces its size. Compressed
+values start with the ``COMPRESSED_MARKER`` byte, other values are returned
+unchanged.'''
+    if len(value) >= threshold:
+        data = COMPRESSED_MARKER + zlib.compress(value, level)
+        if len(data) < len(value):
+            return data
+    return value
+
+
+def decompress(value):
+    '''Decompress *value* if it was compressed via :func:`compress`,
+otherwise return *value* unchanged.'''
+    if isinstance(value, bytes) and value[:1] == COMPRESSED_MARKER:
+        try:
+            return zlib.decompress(value[1:])
+        except zlib.error:
+            pass
+    return value
+
+
 class Encoder(object):
     '''Virtaul class for encoding data in
 :ref:`data structures <model-structures>`. It exposes two methods
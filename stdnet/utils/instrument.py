@@ -0,0 +1,173 @@
+'''Client side instrumentation of backend operations.
+
+An :class:`Instrument` is set on a :class:`stdnet.BackendDataServer` via
+its :meth:`stdnet.BackendDataServer.set_instrument` method, or on all the
+backends of a :class:`stdnet.odm.Router` via
+:meth:`stdnet.odm.Router.set_instrument`. The backend emits an
+:class:`instrument_event` for each script executed in the server and for
+each committed session. Backends without an instrument, the default, skip
+instrumentation altogether.
+
+.. attribute:: instrument_event
+
+    Namedtuple with the following fields:
+
+    * ``name`` the script name, or ``session`` for a committed session.
+    * ``command`` the ``odmrun`` sub-command (``commit``, ``load``,
+      ``query``, ``delete``, ...) or ``None``.
+    * ``model`` the model key or ``None``.
+    * ``keys`` the number of keys passed to the script.
+    * ``size`` approximate size in bytes of keys and arguments.
+    * ``duration`` seconds from the call to the processed reply.
+    * ``count`` number of results, or ``None``.
+    * ``query`` representation of the query element or ``None``.
+'''
+from collections import namedtuple, deque
+from threading import Lock
+
+
+__all__ = ['Instrument', 'InstrumentCollector', 'Histogram',
+           'instrument_event', 'payload_size', 'result_count']
+
+instrument_event = namedtuple('instrument_event',
+                              'name command model keys size duration count '
+                              'query')
+# upper bounds, in seconds, of histogram buckets
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1, 2.5, 5)
+
+
+def payload_size(values):
+    '''Approximate size in bytes of a sequence of command *values*.'''
+    size = 0
+    for value in values:
+        if isinstance(value, bytes):
+            size += len(value)
+        else:
+            size += len(str(value))
+    return size
+
+
+def result_count(result):
+    '''The number of elements in *result*, or ``None`` if not available
+without consuming it.'''
+    if isinstance(result, (list, tuple, set, frozenset, dict)):
+        return len(result)
+    elif isinstance(result, int) and not isinstance(result, bool):
+        return result
+    results = getattr(result, 'results', None)
+    if isinstance(results, (list, tuple)):
+        return len(results)
+
+
+class Instrument(object):
+    '''Interface of instruments. The default implementation does nothing.
+'''
+    def emit(self, event):
+        '''Called with an :class:`instrument_event` once an operation has
+finished.'''
+        pass
+
+
+class Histogram(object):
+    '''Distribution of durations, payload sizes and result counts of the
+events of a model and command.
+
+.. attribute:: buckets
+
+    List of counts of durations less or equal the upper bounds in
+    :attr:`bounds`, the last element counts slower events.
+'''
+    def __init__(self, bounds=DURATION_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0]*(len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.size = 0
+        self.results = 0
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.count)
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else 0.0
+
+    def add(self, event):
+        duration = event.duration
+        index = 0
+        for bound in self.bounds:
+            if duration <= bound:
+                break
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.size += event.size or 0
+        self.results += event.count or 0
+
+    def percentile(self, p):
+        '''Upper bound of the bucket containing the *p* percentile, with *p*
+between 0 and 100. ``None`` for events slower than the last bound.'''
+        if not self.count:
+            return 0.0
+        target = self.count*p/100.0
+        n = 0
+        for bound, count in zip(self.bounds + (None,), self.buckets):
+            n += count
+            if n >= target:
+                return bound
+
+    def as_dict(self):
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.mean,
+                'max': self.max,
+                'size': self.size,
+                'results': self.results,
+                'buckets': dict(zip(self.bounds + ('inf',), self.buckets))}
+
+
+class InstrumentCollector(Instrument):
+    '''An :class:`Instrument` which keeps the last *max_events* events in
+memory and aggregates all events in a :class:`Histogram` for each model
+and command.
+
+.. attribute:: events
+
+    A ``deque`` with the most recent :class:`instrument_event`.
+
+.. attribute:: histograms
+
+    Dictionary of ``(model, command)`` pairs and :class:`Histogram`. The
+    command is the ``odmrun`` sub-command or the event name.
+'''
+    def __init__(self, max_events=1000, bounds=DURATION_BUCKETS):
+        self.bounds = bounds
+        self.events = deque(maxlen=max_events)
+        self.histograms = {}
+        self._lock = Lock()
+
+    def emit(self, event):
+        key = (event.model, event.command or event.name)
+        with self._lock:
+            self.events.append(event)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.bounds)
+            histogram.add(event)
+
+    def stats(self, model=None):
+        '''Dictionary of ``(model, command)`` pairs and histogram
+dictionaries, optionally for *model* only.'''
+        with self._lock:
+            return dict(((key, h.as_dict()) for key, h in
+                         self.histograms.items()
+                         if model is None or key[0] == model))
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self.histograms.clear()
@@ -214,7 +214,7 @@ after the :meth:`setUpClass` was called. By default it does nothing.'''
     this parameter is not used.
 '''
         pk = instance.pkvalue()
-        if exact or self.backend.name == 'redis':
+        if exact or self.backend.name in ('redis', 'memory'):
             self.assertEqual(pk, value)
         elif self.backend.name == 'mongo':
             if instance._meta.pk.type == 'auto':
@@ -273,6 +273,24 @@ class StdnetPlugin(TestPlugin):
                           action="store_true",
                           default=False)
 
+    bench_report = pulsar.Setting(
+        flags=['--bench-report'],
+        desc='Directory where benchmarks save their JSON reports.',
+        default='')
+
+    bench_baseline = pulsar.Setting(
+        flags=['--bench-baseline'],
+        desc=('Directory of baseline JSON reports which benchmark results '
+              'are compared with.'),
+        default='')
+
+    bench_tolerance = pulsar.Setting(
+        flags=['--bench-tolerance'],
+        desc=('Relative change of benchmark results, with respect to the '
+              'baseline, flagged as a regression.'),
+        type=float,
+        default=0.2)
+
     def configure(self, cfg):
         if cfg.sync:
             settings.ASYNC_BINDINGS = False
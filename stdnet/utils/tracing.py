@@ -0,0 +1,221 @@
+'''Tracing spans of the phases of backend operations.
+
+A :class:`Tracer` is set on a :class:`stdnet.odm.Router`, and on the
+backends of its registered models, via
+:meth:`stdnet.odm.Router.set_tracer`. When available, the following nested
+spans are opened:
+
+* ``session.commit`` a committed session, with ``models`` and ``instances``.
+* ``query.construct`` the construction of a :class:`stdnet.odm.Query`, with
+  ``model``.
+* ``query.items``, ``query.count`` and ``query.page`` the execution of a
+  query in the backend, with ``model`` and ``rows``.
+* ``redis.script`` a lua script executed in the redis server, from the call
+  to the reply, with ``script``, ``command``, ``model``, ``keys`` and
+  ``bytes`` of the request.
+* ``redis.parse`` the processing of a script reply, with ``bytes`` of the
+  reply and ``rows``.
+* ``memory.evaluate`` the evaluation of a query by the memory backend.
+* ``odm.make_objects`` the materialisation of model instances, with
+  ``model`` and ``rows``.
+
+Without a tracer, the default, the only cost is a check for ``None``.
+
+Spans are nested by the thread which opens them. With asynchronous
+backends spans of concurrent operations may be nested in the wrong parent.
+'''
+from collections import deque
+from threading import local
+from timeit import default_timer
+
+
+__all__ = ['Span', 'Tracer', 'RecordingTracer', 'response_size']
+
+
+def response_size(response):
+    '''Approximate size in bytes of a *response* from the server.'''
+    if isinstance(response, bytes):
+        return len(response)
+    elif isinstance(response, (list, tuple)):
+        return sum((response_size(r) for r in response))
+    elif response is None:
+        return 0
+    else:
+        return len(str(response))
+
+
+class Span(object):
+    '''A timed phase of an operation, created via :meth:`Tracer.start_span`.
+
+A span is ended via :meth:`end` or, when used as a context manager, on
+exit. Within the ``with`` block the span is the :meth:`Tracer.current_span`
+and the parent of new spans of the same thread.
+
+.. attribute:: name
+
+    The name of the span.
+
+.. attribute:: parent
+
+    The parent :class:`Span` or ``None``.
+
+.. attribute:: attributes
+
+    Dictionary of attributes.
+
+.. attribute:: context
+
+    Free slot for adapters, for example the native span of a third party
+    tracer. Default ``None``.
+'''
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes if attributes is not None else {}
+        self.context = None
+        self.start = default_timer()
+        self.end_time = None
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.name)
+    __str__ = __repr__
+
+    @property
+    def duration(self):
+        '''Seconds between the start and the end of the span, ``None``
+if not ended.'''
+        if self.end_time is not None:
+            return self.end_time - self.start
+
+    @property
+    def ended(self):
+        return self.end_time is not None
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def end(self):
+        '''End the span. Calls after the first have no effect.'''
+        if self.end_time is None:
+            self.end_time = default_timer()
+            self.tracer.on_end(self)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.tracer._pop(self)
+        if value is not None:
+            self.attributes['error'] = repr(value)
+        self.end()
+
+
+class Tracer(object):
+    '''Interface of tracers. The default implementation keeps track of
+spans without exporting them. Adapters to third party tracing libraries
+override :meth:`on_start` and :meth:`on_end`, for example::
+
+    from opentelemetry import trace
+
+    class OpenTelemetryTracer(Tracer):
+        otel = trace.get_tracer('stdnet')
+
+        def on_start(self, span):
+            parent = span.parent.context if span.parent else None
+            context = trace.set_span_in_context(parent) if parent else None
+            span.context = self.otel.start_span(span.name, context=context)
+
+        def on_end(self, span):
+            span.context.set_attributes(span.attributes)
+            span.context.end()
+'''
+    def __init__(self):
+        self._local = local()
+
+    def start_span(self, name, parent=None, **attributes):
+        '''Start and return a new :class:`Span`. The *parent* is the
+:meth:`current_span` if not given.'''
+        if parent is None:
+            parent = self.current_span()
+        span = Span(self, name, parent, attributes)
+        self.on_start(span)
+        return span
+
+    def current_span(self):
+        '''The innermost :class:`Span` used as context manager by the
+current thread, or ``None``.'''
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return stack[-1]
+
+    def on_start(self, span):
+        '''Called when *span* starts.'''
+        pass
+
+    def on_end(self, span):
+        '''Called when *span* ends.'''
+        pass
+
+    def _push(self, span):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(span)
+
+    def _pop(self, span):
+        stack = self._local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
+        elif span in stack:
+            stack.remove(span)
+
+
+class RecordingTracer(Tracer):
+    '''A :class:`Tracer` which keeps the last *max_spans* ended spans in
+memory.
+
+.. attribute:: spans
+
+    A ``deque`` with the most recent ended :class:`Span`, in the order
+    they ended. Children end before their parent.
+'''
+    def __init__(self, max_spans=1000):
+        super(RecordingTracer, self).__init__()
+        self.spans = deque(maxlen=max_spans)
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+    def roots(self):
+        '''List of recorded spans without a parent.'''
+        return [span for span in self.spans if span.parent is None]
+
+    def children(self, span):
+        '''List of recorded spans with *span* as parent, in the order they
+started.'''
+        children = [s for s in self.spans if s.parent is span]
+        return sorted(children, key=lambda s: s.start)
+
+    def tree(self, span=None):
+        '''Text representation of the recorded spans, or of *span* and its
+descendants, one span per line indented by depth.'''
+        lines = []
+        roots = [span] if span is not None else self.roots()
+        for root in sorted(roots, key=lambda s: s.start):
+            self._tree(root, 0, lines)
+        return '\n'.join(lines)
+
+    def clear(self):
+        self.spans.clear()
+
+    def _tree(self, span, depth, lines):
+        attributes = ' '.join(('%s=%s' % (k, span.attributes[k]) for k in
+                               sorted(span.attributes)))
+        duration = span.duration
+        line = '%s%s %.3fms %s' % ('  '*depth, span.name,
+                                   1000*(duration or 0), attributes)
+        lines.append(line.rstrip())
+        for child in self.children(span):
+            self._tree(child, depth + 1, lines)
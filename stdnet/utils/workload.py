@@ -0,0 +1,350 @@
+'''Record the commands sent to redis by a process and replay them.
+
+A :class:`WorkloadRecorder` is set on the backends of a
+:class:`stdnet.odm.Router` via :meth:`stdnet.odm.Router.set_recorder`. It
+writes one line for each command, or pipeline, sent to the server with its
+start time, duration and arguments. Queries, commits and structure
+operations are all recorded, the ``odmrun`` scripts with their sub-command
+and model::
+
+    recorder = WorkloadRecorder('workload.log.gz')
+    models.set_recorder(recorder)
+    ...
+    models.set_recorder(None)
+    recorder.close()
+
+A :class:`WorkloadReplayer` sends the recorded commands to another server,
+at the recorded pace or faster, from several threads, and returns a
+:class:`ReplayReport` with the throughput, latency percentiles and the CPU
+used by the server. From the command line::
+
+    python -m stdnet.utils.workload workload.log.gz -s 127.0.0.1:6379 \\
+        --speed 2 --concurrency 4
+
+The log is a sequence of JSON lines, compressed with gzip when the file name
+ends with ``.gz``. Arguments are stored as the bytes sent to the server.
+Commands are replayed with the keys of the recorded process, therefore the
+target server should be a disposable one.
+
+.. attribute:: workload_entry
+
+    Namedtuple with the following fields:
+
+    * ``offset`` seconds from the start of the recording.
+    * ``duration`` seconds taken by the command or pipeline.
+    * ``transaction`` ``True`` for pipelines executed with
+      ``MULTI``/``EXEC``.
+    * ``labels`` tuple of labels of the commands: the command name, or
+      ``script:command:model`` for scripts.
+    * ``commands`` tuple of command arguments as bytes.
+'''
+import sys
+import json
+import gzip
+import time
+from threading import Thread, Lock
+from collections import namedtuple
+from optparse import OptionParser
+from timeit import default_timer
+
+from stdnet.utils import string_type
+from stdnet.utils.bench import percentile
+
+
+__all__ = ['WorkloadRecorder', 'WorkloadReplayer', 'ReplayReport',
+           'workload_entry', 'read_workload']
+
+workload_entry = namedtuple('workload_entry',
+                            'offset duration transaction labels commands')
+VERSION = 1
+
+
+def wire(value, encoding='utf-8'):
+    '''The bytes sent to redis for *value*, as a latin-1 string which can
+be serialised with JSON.'''
+    if isinstance(value, bytes):
+        pass
+    elif isinstance(value, float):
+        value = repr(value).encode('ascii')
+    elif isinstance(value, string_type):
+        value = value.encode(encoding)
+    else:
+        value = str(value).encode('ascii')
+    return value.decode('latin-1')
+
+
+def command_label(args, options):
+    script = options.get('script')
+    if script is None:
+        return str(args[0])
+    meta = options.get('meta')
+    return '%s:%s:%s' % (script.name, options.get('odm_command') or '',
+                         meta.modelkey if meta is not None else '')
+
+
+def open_log(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 'b')
+    return open(path, mode + 'b')
+
+
+class WorkloadRecorder(object):
+    '''Write the commands sent to redis into the log at *path*.
+
+:parameter path: the log file, compressed if it ends with ``.gz``.
+:parameter encoding: the encoding of string arguments.
+
+.. attribute:: count
+
+    Number of entries recorded.
+'''
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self.count = 0
+        self._start = default_timer()
+        self._lock = Lock()
+        self._file = open_log(path, 'w')
+        self._write({'version': VERSION, 'time': time.time()})
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def record(self, commands, start, duration, transaction=False):
+        '''Record a sequence of *commands*, ``(args, options)`` pairs
+executed at *start* (a :func:`timeit.default_timer` value) and lasting
+*duration* seconds.'''
+        encoding = self.encoding
+        labels = []
+        data = []
+        for args, options in commands:
+            labels.append(command_label(args, options))
+            data.append([wire(a, encoding) for a in args])
+        entry = [round(start - self._start, 6), round(duration, 6),
+                 1 if transaction else 0, labels, data]
+        with self._lock:
+            if self._file is not None:
+                self._write(entry)
+                self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write(self, data):
+        line = json.dumps(data, separators=(',', ':')) + '\n'
+        self._file.write(line.encode('latin-1'))
+
+
+def read_workload(path):
+    '''Generator of :class:`workload_entry` in the log at *path*.'''
+    with open_log(path, 'r') as f:
+        header = json.loads(f.readline().decode('latin-1'))
+        if header.get('version') != VERSION:
+            raise ValueError('Unsupported workload log version %s' %
+                             header.get('version'))
+        for line in f:
+            offset, duration, transaction, labels, data = json.loads(
+                line.decode('latin-1'))
+            commands = tuple((tuple((a.encode('latin-1') for a in args))
+                              for args in data))
+            yield workload_entry(offset, duration, bool(transaction),
+                                 tuple(labels), commands)
+
+
+class ReplayReport(object):
+    '''The outcome of a :meth:`WorkloadReplayer.replay`.
+
+.. attribute:: latencies
+
+    Sorted list of seconds taken by each replayed entry.
+
+.. attribute:: lags
+
+    Sorted list of seconds each entry was sent after its scheduled time.
+    Large lags mean that the replay could not keep the requested pace.
+'''
+    def __init__(self, latencies, lags, errors, elapsed, recorded, cpu=None):
+        self.latencies = sorted(latencies)
+        self.lags = sorted(lags)
+        self.errors = errors
+        self.elapsed = elapsed
+        self.recorded = recorded
+        self.cpu = cpu
+
+    def __repr__(self):
+        return ('%s(%s entries, %.1f/s, p99 %.3fms)' %
+                (self.__class__.__name__, len(self.latencies),
+                 self.throughput, 1000*self.latency(99)))
+
+    @property
+    def throughput(self):
+        return len(self.latencies)/self.elapsed if self.elapsed else 0.0
+
+    def latency(self, p):
+        '''Latency percentile *p*, between 0 and 100, in seconds.'''
+        return percentile(self.latencies, p)
+
+    def as_dict(self):
+        data = {'entries': len(self.latencies),
+                'errors': self.errors,
+                'elapsed': self.elapsed,
+                'recorded': self.recorded,
+                'throughput': self.throughput,
+                'max': self.latencies[-1] if self.latencies else 0.0,
+                'lag_p99': percentile(self.lags, 99),
+                'server_cpu': self.cpu,
+                'server_cpu_ratio': self.cpu/self.elapsed
+                if self.cpu is not None and self.elapsed else None}
+        for p in (50, 90, 99):
+            data['p%s' % p] = self.latency(p)
+        return data
+
+
+class WorkloadReplayer(object):
+    '''Replay recorded entries with a redis *client*.
+
+:parameter client: a :class:`stdnet.backends.redisb.client.Redis` client
+    connected to the target server.
+:parameter speed: replay speed relative to the recorded one, ``2`` replays
+    twice as fast. ``0`` sends entries as fast as possible.
+:parameter concurrency: number of threads, each with its own connection,
+    sending entries.
+'''
+    def __init__(self, client, speed=1.0, concurrency=1):
+        self.client = client
+        self.speed = speed
+        self.concurrency = max(concurrency, 1)
+
+    def replay(self, entries):
+        '''Replay *entries*, an iterable over :class:`workload_entry`, and
+return a :class:`ReplayReport`.'''
+        entries = list(entries)
+        self.client.preload_scripts()
+        cpu = self.server_cpu()
+        self._entries = iter(entries)
+        self._lock = Lock()
+        self._latencies = []
+        self._lags = []
+        self._errors = 0
+        base = entries[0].offset if entries else 0
+        start = default_timer()
+        threads = [Thread(target=self._work, args=(start, base))
+                   for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = default_timer() - start
+        if cpu is not None:
+            end_cpu = self.server_cpu()
+            cpu = end_cpu - cpu if end_cpu is not None else None
+        recorded = entries[-1].offset - base if entries else 0
+        return ReplayReport(self._latencies, self._lags, self._errors,
+                            elapsed, recorded, cpu)
+
+    def server_cpu(self):
+        '''Seconds of CPU used by the server, ``None`` if not available.'''
+        try:
+            info = self.client.info('cpu').get('CPU', {})
+            return (float(info['used_cpu_sys']) +
+                    float(info['used_cpu_user']))
+        except Exception:
+            return None
+
+    # INTERNALS
+    def _next(self):
+        with self._lock:
+            for entry in self._entries:
+                return entry
+
+    def _work(self, start, base):
+        pool = self.client.connection_pool
+        connection = pool.get_connection('replay')
+        speed = self.speed
+        try:
+            while True:
+                entry = self._next()
+                if entry is None:
+                    break
+                if speed:
+                    due = start + (entry.offset - base)/speed
+                    wait = due - default_timer()
+                    if wait > 0:
+                        time.sleep(wait)
+                else:
+                    due = start
+                sent = default_timer()
+                errors = self._execute(connection, entry)
+                end = default_timer()
+                with self._lock:
+                    self._latencies.append(end - sent)
+                    self._lags.append(max(sent - due, 0))
+                    self._errors += errors
+        finally:
+            pool.release(connection)
+
+    def _execute(self, connection, entry):
+        commands = entry.commands
+        if entry.transaction:
+            commands = ((b'MULTI',),) + commands + ((b'EXEC',),)
+        errors = 0
+        try:
+            for args in commands:
+                connection.send_command(*args)
+            for _ in commands:
+                try:
+                    response = connection.read_response()
+                except Exception as e:
+                    if not is_response_error(e):
+                        raise
+                    errors += 1
+                else:
+                    if isinstance(response, list):
+                        errors += len([r for r in response
+                                       if isinstance(r, Exception)])
+        except Exception:
+            connection.disconnect()
+            errors += 1
+        return errors
+
+
+def is_response_error(e):
+    from stdnet.backends.redisb.client.extensions import redis
+    return isinstance(e, redis.ResponseError)
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options] LOG',
+                          description='Replay a recorded workload.')
+    parser.add_option('-s', '--server', default='127.0.0.1:6379',
+                      help='redis server address, default 127.0.0.1:6379')
+    parser.add_option('-d', '--db', type='int', default=0,
+                      help='redis database, default 0')
+    parser.add_option('--speed', type='float', default=1.0,
+                      help='replay speed, 0 for as fast as possible')
+    parser.add_option('-c', '--concurrency', type='int', default=1,
+                      help='number of connections, default 1')
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error('the workload log is required')
+    from stdnet.backends.redisb.client import redis_client
+    host, port = options.server.split(':')
+    client = redis_client((host, int(port)), db=options.db)
+    replayer = WorkloadReplayer(client, options.speed, options.concurrency)
+    report = replayer.replay(read_workload(args[0]))
+    json.dump(report.as_dict(), sys.stdout, indent=4, sort_keys=True)
+    sys.stdout.write('\n')
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
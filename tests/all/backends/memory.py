@@ -0,0 +1,135 @@
+from datetime import date
+
+from stdnet import odm, getdb, CommitException, QuerySetError
+from stdnet.utils import test
+from stdnet.apps.columnts import ColumnTS
+
+from examples.models import (Instrument, Fund, Position, SportAtDate,
+                             SportAtDate2, Node, Dictionary, SimpleList)
+
+
+class TestMemoryBackend(test.TestWrite):
+    multipledb = False
+    connection_string = 'memory://local'
+    models = (Instrument, Fund, Position, SportAtDate, SportAtDate2, Node,
+              Dictionary, SimpleList, odm.Zset, ColumnTS)
+
+    def create_instruments(self):
+        models = self.mapper
+        with models.session().begin() as t:
+            for i in range(10):
+                t.add(models.instrument(name='i%s' % i,
+                                        ccy='EUR' if i % 2 else 'USD',
+                                        type='equity' if i < 5 else 'bond'))
+        return t
+
+    def test_connection_string(self):
+        backend = getdb('memory://')
+        self.assertEqual(backend.name, 'memory')
+        self.assertEqual(backend.connection_string, 'memory://local')
+        self.assertEqual(backend, getdb('memory://local'))
+        self.assertNotEqual(backend, getdb('memory://other'))
+        self.assertTrue(backend.ping())
+
+    def test_commit_and_query(self):
+        self.create_instruments()
+        query = self.mapper.instrument.query()
+        self.assertEqual(query.count(), 10)
+        qs = query.filter(ccy='EUR', type='bond')
+        self.assertEqual(set(i.name for i in qs), set(('i5', 'i7', 'i9')))
+        qs = query.filter(ccy=('EUR', 'USD')).exclude(type='bond')
+        self.assertEqual(qs.count(), 5)
+        qs = query.filter(name__startswith='i1')
+        self.assertEqual([i.name for i in qs], ['i1'])
+        qs = query.sort_by('-name')[:3]
+        self.assertEqual([i.name for i in qs], ['i9', 'i8', 'i7'])
+        instrument = self.mapper.instrument.get(name='i3')
+        self.assertEqualId(instrument, 4)
+
+    def test_unique_rollback(self):
+        models = self.mapper
+        a = models.instrument.new(name='a', ccy='EUR', type='x')
+        b = models.instrument.new(name='b', ccy='EUR', type='x')
+        b.name = 'a'
+        self.assertRaises(CommitException, b.save)
+        self.assertEqual(models.instrument.query().count(), 2)
+        self.assertEqual(models.instrument.filter(name='a').get().id, a.id)
+        self.assertEqual(models.instrument.filter(name='b').get().id, b.id)
+        self.assertRaises(CommitException, models.instrument.new, name='b',
+                          ccy='USD', type='y')
+        self.assertEqual(models.instrument.filter(ccy='USD').count(), 0)
+
+    def test_related_and_cascade_delete(self):
+        models = self.mapper
+        self.create_instruments()
+        fund = models.fund.new(name='f1', ccy='EUR')
+        with models.session().begin() as t:
+            for instrument in models.instrument.filter(ccy='EUR'):
+                t.add(models.position(instrument=instrument, fund=fund,
+                                      dt=date.today(), size=instrument.id))
+        query = models.position.query()
+        self.assertEqual(query.filter(instrument__type='bond').count(), 3)
+        self.assertEqual(query.filter(size__gt=5).count(), 3)
+        positions = query.load_related('instrument')
+        self.assertEqual(sorted(p.instrument.name for p in positions),
+                         ['i1', 'i3', 'i5', 'i7', 'i9'])
+        models.instrument.filter(type='bond').delete()
+        self.assertEqual(models.instrument.query().count(), 5)
+        self.assertEqual(query.count(), 2)
+
+    def test_self_related_delete(self):
+        models = self.mapper
+        root = models.node.new(weight=1)
+        child = models.node.new(parent=root, weight=2)
+        models.node.new(parent=child, weight=3)
+        self.assertEqual(models.node.query().count(), 3)
+        models.node.filter(id=root.id).delete()
+        self.assertEqual(models.node.query().count(), 0)
+
+    def test_ordering_and_pagination(self):
+        models = self.mapper
+        dates = [date(2010, 1, 3), date(2010, 1, 1), date(2010, 1, 2)]
+        with models.session().begin() as t:
+            for i, dt in enumerate(dates):
+                t.add(models.sportatdate(person='p%s' % i, name='n', dt=dt))
+                t.add(models.sportatdate2(person='p%s' % i, name='n', dt=dt))
+        self.assertEqual([s.dt for s in models.sportatdate.query()],
+                         sorted(dates))
+        self.assertEqual([s.dt for s in models.sportatdate2.query()],
+                         sorted(dates, reverse=True))
+        page = models.sportatdate.query().after(None, 2)
+        self.assertEqual([s.dt for s in page], sorted(dates)[:2])
+        page = models.sportatdate.query().after(page.after, 2)
+        self.assertEqual([s.dt for s in page], sorted(dates)[2:])
+        qs = models.sportatdate.query().sort_by('person')
+        self.assertRaises(QuerySetError, qs.after, None, 2)
+
+    def test_structures(self):
+        models = self.mapper
+        d = models.dictionary.new(name='d')
+        d.data.update({'a': 1, 'b': 2})
+        d.save()
+        self.assertEqual(models.dictionary.get(name='d').data['b'], 2)
+        l = models.simplelist.new()
+        l.names.push_back('a')
+        l.names.push_front('z')
+        l.save()
+        self.assertEqual(list(l.names), ['z', 'a'])
+        session = models.session()
+        z = session.add(odm.Zset())
+        z.update(((1, 'a'), (3, 'c'), (2, 'b')))
+        session.commit()
+        self.assertEqual(z.size(), 3)
+        self.assertEqual(list(z.range(1, 2, withscores=False)), ['a', 'b'])
+
+    def test_columnts(self):
+        session = self.mapper.session()
+        ts = session.add(ColumnTS())
+        ts.update({date(2012, 1, 1): {'a': 1, 'b': 2},
+                   date(2012, 1, 2): {'a': 3}})
+        session.commit()
+        self.assertEqual(ts.size(), 2)
+        self.assertEqual(ts.fields(), ('a', 'b'))
+        stats = ts.istats()
+        self.assertEqual(stats['stats']['a']['N'], 2)
+        self.assertFalse('b' in stats['stats'])
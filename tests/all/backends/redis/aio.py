@@ -0,0 +1,80 @@
+'''Test the asyncio redis client'''
+try:
+    import asyncio
+except ImportError:     # pragma    nocover
+    asyncio = None
+
+from stdnet import odm, getdb
+from stdnet.utils import test, gen_unique_id
+
+from examples.models import SimpleModel
+
+
+@test.skipUnless(asyncio, 'Requires asyncio')
+class TestAsyncioClient(test.TestCase):
+    multipledb = 'redis'
+    models = (SimpleModel,)
+
+    @classmethod
+    def after_setup(cls):
+        cls.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(cls.loop)
+        cls.aio_backend = getdb(cls.connection_string, loop='asyncio',
+                                namespace='aio%s-' % gen_unique_id())
+        cls.aio_mapper = odm.Router(cls.aio_backend)
+        cls.aio_mapper.register(SimpleModel)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.run(cls.aio_backend.flush())
+        cls.aio_backend.disconnect()
+        cls.loop.close()
+        asyncio.set_event_loop(None)
+        return super(TestAsyncioClient, cls).tearDownClass()
+
+    @classmethod
+    def run(cls, result):
+        return cls.loop.run_until_complete(result)
+
+    def test_client(self):
+        client = self.aio_backend.client
+        self.assertTrue(client.is_async)
+        self.assertTrue(self.aio_backend.is_async())
+        self.assertTrue(self.run(client.ping()))
+        key = self.aio_backend.basekey(SimpleModel._meta, 'test')
+        self.assertEqual(self.run(client.set(key, 'foo')), True)
+        self.assertEqual(self.run(client.get(key)), b'foo')
+        self.assertEqual(self.run(client.delete(key)), 1)
+
+    def test_pipeline(self):
+        client = self.aio_backend.client
+        key = self.aio_backend.basekey(SimpleModel._meta, 'list')
+        pipe = client.pipeline()
+        pipe.rpush(key, 'a', 'b')
+        pipe.lrange(key, 0, -1)
+        pipe.delete(key)
+        self.assertEqual(self.run(pipe.execute()), [2, [b'a', b'b'], 1])
+
+    def test_concurrent(self):
+        client = self.aio_backend.client
+        pool = client.connection_pool
+        result = self.run(asyncio.gather(*[client.echo(str(i))
+                                           for i in range(100)]))
+        self.assertEqual(result, [str(i).encode('utf-8')
+                                  for i in range(100)])
+        self.assertTrue(pool.available_connections <= pool.max_connections)
+        self.assertEqual(pool.in_use_connections, 0)
+
+    def test_session(self):
+        models = self.aio_mapper
+        code = gen_unique_id()
+        obj = self.run(models.simplemodel.new(code=code, group='g'))
+        self.assertTrue(obj.id)
+        query = models.simplemodel.filter(code=code)
+        self.assertEqual(self.run(query.count()), 1)
+        qs = self.run(query.all())
+        self.assertEqual(qs, [obj])
+        self.assertEqual(self.run(models.simplemodel.get(code=code)), obj)
+        self.run(query.delete())
+        self.assertEqual(self.run(models.simplemodel.filter(
+            code=code).count()), 0)
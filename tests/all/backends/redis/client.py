@@ -4,7 +4,8 @@ from hashlib import sha1
 
 from stdnet import getdb
 from stdnet.backends import redisb
-from stdnet.utils import test, flatzset
+from stdnet.backends.redisb.client.extensions import pack_command
+from stdnet.utils import test, flatzset, gen_unique_id
 
 def get_version(info):
     if 'redis_version' in info:
@@ -23,6 +24,11 @@ return cjson.encode(js)''')
         return json.loads(result.decode(request.encoding))
 
 
+class echo_script(redisb.RedisScript):
+    abstract = True
+    script = 'return ARGV[1]'
+
+
 class TestCase(test.TestWrite):
     multipledb = 'redis'
     
@@ -59,6 +65,88 @@ class TestExtraClientCommands(TestCase):
         self.assertTrue(script.script)
         sha = sha1(script.script.encode('utf-8')).hexdigest()
         self.assertEqual(script.sha1,sha)
+
+    def new_script(self):
+        # a script not yet loaded in the server
+        name = 'echo_script.%s' % gen_unique_id()
+        return echo_script('%s\n-- %s' % (echo_script.source, name), name)
+
+    def test_lazy_script(self):
+        name = 'test_script.%s' % gen_unique_id()
+        script = test_script(test_script.source + ('-- %s' % name,), name)
+        self.assertFalse(hasattr(script, '_script'))
+        self.assertTrue(script.script.endswith(script.name))
+        self.assertTrue(isinstance(script.source[0], redisb.LuaFile))
+
+    def test_preload_scripts(self):
+        c = self.client
+        script = self.new_script()
+        loaded = yield c.preload_scripts((script,))
+        self.assertEqual(loaded, [script])
+        self.assertTrue(script.name in c.loaded_scripts())
+        loaded = yield c.preload_scripts((script,))
+        self.assertEqual(loaded, [])
+        exists = yield c.script_exists(script.sha1)
+        self.assertEqual(exists, [True])
+
+    def test_prefixed_preload_scripts(self):
+        c = self.backend.client.prefixed(self.namespace + 'p-')
+        self.assertTrue(c.prefix)
+        script = self.new_script()
+        loaded = yield c.preload_scripts((script,))
+        self.assertEqual(loaded, [script])
+        result = yield c.execute_script(script, (), 'foo')
+        self.assertEqual(result, b'foo')
+
+    def test_noscript(self):
+        c = self.client
+        script = self.new_script()
+        # the client believes the script is loaded
+        c.loaded_scripts().add(script.name)
+        result = yield c.execute_script(script, (), 'foo')
+        self.assertEqual(result, b'foo')
+        exists = yield c.script_exists(script.sha1)
+        self.assertEqual(exists, [True])
+
+    def test_noscript_pipeline(self):
+        c = self.backend.client
+        if c.is_async:
+            return
+        script = self.new_script()
+        c.loaded_scripts().add(script.name)
+        pipe = c.pipeline()
+        pipe.execute_script(script, (), 'foo')
+        pipe.execute_script(script, (), 'bla')
+        result = yield pipe.execute()
+        self.assertEqual(result, [b'foo', b'bla'])
+
+    def test_pack_command(self):
+        packed = pack_command(('CONFIG GET', 'maxmemory', 1.5, b'\x00'))
+        self.assertEqual(packed, b'*5\r\n$6\r\nCONFIG\r\n$3\r\nGET\r\n'
+                                 b'$9\r\nmaxmemory\r\n$3\r\n1.5\r\n'
+                                 b'$1\r\n\x00\r\n')
+        c = self.backend.client
+        if c.is_async:
+            return
+        pool = c.connection_pool
+        connection = pool.get_connection('CONFIG')
+        try:
+            connection.send_packed_command(
+                pack_command(('CONFIG GET', 'maxmemory')))
+            response = connection.read_response()
+        finally:
+            pool.release(connection)
+        self.assertEqual(response[0], b'maxmemory')
+
+    def test_setup_model_error(self):
+        backend = getdb(self.backend.connection_string)
+        if backend.client.is_async:
+            return
+
+        def preload_scripts(names=None):
+            raise redisb.redis.ResponseError('NOPERM no permissions')
+        backend.client.preload_scripts = preload_scripts
+        self.assertEqual(backend.setup_model(None), None)
         
     def test_del_pattern(self):
         c = self.client
@@ -78,6 +166,23 @@ class TestExtraClientCommands(TestCase):
         yield self.async.assertEqual(c.get('xxxx'), b'moon')
         N = yield c.delpattern('x*')
         self.assertEqual(N, 2)
+
+    def test_del_pattern_batches(self):
+        c = self.client
+        items = []
+        for i in range(25):
+            items.extend(('batch%s' % i, i))
+        yield self.async.assertTrue(c.execute_command('MSET', *items))
+        yield self.async.assertEqual(c.countpattern('batch*', count=10), 25)
+        keys = yield c.scankeys('batch1*', count=10)
+        self.assertEqual(len(keys), 11)
+        progress = []
+        N = yield c.delpattern('batch*', count=10, progress=progress.append,
+                               throttle=0.001)
+        self.assertEqual(N, 25)
+        self.assertTrue(len(progress) > 1)
+        self.assertEqual(progress[-1], 25)
+        yield self.async.assertEqual(c.countpattern('batch*'), 0)
         
     def testMove2Set(self):
         yield self.multi_async((self.client.sadd('foo', 1, 2, 3, 4, 5),
@@ -0,0 +1,135 @@
+'''Redis Cluster key layout and command routing.'''
+from stdnet import getdb, ImproperlyConfigured
+from stdnet.utils import test
+from stdnet.backends.redisb.client import cluster
+
+from examples.models import Instrument, Position
+
+
+class FakeNode(object):
+
+    def __init__(self, address):
+        self.address = address
+        self.commands = []
+        self.transactions = []
+
+    def execute_command(self, *args, **options):
+        self.commands.append(args)
+        return self.address
+
+    def pipeline(self, transaction=True):
+        self.transactions.append(transaction)
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+
+    def __init__(self, node):
+        self.node = node
+        self.stack = []
+
+    def execute_command(self, *args, **options):
+        self.stack.append(args)
+
+    def execute(self, raise_on_error=True):
+        return [self.node.execute_command(*args) for args in self.stack]
+
+
+class TestKeySlot(test.TestCase):
+    multipledb = False
+
+    def test_crc16(self):
+        self.assertEqual(cluster.crc16(b'123456789'), 0x31C3)
+
+    def test_key_slot(self):
+        self.assertEqual(cluster.key_slot('foo'), 12182)
+        self.assertEqual(cluster.key_slot(b'foo'), 12182)
+        self.assertEqual(cluster.key_slot('{foo}:obj:1'), 12182)
+        self.assertEqual(cluster.key_slot('{user}.following'),
+                         cluster.key_slot('{user}.followers'))
+        # empty tags are not tags
+        self.assertEqual(cluster.key_slot('{}foo'),
+                         cluster.crc16(b'{}foo') % cluster.SLOTS)
+
+    def test_command_key(self):
+        self.assertEqual(cluster.command_key(('GET', 'a')), 'a')
+        self.assertEqual(cluster.command_key(('EVALSHA', 'sha', 2, 'a', 'b',
+                                              'c')), 'a')
+        self.assertEqual(cluster.command_key(('EVALSHA', 'sha', 0, 'c')),
+                         None)
+        self.assertEqual(cluster.command_key(('PING',)), None)
+        self.assertEqual(cluster.command_key(('SCRIPT', 'LOAD', 'x')), None)
+
+    def test_redirection(self):
+        self.assertEqual(cluster.redirection('MOVED 3999 127.0.0.1:6381'),
+                         ('MOVED', 3999, ('127.0.0.1', 6381)))
+        self.assertEqual(cluster.redirection('ASK 3999 127.0.0.1:6381'),
+                         ('ASK', 3999, ('127.0.0.1', 6381)))
+        self.assertEqual(cluster.redirection('ERR wrong type'), None)
+
+
+class TestClusterBackend(test.TestCase):
+    multipledb = False
+
+    def backend(self, mode, namespace='test.'):
+        return getdb('redis://127.0.0.1:7000?cluster=%s&namespace=%s'
+                     % (mode, namespace))
+
+    def test_model_tags(self):
+        backend = self.backend('model')
+        self.assertEqual(backend.cluster, 'model')
+        self.assertTrue(isinstance(backend.client, cluster.RedisCluster))
+        self.assertTrue('cluster=model' in backend.connection_string)
+        meta = Instrument._meta
+        self.assertEqual(backend.basekey(meta, 'obj', 1),
+                         '{test.%s}:obj:1' % meta.modelkey)
+        self.assertEqual(backend.basekey(meta), '{test.%s}' % meta.modelkey)
+        self.assertNotEqual(backend.hash_tag(meta),
+                            backend.hash_tag(Position._meta))
+        self.assertEqual(cluster.key_slot(backend.basekey(meta, 'id')),
+                         cluster.key_slot(backend.tempkey(meta)))
+
+    def test_namespace_tags(self):
+        backend = self.backend('namespace')
+        meta = Instrument._meta
+        self.assertEqual(backend.basekey(meta, 'id'),
+                         '{test.}%s:id' % meta.modelkey)
+        self.assertEqual(backend.hash_tag(meta),
+                         backend.hash_tag(Position._meta))
+
+    def test_bad_configuration(self):
+        self.assertRaises(ImproperlyConfigured, self.backend, 'foo')
+        self.assertRaises(ImproperlyConfigured, getdb,
+                          'redis://127.0.0.1:7000?cluster=model&db=3')
+
+    def client(self):
+        client = cluster.RedisCluster([('127.0.0.1', 7000)])
+        a, b = ('127.0.0.1', 7000), ('127.0.0.1', 7001)
+        client.slots = [a]*8192 + [b]*8192
+        client.nodes = {a: FakeNode(a), b: FakeNode(b)}
+        return client
+
+    def test_routing(self):
+        client = self.client()
+        self.assertEqual(len(client.masters()), 2)
+        # slot 12182
+        self.assertEqual(client.execute_command('GET', 'foo'),
+                         ('127.0.0.1', 7001))
+        self.assertEqual(client.execute_command('GET', '{x}foo'),
+                         client.execute_command('GET', '{x}bar'))
+        client.execute_command('SCRIPT', 'FLUSH')
+        for node in client.nodes.values():
+            self.assertTrue(('SCRIPT', 'FLUSH') in node.commands)
+
+    def test_pipeline(self):
+        client = self.client()
+        pipe = client.pipeline()
+        pipe.execute_command('GET', 'foo')
+        pipe.execute_command('GET', '{foo}:a')
+        pipe.execute_command('GET', 'b')
+        result = pipe.execute()
+        self.assertEqual(result, [('127.0.0.1', 7001), ('127.0.0.1', 7001),
+                                  ('127.0.0.1', 7000)])
+        # one slot for each node, both executed as transactions
+        for node in client.nodes.values():
+            self.assertEqual(node.transactions, [True])
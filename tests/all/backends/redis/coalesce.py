@@ -0,0 +1,103 @@
+'''Coalescing of concurrent reads in the redis backend.'''
+from threading import Thread
+from timeit import default_timer
+
+from stdnet import odm, getdb
+from stdnet.utils import test, gen_unique_id
+
+from examples.models import SimpleModel
+
+
+class TestReadCoalescer(test.TestCase):
+    multipledb = 'redis'
+    models = (SimpleModel,)
+
+    @classmethod
+    def after_setup(cls):
+        cls.cbackend = getdb(cls.connection_string, coalesce=20,
+                             namespace='coalesce%s-' % gen_unique_id())
+        cls.cmapper = odm.Router(cls.cbackend)
+        cls.cmapper.register(SimpleModel)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.cbackend.flush()
+        return super(TestReadCoalescer, cls).tearDownClass()
+
+    def concurrent(self, callable, n=10):
+        results = [None]*n
+
+        def run(i):
+            try:
+                results[i] = callable()
+            except Exception as e:
+                results[i] = e
+
+        threads = [Thread(target=run, args=(i,)) for i in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_coalescer(self):
+        coalescer = self.cbackend.coalescer
+        self.assertTrue(coalescer)
+        self.assertEqual(coalescer.window, 0.02)
+        self.assertTrue('coalesce=20' in self.cbackend.connection_string)
+        self.assertFalse(self.backend.coalescer)
+
+    def test_get_by_id(self):
+        models = self.cmapper
+        obj = models.simplemodel.new(code=gen_unique_id(), group='g')
+        coalescer = self.cbackend.coalescer
+        batches, commands = coalescer.batches, coalescer.commands
+        results = self.concurrent(lambda: models.simplemodel.get(id=obj.id))
+        self.assertEqual(coalescer.commands - commands, 20)
+        self.assertTrue(coalescer.batches - batches < 10)
+        for result in results:
+            self.assertEqual(result, obj)
+            self.assertEqual(result.code, obj.code)
+            self.assertEqual(result.group, 'g')
+        # each caller has its own instance
+        self.assertEqual(len(set((id(r) for r in results))), 10)
+
+    def test_no_wait_without_concurrency(self):
+        models = self.cmapper
+        obj = models.simplemodel.new(code=gen_unique_id(), group='g')
+        coalescer = self.cbackend.coalescer
+        batches = coalescer.batches
+        start = default_timer()
+        for _ in range(5):
+            self.assertEqual(models.simplemodel.get(id=obj.id), obj)
+        # the 20 milliseconds window is not waited for
+        self.assertTrue(default_timer() - start < 5*coalescer.window)
+        self.assertEqual(coalescer.batches - batches, 5)
+
+    def test_get_missing(self):
+        models = self.cmapper
+        results = self.concurrent(lambda: models.simplemodel.get(id=-1), 5)
+        for result in results:
+            self.assertTrue(isinstance(result, SimpleModel.DoesNotExist))
+
+    def test_get_by_field(self):
+        models = self.cmapper
+        code = gen_unique_id()
+        obj = models.simplemodel.new(code=code)
+        results = self.concurrent(lambda: models.simplemodel.get(code=code))
+        for result in results:
+            self.assertEqual(result, obj)
+        results = self.concurrent(lambda: models.simplemodel.get(code='xxx'),
+                                  3)
+        for result in results:
+            self.assertTrue(isinstance(result, SimpleModel.DoesNotExist))
+
+    def test_filtered_query(self):
+        # queries with clauses are not coalesced
+        models = self.cmapper
+        obj = models.simplemodel.new(code=gen_unique_id(), group='h')
+        coalescer = self.cbackend.coalescer
+        commands = coalescer.commands
+        qs = models.simplemodel.filter(group='h')
+        self.assertEqual(qs.get(id=obj.id), obj)
+        self.assertEqual(coalescer.commands, commands)
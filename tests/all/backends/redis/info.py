@@ -22,7 +22,7 @@ class TestInfo(client.TestCase):
         yield self.client.set('planet', 'mars')
         yield self.client.lpush('foo', 1, 2, 3, 4, 5)
         yield self.client.lpush('bla', 4, 5, 6, 7, 8)
-        keys = yield self.client.execute_script('keyinfo', (), '*')
+        keys = yield self.client.keyinfo('*')
         self.assertEqual(len(keys), 3)
         d = dict(((k.key, k) for k in keys))
         self.assertEqual(d['planet'].length, 4)
@@ -36,6 +36,8 @@ class TestInfo(client.TestCase):
                                 client.lpush('bla', 4, 5, 6, 7, 8)))
         keys = yield client.execute_script('keyinfo', ('planet', 'bla'))
         self.assertEqual(len(keys), 2)
+        keys = yield client.keyinfo('*', start=1, num=1)
+        self.assertEqual([k.key for k in keys], ['foo'])
         
     def test_manager(self):
         redisdb = yield self.get_manager()
@@ -0,0 +1,70 @@
+'''Model keys derived from the model id set and indices.'''
+from stdnet.utils import test
+
+from examples.models import Instrument3, Fund
+from examples.data import finance_data
+
+
+class TestModelKeys(test.TestWrite):
+    multipledb = 'redis'
+    data_cls = finance_data
+    models = (Instrument3, Fund)
+
+    def pattern_keys(self, backend):
+        # keys matching the model namespace, excluding temporary keys
+        meta = self.model._meta
+        keys = yield backend.client.scankeys('%s*' % backend.basekey(meta))
+        tmp = backend.basekey(meta, 'tmp')
+        yield set((k for k in backend._decode_keys(keys)
+                   if not k.startswith(tmp)))
+
+    def test_model_keys(self):
+        session = yield self.data.create(self)
+        backend = self.mapper.instrument.backend
+        keys = yield backend.model_keys(self.model._meta)
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertTrue(backend.basekey(self.model._meta, 'id') in keys)
+        pattern_keys = yield self.pattern_keys(backend)
+        self.assertEqual(set(keys), pattern_keys)
+
+    def test_model_keys_progress(self):
+        yield self.data.create(self)
+        backend = self.mapper.instrument.backend
+        steps = []
+        keys = yield backend.model_keys(self.model._meta, count=5,
+                                        progress=steps.append)
+        self.assertTrue(steps)
+        # keys shared by ids in different steps are counted more than once
+        self.assertTrue(steps[-1] >= len(keys))
+
+    def test_flush(self):
+        yield self.data.create(self)
+        backend = self.mapper.instrument.backend
+        n = yield self.mapper.instrument.flush()
+        self.assertTrue(n)
+        pattern_keys = yield self.pattern_keys(backend)
+        self.assertFalse(pattern_keys)
+        yield self.async.assertEqual(self.query().count(), 0)
+
+    def test_flush_temporary_keys(self):
+        yield self.data.create(self)
+        backend = self.mapper.instrument.backend
+        meta = self.model._meta
+        qs = yield self.query().filter(ccy='EUR').exclude(type='future').all()
+        self.assertTrue(qs)
+        tmp = yield backend.client.scankeys(backend.tempkey(meta, '*'))
+        self.assertTrue(tmp)
+        yield self.mapper.instrument.flush()
+        keys = yield backend.client.scankeys('%s*' % backend.basekey(meta))
+        self.assertFalse(keys)
+
+    def test_flush_cleared_bitmaps(self):
+        yield self.data.create(self)
+        backend = self.mapper.instrument.backend
+        yield self.query().delete()
+        # bitmaps with all bits cleared are still owned by the model
+        keys = yield backend.model_keys(self.model._meta)
+        self.assertTrue([k for k in keys if ':bidx:' in k])
+        yield self.mapper.instrument.flush()
+        pattern_keys = yield self.pattern_keys(backend)
+        self.assertFalse(pattern_keys)
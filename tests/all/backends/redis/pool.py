@@ -0,0 +1,109 @@
+'''Shared redis connection pools.'''
+import time
+from threading import Thread, Event
+
+from stdnet import getdb
+from stdnet.utils import test
+from stdnet.backends.redisb.client import redis, ConnectionPool, shared_pool
+
+
+class TestConnectionPool(test.TestCase):
+    multipledb = False
+
+    def pool(self, **kwargs):
+        return ConnectionPool(host='127.0.0.1', port=6379, **kwargs)
+
+    def test_shared(self):
+        a = shared_pool(host='127.0.0.1', port=6379, db=11)
+        b = shared_pool(host='127.0.0.1', port=6379, db='11')
+        c = shared_pool(host='127.0.0.1', port=6379, db=12)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_backends_share_pool(self):
+        b1 = getdb('redis://127.0.0.1:6379?db=13&namespace=a.')
+        b2 = getdb('redis://127.0.0.1:6379?db=13&namespace=b.')
+        self.assertEqual(b1.client.connection_pool, b2.client.connection_pool)
+        b3 = getdb('redis://127.0.0.1:6379?db=14')
+        self.assertNotEqual(b1.client.connection_pool,
+                            b3.client.connection_pool)
+
+    def test_stats(self):
+        pool = self.pool(max_connections=2)
+        c1 = pool.get_connection('GET')
+        stats = pool.stats
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['max_connections'], 2)
+        pool.release(c1)
+        stats = pool.stats
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['available'], 1)
+
+    def test_timeout(self):
+        pool = self.pool(max_connections=1, timeout=0.05)
+        connection = pool.get_connection('GET')
+        self.assertRaises(redis.ConnectionError, pool.get_connection, 'GET')
+        self.assertEqual(pool.stats['timeouts'], 1)
+        pool.release(connection)
+        self.assertEqual(pool.get_connection('GET'), connection)
+
+    def test_blocking(self):
+        pool = self.pool(max_connections=1, timeout=5)
+        connection = pool.get_connection('GET')
+        result = []
+
+        def get():
+            result.append(pool.get_connection('GET'))
+
+        thread = Thread(target=get)
+        thread.start()
+        time.sleep(0.05)
+        pool.release(connection)
+        thread.join()
+        self.assertEqual(result, [connection])
+        self.assertEqual(pool.stats['waits'], 1)
+
+    def test_idle_eviction(self):
+        pool = self.pool(idle_timeout=0.01)
+        connection = pool.get_connection('GET')
+        pool.release(connection)
+        time.sleep(0.02)
+        other = pool.get_connection('GET')
+        self.assertNotEqual(other, connection)
+        self.assertEqual(pool.stats['evicted'], 1)
+        self.assertEqual(pool.stats['created'], 1)
+
+    def test_thread_pinning(self):
+        pool = self.pool()
+        main = pool.get_connection('GET')
+        released, go, result = Event(), Event(), []
+
+        def run():
+            connection = pool.get_connection('GET')
+            pool.release(connection)
+            released.set()
+            go.wait()
+            result.append((connection, pool.get_connection('GET')))
+
+        thread = Thread(target=run)
+        thread.start()
+        released.wait()
+        # released last but the thread gets back its own connection
+        pool.release(main)
+        go.set()
+        thread.join()
+        connection, again = result[0]
+        self.assertEqual(connection, again)
+        self.assertNotEqual(connection, main)
+        self.assertEqual(pool.get_connection('GET'), main)
+
+
+class TestPoolStats(test.TestCase):
+    multipledb = 'redis'
+
+    def test_pool_stats(self):
+        self.assertTrue(self.backend.ping())
+        stats = self.backend.pool_stats()
+        self.assertTrue(stats['created'] >= 1)
+        self.assertEqual(stats['timeouts'], 0)
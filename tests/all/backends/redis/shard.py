@@ -0,0 +1,96 @@
+'''Consistent-hash sharding of models across redis servers.'''
+from stdnet import odm, getdb, QuerySetError
+from stdnet.utils import test, gen_unique_id
+
+from examples.models import Instrument, Fund
+
+
+class TestHashRing(test.TestCase):
+    multipledb = False
+
+    def ring(self, *nodes):
+        from stdnet.backends.redisb.shard import HashRing
+        return HashRing(nodes)
+
+    def test_distribution(self):
+        ring = self.ring('a:6379', 'b:6379', 'c:6379')
+        self.assertEqual(len(ring), 3)
+        counts = {}
+        for i in range(3000):
+            node = ring.get('key%s' % i)
+            counts[node] = counts.get(node, 0) + 1
+        self.assertEqual(len(counts), 3)
+        for n in counts.values():
+            self.assertTrue(n > 500)
+
+    def test_add_node(self):
+        ring = self.ring('a:6379', 'b:6379')
+        keys = ['key%s' % i for i in range(1000)]
+        before = dict(((k, ring.get(k)) for k in keys))
+        ring.add('c:6379')
+        for k in keys:
+            node = ring.get(k)
+            # keys move only to the new node
+            self.assertTrue(node in (before[k], 'c:6379'))
+        ring.remove('c:6379')
+        self.assertEqual(dict(((k, ring.get(k)) for k in keys)), before)
+
+    def test_empty(self):
+        ring = self.ring()
+        self.assertRaises(KeyError, ring.get, 'key')
+
+
+class TestShardedBackend(test.TestCase):
+    multipledb = 'redis'
+    models = (Instrument, Fund)
+
+    @classmethod
+    def after_setup(cls):
+        connection_string = cls.backend.connection_string
+        cls.shard = getdb('redis+shard' + connection_string[5:],
+                          namespace='shard%s-' % gen_unique_id())
+        cls.shard_mapper = odm.Router(cls.shard)
+        cls.shard_mapper.register(Instrument)
+        cls.shard_mapper.register(Fund)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.shard.flush()
+        return super(TestShardedBackend, cls).tearDownClass()
+
+    def test_backend(self):
+        shard = self.shard
+        self.assertEqual(shard.name, 'redis+shard')
+        self.assertEqual(len(shard.nodes), 1)
+        self.assertTrue(shard.ping())
+        self.assertTrue(shard.connection_string.startswith('redis+shard://'))
+
+    def test_commit_and_query(self):
+        models = self.shard_mapper
+        with models.session().begin() as t:
+            for i in range(10):
+                t.add(models.instrument(name='s%s' % i, ccy='EUR',
+                                        type='bond' if i % 2 else 'equity'))
+        ids = [i.id for i in t.saved[Instrument._meta]]
+        self.assertEqual(len(set(ids)), 10)
+        self.assertEqual(models.instrument.query().count(), 10)
+        bonds = models.instrument.filter(type='bond').all()
+        self.assertEqual(len(bonds), 5)
+        node = self.shard.instance_node(Instrument._meta, ids[0])
+        self.assertTrue(node in self.shard.nodes.values())
+        obj = models.instrument.get(id=ids[0])
+        self.assertTrue(obj in models.instrument.query())
+        qs = models.instrument.query().sort_by('-name')[:3]
+        self.assertEqual([o.name for o in qs], ['s9', 's8', 's7'])
+        models.instrument.filter(type='bond').delete()
+        self.assertEqual(models.instrument.query().count(), 5)
+
+    def test_pagination(self):
+        qs = self.shard_mapper.fund.query()
+        self.assertRaises(QuerySetError, qs.after)
+
+    def test_reshard(self):
+        models = self.shard_mapper
+        models.instrument.new(name=gen_unique_id(), ccy='USD', type='x')
+        # one node owns everything
+        self.assertEqual(self.shard.reshard(Instrument._meta), 0)
@@ -1,18 +1,79 @@
+'''End-to-end benchmarks of stdnet. Benchmark classes run only with the
+``--bench`` flag, on a dataset given by ``--size``, and save their results
+with :class:`stdnet.utils.bench.BenchmarkReport`::
+
+    python runtests.py benchmarks --bench --size small \
+        --bench-report bench/current --bench-baseline bench/baseline
+'''
 import os
+import logging
+from timeit import default_timer
+
+from stdnet.utils.bench import BenchmarkReport
 
-from stdnet.utils import test
+LOGGER = logging.getLogger('stdnet.bench')
+# number of repetitions of an operation for each dataset size
+REPEAT = {'tiny': 5,
+          'small': 20,
+          'normal': 50,
+          'big': 100,
+          'huge': 200}
 
-from examples.models import Instrument, Fund, Position, PortfolioView,\
-                             UserDefaultView
-from examples.data import finance_data, INSTS_TYPES, CCYS_TYPES
 
+class BenchmarkMixin(object):
+    '''Mixin of benchmark test cases. Test methods return the generator of
+:meth:`bench` for each operation benchmarked.
 
-class Benchmarks(test.TestWrite):
+.. attribute:: group
+
+    Prefix of the names of benchmarks in this class.
+'''
     __benchmark__ = True
-    data_cls = finance_data
-    models = (Instrument, Fund, Position)
-    
-    def test_create(self):
-        session = yield self.data.create(self)
-        
-        
\ No newline at end of file
+    multipledb = 'redis'
+    group = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.report = BenchmarkReport()
+        return super(BenchmarkMixin, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.save_report()
+        return super(BenchmarkMixin, cls).tearDownClass()
+
+    @classmethod
+    def save_report(cls):
+        '''Save the report and compare it with the baseline, if the
+``--bench-report`` and ``--bench-baseline`` options are given.'''
+        cfg = cls.cfg
+        name = '%s.json' % cls.__name__
+        if cfg.bench_report and cls.report:
+            cls.report.save(os.path.join(cfg.bench_report, name))
+        baseline = os.path.join(cfg.bench_baseline, name)
+        if cfg.bench_baseline and os.path.isfile(baseline):
+            baseline = BenchmarkReport.load(baseline)
+            for r in cls.report.compare(baseline, cfg.bench_tolerance):
+                LOGGER.warning('Regression of %s %s: %.6g -> %.6g (%+.1f%%)',
+                               r.name, r.metric, r.baseline, r.current,
+                               100*r.change)
+
+    @property
+    def repeat(self):
+        return REPEAT[self.data.size_code]
+
+    def bench(self, name, operation, repeat=None, ops=1, setup=None):
+        '''Time *repeat* calls of *operation*, each performing *ops*
+operations, and add the result to the report. *operation* is called with the
+repetition index or, if *setup* is given, with the result of calling
+*setup* with the repetition index, which is not timed.'''
+        samples = []
+        for i in range(repeat or self.repeat):
+            arg = i
+            if setup is not None:
+                arg = yield setup(i)
+            start = default_timer()
+            yield operation(arg)
+            samples.append(default_timer() - start)
+        name = '%s.%s' % (self.group, name)
+        yield self.report.add(name, samples, ops, self.data.size_code)
@@ -0,0 +1,49 @@
+'''Benchmarks of the columnts application.'''
+from stdnet.utils import test
+from stdnet.apps.columnts import ColumnTS
+
+from tests.all.apps.columnts.main import ColumnData
+
+from . import BenchmarkMixin
+
+
+class ColumnTSBenchmark(BenchmarkMixin, test.TestWrite):
+    group = 'columnts'
+    data_cls = ColumnData
+
+    def series(self, i=None):
+        models = self.mapper
+        ts = models.register(ColumnTS())
+        models.session().add(ts)
+        return ts
+
+    def update(self, ts):
+        with ts.session.begin() as t:
+            t.add(ts)
+            ts.update(self.data.data1.values)
+        return t.on_result
+
+    def filled(self):
+        ts = self.series()
+        yield self.update(ts)
+        yield ts
+
+    def test_update(self):
+        return self.bench('update', self.update,
+                          ops=len(self.data.data1.values), setup=self.series)
+
+    def test_irange(self):
+        ts = yield self.filled()
+        yield self.bench('irange', lambda i: ts.irange())
+
+    def test_range(self):
+        ts = yield self.filled()
+        dates = self.data.data1.sorted_values[0]
+        n = len(dates)
+        yield self.bench('range', lambda i: ts.range(dates[n//4],
+                                                     dates[3*n//4]))
+
+    def test_stats(self):
+        ts = yield self.filled()
+        dates = self.data.data1.sorted_values[0]
+        yield self.bench('stats', lambda i: ts.stats(dates[0], dates[-1]))
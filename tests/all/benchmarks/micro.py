@@ -0,0 +1,198 @@
+'''Microbenchmarks of pure python components which run on every operation.
+They do not require a backend server and their inputs are generated with a
+fixed random seed, so that reports of different runs are comparable::
+
+    python runtests.py benchmarks.micro --bench --size normal \
+        --bench-report bench/current
+'''
+import random
+from datetime import datetime
+
+from stdnet.utils import test, encoders, zip
+from stdnet.utils.skiplist import skiplist
+from stdnet.utils.zset import zset
+from stdnet.utils.jsontools import flat_to_nested
+from stdnet.backends.redisb import pairs_to_dict
+
+from examples.models import Instrument, NumericData
+
+from . import BenchmarkMixin
+
+SEED = 1000
+
+
+class MicroData(test.DataGenerator):
+    sizes = {'tiny': 100,
+             'small': 1000,
+             'normal': 10000,
+             'big': 50000,
+             'huge': 200000}
+
+    def generate(self):
+        random.seed(SEED)
+        size = self.size
+        self.scores = self.populate('float', start=-1000, end=1000)
+        self.strings = self.populate('string', min_len=5, max_len=30)
+        self.bytes = [s.encode('utf-8') for s in self.strings]
+        self.dates = self.populate('date')
+        self.pairs = []
+        for key, value in zip(self.bytes, self.bytes):
+            self.pairs.append(key)
+            self.pairs.append(value)
+        self.flat = {}
+        for i, value in enumerate(self.strings):
+            key = 'data__%s__%s' % (i % 10, i)
+            self.flat[key] = value
+        self.instruments = []
+        self.numeric = []
+        for i in range(size):
+            self.instruments.append(Instrument(name=self.strings[i],
+                                               ccy='EUR', type='future'))
+            self.numeric.append(NumericData(
+                pv=self.scores[i], vega=self.scores[-i-1], ok=True,
+                data={'date': self.dates[i], 'values': {'a': i, 'b': -i}}))
+
+
+class MicroBenchmark(BenchmarkMixin, test.TestCase):
+    multipledb = False
+    group = 'micro'
+    data_cls = MicroData
+
+    def seeded(self, factory):
+        '''Setup function which seeds the random generator before calling
+*factory*, so that randomised structures are the same at each run.'''
+        def _(i):
+            random.seed(SEED + i)
+            return factory()
+        return _
+
+    def filled_skiplist(self):
+        sl = skiplist()
+        sl.extend(zip(self.data.scores, self.data.strings))
+        return sl
+
+    def filled_zset(self):
+        zs = zset()
+        zs.update(zip(self.data.scores, self.data.strings))
+        return zs
+
+    # skiplist
+    def test_skiplist_insert(self):
+        data = self.data
+        return self.bench('skiplist_insert',
+                          lambda sl: sl.extend(zip(data.scores, data.strings)),
+                          ops=data.size, setup=self.seeded(skiplist))
+
+    def test_skiplist_rank(self):
+        scores = self.data.scores
+
+        def rank(sl):
+            for score in scores:
+                sl.rank(score)
+        return self.bench('skiplist_rank', rank, ops=len(scores),
+                          setup=self.seeded(self.filled_skiplist))
+
+    def test_skiplist_remove(self):
+        scores = self.data.scores
+
+        def remove(sl):
+            for score in scores:
+                sl.remove(score)
+        return self.bench('skiplist_remove', remove, ops=len(scores),
+                          setup=self.seeded(self.filled_skiplist))
+
+    # zset
+    def test_zset_update(self):
+        data = self.data
+        return self.bench('zset_update',
+                          lambda zs: zs.update(zip(data.scores, data.strings)),
+                          ops=data.size, setup=self.seeded(zset))
+
+    def test_zset_rank(self):
+        strings = self.data.strings
+
+        def rank(zs):
+            for value in strings:
+                zs.rank(value)
+        return self.bench('zset_rank', rank, ops=len(strings),
+                          setup=self.seeded(self.filled_zset))
+
+    # encoders
+    def encoder(self, name, encoder, values):
+        def dumps(i):
+            for value in values:
+                encoder.dumps(value)
+
+        def loads(i):
+            for value in dumped:
+                encoder.loads(value)
+        dumped = [encoder.dumps(value) for value in values]
+        yield self.bench('%s_dumps' % name, dumps, ops=len(values))
+        yield self.bench('%s_loads' % name, loads, ops=len(values))
+
+    def test_encoder_default(self):
+        return self.encoder('default', encoders.Default(), self.data.strings)
+
+    def test_encoder_numeric(self):
+        return self.encoder('numeric', encoders.NumericDefault(),
+                            self.data.scores)
+
+    def test_encoder_double(self):
+        return self.encoder('double', encoders.CompactDouble(),
+                            self.data.scores)
+
+    def test_encoder_json(self):
+        values = [{'dt': dt, 'value': v} for dt, v in
+                  zip(self.data.dates, self.data.scores)]
+        return self.encoder('json', encoders.Json(), values)
+
+    def test_encoder_pickle(self):
+        return self.encoder('pickle', encoders.PythonPickle(),
+                            self.data.strings)
+
+    def test_encoder_datetime(self):
+        values = [datetime(d.year, d.month, d.day) for d in self.data.dates]
+        return self.encoder('datetime', encoders.DateTimeConverter(), values)
+
+    # serialisation helpers
+    def test_flat_to_nested(self):
+        flat = self.data.flat
+        return self.bench('flat_to_nested', lambda i: flat_to_nested(
+            flat, attname='data'), ops=len(flat))
+
+    def test_pairs_to_dict(self):
+        pairs = self.data.pairs
+        return self.bench('pairs_to_dict',
+                          lambda i: pairs_to_dict(pairs, 'utf-8'),
+                          ops=len(pairs)//2)
+
+    # model validation and loading
+    def is_valid(self, name, instances):
+        meta = instances[0]._meta
+
+        def is_valid(i):
+            for instance in instances:
+                meta.is_valid(instance)
+        return self.bench('%s_is_valid' % name, is_valid,
+                          ops=len(instances))
+
+    def load_state(self, name, instances):
+        meta = instances[0]._meta
+        states = []
+        for i, instance in enumerate(instances):
+            meta.is_valid(instance)
+            states.append((i + 1, None, instance.dbdata['cleaned_data']))
+
+        def load_state(i):
+            for state in states:
+                meta.make_object(state)
+        return self.bench('%s_load_state' % name, load_state,
+                          ops=len(states))
+
+    def test_is_valid(self):
+        yield self.is_valid('instrument', self.data.instruments)
+        yield self.is_valid('numeric', self.data.numeric)
+
+    def test_load_state(self):
+        yield self.load_state('instrument', self.data.instruments)
+        yield self.load_state('numeric', self.data.numeric)
@@ -0,0 +1,103 @@
+'''Benchmarks of model commits and queries.'''
+from random import randint
+
+from stdnet.utils import test, zip
+
+from examples.models import Instrument, Fund, Position
+from examples.data import finance_data, INSTS_TYPES, CCYS_TYPES
+
+from . import BenchmarkMixin
+
+
+class CommitBenchmark(BenchmarkMixin, test.TestWrite):
+    group = 'commit'
+    data_cls = finance_data
+    models = (Instrument, Fund, Position)
+
+    def add_instruments(self, prefix):
+        data = self.data
+        with self.session().begin() as t:
+            for name, typ, ccy in zip(data.inst_names, data.inst_types,
+                                      data.inst_ccys):
+                t.add(self.mapper.instrument(name='%s%s' % (prefix, name),
+                                             type=typ, ccy=ccy))
+        return t.on_result
+
+    def instruments(self, i):
+        prefix = 'u%s-' % i
+        yield self.add_instruments(prefix)
+        names = ['%s%s' % (prefix, name) for name in self.data.inst_names]
+        yield self.query().filter(name__in=names).all()
+
+    def test_insert(self):
+        return self.bench('insert', self.add_instruments,
+                          ops=len(self.data.inst_names))
+
+    def test_update(self):
+        def update(instruments):
+            with self.session().begin() as t:
+                for instrument in instruments:
+                    instrument.description = 'updated'
+                    t.add(instrument)
+            return t.on_result
+        return self.bench('update', update, ops=len(self.data.inst_names),
+                          setup=self.instruments)
+
+    def test_delete(self):
+        def delete(instruments):
+            with self.session().begin() as t:
+                for instrument in instruments:
+                    t.delete(instrument)
+            return t.on_result
+        return self.bench('delete', delete, ops=len(self.data.inst_names),
+                          setup=self.instruments)
+
+
+class QueryBenchmark(BenchmarkMixin, test.TestCase):
+    group = 'query'
+    data_cls = finance_data
+    models = (Instrument, Fund, Position)
+
+    @classmethod
+    def after_setup(cls):
+        yield cls.data.makePositions(cls)
+        cls.ids = yield cls.query().get_field('id').all()
+
+    def choice(self, values):
+        return values[randint(0, len(values) - 1)]
+
+    def test_get(self):
+        ids = self.ids
+        return self.bench('get', lambda i: self.query().get(id=ids[i]),
+                          repeat=min(len(ids), 10*self.repeat))
+
+    def test_filter(self):
+        return self.bench('filter', lambda i: self.query().filter(
+            ccy=self.choice(CCYS_TYPES)).all(), repeat=10*self.repeat)
+
+    def test_exclude(self):
+        return self.bench('exclude', lambda i: self.query().exclude(
+            type=self.choice(INSTS_TYPES)).all(), repeat=10*self.repeat)
+
+    def test_intersect(self):
+        return self.bench('intersect', lambda i: self.query().filter(
+            ccy=self.choice(CCYS_TYPES), type=self.choice(INSTS_TYPES)).all(),
+            repeat=10*self.repeat)
+
+    def test_range(self):
+        return self.bench('range', lambda i: self.query(Position).filter(
+            size__gt=randint(-100000, 100000)).count(), repeat=self.repeat)
+
+    def test_sort_slice(self):
+        return self.bench('sort_slice', lambda i: self.query(Position).sort_by(
+            '-size')[:20], repeat=self.repeat)
+
+    def test_load_only(self):
+        return self.bench('load_only', lambda i: self.query(Position).filter(
+            fund__ccy=self.choice(CCYS_TYPES)).load_only('size', 'dt').all(),
+            repeat=self.repeat)
+
+    def test_load_related(self):
+        return self.bench('load_related', lambda i: self.query(Position)
+                          .load_related('instrument', 'name').load_related(
+                              'fund', 'name')[:100], repeat=self.repeat)
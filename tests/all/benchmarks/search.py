@@ -0,0 +1,38 @@
+'''Benchmarks of the search engine application.'''
+from random import randint
+
+from stdnet.utils import test
+
+from examples.wordsearch.models import Item
+
+from tests.all.apps.searchengine.meta import SearchMixin
+
+from . import BenchmarkMixin
+
+
+class SearchBenchmark(BenchmarkMixin, SearchMixin, test.TestCase):
+    group = 'search'
+
+    @classmethod
+    def after_setup(cls):
+        yield super(SearchBenchmark, cls).after_setup()
+        yield cls.data.make_items(cls, content=True)
+        cls.wordlist = sorted(cls.words)
+
+    def text(self, words=1):
+        wordlist = self.wordlist
+        return ' '.join((wordlist[randint(0, len(wordlist) - 1)]
+                         for _ in range(words)))
+
+    def test_index(self):
+        return self.bench('index',
+                          lambda i: self.data.make_items(self, content=True),
+                          ops=len(self.data.names))
+
+    def test_search(self):
+        return self.bench('search', lambda i: self.query(Item).search(
+            self.text()).all(), repeat=10*self.repeat)
+
+    def test_search_words(self):
+        return self.bench('search_words', lambda i: self.query(Item).search(
+            self.text(3)).all(), repeat=10*self.repeat)
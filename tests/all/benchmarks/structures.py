@@ -0,0 +1,71 @@
+'''Benchmarks of data structures.'''
+from stdnet import odm
+from stdnet.utils import test
+
+from examples.data import key_data
+
+from . import BenchmarkMixin
+
+
+class StructureBenchmark(BenchmarkMixin, test.TestWrite):
+    group = 'structure'
+    data_cls = key_data
+
+    def structure(self, cls, i=None):
+        models = self.mapper
+        s = models.register(cls())
+        models.session().add(s)
+        return s
+
+    def commit(self, s, update):
+        with s.session.begin() as t:
+            t.add(s)
+            update(s)
+        return t.on_result
+
+    def filled(self, cls, update):
+        s = self.structure(cls)
+        yield self.commit(s, update)
+        yield s
+
+    def test_set_add(self):
+        keys = self.data.keys
+        return self.bench('set_add', lambda s: self.commit(
+            s, lambda s: s.update(keys)), ops=len(keys),
+            setup=lambda i: self.structure(odm.Set))
+
+    def test_zset_add(self):
+        scored = list(enumerate(self.data.keys))
+        return self.bench('zset_add', lambda s: self.commit(
+            s, lambda s: s.update(scored)), ops=len(scored),
+            setup=lambda i: self.structure(odm.Zset))
+
+    def test_zset_range(self):
+        scored = list(enumerate(self.data.keys))
+        zset = yield self.filled(odm.Zset, lambda s: s.update(scored))
+        n = len(scored)
+        yield self.bench('zset_range', lambda i: zset.range(n//4, n//2),
+                         repeat=10*self.repeat)
+
+    def test_hash_update(self):
+        mapping = dict(self.data.mapping())
+        return self.bench('hash_update', lambda s: self.commit(
+            s, lambda s: s.update(mapping)), ops=len(mapping),
+            setup=lambda i: self.structure(odm.HashTable))
+
+    def test_hash_get(self):
+        keys = self.data.keys
+        mapping = dict(self.data.mapping())
+        table = yield self.filled(odm.HashTable, lambda s: s.update(mapping))
+        yield self.bench('hash_get', lambda i: table.get(keys[i % len(keys)]),
+                         repeat=10*self.repeat)
+
+    def test_list_push(self):
+        values = self.data.values
+
+        def push(s):
+            for value in values:
+                s.push_back(value)
+        return self.bench('list_push', lambda s: self.commit(s, push),
+                          ops=len(values),
+                          setup=lambda i: self.structure(odm.List))
@@ -0,0 +1,90 @@
+'''Compression of large field values.'''
+import zlib
+
+from stdnet import odm, FieldError
+from stdnet.utils import test
+from stdnet.utils.encoders import compress, decompress, COMPRESSED_MARKER
+
+from examples.models import CompressedData, Statistics, SimpleModel
+
+
+class TestCompress(test.TestCase):
+    model = CompressedData
+    models = (CompressedData, SimpleModel)
+
+    def test_helpers(self):
+        value = b'x'*200
+        data = compress(value)
+        self.assertTrue(data.startswith(COMPRESSED_MARKER))
+        self.assertTrue(len(data) < len(value))
+        self.assertEqual(decompress(data), value)
+        self.assertEqual(compress(b'x'*20), b'x'*20)
+        self.assertEqual(compress(b'abcdefghij', threshold=5), b'abcdefghij')
+        self.assertEqual(decompress(b'abc'), b'abc')
+        self.assertEqual(decompress(b'\x00abc'), b'\x00abc')
+        self.assertEqual(decompress('abc'), 'abc')
+
+    def test_meta(self):
+        dfields = self.model._meta.dfields
+        self.assertEqual(dfields['text'].compress, 6)
+        self.assertEqual(dfields['data'].compress, 9)
+        self.assertEqual(dfields['data'].compress_threshold, 32)
+        self.assertEqual(Statistics._meta.dfields['data'].compress, None)
+        self.assertRaises(FieldError, odm.CharField, compress=10)
+        self.assertRaises(FieldError, odm.JSONField, compress=True,
+                          as_string=False)
+
+    def test_cleaned_data(self):
+        text = 'hello world '*50
+        m = self.model(name='a', text=text, data={'a': list(range(100))},
+                       blob='small')
+        self.assertTrue(m.is_valid())
+        data = m._dbdata['cleaned_data']
+        self.assertTrue(data['text'].startswith(COMPRESSED_MARKER))
+        self.assertEqual(zlib.decompress(data['text'][1:]).decode('utf-8'),
+                         text)
+        self.assertTrue(data['data'].startswith(COMPRESSED_MARKER))
+        self.assertFalse(data['blob'].startswith(COMPRESSED_MARKER))
+        self.assertEqual(m.text, text)
+
+    def test_save_and_load(self):
+        models = self.mapper
+        text = 'hello world '*50
+        data = {'a': list(range(100)), 'b': 'x'}
+        blob = {'key': ['value']*100}
+        m = yield models.compresseddata.new(name='a', text=text, data=data,
+                                            blob=blob)
+        m = yield models.compresseddata.get(id=m.id)
+        self.assertEqual(m.text, text)
+        self.assertEqual(m.data, data)
+        self.assertEqual(m.blob, blob)
+        m = yield models.compresseddata.new(name='b', text='short',
+                                            data={'a': 1})
+        m = yield models.compresseddata.get(id=m.id)
+        self.assertEqual(m.text, 'short')
+        self.assertEqual(m.data, {'a': 1})
+
+    def test_uncompressed_values(self):
+        # values stored without compression are loaded
+        field = self.model._meta.dfields['data']
+        self.assertEqual(field.to_python(b'{"a": 1}'), {'a': 1})
+        backend = self.mapper.compresseddata.backend
+        self.assertEqual(field.to_python(b'{"a": 1}', backend), {'a': 1})
+        value = compress(b'{"a": [1, 1, 1, 1, 1, 1, 1, 1, 1, 1]}', 6, 10)
+        self.assertEqual(field.to_python(value, backend), {'a': [1]*10})
+
+    def test_no_compress_keeps_bytes(self):
+        # fields without compression never decompress values
+        models = self.mapper
+        value = COMPRESSED_MARKER + zlib.compress(b'hello world')
+        m = models.simplemodel(code='a', somebytes=value)
+        self.assertEqual(m.somebytes, value)
+        yield models.add(m)
+        self.assertEqual(m.somebytes, value)
+        m = yield models.simplemodel.get(id=m.id)
+        self.assertEqual(m.somebytes, value)
+        # values assigned to compressed fields are not decompressed either
+        field = self.model._meta.dfields['blob']
+        self.assertEqual(field.decompressed(value, None), value)
+        backend = models.compresseddata.backend
+        self.assertEqual(field.decompressed(value, backend), b'hello world')
@@ -0,0 +1,65 @@
+'''Lazy loading of heavy fields.'''
+from datetime import date
+
+from stdnet import odm
+from stdnet.odm.fields import LazyAttribute
+from stdnet.utils import test
+
+from examples.models import (LazyEnvironment, LazyStatistics, Environment,
+                             Statistics)
+
+
+class TestLazyFields(test.TestCase):
+    models = (LazyEnvironment, LazyStatistics)
+
+    def test_meta(self):
+        self.assertTrue(LazyEnvironment._meta.dfields['data'].lazy)
+        self.assertFalse(Environment._meta.dfields['data'].lazy)
+        self.assertFalse(Statistics._meta.dfields['data'].lazy)
+        dfields = LazyStatistics._meta.dfields
+        self.assertTrue(dfields['data'].lazy)
+        self.assertTrue(dfields['info'].lazy)
+        self.assertFalse(dfields['extra'].lazy)
+        self.assertFalse(dfields['name'].lazy)
+        self.assertTrue(isinstance(LazyStatistics.data, LazyAttribute))
+        self.assertRaises(TypeError, odm.SymbolField, lazy=True)
+
+    def test_pickle(self):
+        models = self.mapper
+        e = yield models.lazyenvironment.new(data=['ciao', {'a': 1}])
+        e = yield models.lazyenvironment.get(id=e.id)
+        self.assertFalse('data' in e.__dict__)
+        self.assertTrue('data' in e.dbdata['lazy'])
+        self.assertEqual(e.data, ['ciao', {'a': 1}])
+        self.assertTrue('data' in e.__dict__)
+        self.assertFalse(e.dbdata['lazy'])
+        self.assertTrue(e.data is e.data)
+
+    def test_json(self):
+        models = self.mapper
+        data = {'pv': {'': 3.2, 'mean': 1.5}, 'dt': date(2013, 1, 1)}
+        s = yield models.lazystatistics.new(name='a', data=data,
+                                            info={'x': [1, 2]},
+                                            extra=(1, 2))
+        s = yield models.lazystatistics.get(id=s.id)
+        self.assertEqual(s.name, 'a')
+        self.assertEqual(s.extra, (1, 2))
+        self.assertEqual(sorted(s.dbdata['lazy']), ['data', 'info'])
+        self.assertEqual(s.get_attr_value('data__pv__mean'), 1.5)
+        self.assertEqual(s.data, data)
+        self.assertEqual(s.info, {'x': [1, 2]})
+        s.data['pv']['mean'] = 2.5
+        yield s.save()
+        s = yield models.lazystatistics.get(id=s.id)
+        self.assertEqual(s.data['pv']['mean'], 2.5)
+        self.assertEqual(s.info, {'x': [1, 2]})
+
+    def test_set_before_access(self):
+        models = self.mapper
+        s = yield models.lazystatistics.new(name='b', info={'x': 1})
+        s = yield models.lazystatistics.get(id=s.id)
+        s.info = {'y': 2}
+        self.assertEqual(s.info, {'y': 2})
+        yield s.save()
+        s = yield models.lazystatistics.get(id=s.id)
+        self.assertEqual(s.info, {'y': 2})
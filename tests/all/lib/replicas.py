@@ -0,0 +1,156 @@
+'''Load balancing of read replicas.'''
+from threading import Event
+
+from stdnet import (odm, BackendDataServer, ReplicaSet, ImproperlyConfigured,
+                    CommitException)
+from stdnet.utils import test
+
+from examples.models import SimpleModel
+
+
+class DummyReplica(BackendDataServer):
+    default_port = 9090
+    offset = 0
+    alive = True
+
+    def setup_connection(self, address):
+        pass
+
+    def ping(self):
+        if not self.alive:
+            raise IOError('connection refused')
+        return True
+
+    def replication_offset(self):
+        return self.offset
+
+
+class TestReplicaSet(test.TestCase):
+    multipledb = False
+
+    def replicas(self, n=3, **kwargs):
+        master = DummyReplica(address=('master', 9090))
+        replicas = [DummyReplica(address=('replica%s' % i, 9090))
+                    for i in range(n)]
+        return master, ReplicaSet(replicas, check_interval=60, **kwargs)
+
+    def test_round_robin(self):
+        master, replicas = self.replicas()
+        self.assertEqual(len(replicas), 3)
+        chosen = set((replicas.get(master) for _ in range(6)))
+        self.assertEqual(chosen, set(replicas))
+
+    def test_latency(self):
+        master, replicas = self.replicas(strategy='latency')
+        replica = replicas.get(master)
+        self.assertTrue(replica in replicas)
+        status = replicas.status[replica]
+        self.assertTrue(status.healthy)
+        for s in replicas.status.values():
+            self.assertTrue(status.latency <= s.latency)
+
+    def test_failback(self):
+        master, replicas = self.replicas(2)
+        down = replicas.replicas[0]
+        down.alive = False
+        replicas.check(master)
+        for _ in range(4):
+            self.assertEqual(replicas.get(master), replicas.replicas[1])
+        self.assertFalse(replicas.status[down].healthy)
+        replicas.replicas[1].alive = False
+        replicas.check(master)
+        self.assertEqual(replicas.get(master), master)
+        down.alive = True
+        replicas.check(master)
+        self.assertEqual(replicas.get(master), down)
+
+    def test_lag(self):
+        master, replicas = self.replicas(2, max_lag=100)
+        master.offset = 1000
+        replicas.replicas[0].offset = 950
+        replicas.replicas[1].offset = 500
+        self.assertEqual(replicas.available(master), replicas.replicas[:1])
+        self.assertEqual(replicas.status[replicas.replicas[1]].lag, 500)
+        replicas.replicas[1].offset = 1000
+        replicas.check(master)
+        self.assertEqual(replicas.available(master), replicas.replicas)
+
+    def test_check_interval(self):
+        master, replicas = self.replicas(1)
+        replica = replicas.get(master)
+        replica.alive = False
+        # the status is not checked again before the interval
+        self.assertEqual(replicas.get(master), replica)
+        replicas.check(master)
+        self.assertEqual(replicas.get(master), master)
+
+    def test_background_refresh(self):
+        master, replicas = self.replicas(1)
+        replica = replicas.get(master)
+        replicas.check_interval = 0
+        released = Event()
+        ping = replica.ping
+        def slow_ping():
+            released.wait()
+            replica.alive = False
+            return ping()
+        replica.ping = slow_ping
+        # reads do not wait for the refresh running in the background
+        self.assertEqual(replicas.get(master), replica)
+        refresh = replicas._refreshing
+        self.assertTrue(refresh)
+        self.assertEqual(replicas.get(master), replica)
+        self.assertEqual(replicas.refresh(master), None)
+        released.set()
+        refresh.join()
+        self.assertFalse(replicas.status[replica].healthy)
+        replicas.check_interval = 60
+        self.assertEqual(replicas.get(master), master)
+
+    def test_bad_strategy(self):
+        self.assertRaises(ImproperlyConfigured, ReplicaSet, [], 'random')
+
+
+class TestReadReplicas(test.TestWrite):
+    multipledb = 'redis'
+
+    def router(self, read_backend):
+        models = odm.Router(self.backend)
+        models.register(SimpleModel, read_backend=read_backend)
+        return models
+
+    def test_register_list(self):
+        models = self.router([self.backend.connection_string])
+        manager = models.simplemodel
+        self.assertTrue(isinstance(manager.replicas, ReplicaSet))
+        self.assertEqual(manager.read_backend.connection_string,
+                         self.backend.connection_string)
+
+    def test_replication_offset(self):
+        offset = self.backend.replication_offset()
+        self.assertTrue(isinstance(offset, int))
+
+    def test_read_your_writes(self):
+        replicas = ReplicaSet([self.backend.connection_string])
+        models = self.router(replicas)
+        session = models.session(read_your_writes=True)
+        sm = session.model(SimpleModel)
+        self.assertFalse(session.pinned)
+        self.assertTrue(sm.read_backend in replicas)
+        with session.begin() as t:
+            t.add(models.simplemodel(code='a'))
+        yield t.on_result
+        self.assertTrue(session.pinned)
+        self.assertEqual(sm.read_backend, models.simplemodel.backend)
+        qs = session.query(SimpleModel).filter(code='a')
+        self.assertEqual(qs.backend, models.simplemodel.backend)
+        self.assertEqual(qs.count(), 1)
+
+    def test_failed_commit_not_pinned(self):
+        replicas = ReplicaSet([self.backend.connection_string])
+        models = self.router(replicas)
+        yield models.simplemodel.new(code='b')
+        session = models.session(read_your_writes=True)
+        yield self.async.assertRaises(CommitException, session.add,
+                                      models.simplemodel(code='b'))
+        self.assertFalse(session.pinned)
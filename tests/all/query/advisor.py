@@ -0,0 +1,110 @@
+'''Index advisor.'''
+from stdnet import odm
+from stdnet.odm import IndexAdvisor, parse_fingerprint
+from stdnet.utils import test
+
+from examples.models import Instrument, Instrument5
+
+
+class TestFingerprintParser(test.TestCase):
+    multipledb = False
+
+    def test_parse(self):
+        model, tree, options = parse_fingerprint(
+            'examples.instrument intersect(set-ccy(value), set-type(value, '
+            'gt)) order=-name fields=ccy,type where=this.ccy == ?')
+        self.assertEqual(model, 'examples.instrument')
+        self.assertEqual(tree, ('intersect',
+                                [('set-ccy', [('value', None)]),
+                                 ('set-type', [('value', None),
+                                               ('gt', None)])]))
+        self.assertEqual(options, {'order': '-name', 'fields': 'ccy,type',
+                                   'where': 'this.ccy == ?'})
+
+    def test_parse_compound(self):
+        model, tree, options = parse_fingerprint('m set-ccy,type(compound)')
+        self.assertEqual(tree, ('set-ccy,type', [('compound', None)]))
+        self.assertEqual(options, {})
+
+
+class TestIndexAdvisor(test.TestWrite):
+    multipledb = 'redis'
+
+    def setUp(self):
+        self.models = odm.Router(self.backend)
+        self.models.register(Instrument)
+        self.models.register(Instrument5)
+        self.advisor = IndexAdvisor(self.models, min_queries=2)
+
+    def recommendations(self, **kwargs):
+        return dict((((r.action, r.kind, r.fields), r) for r in
+                     self.advisor.report(**kwargs)))
+
+    def test_workload(self):
+        qs = self.models.instrument.filter(ccy='EUR', type='future')
+        for _ in range(3):
+            self.advisor.record(qs)
+        workload = self.advisor.workload[Instrument._meta.modelkey]
+        self.assertEqual(workload.queries, 3)
+        self.assertEqual(workload.equality, {'ccy': 3, 'type': 3})
+        self.assertEqual(workload.combined, {('ccy', 'type'): 3})
+
+    def test_additions(self):
+        qs = self.models.instrument.filter(ccy='EUR', type='future')
+        qs = qs.sort_by('-description').where("this.description == 'a'")
+        self.advisor.record(qs, count=3)
+        r = self.recommendations(sizes=False)
+        self.assertEqual(r[('add', 'compound', ('ccy', 'type'))].queries, 3)
+        self.assertEqual(r[('add', 'ordering', ('description',))].queries, 3)
+        index = r[('add', 'index', ('description',))]
+        self.assertEqual(index.write_cost, 1)
+        self.assertEqual(len(r), 3)
+
+    def test_removals(self):
+        for ccy in ('EUR', 'USD'):
+            self.advisor.record(self.models.instrument.filter(ccy=ccy))
+            self.advisor.record(self.models[Instrument5].filter(ccy=ccy))
+        r = self.recommendations(sizes=False)
+        removal = r[('remove', 'index', ('type',))]
+        self.assertEqual(removal.write_cost, -1)
+        self.assertTrue(('remove', 'compound', ('ccy', 'type')) in r)
+        self.assertTrue(('remove', 'compound', ('ccy', 'description')) in r)
+        self.assertFalse(('remove', 'index', ('ccy',)) in r)
+        # compound index used
+        qs = self.models[Instrument5].filter(ccy='EUR', type='future')
+        self.advisor.record(qs)
+        r = self.recommendations(sizes=False)
+        self.assertFalse(('remove', 'compound', ('ccy', 'type')) in r)
+
+    def test_range_lookups_keep_index(self):
+        for _ in range(2):
+            self.advisor.record(self.models.instrument.filter(ccy='EUR'))
+            self.advisor.record(
+                self.models.instrument.filter(type__startswith='fut'))
+        workload = self.advisor.workload[Instrument._meta.modelkey]
+        self.assertEqual(workload.ranges, {'type': 2})
+        r = self.recommendations(sizes=False)
+        self.assertFalse(('remove', 'index', ('type',)) in r)
+        self.assertFalse(('remove', 'index', ('ccy',)) in r)
+
+    def test_sizes(self):
+        models = self.models
+        with models.session().begin() as t:
+            for i in range(20):
+                t.add(models.instrument(name='i%s' % i,
+                                        ccy=('EUR', 'USD')[i % 2],
+                                        type='future'))
+        yield t.on_result
+        sizes = self.backend.index_sizes(Instrument._meta)
+        self.assertEqual(sizes['id'].members, 20)
+        self.assertEqual(sizes['ccy'].keys, 2)
+        self.assertEqual(sizes['ccy'].members, 20)
+        self.assertEqual(sizes['type'].keys, 1)
+        self.assertEqual(sizes['name'].members, 20)
+        self.advisor.record(models.instrument.filter(ccy='EUR'), count=2)
+        r = self.recommendations()
+        removal = r[('remove', 'index', ('type',))]
+        self.assertEqual(removal.memory, -sizes['type'].memory)
+        convert = r[('convert', 'bitmap', ('ccy',))]
+        self.assertTrue(convert.memory < 0)
+        self.assertEqual(convert.queries, 2)
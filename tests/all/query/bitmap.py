@@ -0,0 +1,109 @@
+'''Bitmap indexes'''
+from stdnet import odm, FieldError
+from stdnet.utils import test
+
+from examples.models import Instrument3, Instrument4, Fund, Position
+from examples.data import finance_data
+
+from . import instruments
+
+
+class TestBitmapFilter(instruments.TestFilter):
+    multipledb = 'redis'
+    models = (Instrument3, Fund, Position)
+
+    def test_meta(self):
+        meta = self.model._meta
+        self.assertTrue(meta.dfields['ccy'].bitmap)
+        self.assertTrue(meta.dfields['ccy'].index)
+        self.assertFalse(meta.dfields['name'].bitmap)
+        self.assertEqual(sorted(meta.as_dict()['bitmaps']), ['ccy', 'type'])
+        self.assertEqual(meta.bitmaps, frozenset(('ccy', 'type')))
+        self.assertEqual(Fund._meta.bitmaps, frozenset())
+
+    def test_bitmap_keys(self):
+        keys = yield self.mapper.instrument.backend.model_keys(
+            self.model._meta)
+        bkeys = [k for k in keys if ':bidx:' in k]
+        self.assertTrue(bkeys)
+        self.assertFalse([k for k in keys if ':idx:ccy:' in k])
+        self.assertFalse([k for k in keys if ':idx:type:' in k])
+
+    def test_mixed_filter(self):
+        session = self.session()
+        query = session.query(self.model)
+        all = yield query.all()
+        obj = all[0]
+        qs = yield query.filter(ccy=obj.ccy, type=obj.type,
+                                name=obj.name).all()
+        self.assertEqual(qs, [obj])
+        qs = yield query.filter(ccy=obj.ccy, name=obj.name).exclude(
+            type=obj.type).all()
+        self.assertEqual(qs, [])
+
+    def test_exclude_only(self):
+        session = self.session()
+        query = session.query(self.model)
+        all = yield query.all()
+        qs = yield query.exclude(ccy='EUR', type='future').all()
+        self.assertEqual(set(qs), set((o for o in all if o.ccy != 'EUR'
+                                       and o.type != 'future')))
+
+
+class TestBitmapFilterOrdered(instruments.TestFilter):
+    multipledb = 'redis'
+    models = (Instrument4, Fund, Position)
+
+
+class TestBitmapWrite(test.TestWrite):
+    multipledb = 'redis'
+    data_cls = finance_data
+    models = (Instrument3, Fund)
+
+    def test_delete_clears_bits(self):
+        session = yield self.data.create(self)
+        query = session.query(self.model)
+        c = yield query.filter(ccy='EUR').count()
+        self.assertTrue(c)
+        yield query.filter(ccy='EUR').delete()
+        yield self.async.assertEqual(query.filter(ccy='EUR').count(), 0)
+        c2 = yield query.filter(ccy__in=('EUR', 'USD')).count()
+        c3 = yield query.filter(ccy='USD').count()
+        self.assertEqual(c2, c3)
+
+    def test_update_moves_bit(self):
+        session = yield self.data.create(self)
+        query = session.query(self.model)
+        obj = yield query.filter(ccy='EUR').all()
+        obj = obj[0]
+        obj.ccy = 'CHF'
+        yield session.add(obj)
+        qs = yield query.filter(ccy='EUR').all()
+        self.assertFalse(obj in qs)
+        qs = yield query.filter(ccy='CHF').all()
+        self.assertTrue(obj in qs)
+
+
+class TestBitmapField(test.TestCase):
+    multipledb = False
+
+    def test_unique(self):
+        self.assertRaises(FieldError, odm.SymbolField, unique=True,
+                          bitmap=True)
+
+    def test_auto_id_required(self):
+
+        def make_model():
+            class BitmapModel(odm.StdModel):
+                id = odm.SymbolField(primary_key=True)
+                ccy = odm.SymbolField(bitmap=True)
+
+                class Meta:
+                    register = False
+
+        self.assertRaises(FieldError, make_model)
+
+    def test_as_cache(self):
+        field = odm.SymbolField(bitmap=True, as_cache=True)
+        self.assertFalse(field.bitmap)
+        self.assertFalse(field.index)
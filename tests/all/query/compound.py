@@ -0,0 +1,119 @@
+'''Compound indexes'''
+from stdnet import odm, QuerySetError, ImproperlyConfigured
+from stdnet.utils import test
+
+from examples.models import Instrument5, Fund, Position
+from examples.data import finance_data
+
+from . import instruments
+
+
+class TestCompoundFilter(instruments.TestFilter):
+    multipledb = 'redis'
+    models = (Instrument5, Fund, Position)
+
+    def test_meta(self):
+        meta = self.model._meta
+        self.assertEqual(len(meta.compound_indices), 2)
+        self.assertEqual(meta.as_dict()['compound'],
+                         {'ccy,type': ['ccy', 'type'],
+                          'ccy,description': ['ccy', 'description']})
+
+    def test_construct(self):
+        qs = self.query().filter(ccy=('EUR', 'USD'), type='future')
+        q = qs.construct()
+        self.assertEqual(q.keyword, 'set')
+        self.assertEqual(q.name, 'ccy,type')
+        self.assertEqual(len(q), 2)
+        # exclude does not use compound indices
+        q = self.query().exclude(ccy='EUR', type='future').construct()
+        self.assertEqual(q.keyword, 'diff')
+
+    def test_range_not_compound(self):
+        q = self.query().filter(ccy='EUR', type__startswith='f').construct()
+        self.assertEqual(q.keyword, 'intersect')
+        self.assertEqual(set((c.name for c in q)), set(('ccy', 'type')))
+
+    def test_unindexed_component(self):
+        query = self.query()
+        all = yield query.all()
+        obj = all[0]
+        qs = yield query.filter(ccy=obj.ccy,
+                                description=obj.description).all()
+        self.assertTrue(obj in qs)
+        for o in qs:
+            self.assertEqual(o.ccy, obj.ccy)
+            self.assertEqual(o.description, obj.description)
+        self.assertRaises(QuerySetError, query.filter(
+            description=obj.description).count)
+
+    def test_overlapping(self):
+        query = self.query()
+        all = yield query.all()
+        obj = all[0]
+        qs = yield query.filter(ccy=obj.ccy, type=obj.type,
+                                description=obj.description).all()
+        self.assertTrue(obj in qs)
+        for o in qs:
+            self.assertEqual((o.ccy, o.type), (obj.ccy, obj.type))
+
+
+class TestCompoundWrite(test.TestWrite):
+    multipledb = 'redis'
+    data_cls = finance_data
+    models = (Instrument5, Fund)
+
+    def test_update(self):
+        session = yield self.data.create(self)
+        query = session.query(self.model)
+        all = yield query.filter(ccy='EUR').all()
+        obj = all[0]
+        obj.ccy = 'CHF'
+        obj.type = 'bond'
+        yield session.add(obj)
+        qs = yield query.filter(ccy='EUR', type=obj.type).all()
+        self.assertFalse(obj in qs)
+        qs = yield query.filter(ccy='CHF', type='bond').all()
+        self.assertTrue(obj in qs)
+        for o in qs:
+            self.assertEqual((o.ccy, o.type), ('CHF', 'bond'))
+
+    def test_delete(self):
+        session = yield self.data.create(self)
+        query = session.query(self.model)
+        all = yield query.all()
+        obj = all[0]
+        yield session.delete(obj)
+        yield self.async.assertEqual(query.filter(ccy=obj.ccy, type=obj.type,
+                                                  id=obj.id).count(), 0)
+        keys = yield self.mapper.instrument.backend.model_keys(
+            self.model._meta)
+        self.assertTrue([k for k in keys if ':cidx:ccy,type:' in k])
+
+
+class TestCompoundMeta(test.TestCase):
+    multipledb = False
+
+    def test_bad_field(self):
+
+        def make_model():
+            class CompoundModel(odm.StdModel):
+                a = odm.SymbolField()
+
+                class Meta:
+                    register = False
+                    indexes = [('a', 'b')]
+
+        self.assertRaises(ImproperlyConfigured, make_model)
+
+    def test_single_field(self):
+
+        def make_model():
+            class CompoundModel(odm.StdModel):
+                a = odm.SymbolField()
+
+                class Meta:
+                    register = False
+                    indexes = [('a',)]
+
+        self.assertRaises(ImproperlyConfigured, make_model)
@@ -0,0 +1,131 @@
+'''Boolean expression queries with Predicate'''
+from stdnet import QuerySetError
+from stdnet.odm import Predicate as P
+
+from examples.models import (Instrument2, Instrument3, Instrument5, Fund,
+                             Position)
+from examples.data import FinanceTest
+
+
+class TestExpression(FinanceTest):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.create(cls)
+
+    def check(self, query, match):
+        all = yield self.query().all()
+        qs = yield query.all()
+        self.assertTrue(qs)
+        self.assertEqual(set(qs), set((o for o in all if match(o))))
+        yield qs
+
+    def test_repr(self):
+        p = P(ccy='EUR') | ~P(type='future')
+        self.assertEqual(str(p), "(Predicate({'ccy': 'EUR'}) or "
+                                 "~Predicate({'type': 'future'}))")
+        self.assertTrue('Predicate' in str(self.query().filter(p)))
+
+    def test_bad_predicates(self):
+        self.assertRaises(TypeError, lambda: P(ccy='EUR') | 'foo')
+        self.assertRaises(QuerySetError, self.query().filter, 'foo')
+
+    def test_construct(self):
+        q = self.query().filter(P(ccy='EUR') | P(type='future')).construct()
+        self.assertEqual(q.keyword, 'expression')
+        self.assertEqual(q.underlying[0].keyword, 'union')
+
+    def test_or(self):
+        qs = self.query().filter(P(ccy='EUR') | P(type='future'))
+        return self.check(qs, lambda o: o.ccy == 'EUR' or o.type == 'future')
+
+    def test_and_not(self):
+        qs = self.query().filter(P(ccy='EUR') | (P(type='future') &
+                                                 ~P(ccy='USD')))
+        return self.check(qs, lambda o: o.ccy == 'EUR' or
+                          (o.type == 'future' and o.ccy != 'USD'))
+
+    def test_not(self):
+        qs = self.query().filter(~P(ccy='EUR'))
+        return self.check(qs, lambda o: o.ccy != 'EUR')
+
+    def test_not_or(self):
+        qs = self.query().filter(~(P(ccy='EUR') | P(ccy='USD')))
+        return self.check(qs, lambda o: o.ccy not in ('EUR', 'USD'))
+
+    def test_or_not(self):
+        qs = self.query().filter(P(type='future') | ~P(ccy='EUR'))
+        return self.check(qs, lambda o: o.type == 'future' or o.ccy != 'EUR')
+
+    def test_in(self):
+        qs = self.query().filter(P(ccy=('EUR', 'USD'), type='future') |
+                                 P(type='equity'))
+        return self.check(qs, lambda o: (o.ccy in ('EUR', 'USD') and
+                                         o.type == 'future') or
+                          o.type == 'equity')
+
+    def test_with_kwargs(self):
+        qs = self.query().filter(P(type='future') | P(type='equity'),
+                                 ccy='EUR').exclude(type='equity')
+        return self.check(qs, lambda o: o.ccy == 'EUR' and o.type == 'future')
+
+    def test_chained(self):
+        qs = self.query().filter(P(type='future') | P(type='equity'))
+        qs = qs.filter(~P(ccy='EUR'))
+        return self.check(qs, lambda o: o.ccy != 'EUR' and
+                          o.type in ('future', 'equity'))
+
+    def test_range(self):
+        qs = self.query().filter(P(id__gt=5) & ~P(ccy='EUR') | P(id__le=2))
+        return self.check(qs, lambda o: (o.id > 5 and o.ccy != 'EUR') or
+                          o.id <= 2)
+
+    def test_range_on_field(self):
+        qs = self.query().filter(P(type__startswith='fu') | P(ccy='EUR'))
+        return self.check(qs, lambda o: o.type.startswith('fu') or
+                          o.ccy == 'EUR')
+
+    def test_subquery(self):
+        eur = self.query().filter(ccy='EUR')
+        qs = self.query().filter(P(id__in=eur) | P(type='future'))
+        return self.check(qs, lambda o: o.ccy == 'EUR' or o.type == 'future')
+
+    def test_unique_field(self):
+        all = yield self.query().all()
+        qs = self.query().filter(P(name=all[0].name) | P(name=all[1].name))
+        qs = yield qs.all()
+        self.assertEqual(set(qs), set(all[:2]))
+
+    def test_empty(self):
+        qs = self.query().filter(P(ccy__in=()) | P(type='future'))
+        yield self.check(qs, lambda o: o.type == 'future')
+        qs = self.query().filter(P(ccy__in=()) & P(type='future'))
+        yield self.async.assertEqual(qs.count(), 0)
+        qs = self.query().filter(~P(ccy__in=()))
+        yield self.async.assertEqual(qs.count(), self.data.num_insts)
+
+    def test_count(self):
+        qs = self.query().filter(P(ccy='EUR') | P(ccy='USD'))
+        c = yield qs.count()
+        c1 = yield self.query().filter(ccy=('EUR', 'USD')).count()
+        self.assertEqual(c, c1)
+
+
+class TestExpressionOrdered(TestExpression):
+    models = (Instrument2, Fund, Position)
+
+    def test_sorted(self):
+        all = yield self.query().all()
+        qs = yield self.query().filter(P(ccy='EUR') | P(type='future')).all()
+        self.assertEqual(qs, [o for o in all if o.ccy == 'EUR' or
+                              o.type == 'future'])
+
+
+class TestExpressionBitmap(TestExpression):
+    multipledb = 'redis'
+    models = (Instrument3, Fund, Position)
+
+
+class TestExpressionCompound(TestExpression):
+    multipledb = 'redis'
+    models = (Instrument5, Fund, Position)
@@ -0,0 +1,133 @@
+'''Keyset pagination with Query.after and Query.before.'''
+from datetime import date
+
+from stdnet import QuerySetError, Page
+from stdnet.backends import encode_cursor
+from stdnet.utils import test
+
+from examples.models import SportAtDate, SportAtDate2
+from examples.data import FinanceTest
+
+from . import sorting
+
+
+class KeysetMixin(object):
+
+    def paginate(self, qs, limit, backward=False):
+        cursor, pages = None, []
+        while True:
+            if backward:
+                page = yield qs.before(cursor, limit)
+                cursor = page.before
+            else:
+                page = yield qs.after(cursor, limit)
+                cursor = page.after
+            self.assertTrue(isinstance(page, Page))
+            self.assertTrue(len(page) <= limit)
+            if page:
+                pages.append(page)
+            if cursor is None:
+                break
+        yield pages
+
+
+class TestKeysetOrdered(sorting.TestSort, KeysetMixin):
+    model = SportAtDate
+
+    def test_forward(self):
+        all = yield self.query().all()
+        pages = yield self.paginate(self.query(), 3)
+        self.assertEqual(sum(pages, []), all)
+        self.checkOrder(all, 'dt')
+
+    def test_backward(self):
+        all = yield self.query().all()
+        pages = yield self.paginate(self.query(), 4, True)
+        self.assertEqual(sum(reversed(pages), []), all)
+        page = yield self.query().before(limit=2)
+        self.assertEqual(page, all[-2:])
+        self.assertTrue(page.before)
+
+    def test_cursors(self):
+        qs = self.query()
+        all = yield qs.all()
+        page = yield qs.after(limit=5)
+        self.assertEqual(page, all[:5])
+        self.assertEqual(page.before, None)
+        next = yield qs.after(page.after, 5)
+        self.assertEqual(next, all[5:10])
+        previous = yield qs.before(next.before, 3)
+        self.assertEqual(previous, all[2:5])
+        first = yield qs.before(previous.before, 3)
+        self.assertEqual(first, all[:2])
+        self.assertEqual(first.before, None)
+
+    def test_filter(self):
+        qs = self.query().filter(name='rugby')
+        all = yield qs.all()
+        pages = yield self.paginate(qs, 2)
+        self.assertEqual(sum(pages, []), all)
+
+    def test_sort_by_ordering(self):
+        qs = self.query().sort_by('-dt')
+        all = yield qs.all()
+        pages = yield self.paginate(qs, 3)
+        self.assertEqual(sum(pages, []), all)
+
+    def test_errors(self):
+        qs = self.query()
+        self.assertRaises(QuerySetError, qs.sort_by('name').after)
+        self.assertRaises(QuerySetError, qs.after, 'foo')
+        self.assertRaises(QuerySetError, qs.after, None, 0)
+
+
+class TestKeysetOrderedDesc(TestKeysetOrdered):
+    model = SportAtDate2
+
+
+class TestKeysetScan(FinanceTest, KeysetMixin):
+
+    @classmethod
+    def after_setup(cls):
+        return cls.data.create(cls)
+
+    def test_scan(self):
+        qs = self.query()
+        all = yield qs.all()
+        pages = yield self.paginate(qs, 7)
+        items = sum(pages, [])
+        self.assertEqual(len(items), len(all))
+        self.assertEqual(set(items), set(all))
+
+    def test_filter(self):
+        qs = self.query().filter(ccy='EUR')
+        all = yield qs.all()
+        pages = yield self.paginate(qs, 2)
+        self.assertEqual(set(sum(pages, [])), set(all))
+
+    def test_errors(self):
+        qs = self.query()
+        self.assertRaises(QuerySetError, qs.before)
+        cursor = encode_cursor('z', '1', '1')
+        self.assertRaises(QuerySetError, qs.after, cursor)
+
+
+class TestKeysetWrite(test.TestWrite):
+    models = (SportAtDate,)
+
+    def test_deleted_cursor(self):
+        session = self.session()
+        with session.begin() as t:
+            for day in (1, 2, 2, 2, 3, 4):
+                t.add(self.model(person='luca', name='run',
+                                 dt=date(2013, 1, day)))
+        yield t.on_result
+        qs = self.query()
+        all = yield qs.all()
+        page = yield qs.after(limit=2)
+        self.assertEqual(page, all[:2])
+        yield session.delete(page[-1])
+        page = yield qs.after(page.after, 2)
+        self.assertEqual(page, all[2:4])
+        page = yield qs.before(page.before)
+        self.assertEqual(page, all[:1])
@@ -0,0 +1,74 @@
+'''Client side slow query log.'''
+from stdnet import odm
+from stdnet.odm import SlowLog, query_fingerprint
+from stdnet.utils import test
+
+from examples.models import SimpleModel
+
+
+class TestSlowLog(test.TestWrite):
+    multipledb = 'redis'
+
+    def setUp(self):
+        self.slowlog = SlowLog(threshold=0)
+        self.models = odm.Router(self.backend, slowlog=self.slowlog)
+        self.models.register(SimpleModel)
+
+    def fingerprint(self, query):
+        return query_fingerprint(query.construct())
+
+    def test_fingerprint(self):
+        qs = self.models.simplemodel.query()
+        a = self.fingerprint(qs.filter(code='a', group='x'))
+        b = self.fingerprint(qs.filter(group='y', code='b'))
+        self.assertEqual(a, b)
+        self.assertTrue(a.startswith(SimpleModel._meta.modelkey))
+        c = self.fingerprint(qs.filter(code__in=('a', 'b', 'c'), group='x'))
+        self.assertEqual(a, c)
+        d = self.fingerprint(qs.filter(code='a').sort_by('-code')
+                             .load_only('group'))
+        self.assertTrue('order=-code' in d)
+        self.assertTrue('fields=group' in d)
+        e = self.fingerprint(qs.exclude(code='a'))
+        self.assertNotEqual(a, e)
+
+    def test_threshold(self):
+        slowlog = SlowLog(threshold=1, thresholds={'a.b': 0})
+        self.assertEqual(slowlog.threshold_for('a.b'), 0)
+        self.assertEqual(slowlog.threshold_for('c.d'), 1)
+
+    def test_items(self):
+        models = self.models
+        yield models.simplemodel.new(code='a', group='x')
+        yield models.simplemodel.new(code='b', group='x')
+        self.slowlog.clear()
+        result = yield models.simplemodel.filter(group='x').all()
+        self.assertEqual(len(result), 2)
+        entries = self.slowlog.entries()
+        self.assertEqual([e.operation for e in entries], ['items'])
+        entry = entries[0]
+        self.assertEqual(entry.model, SimpleModel._meta.modelkey)
+        self.assertEqual(entry.count, 2)
+        self.assertTrue(entry.duration >= 0)
+        self.assertTrue('load' in entry.phases)
+        self.assertEqual(entry.caller[2], 'test_items')
+        self.assertEqual(self.slowlog.fingerprints()[entry.fingerprint][0], 1)
+
+    def test_count_and_size(self):
+        models = self.models
+        self.models.slowlog = SlowLog(threshold=0, size=2, caller=False)
+        slowlog = self.models.slowlog
+        for code in ('a', 'b', 'c'):
+            n = yield models.simplemodel.filter(code=code).count()
+            self.assertEqual(n, 0)
+        entries = slowlog.entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0].operation, 'count')
+        self.assertEqual(entries[0].caller, None)
+        self.assertEqual(len(slowlog.entries(limit=1)), 1)
+        self.assertEqual(slowlog.entries(model='foo.bar'), [])
+
+    def test_fast_queries(self):
+        self.models.slowlog = SlowLog(threshold=60)
+        yield self.models.simplemodel.query().all()
+        self.assertEqual(len(self.models.slowlog), 0)
@@ -1,3 +1,6 @@
+from stdnet import QuerySetError
+from stdnet.utils import test
+
 from . import ranges
 
 
@@ -30,4 +33,80 @@ class TestWhere(ranges.NumericTest):
         qs = yield qs.all()
         self.assertTrue(qs)
         for m in qs:
-            self.assertTrue(m.vega > m.delta)
\ No newline at end of file
+            self.assertTrue(m.vega > m.delta)
+
+
+class TestWhereScripts(ranges.NumericTest):
+    multipledb = 'redis'
+
+    def testConstantsHoisting(self):
+        cache = self.backend.where_scripts
+        s1, args1 = cache.get('this.vega > 0.5 and this.pv < 10')
+        s2, args2 = cache.get('this.vega > 2 and this.pv < 1e3')
+        self.assertEqual(s1, s2)
+        self.assertEqual(s1.clause, 'this.vega > __args[1] and '
+                                    'this.pv < __args[2]')
+        self.assertEqual(args1, ('n0.5', 'n10'))
+        self.assertEqual(args2, ('n2', 'n1e3'))
+
+    def testSameShape(self):
+        session = self.session()
+        query = session.query(self.model)
+        all = yield query.all()
+        cache = self.backend.where_scripts
+        for value in (0.2, 0.5):
+            qs = yield query.where('this.vega > %s' % value).all()
+            self.assertEqual(set(qs), set((m for m in all
+                                           if m.vega > value)))
+        script, _ = cache.get('this.vega > 0.1')
+        self.assertTrue(script.stats['calls'] >= 2)
+        self.assertTrue(script.stats['scanned'] >= 2*len(all))
+        self.assertTrue(script.clause in self.backend.where_stats())
+
+    def testStringConstants(self):
+        s, args = self.backend.where_scripts.get(
+            "this['vega'] ~= \"a\\\"b\" and this.pv ~= '1\\n'")
+        self.assertEqual(s.clause, 'this[__args[1]] ~= __args[2] and '
+                                   'this.pv ~= __args[3]')
+        self.assertEqual(args, ('svega', 'sa"b', 's1\n'))
+        session = self.session()
+        qs = yield session.query(self.model).where(
+            "this['vega'] > this[\"delta\"]").all()
+        self.assertTrue(qs)
+        for m in qs:
+            self.assertTrue(m.vega > m.delta)
+
+    def testLongStringsAndComments(self):
+        cache = self.backend.where_scripts
+        s, args = cache.get("this.name ~= [==[a']]b]==] --[[ 'x' 1 ]] and "
+                            "this.pv > 2 -- 'y' 3")
+        self.assertEqual(s.clause,
+                         'this.name ~= __args[1]   and this.pv > __args[2]  ')
+        self.assertEqual(args, ("sa']]b", 'n2'))
+        self.assertRaises(QuerySetError, cache.get, 'this.name == [[a')
+        self.assertRaises(QuerySetError, cache.get, 'this.pv > 1 --[[ a')
+        session = self.session()
+        qs = yield session.query(self.model).where(
+            "this.vega > this.delta and [[\na]] == '-- a' -- 'b'").all()
+        self.assertFalse(qs)
+        qs = yield session.query(self.model).where(
+            "this.vega > this.delta and [[\na]] == 'a' --[=[\n]]\n]=]").all()
+        self.assertTrue(qs)
+        for m in qs:
+            self.assertTrue(m.vega > m.delta)
+
+
+class TestWhereScriptsCache(test.TestCase):
+    multipledb = False
+
+    def testEviction(self):
+        from stdnet.backends.redisb import WhereScripts
+        cache = WhereScripts(max_size=2)
+        cache.get('this.a > 1')
+        cache.get('this.b > 1')
+        cache.get('this.a > 2')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.get('this.c > 1')
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('this.b > __args[1]' in cache.stats())
+        self.assertTrue('this.a > __args[1]' in cache.stats())
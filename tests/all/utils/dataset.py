@@ -0,0 +1,100 @@
+from datetime import date
+
+from stdnet import odm
+from stdnet.utils import test
+from stdnet.utils import dataset as ds
+
+from examples.models import Instrument, Fund, Position
+
+
+def make_dataset(router, seed=10, size=30):
+    data = ds.Dataset(router, seed=seed, batch_size=7)
+    data.add(Instrument, size, name=ds.Sequence('inst%s'),
+             ccy=ds.Choice(cardinality=5, skew=2),
+             type=ds.Choice(('equity', 'bond', 'future')),
+             description=ds.Text(5, 10, nulls=0.5))
+    data.add(Fund, 5, name=ds.Sequence('fund%s'),
+             ccy=ds.Choice(('EUR', 'USD')))
+    data.add(Position, instrument=ds.Related(Instrument, fanout=2, skew=1),
+             fund=ds.Related(Fund), size=ds.Float(-10, 10),
+             dt=ds.Date(date(2010, 1, 1), date(2013, 1, 1)))
+    return data
+
+
+def rows(data, model):
+    return [row for batch in data.rows(model) for row in batch]
+
+
+class TestColumns(test.TestCase):
+    multipledb = False
+
+    def test_reproducible(self):
+        r1 = rows(make_dataset(None), Instrument)
+        r2 = rows(make_dataset(None), Instrument)
+        self.assertEqual(len(r1), 30)
+        self.assertEqual(r1, r2)
+        r3 = rows(make_dataset(None, seed=11), Instrument)
+        self.assertNotEqual(r1, r3)
+
+    def test_batches(self):
+        data = make_dataset(None)
+        sizes = [len(batch) for batch in data.rows(Instrument)]
+        self.assertEqual(sizes, [7, 7, 7, 7, 2])
+
+    def test_sequence(self):
+        names = [row['name'] for row in rows(make_dataset(None), Instrument)]
+        self.assertEqual(names, ['inst%s' % i for i in range(30)])
+
+    def test_choice(self):
+        data = make_dataset(None, size=1000)
+        ccys = [row['ccy'] for row in rows(data, Instrument)]
+        self.assertTrue(set(ccys) <= set(('v0', 'v1', 'v2', 'v3', 'v4')))
+        counts = [ccys.count('v%s' % i) for i in range(5)]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertTrue(counts[0] > 400)
+
+    def test_nulls(self):
+        data = make_dataset(None, size=1000)
+        nulls = [row['description'] for row in rows(data, Instrument)
+                 if row['description'] is None]
+        self.assertTrue(400 < len(nulls) < 600)
+
+    def test_related(self):
+        data = make_dataset(None)
+        self.assertEqual(data.get(Position).size, 60)
+        self.assertRaises(ValueError, rows, data, Position)
+        data.ids[Instrument] = list(range(100, 130))
+        data.ids[Fund] = [1, 2, 3, 4, 5]
+        positions = rows(data, Position)
+        self.assertEqual(len(positions), 60)
+        for row in positions:
+            self.assertTrue(100 <= row['instrument'] < 130)
+            self.assertTrue(row['fund'] in data.ids[Fund])
+            self.assertTrue(date(2010, 1, 1) <= row['dt'] < date(2013, 1, 1))
+
+
+class TestDataset(test.TestWrite):
+    multipledb = 'redis'
+    models = (Instrument, Fund, Position)
+
+    def test_create(self):
+        data = make_dataset(self.mapper)
+        ids = yield data.create()
+        self.assertEqual(len(ids[Instrument]), 30)
+        self.assertEqual(len(ids[Fund]), 5)
+        self.assertEqual(len(ids[Position]), 60)
+        yield self.async.assertEqual(self.query(Position).count(), 60)
+        qs = self.query(Position).filter(instrument=ids[Instrument][0])
+        positions = yield qs.all()
+        self.assertTrue(positions)
+
+    def test_create_router_from_connection_string(self):
+        models = odm.Router(self.backend.connection_string)
+        for model in self.models:
+            models.register(model)
+        self.assertEqual(models.position.backend.connection_string,
+                         self.backend.connection_string)
+        data = make_dataset(models, size=10)
+        ids = yield data.create()
+        self.assertEqual(len(ids[Instrument]), 10)
+        self.assertEqual(len(ids[Position]), 20)
@@ -0,0 +1,92 @@
+'''Client side instrumentation.'''
+from stdnet import odm
+from stdnet.utils import test
+from stdnet.utils.instrument import (Instrument, InstrumentCollector,
+                                     Histogram, instrument_event,
+                                     payload_size, result_count)
+
+from examples.models import SimpleModel
+
+
+def event(duration, model='m', command='load', count=1):
+    return instrument_event('odmrun', command, model, 1, 10, duration, count,
+                            None)
+
+
+class TestHistogram(test.TestCase):
+    multipledb = False
+
+    def test_buckets(self):
+        h = Histogram((0.001, 0.01, 0.1))
+        for d in (0.0005, 0.005, 0.005, 0.05, 1):
+            h.add(event(d))
+        self.assertEqual(h.buckets, [1, 2, 1, 1])
+        self.assertEqual(h.count, 5)
+        self.assertEqual(h.max, 1)
+        self.assertEqual(h.size, 50)
+        self.assertEqual(h.results, 5)
+        self.assertEqual(h.percentile(50), 0.01)
+        self.assertEqual(h.percentile(100), None)
+        self.assertAlmostEqual(h.mean, 1.0605/5)
+
+    def test_helpers(self):
+        self.assertEqual(payload_size(('ab', b'cde', 12)), 7)
+        self.assertEqual(result_count([1, 2]), 2)
+        self.assertEqual(result_count(5), 5)
+        self.assertEqual(result_count(iter(())), None)
+        self.assertEqual(result_count(True), None)
+
+    def test_collector(self):
+        collector = InstrumentCollector(max_events=2)
+        self.assertTrue(isinstance(collector, Instrument))
+        collector.emit(event(0.001))
+        collector.emit(event(0.002, model='n'))
+        collector.emit(event(0.003, command='commit'))
+        self.assertEqual(len(collector.events), 2)
+        stats = collector.stats()
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(stats[('m', 'load')]['count'], 1)
+        self.assertEqual(len(collector.stats('m')), 2)
+        collector.clear()
+        self.assertFalse(collector.events)
+        self.assertFalse(collector.histograms)
+
+
+class TestInstrumentedBackend(test.TestWrite):
+    multipledb = 'redis'
+
+    def setUp(self):
+        self.collector = InstrumentCollector()
+        self.models = odm.Router(self.backend)
+        self.models.register(SimpleModel)
+        self.models.set_instrument(self.collector)
+
+    def tearDown(self):
+        self.backend.set_instrument(None)
+
+    def test_no_instrument(self):
+        backend = self.models.simplemodel.backend
+        backend.set_instrument(None)
+        self.assertEqual(backend.instrument, None)
+        self.assertEqual(backend.client.instrument, None)
+
+    def test_events(self):
+        models = self.models
+        modelkey = SimpleModel._meta.modelkey
+        yield models.simplemodel.new(code='a', group='x')
+        commands = [(e.name, e.command) for e in self.collector.events]
+        self.assertTrue(('odmrun', 'commit') in commands)
+        self.assertTrue(('session', None) in commands)
+        self.collector.clear()
+        result = yield models.simplemodel.filter(group='x').all()
+        self.assertEqual(len(result), 1)
+        events = dict(((e.command, e) for e in self.collector.events))
+        self.assertTrue('query' in events)
+        load = events['load']
+        self.assertEqual(load.model, modelkey)
+        self.assertEqual(load.count, 1)
+        self.assertTrue(load.duration >= 0)
+        self.assertTrue(load.size > 0)
+        self.assertTrue(load.query)
+        stats = self.collector.stats(modelkey)
+        self.assertEqual(stats[(modelkey, 'load')]['count'], 1)
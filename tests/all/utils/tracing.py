@@ -0,0 +1,119 @@
+'''Tracing spans.'''
+from stdnet import odm
+from stdnet.utils import test
+from stdnet.utils.tracing import (Tracer, RecordingTracer, Span,
+                                  response_size)
+
+from examples.models import SimpleModel
+
+
+class TestTracer(test.TestCase):
+    multipledb = False
+
+    def test_nesting(self):
+        tracer = RecordingTracer()
+        self.assertEqual(tracer.current_span(), None)
+        with tracer.start_span('a', model='m') as a:
+            self.assertEqual(tracer.current_span(), a)
+            with tracer.start_span('b') as b:
+                self.assertEqual(b.parent, a)
+            c = tracer.start_span('c', rows=2)
+            self.assertEqual(tracer.current_span(), a)
+        self.assertEqual(tracer.current_span(), None)
+        self.assertFalse(c.ended)
+        self.assertEqual(c.duration, None)
+        c.end()
+        c.end()
+        self.assertEqual([s.name for s in tracer.spans], ['b', 'a', 'c'])
+        self.assertTrue(a.duration >= b.duration)
+        self.assertEqual(tracer.roots(), [a])
+        self.assertEqual(tracer.children(a), [b, c])
+        lines = tracer.tree().split('\n')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('a '))
+        self.assertTrue(lines[0].endswith('model=m'))
+        self.assertTrue(lines[2].startswith('  c '))
+        tracer.clear()
+        self.assertFalse(tracer.spans)
+
+    def test_error(self):
+        tracer = RecordingTracer()
+
+        def fail():
+            with tracer.start_span('a'):
+                raise ValueError('bla')
+        self.assertRaises(ValueError, fail)
+        span = tracer.spans[0]
+        self.assertTrue('ValueError' in span.attributes['error'])
+        self.assertEqual(tracer.current_span(), None)
+
+    def test_adapter(self):
+        events = []
+
+        class Adapter(Tracer):
+
+            def on_start(self, span):
+                span.context = len(events)
+                events.append(('start', span.name))
+
+            def on_end(self, span):
+                events.append(('end', span.name, span.context))
+
+        tracer = Adapter()
+        with tracer.start_span('a') as span:
+            self.assertTrue(isinstance(span, Span))
+        self.assertEqual(events, [('start', 'a'), ('end', 'a', 0)])
+
+    def test_response_size(self):
+        self.assertEqual(response_size(None), 0)
+        self.assertEqual(response_size([b'ab', [b'c', 12]]), 5)
+
+
+class TestTracedBackend(test.TestWrite):
+
+    def setUp(self):
+        self.tracer = RecordingTracer()
+        self.models = odm.Router(self.backend)
+        self.models.register(SimpleModel)
+        self.models.set_tracer(self.tracer)
+
+    def tearDown(self):
+        self.backend.set_tracer(None)
+
+    def test_no_tracer(self):
+        models = self.models
+        models.set_tracer(None)
+        self.assertEqual(models.tracer, None)
+        self.assertEqual(models.simplemodel.backend.tracer, None)
+        yield models.simplemodel.new(code='a', group='x')
+        self.assertFalse(self.tracer.spans)
+
+    def test_spans(self):
+        models = self.models
+        modelkey = SimpleModel._meta.modelkey
+        yield models.simplemodel.new(code='a', group='x')
+        names = set((s.name for s in self.tracer.spans))
+        self.assertTrue('session.commit' in names)
+        commit = [s for s in self.tracer.spans if s.name == 'session.commit']
+        self.assertEqual(commit[0].attributes['models'], modelkey)
+        self.assertEqual(commit[0].attributes['instances'], 1)
+        self.tracer.clear()
+        result = yield models.simplemodel.filter(group='x').all()
+        self.assertEqual(len(result), 1)
+        spans = dict(((s.name, s) for s in self.tracer.spans))
+        self.assertTrue('query.construct' in spans)
+        items = spans['query.items']
+        self.assertEqual(items.attributes['model'], modelkey)
+        self.assertEqual(items.attributes['rows'], 1)
+        make_objects = spans['odm.make_objects']
+        self.assertEqual(make_objects.attributes['rows'], 1)
+        if self.backend.name == 'redis':
+            script = spans['redis.script']
+            self.assertEqual(script.attributes['model'], modelkey)
+            self.assertTrue(script.attributes['bytes'] > 0)
+            self.assertTrue(spans['redis.parse'].attributes['bytes'] > 0)
+        self.tracer.clear()
+        count = yield models.simplemodel.query().count()
+        self.assertEqual(count, 1)
+        spans = dict(((s.name, s) for s in self.tracer.spans))
+        self.assertEqual(spans['query.count'].attributes['rows'], 1)
@@ -0,0 +1,106 @@
+'''Workload record and replay.'''
+import os
+import shutil
+import tempfile
+from timeit import default_timer
+
+from stdnet import odm
+from stdnet.utils import test
+from stdnet.utils.workload import (WorkloadRecorder, WorkloadReplayer,
+                                   ReplayReport, read_workload)
+
+from examples.models import SimpleModel
+
+UNICODE = b'h\xc3\xa9'.decode('utf-8')
+
+
+class TempDir(object):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class TestWorkloadLog(TempDir, test.TestCase):
+    multipledb = False
+
+    def record(self, name):
+        path = os.path.join(self.dir, name)
+        with WorkloadRecorder(path) as recorder:
+            recorder.record([(('SET', 'key', 1.5), {})], default_timer(),
+                            0.001)
+            recorder.record([(('HSET', UNICODE, 'f', b'\xff'), {}),
+                             (('GET', 'key'), {})], default_timer(), 0.002,
+                            True)
+        self.assertEqual(recorder.count, 2)
+        return list(read_workload(path))
+
+    def test_roundtrip(self):
+        for name in ('workload.log', 'workload.log.gz'):
+            entries = self.record(name)
+            self.assertEqual(len(entries), 2)
+            first, second = entries
+            self.assertEqual(first.commands, ((b'SET', b'key', b'1.5'),))
+            self.assertEqual(first.labels, ('SET',))
+            self.assertFalse(first.transaction)
+            self.assertEqual(second.commands,
+                             ((b'HSET', b'h\xc3\xa9', b'f', b'\xff'),
+                              (b'GET', b'key')))
+            self.assertEqual(second.labels, ('HSET', 'GET'))
+            self.assertTrue(second.transaction)
+            self.assertTrue(second.offset >= first.offset)
+
+    def test_report(self):
+        report = ReplayReport([0.3, 0.1, 0.2, 0.4], [0, 0, 0.1, 0], 1, 2.0,
+                              4.0, cpu=0.5)
+        self.assertEqual(report.throughput, 2)
+        self.assertEqual(report.latency(50), 0.2)
+        data = report.as_dict()
+        self.assertEqual(data['entries'], 4)
+        self.assertEqual(data['errors'], 1)
+        self.assertEqual(data['max'], 0.4)
+        self.assertEqual(data['lag_p99'], 0.1)
+        self.assertEqual(data['server_cpu_ratio'], 0.25)
+
+
+class TestRecordReplay(TempDir, test.TestWrite):
+    multipledb = 'redis'
+
+    def setUp(self):
+        super(TestRecordReplay, self).setUp()
+        self.models = odm.Router(self.backend)
+        self.models.register(SimpleModel)
+
+    def tearDown(self):
+        self.backend.set_recorder(None)
+        super(TestRecordReplay, self).tearDown()
+
+    def test_record_replay(self):
+        if self.backend.is_async():
+            return
+        models = self.models
+        path = os.path.join(self.dir, 'workload.log.gz')
+        recorder = WorkloadRecorder(path)
+        models.set_recorder(recorder)
+        self.assertEqual(self.backend.client.recorder, recorder)
+        models.simplemodel.new(code='a', group='x')
+        result = models.simplemodel.filter(group='x').all()
+        self.assertEqual(len(result), 1)
+        models.set_recorder(None)
+        self.assertEqual(self.backend.client.recorder, None)
+        recorder.close()
+        entries = list(read_workload(path))
+        labels = [l for e in entries for l in e.labels]
+        modelkey = SimpleModel._meta.modelkey
+        self.assertTrue('odmrun:commit:%s' % modelkey in labels)
+        self.assertTrue('odmrun:query:%s' % modelkey in labels)
+        self.backend.flush()
+        replayer = WorkloadReplayer(self.backend.client, speed=0,
+                                    concurrency=2)
+        report = replayer.replay(entries)
+        self.assertEqual(len(report.latencies), len(entries))
+        self.assertEqual(report.errors, 0)
+        self.assertTrue(report.throughput > 0)
+        self.assertEqual(models.simplemodel.query().count(), 1)